@@ -1266,7 +1266,9 @@ class ExecutionEngine:
         self.performance_tracker = performance_tracker or AgentPerformanceTracker()
         self.alert_system = alert_system
     
-    async def execute_plan(self, plan: ExecutionPlan, dry_run: bool = False) -> ExecutionResult:
+    async def execute_plan(
+        self, plan: ExecutionPlan, dry_run: bool = False, progress: Optional[Callable] = None
+    ) -> ExecutionResult:
         execution_id = f"EXEC-{uuid4().hex[:8]}"
         started_at = datetime.now(timezone.utc)
         
@@ -1351,6 +1353,11 @@ class ExecutionEngine:
             phase.status = TaskStatus.SUCCESS if all(
                 t.status == TaskStatus.SUCCESS for t in phase.tasks if t.status != TaskStatus.SKIPPED
             ) else TaskStatus.FAILED
+            if progress:
+                progress("phase_completed", {
+                    "phase_id": phase.phase_id, "name": phase.name, "status": phase.status.value,
+                    "tasks_completed": tasks_completed, "tasks_failed": tasks_failed,
+                })
         
         completed_at = datetime.now(timezone.utc)
         total_duration_ms = int((completed_at - started_at).total_seconds() * 1000)
@@ -1445,7 +1452,8 @@ class CampaignStrategyOrchestrator:
         industry_type: str = "custom",
         execution_mode: str = "standard",
         dry_run: bool = False,
-        use_smart_allocation: bool = True
+        use_smart_allocation: bool = True,
+        progress: Optional[Callable] = None
     ) -> Dict[str, Any]:
         """
         Process a marketing strategy document and execute it using the 35 agents.
@@ -1457,6 +1465,7 @@ class CampaignStrategyOrchestrator:
             execution_mode: plan_only, standard, or comprehensive
             dry_run: If True, simulate execution without calling agents
             use_smart_allocation: Use smart agent allocation based on history
+            progress: Optional callback progress(phase, data) called as each phase completes
         
         Returns:
             Complete execution results with plan and recommendations
@@ -1472,9 +1481,13 @@ class CampaignStrategyOrchestrator:
         
         # 1. Parse the strategy document
         strategy = await self.parser.parse(document_content, tenant_id, industry)
+        if progress:
+            progress("strategy_parsed", {"confidence": strategy["parse_confidence"], "channels": strategy["channels"]})
         
         # 2. Create execution plan
         plan = await self.planner.create_plan(strategy, execution_mode, use_smart_allocation)
+        if progress:
+            progress("plan_created", {"tasks": plan.total_tasks, "phases": len(plan.phases)})
         
         # 3. Execute the plan (or just return it if plan_only)
         if execution_mode == "plan_only":
@@ -1487,7 +1500,9 @@ class CampaignStrategyOrchestrator:
             }
         
         # 4. Execute
-        result = await self.executor.execute_plan(plan, dry_run)
+        result = await self.executor.execute_plan(plan, dry_run, progress)
+        if progress:
+            progress("plan_executed", {"status": getattr(result.status, "value", result.status), "alerts": len(result.alerts)})
         
         return {
             "orchestrator_version": self.version,
@@ -1568,7 +1583,7 @@ class CampaignStrategyOrchestrator:
 # AGENT EXECUTE FUNCTION (Required for Nadakki AI Suite)
 # ============================================================================
 
-async def execute(input_data: dict) -> dict:
+async def execute(input_data: dict, context: Optional[dict] = None) -> dict:
     """
     Main execute function for the Campaign Strategy Orchestrator.
     This is called by the Nadakki AI Suite agent execution framework.
@@ -1581,6 +1596,8 @@ async def execute(input_data: dict) -> dict:
         "execution_mode": "plan_only|standard|comprehensive",
         "dry_run": true/false
     }
+
+    context (optional): {"progress": callback(phase, data)} to report phases while streaming.
     """
     try:
         strategy_document = input_data.get("strategy_document", "")
@@ -1605,7 +1622,8 @@ async def execute(input_data: dict) -> dict:
             tenant_id=tenant_id,
             industry_type=industry_type,
             execution_mode=execution_mode,
-            dry_run=dry_run
+            dry_run=dry_run,
+            progress=(context or {}).get("progress")
         )
         
         return {
@@ -1787,7 +1805,7 @@ class CampaignStrategyOrchestratorAgentOperative:
                     "version": VERSION,
                     "dry_run": True,
                 }
-            return await execute(input_data)
+            return await execute(input_data, kwargs)
         # Direct call mode
         merged = {"strategy_document": input_data, "tenant_id": tenant_id, **kwargs}
         return await execute(merged)
@@ -68,6 +68,12 @@ _default_config = {"enable_compliance": True, "enable_audit_trail": True, "enabl
 def get_config(tenant_id: str = "default") -> Dict[str, Any]:
     return {**_default_config, "tenant_id": tenant_id}
 
+def _progress(context: Optional[Dict[str, Any]], phase: str, **data) -> None:
+    # Streaming opcional: context["progress"] lo inyecta /agents/execute/stream
+    callback = context.get("progress") if context else None
+    if callback is not None:
+        callback(phase, data)
+
 def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     start = time.time()
     tenant_id = context.get("tenant_id", "default") if context else "default"
@@ -87,6 +93,7 @@ def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None
         verrs = validate_input(input_data, [])
         if verrs: return _validation_err(verrs, tenant_id, trace, start)
         trace.append("input_validated")
+        _progress(context, "validation", status="passed")
         
         compliance_result = None
         if config.get("enable_compliance"):
@@ -94,6 +101,7 @@ def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None
             if compliance_result.get("blocking_issues"):
                 return _compliance_blocked(compliance_result, tenant_id, trace, start)
             trace.append("compliance_pass")
+            _progress(context, "compliance", status="pass")
         
         # === CORE LOGIC ===
         lead = input_data.get("lead", {})
@@ -143,6 +151,7 @@ def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None
         
         trace.append(f"score={final_score:.2f}")
         trace.append(f"category={category}")
+        _progress(context, "core_logic", final_score=round(final_score, 3), category=category)
         
         latency = int((time.time() - start) * 1000)
         confidence = min(0.6 + final_score * 0.3, 0.95)
@@ -190,6 +199,7 @@ def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None
             result["_decision_layer_applied"] = True
             result["_decision_layer_timestamp"] = datetime.utcnow().isoformat() + "Z"
             result["_decision_layer_version"] = "v2.0.0"
+            _progress(context, "decision_layer", action=result["decision"]["action"], priority=priority)
         
         result["reason_codes"] = [
             {"code": "LEAD_SCORED", "category": "ANALYSIS", "description": f"Lead scored at {final_score:.0%}", "factor": "score", "value": round(final_score, 3), "contribution": 0.4, "impact": "positive" if final_score > 0.5 else "neutral"},
@@ -215,6 +225,7 @@ def execute(input_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None
             result["_input_hash"] = audit.get("input_hash", input_hash)
             result["_output_hash"] = audit.get("output_hash", "")
             result["_audit_trail"] = audit
+            _progress(context, "audit", output_hash=result["_output_hash"][:16])
         
         result["_error_handling"] = {"layer_applied": True, "layer_version": "1.0.0", "status": "success", "circuit_breaker_state": _circuit_breaker.get_state()}
         result["_data_quality"] = {"quality_score": min(100, 50 + len([v for v in lead.values() if v]) * 8), "quality_level": "high" if len(lead) >= 5 else "medium", "completeness_pct": min(100, len([v for v in lead.values() if v]) * 15), "confidence": round(confidence, 2), "issues": [], "sufficient_for_analysis": True}
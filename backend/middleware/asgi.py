@@ -0,0 +1,213 @@
+"""
+Pure-ASGI versions of the RLS, Audit, RateLimit and Usage middleware.
+
+BaseHTTPMiddleware runs every call_next in an extra task with memory
+streams; four of them stacked add per-request latency and buffer
+streaming responses. These classes keep the exact semantics of their
+BaseHTTPMiddleware counterparts (same skip lists, same 429 bodies and
+headers, same fire-and-forget audit/usage writes) by reusing the policy
+helpers of each module, and only wrap `send` to observe the response.
+
+EdgeMiddleware is the combined fast path: one layer that parses the
+headers once and applies the four policies in the same order as the
+stacked chain (usage -> rate limit -> audit -> RLS).
+
+MIDDLEWARE_MODE selects the chain in main.py: combined (default) | asgi | legacy.
+"""
+
+import os
+import time
+from typing import Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.db.rls import DEFAULT_TENANT
+from backend.middleware.audit import audit_skipped, schedule_audit_event
+from backend.middleware.rate_limit import limit_headers, rate_limit_skipped, rate_limited_response, take
+from backend.middleware import usage
+from backend.middleware.usage import plan_limit_response, schedule_usage_increment, usage_tracked
+
+MIDDLEWARE_MODES = ("combined", "asgi", "legacy")
+
+
+def middleware_mode() -> str:
+    mode = os.environ.get("MIDDLEWARE_MODE", "combined").lower()
+    return mode if mode in MIDDLEWARE_MODES else "combined"
+
+
+def _tenant_and_user(scope: Scope) -> Tuple[str, Optional[str]]:
+    """X-Tenant-ID y X-User-ID en una sola pasada por los headers crudos."""
+    tenant = user = None
+    for name, value in scope["headers"]:
+        if name == b"x-tenant-id":
+            if tenant is None:
+                tenant = value.decode("latin-1")
+        elif name == b"x-user-id":
+            if user is None:
+                user = value.decode("latin-1")
+    return (DEFAULT_TENANT if tenant is None else tenant), user
+
+
+def _set_tenant_state(scope: Scope, tenant: str) -> None:
+    # request.state lee scope["state"]
+    scope.setdefault("state", {})["tenant_id"] = tenant
+
+
+class RLSASGIMiddleware:
+    """request.state.tenant_id = X-Tenant-ID (default credicefi)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            _set_tenant_state(scope, _tenant_and_user(scope)[0])
+        await self.app(scope, receive, send)
+
+
+class AuditASGIMiddleware:
+    """Audit event per request; latency measured up to the response headers, as before."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or audit_skipped(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        tenant, user_id = _tenant_and_user(scope)
+        start = time.time()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                latency_ms = round((time.time() - start) * 1000)
+                schedule_audit_event(tenant, user_id, scope["method"], scope["path"], message["status"], latency_ms)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class RateLimitASGIMiddleware:
+    """100 requests/min per tenant; X-RateLimit-* headers on every response."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or rate_limit_skipped(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        decision = take(_tenant_and_user(scope)[0])
+        if not decision.allowed:
+            await rate_limited_response(decision)(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(limit_headers(decision))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class UsageTrackingASGIMiddleware:
+    """Plan limit before POST /agents/execute, usage increment after a 200."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not usage_tracked(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        tenant = _tenant_and_user(scope)[0]
+        limit_error = await usage._check_plan_limit(tenant)
+        if limit_error:
+            await plan_limit_response(limit_error)(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                schedule_usage_increment(tenant)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class EdgeMiddleware:
+    """
+    The four policies in one layer, tenant resolved once. Equivalent to
+    UsageTracking(RateLimit(Audit(RLS(app)))).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        method = scope["method"]
+        tenant, user_id = _tenant_and_user(scope)
+
+        tracked = usage_tracked(method, path)
+        if tracked:
+            limit_error = await usage._check_plan_limit(tenant)
+            if limit_error:
+                await plan_limit_response(limit_error)(scope, receive, send)
+                return
+
+        limited = not rate_limit_skipped(path)
+        decision = None
+        if limited:
+            decision = take(tenant)
+            if not decision.allowed:
+                await rate_limited_response(decision)(scope, receive, send)
+                return
+
+        audited = not audit_skipped(path)
+        _set_tenant_state(scope, tenant)
+
+        if not (tracked or limited or audited):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.time()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if limited:
+                    MutableHeaders(scope=message).update(limit_headers(decision))
+                if audited:
+                    schedule_audit_event(tenant, user_id, method, path, status, round((time.time() - start) * 1000))
+                if tracked and status == 200:
+                    schedule_usage_increment(tenant)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def install_middleware(app, mode: Optional[str] = None) -> str:
+    """Registra la cadena RLS/Audit/RateLimit/Usage en `app` (outermost: Usage). Devuelve el modo usado."""
+    mode = mode or middleware_mode()
+    if mode == "combined":
+        app.add_middleware(EdgeMiddleware)
+        return mode
+    if mode == "legacy":
+        from backend.db.rls import RLSMiddleware
+        from backend.middleware.audit import AuditMiddleware
+        from backend.middleware.rate_limit import GlobalRateLimitMiddleware
+        from backend.middleware.usage import UsageTrackingMiddleware
+        chain = (RLSMiddleware, AuditMiddleware, GlobalRateLimitMiddleware, UsageTrackingMiddleware)
+    else:
+        chain = (RLSASGIMiddleware, AuditASGIMiddleware, RateLimitASGIMiddleware, UsageTrackingASGIMiddleware)
+    for middleware in chain:
+        app.add_middleware(middleware)
+    return mode
@@ -1,23 +1,87 @@
 """
 Audit Middleware — logs every HTTP request to audit_events table.
 Falls back silently if DB is unavailable.
+
+Events are not written per request: schedule_audit_event() queues them in
+an AsyncBatchWriter (services/batch_writer.py) and one background task
+bulk-inserts them, with tenant slugs resolved by services/tenant_directory.py.
+
+Env:
+    AUDIT_QUEUE_SIZE    10000  events buffered at most
+    AUDIT_BATCH_SIZE    500    events per INSERT
+    AUDIT_FLUSH_MS      200    max delay before a partial batch is written
+    AUDIT_SAMPLE_RATE   10     above 75% of the queue keep 1 in N non-error events (1 = never sample)
 """
 
-import asyncio
 import logging
 import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 from sqlalchemy import text
 
+from services.batch_writer import AsyncBatchWriter
+from services.env import env_int
+
 logger = logging.getLogger("nadakki.audit_middleware")
 
 # Endpoints to exclude from audit logging
 _SKIP_PREFIXES = ("/docs", "/redoc", "/openapi.json", "/favicon.ico", "/health")
 
 
+def audit_skipped(path: str) -> bool:
+    return path.startswith(_SKIP_PREFIXES)
+
+
+_writer: Optional[AsyncBatchWriter] = None
+
+
+def get_audit_writer() -> AsyncBatchWriter:
+    global _writer
+    if _writer is None:
+        _writer = AsyncBatchWriter(
+            lambda batch: _write_audit_batch(batch),
+            name="audit",
+            max_queue=env_int("AUDIT_QUEUE_SIZE", 10000),
+            batch_size=env_int("AUDIT_BATCH_SIZE", 500),
+            flush_interval=env_int("AUDIT_FLUSH_MS", 200) / 1000,
+            sample_rate=env_int("AUDIT_SAMPLE_RATE", 10),
+            # Los errores nunca se muestrean (solo se descartan con la cola llena)
+            sampleable=lambda event: event["status_code"] < 400,
+        )
+    return _writer
+
+
+async def shutdown_audit_writer() -> None:
+    if _writer is not None:
+        await _writer.stop()
+
+
+def schedule_audit_event(
+    tenant_slug: str,
+    user_id: str | None,
+    method: str,
+    path: str,
+    status_code: int,
+    latency_ms: int,
+) -> None:
+    """Queue the event for the batched writer (never blocks the request)."""
+    get_audit_writer().submit({
+        "tenant_slug": tenant_slug,
+        "user_id": user_id,
+        "action": f"{method} {path}",
+        "endpoint": path,
+        "method": method,
+        "status_code": status_code,
+        "latency_ms": latency_ms,
+        "timestamp": datetime.now(timezone.utc),
+    })
+
+
 class AuditMiddleware(BaseHTTPMiddleware):
     """Logs tenant_id, endpoint, method, status_code, latency to audit_events."""
 
@@ -25,79 +89,60 @@ class AuditMiddleware(BaseHTTPMiddleware):
         path = request.url.path
 
         # Skip noisy endpoints
-        if any(path.startswith(p) for p in _SKIP_PREFIXES):
+        if audit_skipped(path):
             return await call_next(request)
 
         tenant_slug = request.headers.get("x-tenant-id", "credicefi")
         user_id = request.headers.get("x-user-id")
-        method = request.method
         start = time.time()
 
         response = await call_next(request)
 
         latency_ms = round((time.time() - start) * 1000)
-        status_code = response.status_code
-
-        # Fire-and-forget DB write
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(
-                _write_audit_event(
-                    tenant_slug=tenant_slug,
-                    user_id=user_id,
-                    action=f"{method} {path}",
-                    endpoint=path,
-                    method=method,
-                    status_code=status_code,
-                    latency_ms=latency_ms,
-                )
-            )
-        except Exception:
-            pass  # silently skip if no loop or other issue
-
+        schedule_audit_event(tenant_slug, user_id, request.method, path, response.status_code, latency_ms)
         return response
 
 
-async def _write_audit_event(
-    tenant_slug: str,
-    user_id: str | None,
-    action: str,
-    endpoint: str,
-    method: str,
-    status_code: int,
-    latency_ms: int,
-) -> None:
-    """Insert audit event into PostgreSQL. Resolves tenant slug to UUID. Fails silently."""
+_BULK_INSERT = text(
+    "INSERT INTO audit_events (tenant_id, user_id, action, endpoint, method, status_code, timestamp) "
+    "SELECT * FROM unnest(CAST(:tenant_ids AS uuid[]), CAST(:user_ids AS uuid[]), CAST(:actions AS text[]), "
+    "CAST(:endpoints AS text[]), CAST(:methods AS text[]), CAST(:status_codes AS integer[]), "
+    "CAST(:timestamps AS timestamptz[]))"
+)
+
+
+def _as_uuid(value: Optional[str]) -> Optional[uuid.UUID]:
+    # audit_events.user_id es UUID: un X-User-ID invalido no debe tumbar todo el batch
+    if not value:
+        return None
     try:
-        from services.db import db_available, get_session
-
-        if not db_available():
-            return
-
-        async with get_session() as session:
-            # Resolve tenant slug to UUID
-            result = await session.execute(
-                text("SELECT id FROM tenants WHERE slug = :slug LIMIT 1"),
-                {"slug": tenant_slug},
-            )
-            row = result.first()
-            tenant_uuid = str(row[0]) if row else None
-
-            await session.execute(
-                text(
-                    "INSERT INTO audit_events "
-                    "(tenant_id, user_id, action, endpoint, method, status_code) "
-                    "VALUES (:tenant_id, :user_id, :action, :endpoint, :method, :status_code)"
-                ),
-                {
-                    "tenant_id": tenant_uuid,
-                    "user_id": user_id,
-                    "action": action,
-                    "endpoint": endpoint,
-                    "method": method,
-                    "status_code": status_code,
-                },
-            )
-            await session.commit()
-    except Exception as exc:
-        logger.debug("Audit event write failed: %s", exc)
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+async def _write_audit_batch(events: List[Dict[str, Any]]) -> None:
+    """Bulk insert (one statement per batch). Slugs -> UUID from the tenant directory. No-op without DB."""
+    from services.db import db_available, get_session
+    from services.tenant_directory import get_tenant_directory
+
+    if not db_available():
+        return
+
+    async with get_session() as session:
+        # Normalmente todo sale de cache; lo que falte se resuelve en una sola query
+        tenants = await get_tenant_directory().resolve_many({e["tenant_slug"] for e in events}, session)
+        tenant_ids = {slug: _as_uuid(t.id) for slug, t in tenants.items() if t is not None}
+        await session.execute(
+            _BULK_INSERT,
+            {
+                "tenant_ids": [tenant_ids.get(e["tenant_slug"]) for e in events],
+                "user_ids": [_as_uuid(e["user_id"]) for e in events],
+                "actions": [e["action"] for e in events],
+                "endpoints": [e["endpoint"] for e in events],
+                "methods": [e["method"] for e in events],
+                "status_codes": [e["status_code"] for e in events],
+                "timestamps": [e["timestamp"] for e in events],
+            },
+        )
+        await session.commit()
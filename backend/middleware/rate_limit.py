@@ -1,60 +1,63 @@
 """
 Global rate limiting middleware — 100 requests/min per tenant.
-Adds X-RateLimit-Remaining header. Returns 429 if exceeded.
+Adds X-RateLimit-Limit/Remaining/Reset headers. Returns 429 with an exact Retry-After if exceeded.
 """
 
-import time
-import threading
 import logging
-from collections import defaultdict
+import math
+from typing import Dict
 
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
 
+from services.rate_limiter import RateLimitDecision, make_limiter
+
 logger = logging.getLogger("nadakki.rate_limit")
 
 _MAX_REQUESTS = 100
 _WINDOW_SECONDS = 60
 
-_buckets: dict = defaultdict(list)
-_lock = threading.Lock()
+# Compartido entre workers si RATE_LIMIT_BACKEND=sqlite
+_limiter = make_limiter(_MAX_REQUESTS, _WINDOW_SECONDS, "global")
+
+
+_SKIP_PATHS = frozenset(("/health", "/docs", "/redoc", "/openapi.json", "/favicon.ico"))
+
+
+def rate_limit_skipped(path: str) -> bool:
+    return path in _SKIP_PATHS
+
+
+def take(tenant: str) -> RateLimitDecision:
+    """Registra un request del tenant (O(1), ver services/rate_limiter.py)."""
+    return _limiter.hit(tenant)
+
+
+def rate_limited_response(decision: RateLimitDecision) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Rate limit exceeded", "retry_after_seconds": max(1, math.ceil(decision.retry_after))},
+        headers=decision.headers(),
+    )
+
+
+def limit_headers(decision: RateLimitDecision) -> Dict[str, str]:
+    return decision.headers()
 
 
 class GlobalRateLimitMiddleware(BaseHTTPMiddleware):
     """100 requests/min per tenant. Adds X-RateLimit-Remaining header."""
 
     async def dispatch(self, request: Request, call_next) -> Response:
-        path = request.url.path
-
         # Skip health and docs
-        if path in ("/health", "/docs", "/redoc", "/openapi.json", "/favicon.ico"):
+        if rate_limit_skipped(request.url.path):
             return await call_next(request)
 
-        tenant = request.headers.get("x-tenant-id", "credicefi")
-        now = time.time()
-        cutoff = now - _WINDOW_SECONDS
-
-        with _lock:
-            _buckets[tenant] = [t for t in _buckets[tenant] if t > cutoff]
-            count = len(_buckets[tenant])
-
-            if count >= _MAX_REQUESTS:
-                remaining = 0
-                return JSONResponse(
-                    status_code=429,
-                    content={"error": "Rate limit exceeded", "retry_after_seconds": _WINDOW_SECONDS},
-                    headers={
-                        "X-RateLimit-Limit": str(_MAX_REQUESTS),
-                        "X-RateLimit-Remaining": "0",
-                        "Retry-After": str(_WINDOW_SECONDS),
-                    },
-                )
-
-            _buckets[tenant].append(now)
-            remaining = _MAX_REQUESTS - count - 1
+        decision = take(request.headers.get("x-tenant-id", "credicefi"))
+        if not decision.allowed:
+            return rate_limited_response(decision)
 
         response = await call_next(request)
-        response.headers["X-RateLimit-Limit"] = str(_MAX_REQUESTS)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers.update(limit_headers(decision))
         return response
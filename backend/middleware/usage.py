@@ -1,6 +1,9 @@
 """
 Usage tracking middleware — increments executions_count on POST /agents/execute.
 Also enforces plan execution limits (429 Too Many Requests).
+
+Counts live in services/usage_counters.py (in memory, flushed to
+usage_tracking in batches); tenants resolve through services/tenant_directory.py.
 """
 
 import asyncio
@@ -9,7 +12,6 @@ import logging
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
-from sqlalchemy import text
 
 logger = logging.getLogger("nadakki.usage_middleware")
 
@@ -20,23 +22,42 @@ PLAN_LIMITS = {
 }
 
 
+def usage_tracked(method: str, path: str) -> bool:
+    """Only POST /agents/execute (and its /api/v1 alias) counts as an execution."""
+    return method == "POST" and path in ("/agents/execute", "/api/v1/agents/execute")
+
+
+def plan_limit_response(limit_error: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Plan execution limit exceeded", "detail": limit_error},
+    )
+
+
+def schedule_usage_increment(tenant_slug: str) -> None:
+    """Counts one execution. In memory when the tenant is cached, otherwise via a task."""
+    from services.db import db_available
+    from services.tenant_directory import get_tenant_directory
+    from services.usage_counters import get_usage_counters
+
+    if db_available():
+        cached, tenant = get_tenant_directory().lookup(tenant_slug)
+        if cached:
+            if tenant is not None:
+                get_usage_counters().add(tenant.id)
+            return
+    try:
+        loop = asyncio.get_running_loop()
+        loop.create_task(_increment_usage(tenant_slug))
+    except Exception:
+        pass
+
+
 class UsageTrackingMiddleware(BaseHTTPMiddleware):
     """Tracks agent executions per tenant per day. Enforces plan limits."""
 
     async def dispatch(self, request: Request, call_next) -> Response:
-        path = request.url.path
-        method = request.method
-
-        # Only track POST /agents/execute
-        if not (method == "POST" and path in ("/agents/execute", "/api/v1/agents/execute")):
-            return await call_next(request)
-
-        # Also match /api/v1/agents/{id}/execute
-        if method == "POST" and "/agents/" in path and path.endswith("/execute"):
-            pass  # fall through to tracking
-        elif method == "POST" and path == "/agents/execute":
-            pass  # fall through
-        else:
+        if not usage_tracked(request.method, request.url.path):
             return await call_next(request)
 
         tenant_slug = request.headers.get("x-tenant-id", "credicefi")
@@ -44,90 +65,63 @@ class UsageTrackingMiddleware(BaseHTTPMiddleware):
         # Check limit before execution
         limit_error = await _check_plan_limit(tenant_slug)
         if limit_error:
-            return JSONResponse(
-                status_code=429,
-                content={"error": "Plan execution limit exceeded", "detail": limit_error},
-            )
+            return plan_limit_response(limit_error)
 
         response = await call_next(request)
 
-        # Increment usage counter (fire-and-forget) only on success
+        # Increment usage counter only on success
         if response.status_code == 200:
-            try:
-                loop = asyncio.get_running_loop()
-                loop.create_task(_increment_usage(tenant_slug))
-            except Exception:
-                pass
+            schedule_usage_increment(tenant_slug)
 
         return response
 
 
-async def _check_plan_limit(tenant_slug: str) -> str | None:
-    """Returns error message if tenant exceeds plan limit, None if OK."""
+async def _check_plan_limit(tenant_slug: str, count: int = 1) -> str | None:
+    """Returns error message if `count` more executions exceed the plan limit, None if OK."""
     try:
-        from services.db import db_available, get_session
+        from services.db import db_available
+        from services.tenant_directory import get_tenant_directory
+        from services.usage_counters import get_usage_counters
         if not db_available():
             return None
 
-        async with get_session() as session:
-            # Get tenant plan and current month usage
-            result = await session.execute(
-                text(
-                    "SELECT t.plan, COALESCE(SUM(u.executions_count), 0) "
-                    "FROM tenants t "
-                    "LEFT JOIN usage_tracking u ON u.tenant_id = t.id "
-                    "  AND u.date >= date_trunc('month', CURRENT_DATE) "
-                    "WHERE t.slug = :slug "
-                    "GROUP BY t.plan"
-                ),
-                {"slug": tenant_slug},
+        # Plan e id desde el directorio de tenants (sin query en el hot path)
+        tenant = await get_tenant_directory().resolve(tenant_slug)
+        if tenant is None:
+            return None
+
+        plan = tenant.plan
+        max_exec = PLAN_LIMITS.get(plan)
+        if max_exec is None:
+            return None  # unlimited: no hace falta contar
+
+        # Contador en memoria (write-behind); solo va a la DB cerca del limite
+        allowed, current_usage = await get_usage_counters().check(tenant.id, max_exec, count)
+        if not allowed:
+            requested = f" Requested: {count}." if count > 1 else ""
+            return (
+                f"Plan '{plan}' allows {max_exec} executions/month. "
+                f"Current usage: {current_usage}.{requested} Upgrade your plan."
             )
-            row = result.first()
-            if not row:
-                return None
-
-            plan = row[0] or "starter"
-            current_usage = int(row[1])
-            max_exec = PLAN_LIMITS.get(plan)
-
-            if max_exec is not None and current_usage >= max_exec:
-                return (
-                    f"Plan '{plan}' allows {max_exec} executions/month. "
-                    f"Current usage: {current_usage}. Upgrade your plan."
-                )
     except Exception as e:
         logger.debug("Plan limit check failed: %s", e)
     return None
 
 
-async def _increment_usage(tenant_slug: str) -> None:
-    """Increment the daily execution counter for a tenant."""
+async def _increment_usage(tenant_slug: str, count: int = 1) -> None:
+    """Count `count` executions for a tenant; written to usage_tracking by the batched flush."""
+    if count <= 0:
+        return
     try:
-        from services.db import db_available, get_session
+        from services.db import db_available
+        from services.tenant_directory import get_tenant_directory
+        from services.usage_counters import get_usage_counters
         if not db_available():
             return
 
-        async with get_session() as session:
-            # Resolve slug
-            result = await session.execute(
-                text("SELECT id FROM tenants WHERE slug = :slug"),
-                {"slug": tenant_slug},
-            )
-            row = result.first()
-            if not row:
-                return
-            tenant_id = str(row[0])
-
-            # Upsert daily counter
-            await session.execute(
-                text(
-                    "INSERT INTO usage_tracking (tenant_id, date, executions_count) "
-                    "VALUES (:tid, CURRENT_DATE, 1) "
-                    "ON CONFLICT (tenant_id, date) "
-                    "DO UPDATE SET executions_count = usage_tracking.executions_count + 1"
-                ),
-                {"tid": tenant_id},
-            )
-            await session.commit()
+        tenant = await get_tenant_directory().resolve(tenant_slug)
+        if tenant is None:
+            return
+        get_usage_counters().add(tenant.id, count)
     except Exception as e:
         logger.debug("Usage increment failed: %s", e)
@@ -11,6 +11,8 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from sqlalchemy import text
 
+from services.tenant_directory import get_tenant_directory
+
 logger = logging.getLogger("nadakki.billing")
 
 router = APIRouter(prefix="/api/v1", tags=["billing"])
@@ -118,6 +120,7 @@ async def change_plan(tenant_id: str, body: PlanChangeRequest):
             {"plan": body.plan, "tid": tid},
         )
         await session.commit()
+        get_tenant_directory().invalidate(tid)
 
         return {
             "tenant_id": tid,
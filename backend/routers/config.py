@@ -180,3 +180,27 @@ async def system_info():
         pass
 
     return info
+
+
+@router.get("/db/audit-writer")
+def db_audit_writer():
+    """Batched audit writer metrics: queue depth, written, dropped/sampled events."""
+    from backend.middleware.audit import get_audit_writer
+
+    return get_audit_writer().stats()
+
+
+@router.get("/db/tenant-cache")
+def db_tenant_cache():
+    """Tenant directory cache metrics: entries, hits, negative hits, queries."""
+    from services.tenant_directory import get_tenant_directory
+
+    return get_tenant_directory().stats()
+
+
+@router.get("/db/usage-counters")
+def db_usage_counters():
+    """Write-behind usage counters: pending executions, flushes, near-limit syncs."""
+    from services.usage_counters import get_usage_counters
+
+    return get_usage_counters().stats()
@@ -11,6 +11,8 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from sqlalchemy import text
 
+from services.tenant_directory import TenantRecord, get_tenant_directory
+
 logger = logging.getLogger("nadakki.tenant_router")
 
 router = APIRouter(prefix="/api/v1", tags=["tenants"])
@@ -256,6 +258,9 @@ async def onboard_tenant(body: OnboardRequest):
         )
 
         await session.commit()
+        # Reemplaza una posible entrada negativa del slug nuevo
+        get_tenant_directory().invalidate(slug)
+        get_tenant_directory().put(TenantRecord(tenant_id, slug, body.plan or "starter"))
 
         return {
             "tenant_id": tenant_id,
@@ -2,12 +2,20 @@
 Usage tracking router.
 GET /api/v1/tenants/{tenant_id}/usage        — current month summary
 GET /api/v1/tenants/{tenant_id}/usage/recent — last 10 agent executions
+GET /api/v1/tenants/{tenant_id}/usage/timeseries — requests/errors/tokens per hour, day or month
 
-{tenant_id} accepts both slug and UUID.
+{tenant_id} accepts both slug and UUID. The time series is served from the
+UsageTracker rollups (USAGE_DB_PATH), keyed by tenant UUID: the id is
+normalised through the tenant directory (in-memory cache, preloaded at
+startup) and an unknown tenant is a 404. Without a database the id is used
+as given.
 """
 
+import asyncio
 import logging
 import re
+from datetime import datetime
+from typing import Optional
 
 from fastapi import APIRouter, HTTPException
 from sqlalchemy import text
@@ -50,6 +58,18 @@ async def _resolve_tenant(session, tenant_id: str):
     return str(row[0]), row[1] or "starter"
 
 
+async def _normalise_tenant_id(tenant_id: str) -> str:
+    """Slug or UUID -> UUID via the tenant directory (as given without a database)."""
+    from services.db import db_available
+    from services.tenant_directory import get_tenant_directory
+    if not db_available():
+        return tenant_id
+    record = await get_tenant_directory().resolve(tenant_id)
+    if record is None:
+        raise HTTPException(404, {"error": f"Tenant '{tenant_id}' not found"})
+    return record.id
+
+
 @router.get("/tenants/{tenant_id}/usage")
 async def get_tenant_usage(tenant_id: str):
     """Return current month usage for a tenant."""
@@ -126,3 +146,25 @@ async def get_recent_executions(tenant_id: str):
             for r in result.fetchall()
         ]
         return {"tenant_id": tid, "recent_executions": rows, "total": len(rows)}
+
+
+@router.get("/tenants/{tenant_id}/usage/timeseries")
+async def get_usage_timeseries(
+    tenant_id: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    agent: Optional[str] = None,
+    by_agent: bool = False,
+):
+    """Usage per period in [start, end), read from the coarsest rollup that fits."""
+    from services.usage_tracker import GRANULARITIES, get_usage_tracker
+
+    if granularity not in GRANULARITIES:
+        raise HTTPException(400, {"error": f"granularity must be one of {sorted(GRANULARITIES)}"})
+    tenant_id = await _normalise_tenant_id(tenant_id)
+    # El primer get_usage_tracker() abre la DB y crea el esquema: tampoco en el loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, lambda: get_usage_tracker().get_timeseries(tenant_id, start, end, granularity, agent, by_agent)
+    )
@@ -1,6 +1,11 @@
 ﻿"""
 Sistema de Billing y Rate Limiting Enterprise
 Manejo automático de facturación, límites de uso y alertas por tenant
+
+Las evaluaciones se cuentan en core.evaluation_ledger (contadores en memoria
++ log append-only con checkpoints a SQLite); las lecturas de tenant_usage
+esperan el checkpoint de lo registrado antes (TimeoutError si no llega:
+mejor fallar que facturar con tenant_usage atrasado).
 """
 
 import json
@@ -12,6 +17,8 @@ import threading
 from dataclasses import dataclass
 from enum import Enum
 
+from core.evaluation_ledger import EvaluationLedger
+
 class PlanType(Enum):
     STARTER = "starter"
     PROFESSIONAL = "professional"  
@@ -53,8 +60,13 @@ class BillingManager:
                 support_level="dedicated"
             )
         }
-        self.lock = threading.Lock()
         self._init_database()
+        self.ledger = EvaluationLedger(db_path)
+
+    def _flush_ledger(self, timeout: float = 10.0):
+        """Espera el checkpoint de lo registrado; tenant_usage queda al día o falla"""
+        if not self.ledger.flush(timeout):
+            raise TimeoutError(f"Billing ledger: checkpoint pendiente tras {timeout}s, tenant_usage no está al día")
     
     def _init_database(self):
         """Inicializa base de datos de billing"""
@@ -86,72 +98,32 @@ class BillingManager:
             conn.commit()
     
     def track_evaluation(self, tenant_id: str, tenant_config: dict = None) -> Dict:
-        """Registra una evaluación y verifica límites"""
-        with self.lock:
-            current_month = datetime.now().strftime('%Y-%m')
-            
-            # Obtener configuración del plan
-            plan_type = self._get_tenant_plan(tenant_id, tenant_config)
-            plan_config = self.plans[plan_type]
-            
-            with sqlite3.connect(self.db_path) as conn:
-                # Obtener o crear registro de uso mensual
-                cursor = conn.execute('''
-                    SELECT evaluations_count, overage_count 
-                    FROM tenant_usage 
-                    WHERE tenant_id = ? AND year_month = ?
-                ''', (tenant_id, current_month))
-                
-                row = cursor.fetchone()
-                
-                if row:
-                    current_count, overage_count = row
-                    new_count = current_count + 1
-                    new_overage = max(0, new_count - plan_config.monthly_evaluations)
-                    
-                    conn.execute('''
-                        UPDATE tenant_usage 
-                        SET evaluations_count = ?, overage_count = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE tenant_id = ? AND year_month = ?
-                    ''', (new_count, new_overage, tenant_id, current_month))
-                else:
-                    new_count = 1
-                    new_overage = max(0, new_count - plan_config.monthly_evaluations)
-                    
-                    conn.execute('''
-                        INSERT INTO tenant_usage 
-                        (tenant_id, year_month, evaluations_count, plan_type, monthly_limit, overage_count)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (tenant_id, current_month, new_count, plan_type.value, 
-                         plan_config.monthly_evaluations, new_overage))
-                
-                # Registrar evento
-                event_data = json.dumps({
-                    'evaluations_count': new_count,
-                    'monthly_limit': plan_config.monthly_evaluations,
-                    'overage_count': new_overage,
-                    'plan_type': plan_type.value
-                })
-                
-                conn.execute('''
-                    INSERT INTO billing_events (tenant_id, event_type, event_data)
-                    VALUES (?, ?, ?)
-                ''', (tenant_id, 'evaluation_tracked', event_data))
-                
-                conn.commit()
-                
-                # Verificar límites y generar alertas
-                usage_status = self._check_usage_limits(tenant_id, new_count, plan_config)
-                
-                return {
-                    'allowed': usage_status['allowed'],
-                    'current_usage': new_count,
-                    'monthly_limit': plan_config.monthly_evaluations,
-                    'overage_count': new_overage,
-                    'plan_type': plan_type.value,
-                    'warnings': usage_status.get('warnings', []),
-                    'actions': usage_status.get('actions', [])
-                }
+        """Registra una evaluación y verifica límites (sin locks ni I/O: la escribe el ledger)"""
+        current_month = datetime.now().strftime('%Y-%m')
+        
+        # Obtener configuración del plan
+        plan_type = self._get_tenant_plan(tenant_id, tenant_config)
+        plan_config = self.plans[plan_type]
+        
+        new_count = self.ledger.next_count(tenant_id, current_month)
+        new_overage = max(0, new_count - plan_config.monthly_evaluations)
+        
+        # Registrar evento (tenant_usage y billing_events se actualizan en el checkpoint)
+        self.ledger.append(tenant_id, current_month, new_count, plan_type.value,
+                           plan_config.monthly_evaluations, new_overage)
+        
+        # Verificar límites y generar alertas
+        usage_status = self._check_usage_limits(tenant_id, new_count, plan_config)
+        
+        return {
+            'allowed': usage_status['allowed'],
+            'current_usage': new_count,
+            'monthly_limit': plan_config.monthly_evaluations,
+            'overage_count': new_overage,
+            'plan_type': plan_type.value,
+            'warnings': usage_status.get('warnings', []),
+            'actions': usage_status.get('actions', [])
+        }
     
     def _get_tenant_plan(self, tenant_id: str, tenant_config: dict = None) -> PlanType:
         """Obtiene el plan del tenant desde configuración"""
@@ -204,6 +176,7 @@ class BillingManager:
     def get_tenant_usage_summary(self, tenant_id: str) -> Dict:
         """Obtiene resumen de uso del tenant"""
         current_month = datetime.now().strftime('%Y-%m')
+        self._flush_ledger()
         
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute('''
@@ -244,6 +217,7 @@ class BillingManager:
         """Genera factura mensual para un tenant"""
         if not year_month:
             year_month = datetime.now().strftime('%Y-%m')
+        self._flush_ledger()
         
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute('''
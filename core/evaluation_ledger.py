@@ -0,0 +1,482 @@
+"""
+Evaluation Ledger - registro append-only de evaluaciones para BillingManager
+
+track_evaluation ya no toma un lock global ni abre SQLite por evaluación:
+- el conteo del mes sale de un contador por tenant/mes (itertools.count:
+  next() es atómico bajo el GIL, sin lock en el camino caliente);
+- el evento se agrega a una deque (append atómico);
+- un thread escritor vuelca la deque al log del proceso (<generación>.log,
+  una línea JSON por evento) y cada BILLING_CHECKPOINT_EVENTS eventos o
+  BILLING_CHECKPOINT_MS aplica ese tramo del log a tenant_usage (sumando
+  cuántas evaluaciones hubo por tenant/mes) y billing_events en una
+  transacción, junto con la posición (generación, offset) hasta donde
+  quedó aplicado.
+
+Varios procesos (workers de uvicorn) pueden escribir el mismo billing.db:
+cada uno toma en su primer track un slot libre del ledger (<db>-ledger/
+para el slot 0, <db>-ledger/slot-N/ para los demás) con un lock exclusivo
+de su archivo LOCK, y solo escribe, reaplica y borra los logs de ese slot.
+Como el checkpoint suma deltas, los totales de tenant_usage son exactos
+con cualquier número de procesos. El conteo que devuelve track_evaluation
+suma lo propio a lo que los demás procesos habían aplicado en el último
+checkpoint, así que entre procesos puede atrasarse hasta un checkpoint
+(BILLING_CHECKPOINT_MS); dentro de un proceso es exacto.
+
+Al tomar el slot, recover() reaplica la cola de su log posterior al
+checkpoint; como la posición se guarda en la misma transacción, cada evento
+se aplica una sola vez. Los slots se toman del menor libre, así que el
+proceso que reemplaza a uno caído retoma su slot y su cola. Lo que seguía
+en la deque al morir el proceso se pierde: BILLING_LEDGER_FLUSH_MS acota
+esa ventana (BILLING_LEDGER_FSYNC=1 además hace fsync de cada escritura del
+log). Las lecturas (flush de un ledger que nunca contó) no toman slot ni
+tocan logs. close() suelta el slot.
+
+Env:
+    BILLING_LEDGER_FLUSH_MS     50     espera máxima antes de escribir el log
+    BILLING_CHECKPOINT_EVENTS   1000   eventos por checkpoint
+    BILLING_CHECKPOINT_MS       1000   espera máxima antes de un checkpoint
+    BILLING_LEDGER_ROTATE_MB    64     tamaño del log antes de abrir otra generación
+    BILLING_LEDGER_FSYNC        0
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.env import env_int
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("nadakki.evaluation_ledger")
+
+
+def _try_lock(file) -> None:
+    """Lock exclusivo sin esperar (OSError si lo tiene otro); se suelta al cerrar el archivo"""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _event_data(event: Dict) -> str:
+    """event_data de billing_events (mismo JSON que escribía track_evaluation)"""
+    return json.dumps({
+        'evaluations_count': event["n"],
+        'monthly_limit': event["l"],
+        'overage_count': event["o"],
+        'plan_type': event["p"]
+    })
+
+
+class EvaluationLedger:
+    """Contadores por tenant/mes + log append-only con checkpoints a SQLite"""
+
+    def __init__(
+        self,
+        db_path: str,
+        log_dir: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        checkpoint_events: Optional[int] = None,
+        checkpoint_interval: Optional[float] = None,
+        rotate_bytes: Optional[int] = None,
+        fsync: Optional[bool] = None,
+    ):
+        self.db_path = db_path
+        self.log_dir = Path(log_dir or f"{db_path}-ledger")
+        self.flush_interval = flush_interval if flush_interval is not None else env_int("BILLING_LEDGER_FLUSH_MS", 50) / 1000
+        self.checkpoint_events = checkpoint_events or env_int("BILLING_CHECKPOINT_EVENTS", 1000)
+        self.checkpoint_interval = (
+            checkpoint_interval if checkpoint_interval is not None else env_int("BILLING_CHECKPOINT_MS", 1000) / 1000
+        )
+        self.rotate_bytes = rotate_bytes or env_int("BILLING_LEDGER_ROTATE_MB", 64) * 1024 * 1024
+        self.fsync = fsync if fsync is not None else os.environ.get("BILLING_LEDGER_FSYNC", "0") == "1"
+
+        # Camino caliente: sin locks. conteo = _others[key] + next(_counters[key])
+        self._counters: Dict[Tuple[str, str], "itertools.count"] = {}
+        self._others: Dict[Tuple[str, str], int] = {}  # aplicado en SQLite por otros procesos
+        self._buffer: deque = deque()
+
+        # Solo el escritor (o un flush sin thread) toca lo de abajo
+        self._drain_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._log = None
+        self._generation = 0
+        self._unapplied: List[Dict] = []
+        self._applied: Dict[Tuple[str, str], int] = {}  # propio ya aplicado, por tenant/mes
+        self._last_checkpoint = time.monotonic()
+
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        # Slot del ledger: solo quien tiene su lock escribe, reaplica y borra sus logs
+        self.slot: Optional[int] = None
+        self._slot_dir = self.log_dir
+        self._lock_file = None
+        self._writer = False  # slot tomado y cola de su log ya reaplicada
+
+        # Métricas
+        self.checkpoints = 0
+        self.checkpointed = 0
+        self.replayed = 0
+
+    def _open(self) -> None:
+        """Toma el menor slot libre y reaplica la cola de su log (primer track)"""
+        with self._start_lock:
+            if self._writer:
+                return
+            slot = 0
+            while True:
+                slot_dir = self.log_dir if slot == 0 else self.log_dir / f"slot-{slot}"
+                slot_dir.mkdir(parents=True, exist_ok=True)
+                lock_file = open(slot_dir / "LOCK", "a+b")
+                try:
+                    _try_lock(lock_file)
+                    break
+                except OSError:
+                    lock_file.close()  # lo usa otro proceso (u otra instancia)
+                    slot += 1
+            self.slot, self._slot_dir, self._lock_file = slot, slot_dir, lock_file
+            try:
+                self.recover()
+            except Exception:
+                self._release()
+                raise
+            self._writer = True
+
+    def _release(self) -> None:
+        self._writer = False
+        self.slot = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # -- camino caliente -------------------------------------------------------
+
+    def next_count(self, tenant_id: str, year_month: str) -> int:
+        """Conteo del tenant en el mes incluyendo esta evaluación"""
+        if not self._writer:
+            self._open()
+        key = (tenant_id, year_month)
+        counter = self._counters.get(key)
+        if counter is None:
+            # _others antes que el contador: quien ve el contador ve la base.
+            # Si dos threads siembran a la vez, setdefault deja un solo contador
+            self._others[key] = self._stored_count(key)
+            counter = self._counters.setdefault(key, itertools.count(1))
+        return self._others[key] + next(counter)
+
+    def append(self, tenant_id: str, year_month: str, count: int, plan_type: str,
+               monthly_limit: int, overage_count: int) -> None:
+        if not self._writer:
+            self._open()
+        self._buffer.append({
+            "t": tenant_id, "m": year_month, "n": count, "p": plan_type,
+            "l": monthly_limit, "o": overage_count,
+            # Mismo formato que CURRENT_TIMESTAMP de SQLite
+            "ts": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """Espera a que todo lo agregado antes de la llamada esté en SQLite"""
+        if not self._writer:
+            return True  # este proceso no contó nada: no hay nada suyo pendiente
+        if self._thread is None or not self._thread.is_alive():
+            self._drain(force_checkpoint=True)
+            return True
+        marker = threading.Event()
+        self._buffer.append(marker)
+        self._wake.set()
+        return marker.wait(timeout)
+
+    # -- escritor --------------------------------------------------------------
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="billing-ledger", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._drain()
+            except Exception as exc:
+                # Los eventos siguen en _unapplied (o en la deque): se reintenta en la próxima vuelta
+                logger.warning("Billing ledger: escritura fallida: %s", exc)
+                time.sleep(self.flush_interval)
+        self._drain(force_checkpoint=True)
+
+    def _drain(self, force_checkpoint: bool = False) -> None:
+        with self._drain_lock:
+            events, markers = [], []
+            buffer = self._buffer
+            while True:
+                try:
+                    item = buffer.popleft()
+                except IndexError:
+                    break
+                (markers if isinstance(item, threading.Event) else events).append(item)
+            try:
+                if events:
+                    self._write_log(events)
+                due = (
+                    force_checkpoint or markers
+                    or len(self._unapplied) >= self.checkpoint_events
+                    or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+                )
+                if self._unapplied and due:
+                    self._checkpoint()
+            except Exception:
+                # Los flush() pendientes esperan al próximo intento
+                buffer.extend(markers)
+                raise
+            for marker in markers:
+                marker.set()
+
+    def _log_path(self, generation: int) -> Path:
+        return self._slot_dir / f"{generation:08d}.log"
+
+    def _write_log(self, events: List[Dict]) -> None:
+        data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode()
+        try:
+            self._log.write(data)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+        except Exception:
+            # Lo que no llegó al log vuelve al frente de la deque
+            self._buffer.extendleft(reversed(events))
+            raise
+        self._unapplied.extend(events)
+
+    def _checkpoint(self) -> None:
+        events = self._unapplied
+        conn = self._db()
+        try:
+            totals = self._apply(conn, events)
+            self._save_position(conn, self._generation, self._log.tell())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._refresh_others(events, totals)
+        self._unapplied = []
+        self._last_checkpoint = time.monotonic()
+        self.checkpoints += 1
+        self.checkpointed += len(events)
+        if self._log.tell() >= self.rotate_bytes:
+            self._rotate()
+
+    def _refresh_others(self, events: List[Dict], totals: Dict[Tuple[str, str], int]) -> None:
+        """Con el total recién aplicado, actualiza lo contado por los demás procesos"""
+        for event in events:
+            key = (event["t"], event["m"])
+            if key in self._counters:
+                self._applied[key] = self._applied.get(key, 0) + 1
+        for key, total in totals.items():
+            if key in self._counters:
+                # Solo crece: un conteo devuelto nunca se repite dentro del proceso
+                self._others[key] = max(self._others.get(key, 0), total - self._applied.get(key, 0))
+
+    def _rotate(self) -> None:
+        """Abre la generación siguiente; la anterior ya está aplicada entera"""
+        previous = self._generation
+        self._log.close()
+        self._generation += 1
+        self._log = open(self._log_path(self._generation), "ab")
+        conn = self._db()
+        self._save_position(conn, self._generation, 0)
+        conn.commit()
+        self._log_path(previous).unlink()
+
+    # -- SQLite ----------------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ledger_slots (
+                    slot INTEGER PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    log_offset INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Posición del ledger de un solo proceso (ledger_checkpoint): es la del slot 0
+            if conn.execute("SELECT name FROM sqlite_master WHERE name = 'ledger_checkpoint'").fetchone():
+                conn.execute('''
+                    INSERT OR IGNORE INTO ledger_slots (slot, generation, log_offset)
+                    SELECT 0, generation, log_offset FROM ledger_checkpoint WHERE id = 1
+                ''')
+                conn.execute("DROP TABLE ledger_checkpoint")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _save_position(self, conn: sqlite3.Connection, generation: int, offset: int) -> None:
+        conn.execute('''
+            INSERT INTO ledger_slots (slot, generation, log_offset) VALUES (?, ?, ?)
+            ON CONFLICT (slot) DO UPDATE SET
+                generation = excluded.generation, log_offset = excluded.log_offset,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (self.slot, generation, offset))
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, events: List[Dict]) -> Dict[Tuple[str, str], int]:
+        """
+        Aplica los eventos a tenant_usage/billing_events (sin commit). Suma
+        deltas: otros procesos aplican sus propios eventos al mismo tenant/mes.
+        Devuelve el total de cada tenant/mes tocado.
+        """
+        # Por tenant/mes: el primer evento crea la fila (plan y límite), el último da el límite del overage
+        deltas: Dict[Tuple[str, str], List] = {}
+        for event in events:
+            key = (event["t"], event["m"])
+            entry = deltas.get(key)
+            if entry is None:
+                deltas[key] = [event, event, 1]
+            else:
+                entry[1] = event
+                entry[2] += 1
+
+        conn.executemany('''
+            INSERT INTO tenant_usage
+            (tenant_id, year_month, evaluations_count, plan_type, monthly_limit, overage_count)
+            VALUES (?, ?, ?, ?, ?, MAX(0, ? - ?))
+            ON CONFLICT (tenant_id, year_month) DO UPDATE SET
+                evaluations_count = evaluations_count + excluded.evaluations_count,
+                overage_count = MAX(0, evaluations_count + excluded.evaluations_count - ?),
+                updated_at = CURRENT_TIMESTAMP
+        ''', [
+            (first["t"], first["m"], n, first["p"], first["l"], n, last["l"], last["l"])
+            for first, last, n in deltas.values()
+        ])
+        conn.executemany('''
+            INSERT INTO billing_events (tenant_id, event_type, event_data, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', [(event["t"], 'evaluation_tracked', _event_data(event), event["ts"]) for event in events])
+        return {
+            key: conn.execute('''
+                SELECT evaluations_count FROM tenant_usage WHERE tenant_id = ? AND year_month = ?
+            ''', key).fetchone()[0]
+            for key in deltas
+        }
+
+    def _stored_count(self, key: Tuple[str, str]) -> int:
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            row = conn.execute('''
+                SELECT evaluations_count FROM tenant_usage WHERE tenant_id = ? AND year_month = ?
+            ''', key).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    # -- recuperación ----------------------------------------------------------
+
+    def recover(self) -> int:
+        """
+        Reaplica la cola del log del slot posterior a su checkpoint y abre una
+        generación nueva. Devuelve cuántos eventos se reaplicaron. Requiere el
+        lock del slot: sin él los logs pueden ser de un escritor vivo.
+        """
+        if self._lock_file is None:
+            raise RuntimeError(f"recover() sin el lock de un slot de {self.log_dir}")
+        with self._drain_lock:
+            conn = self._db()
+            row = conn.execute(
+                "SELECT generation, log_offset FROM ledger_slots WHERE slot = ?", (self.slot,)
+            ).fetchone()
+            generation, offset = row if row else (0, 0)
+
+            logs = sorted(
+                int(path.stem) for path in self._slot_dir.glob("*.log") if path.stem.isdigit()
+            )
+            events: List[Dict] = []
+            for gen in (g for g in logs if g >= generation):
+                data = self._log_path(gen).read_bytes()
+                start = offset if gen == generation else 0
+                # Una línea sin '\n' al final es una escritura cortada: se descarta
+                end = data.rfind(b"\n") + 1
+                for line in data[start:end].splitlines():
+                    if line.strip():
+                        events.append(json.loads(line))
+
+            self._generation = max(logs + [generation]) + 1
+            try:
+                if events:
+                    self._apply(conn, events)
+                self._save_position(conn, self._generation, 0)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            # Solo los logs del slot leídos arriba (o ya cubiertos por su checkpoint);
+            # con su lock tomado ningún otro proceso puede estar escribiéndolos
+            for gen in logs:
+                self._log_path(gen).unlink()
+            if self._log is not None:
+                self._log.close()
+            self._log = open(self._log_path(self._generation), "ab")
+            self._unapplied = []
+            # Los contadores se siembran desde tenant_usage en el primer next_count de cada tenant/mes
+            self._counters, self._others, self._applied = {}, {}, {}
+        if events:
+            logger.info("Billing ledger: %d eventos reaplicados desde el log", len(events))
+        self.replayed += len(events)
+        return len(events)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Escribe y aplica lo pendiente y suelta el slot (shutdown / atexit)"""
+        atexit.unregister(self.close)
+        if not self._writer:
+            return
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._stopping = True
+            self._wake.set()
+            thread.join(timeout)
+        self._drain(force_checkpoint=True)
+        if thread is None or not thread.is_alive():
+            with self._drain_lock:
+                self._release()
+
+    def stats(self) -> Dict:
+        return {
+            "buffered": len(self._buffer),
+            "unapplied": len(self._unapplied),
+            "checkpoints": self.checkpoints,
+            "checkpointed": self.checkpointed,
+            "replayed": self.replayed,
+            "generation": self._generation,
+            "tenant_months": len(self._counters),
+            "writer": self._writer,
+            "slot": self.slot,
+        }
@@ -27,15 +27,16 @@ v5.4.4 OPTIMIZACIONES:
 """
 
 from fastapi import FastAPI, Header, Query, Path as PathParam
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import asyncio
 import os
 import ast
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple, Set
 from datetime import datetime
 from functools import lru_cache
-import re
 import time as _time_mod
 from dotenv import load_dotenv
 
@@ -55,12 +56,44 @@ from routers.social_status_router import router as social_status_router
 from routers.auth.meta_oauth import router as meta_oauth_router
 from routers.auth.google_oauth import router as google_oauth_router
 from routers.agent_execution_router import router as agent_execution_router
+from routers.agent_jobs_router import router as agent_jobs_router
 from routers.audit_router import router as audit_router
 from backend.routers.tenant_router import router as tenant_router
 from backend.routers.api_keys_router import router as api_keys_router
 from backend.routers.usage_router import router as usage_router
 from backend.routers.billing_router import router as billing_router
 from services.db import init_db, db_ping
+from services.discovery_index import DiscoveryIndex, default_index_path, index_enabled
+from services.agent_discovery import (
+    FOLDER_BLACKLIST,
+    NON_AGENT_KEYWORDS,
+    SIGNAL_GROUPS,
+    ANTI_SIGNALS,
+    LABEL_ORDER,
+    LABEL_MIN_MAP,
+    IntelligentAgentDetector,
+    PlatformDetector,
+    safe_unparse,
+    detect_module_context,
+    should_ignore_path,
+    score_agent_class_v2_enhanced,
+    determine_real_status,
+    scan_agent_file,
+    run_discovery,
+    empty_stats,
+    scanner_fingerprint,
+    discovery_workers,
+)
+from services.agent_catalog import (
+    CatalogResponseCache,
+    CachedResponse,
+    CatalogSnapshot,
+    current_catalog,
+    etag_matches,
+    on_catalog_change,
+    publish_catalog,
+)
+from services.catalog_refresher import get_refresher, reload_interval
 
 # =============================================================================
 # APP CONFIGURACIÓN
@@ -91,15 +124,10 @@ app.add_middleware(
 )
 
 # ✅ MIDDLEWARE: RLS tenant context + Audit logging + Rate limit + Usage tracking
-from backend.db.rls import RLSMiddleware
-from backend.middleware.audit import AuditMiddleware
-from backend.middleware.rate_limit import GlobalRateLimitMiddleware
-from backend.middleware.usage import UsageTrackingMiddleware
+# Pure ASGI; MIDDLEWARE_MODE=combined (una sola capa) | asgi | legacy (BaseHTTPMiddleware)
+from backend.middleware.asgi import install_middleware
 
-app.add_middleware(RLSMiddleware)
-app.add_middleware(AuditMiddleware)
-app.add_middleware(GlobalRateLimitMiddleware)
-app.add_middleware(UsageTrackingMiddleware)
+install_middleware(app)
 
 # ✅ INCLUIR MARKETING ROUTER
 if marketing_router:
@@ -110,6 +138,7 @@ app.include_router(social_status_router)
 app.include_router(meta_oauth_router)
 app.include_router(google_oauth_router)
 app.include_router(agent_execution_router)
+app.include_router(agent_jobs_router)
 app.include_router(audit_router)
 app.include_router(tenant_router)
 app.include_router(api_keys_router)
@@ -137,693 +166,195 @@ async def _startup_db_setup():
 
 
 # =============================================================================
-# CONFIGURACIÓN ROBUSTA
+# DESCUBRIMIENTO
 # =============================================================================
 
-FOLDER_BLACKLIST: Set[str] = {
-    "__pycache__", ".git", ".venv", "venv", "node_modules",
-    "backup", "legacy", "tests", "testing", "test"
-}
-
-NON_AGENT_KEYWORDS: Set[str] = {
-    "test_", "_test", "mock_", "fake_", "dummy_", "example_", "demo_",
-    "base_", "abstract_", "mixin_", "interface_"
-}
-
-def safe_unparse(node) -> str:
-    """Compatible Python 3.8+"""
-    try:
-        if hasattr(ast, "unparse"):
-            return ast.unparse(node)
-    except Exception:
-        pass
-    return getattr(node, "id", "") or getattr(node, "attr", "") or node.__class__.__name__
-
-def detect_module_context(filepath: str) -> str:
-    """Detecta módulo real"""
-    p = (filepath or "").replace("\\", "/").lower()
-    parts = [x for x in p.split("/") if x]
-
-    if "agents" in parts:
-        idx = parts.index("agents")
-        if idx + 1 < len(parts):
-            return parts[idx + 1]
-
-    for seg in parts:
-        if seg not in ("src", "app", "backend", "services", "api"):
-            return seg
-    return ""
-
-def should_ignore_path(rel_path: str) -> bool:
-    """Ignora por RUTA"""
-    p = rel_path.replace("\\", "/").lower()
-    parts = p.split("/")
-
-    for part in parts:
-        if part in FOLDER_BLACKLIST:
-            return True
-
-    filename = parts[-1] if parts else ""
+def find_agents_folder() -> Optional[Path]:
+    """Busca agents/"""
+    search_paths = [
+        Path(__file__).parent / "agents",
+        Path.cwd() / "agents",
+        Path.cwd().parent / "agents"
+    ]
+    for path in search_paths:
+        if path.exists() and path.is_dir():
+            return path
+    return None
 
-    if any(kw in filename for kw in NON_AGENT_KEYWORDS):
-        if ("agent" in filename) or ("ia" in filename):
-            return False
-        return filename.endswith("_test.py") or filename.startswith("test_")
+@lru_cache(maxsize=1)
+def intelligent_discovery() -> Tuple[Dict[str, dict], Dict[str, Any]]:
+    """Descubrimiento inteligente (incremental vía índice en disco)"""
 
-    return False
+    agents_path = find_agents_folder()
+    if not agents_path:
+        print("❌ No se encontró carpeta 'agents/'")
+        return {}, empty_stats()
 
-# =============================================================================
-# DETECTOR INTELIGENTE
-# =============================================================================
+    print(f"📂 agents/ encontrado: {agents_path}")
+    print("🔍 Escaneando (v5.4.4 - scoring optimizado)...\n")
 
-class IntelligentAgentDetector:
-    """Detector adaptable"""
-    
-    ACTION_METHODS = {
-        "execute", "run", "process", "handle", "create",
-        "generate", "optimize", "manage", "analyze", "predict",
-        "invoke", "call", "start", "begin"
-    }
+    index = None
+    if index_enabled():
+        index = DiscoveryIndex(default_index_path(), scanner_fingerprint()).load()
 
-    AGENT_CLASS_KEYWORDS = {
-        "agent", "ia", "manager", "strategist", "generator",
-        "optimizer", "creator", "analyzer", "predictor", "assistant", 
-        "runner", "handler", "processor", "orchestrator"
-    }
+    workers = discovery_workers()
+    agents, stats = run_discovery(agents_path, index, workers=workers)
 
-    NON_CONCRETE_KEYWORDS = {
-        "base", "abstract", "test", "mock", "fake", "dummy", 
-        "example", "demo", "placeholder", "mixin", "interface"
-    }
+    print(f"\n{'='*120}")
+    print("📊 DESCUBRIMIENTO COMPLETADO v5.4.4")
+    if index is not None:
+        report = stats["discovery"]["index"]
+        print(f"🗂️  Índice: {report['hits']} hits | {report['rescanned']} re-escaneados | {report['removed']} eliminados")
+    if workers > 1:
+        print(f"⚡ Modo paralelo: {workers} procesos")
+    print(f"{'='*120}\n")
 
-    @staticmethod
-    def has_substantial_body(method_node) -> bool:
-        """Verifica lógica real"""
-        if not hasattr(method_node, "body"):
-            return False
-        body = method_node.body
-        if not body:
-            return False
-
-        if len(body) == 1:
-            first = body[0]
-            if isinstance(first, ast.Pass):
-                return False
-            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and first.value.value is Ellipsis:
-                return False
-            if isinstance(first, ast.Raise):
-                exc = first.exc
-                if isinstance(exc, ast.Call):
-                    func_name = getattr(exc.func, "id", "") or getattr(exc.func, "attr", "")
-                    if "notimplementederror" in (func_name or "").lower():
-                        return False
-        return True
-
-    @staticmethod
-    def detect_agent_type(node: ast.ClassDef, content: str) -> str:
-        """Detecta tipo: IA vs Agent"""
-        n = node.name.lower()
-        c = (content or "").lower()
-        if any(x in c for x in ("openai", "anthropic", "claude", "gpt", "llm", "embedding")):
-            return "IA"
-        if any(x in n for x in ("ia", "ai", "intelligence")):
-            return "IA"
-        return "Agent"
-
-    @staticmethod
-    def detect_api_version(content: str, imports: List[str]) -> str:
-        """
-        🔧 FIX 2: Detecta API version mejorado
-        Busca en imports + contenido
-        """
-        c = content.lower()
-        
-        # Por imports
-        if "openai" in imports:
-            if "openai.OpenAI" in content or "from openai import" in content:
-                return "openai_v1"
-            elif "openai.Completion" in content:
-                return "openai_v0"
-        
-        if "anthropic" in imports:
-            if "anthropic.Anthropic" in content or "from anthropic import" in content:
-                return "anthropic_v1"
-        
-        if "cohere" in imports:
-            return "cohere"
-        
-        if "together" in imports:
-            return "together"
-        
-        if "langchain" in imports:
-            return "langchain"
-        
-        if "llamaindex" in imports:
-            return "llamaindex"
-        
-        # Por contenido (fallback)
-        if "openai" in c:
-            if "openai.OpenAI(" in c:
-                return "openai_v1"
-            elif "openai.Completion" in c:
-                return "openai_v0"
-        
-        if "anthropic" in c:
-            return "anthropic_v1"
-        
-        if "cohere" in c:
-            return "cohere"
-        
-        return "unknown"
-
-    @staticmethod
-    def extract_imports(tree: ast.AST) -> List[str]:
-        """Extrae imports"""
-        imports = []
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    imports.append(alias.name.split(".")[0])
-            elif isinstance(node, ast.ImportFrom):
-                if node.module:
-                    imports.append(node.module.split(".")[0])
-        
-        return sorted(list(set(imports)))
-
-    @staticmethod
-    def count_llm_calls(content: str) -> int:
-        """Cuenta llamadas a LLMs"""
-        count = 0
-        llm_patterns = [
-            r"openai\.",
-            r"anthropic\.",
-            r"cohere\.",
-            r"together\.",
-            r"\.create\(",
-            r"\.generate\(",
-            r"ChatCompletion",
-            r"Message\.create",
-        ]
-        
-        for pattern in llm_patterns:
-            count += len(re.findall(pattern, content, re.IGNORECASE))
-        
-        return count
+    return agents, stats
 
 # =============================================================================
-# SIGNAL GROUPS Y ANTI-SIGNALS
+# INICIALIZACIÓN
 # =============================================================================
 
-SIGNAL_GROUPS = {
-    "llm": ["openai", "chatcompletion", "anthropic", "claude", "gpt", "embedding", "llm"],
-    "http": ["requests.", "httpx.", "aiohttp", "api_key", "client."],
-    "framework": ["fastapi", "pydantic", "langchain", "llamaindex", "crewai"],
-    "marketing_ads": ["adwords", "google ads", "campaign", "ad group", "search terms", "rsa", "roas", "ctr"],
-    "orchestration": ["orchestrat", "workflow", "pipeline"]
-}
-
-ANTI_SIGNALS = [
-    ("google_analytics", ["google analytics", "ga4", "gtag", "measurement id"], 1.2),
-    ("pure_utils", ["argparse", "click.command", "typer.", "def main("], 1.0),
-    ("models_only", ["basemodel", "pydantic.basemodel", "class config"], 0.8),
-]
+print("\n" + "="*120)
+print("🚀 NADAKKI v5.4.4 - OPTIMIZADO (Scoring mejorado + API version fix + Marketing Stats)")
+print("="*120)
 
-LABEL_ORDER = ["not_agent", "agent_possible", "agent_likely", "agent_highly_likely", "agent_confirmed"]
-LABEL_MIN_MAP = {k: i for i, k in enumerate(LABEL_ORDER)}
+ALL_AGENTS, DISCOVERY_STATS = intelligent_discovery()
+CATALOG = publish_catalog(ALL_AGENTS, DISCOVERY_STATS)
+CATALOG_ENGINE = CATALOG.engine
+CATALOG_RESPONSES = CatalogResponseCache()
 
-# =============================================================================
-# 🔧 FIX 1: SCORING OPTIMIZADO (menos conservador)
-# =============================================================================
 
-def score_agent_class_v2_enhanced(
-    node: ast.ClassDef,
-    filename: str,
-    content: str,
-    tree: ast.AST,
-    filepath: str = ""
-) -> Dict[str, Any]:
-    """Scoring optimizado con thresholds mejorados"""
-    
-    class_name = (node.name or "").lower()
-    filename_lower = (filename or "").lower()
-    content_lower = (content or "").lower()
-
-    reasons: List[str] = []
-    score = 0.0
-    metadata: Dict[str, Any] = {
-        "has_inheritance": False,
-        "inherits_from": "",
-        "has_decorators": False,
-        "decorators": [],
-        "method_count": 0,
-        "substantial_methods": 0,
-        "content_signal_groups": [],
-        "detected_type": "unknown",
-        "action_methods_found": [],
-        "api_version": "unknown",
-        "dependencies": [],
-        "llm_call_count": 0
-    }
+def _on_catalog_change(snapshot: CatalogSnapshot) -> None:
+    """Hot-reload: mantiene los globals legacy (from main import ALL_AGENTS) alineados"""
+    global ALL_AGENTS, DISCOVERY_STATS, CATALOG, CATALOG_ENGINE
+    ALL_AGENTS, DISCOVERY_STATS = snapshot.agents, snapshot.stats
+    CATALOG, CATALOG_ENGINE = snapshot, snapshot.engine
+    CATALOG_RESPONSES.clear()
 
-    module_context = detect_module_context(filepath) if filepath else ""
-    weights = {
-        "inheritance": 3.5,
-        "class_keywords": 1.8,
-        "action_methods": 3.5,
-        "docstring_length": 1.2,
-        "docstring_keywords": 0.7,
-        "filename_agent": 0.7,
-        "decorators": 2.0,
-        "module_bonus": 1.0 if module_context in ["marketing", "ads", "advertising"] else 0.0,
-    }
 
-    # 1. HERENCIA
-    for base in node.bases:
-        base_name = ""
-        if isinstance(base, ast.Name):
-            base_name = (base.id or "").lower()
-        elif isinstance(base, ast.Attribute):
-            base_name = (getattr(base, "attr", "") or "").lower()
-
-        if any(k in base_name for k in ("agent", "ia", "runner", "tool", "assistant", "processor", "handler")):
-            score += weights["inheritance"]
-            metadata["has_inheritance"] = True
-            metadata["inherits_from"] = base_name
-            reasons.append(f"inheritance:{base_name}")
-            break
-
-    # 2. DECORADORES
-    if node.decorator_list:
-        for decorator in node.decorator_list:
-            decorator_str = safe_unparse(decorator).lower()
-            metadata["decorators"].append(decorator_str)
-            if any(dec in decorator_str for dec in ("agent", "tool", "function", "llm", "task")):
-                score += weights["decorators"]
-                metadata["has_decorators"] = True
-                reasons.append(f"decorator:{decorator_str[:30]}")
-
-    # 3. NOMBRE DE CLASE
-    class_keywords_found = [kw for kw in IntelligentAgentDetector.AGENT_CLASS_KEYWORDS if kw in class_name]
-    if class_keywords_found:
-        score += weights["class_keywords"]
-        reasons.append(f"class_keywords:{','.join(sorted(set(class_keywords_found)))}")
-
-    # 4. DOCSTRING
-    doc = ast.get_docstring(node) or ""
-    if doc.strip():
-        d = doc.strip()
-        if len(d) >= 20:
-            score += weights["docstring_length"]
-            reasons.append("docstring>=20")
-        elif len(d) >= 10:
-            score += weights["docstring_length"] * 0.5
-            reasons.append("docstring>=10")
-
-        doc_lower = d.lower()
-        doc_keywords = ["agent", "ia", "execute", "run", "process", "optimize", "generate", "analyze"]
-        doc_keywords_found = [kw for kw in doc_keywords if kw in doc_lower]
-        if doc_keywords_found:
-            score += weights["docstring_keywords"]
-            reasons.append(f"docstring_keywords:{','.join(sorted(set(doc_keywords_found)))}")
-
-    # 5. MÉTODOS
-    action_methods_found: List[str] = []
-    for item in node.body:
-        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            metadata["method_count"] += 1
-            if IntelligentAgentDetector.has_substantial_body(item):
-                metadata["substantial_methods"] += 1
-                if item.name in IntelligentAgentDetector.ACTION_METHODS:
-                    action_methods_found.append(item.name)
-
-    metadata["action_methods_found"] = sorted(set(action_methods_found))
-
-    if action_methods_found:
-        score += min(weights["action_methods"], 2.5 + 0.6 * len(set(action_methods_found)))
-        reasons.append(f"action_methods:{','.join(sorted(set(action_methods_found)))}")
-    elif metadata["substantial_methods"] > 0:
-        score += weights["action_methods"] * 0.3
-        reasons.append(f"substantial_methods:{metadata['substantial_methods']}")
-
-    # 6. SEÑALES POR GRUPOS
-    group_hits = 0
-    group_details = []
-    for group, kws in SIGNAL_GROUPS.items():
-        hits = sum(1 for kw in kws if kw in content_lower)
-        if hits:
-            group_hits += 1
-            group_details.append({group: hits})
-    if group_hits:
-        score += min(group_hits * 0.8, 2.4)
-        metadata["content_signal_groups"] = group_details
-        reasons.append(f"content_signal_groups:{group_hits}")
-
-    # 7. NOMBRE ARCHIVO
-    if ("agent" in filename_lower) or ("ia" in filename_lower):
-        score += weights["filename_agent"]
-        reasons.append("filename_mentions_agent")
-
-    # 8. BONUS CONTEXTO
-    if weights["module_bonus"] > 0:
-        score += weights["module_bonus"]
-        reasons.append(f"module_bonus:{module_context}")
-
-    # 9. TIPO
-    agent_type = IntelligentAgentDetector.detect_agent_type(node, content)
-    metadata["detected_type"] = agent_type
-
-    # 🔧 FIX 2: API version con imports
-    imports_list = IntelligentAgentDetector.extract_imports(tree)
-    metadata["dependencies"] = imports_list
-    metadata["api_version"] = IntelligentAgentDetector.detect_api_version(content, imports_list)
-    metadata["llm_call_count"] = IntelligentAgentDetector.count_llm_calls(content)
-
-    # 10. ANTI-SIGNALS
-    for name, kws, penalty in ANTI_SIGNALS:
-        if sum(1 for kw in kws if kw in content_lower) >= 2:
-            score -= penalty
-            reasons.append(f"penalty:{name}")
-
-    if any(x in content_lower for x in ("pytest", "unittest", "mock.", "fixture")):
-        score -= 2.5
-        reasons.append("penalty:test_or_mock_content")
-
-    if any(nc in class_name for nc in IntelligentAgentDetector.NON_CONCRETE_KEYWORDS):
-        score -= 1.5
-        reasons.append("penalty:non_concrete_keyword")
-
-    if metadata["method_count"] < 2 and (not action_methods_found) and (not metadata["has_inheritance"]):
-        score -= 1.0
-        reasons.append("penalty:too_few_methods")
-
-    # Clamp
-    score = max(0.0, min(10.0, round(score, 2)))
-
-    # 🔧 FIX 1: Labels con thresholds optimizados
-    label = "not_agent"
-    if score >= 7.0:  # Antes >= 7.5
-        label = "agent_confirmed"
-    elif score >= 5.5:  # Antes >= 6.0
-        label = "agent_highly_likely"
-    elif score >= 4.0:  # Antes >= 4.5
-        label = "agent_likely"
-    elif score >= 3.0:
-        label = "agent_possible"
-
-    # GO/NO-GO
-    strong = metadata["has_inheritance"] or bool(action_methods_found)
-    if label == "agent_confirmed" and not (strong or group_hits >= 2):
-        label = "agent_highly_likely"
-        reasons.append("downgrade:missing_strong_or_multi_signal")
+on_catalog_change(_on_catalog_change)
 
-    return {
-        "score": score,
-        "label": label,
-        "reasons": reasons,
-        "metadata": metadata,
-        "confidence": round(score / 10.0, 3),
-        "module_context": module_context,
-        "group_hits": group_hits
-    }
+_catalog_watcher_task: Optional[asyncio.Task] = None
+_usage_retention_task: Optional[asyncio.Task] = None
 
-# =============================================================================
-# STATUS DETERMINATION
-# =============================================================================
 
-def determine_real_status(content: str, scored: Dict, node: ast.ClassDef) -> str:
-    """Determina status"""
-    c = content.lower()
+@app.on_event("startup")
+async def _startup_tenant_directory():
+    """Precarga slug -> (UUID, plan) de todos los tenants para el middleware"""
+    from services.db import db_available
+    from services.tenant_directory import get_tenant_directory
+    if db_available():
+        try:
+            await get_tenant_directory().preload()
+        except Exception as e:
+            print(f"Tenant directory preload skipped: {e}")
 
-    if "# production" in c or "@production" in c:
-        return "production"
-    if "# development" in c or "# dev" in c or "@dev" in c:
-        return "development"
-    if "# template" in c or "# example" in c:
-        return "template"
 
-    has_real_logic = False
-    for item in node.body:
-        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            if item.name in ["execute", "run", "process", "handle", "create"]:
-                if IntelligentAgentDetector.has_substantial_body(item):
-                    has_real_logic = True
-                else:
-                    return "template"
+@app.on_event("startup")
+async def _startup_catalog_watcher():
+    """CATALOG_RELOAD_INTERVAL > 0: vigila agents/ y recarga el catálogo sin reiniciar"""
+    global _catalog_watcher_task
+    interval = reload_interval()
+    agents_path = find_agents_folder()
+    if interval <= 0 or not agents_path:
+        return
+    _catalog_watcher_task = asyncio.get_running_loop().create_task(
+        get_refresher(agents_path).run_forever(interval)
+    )
 
-    if not has_real_logic and scored["label"] != "agent_confirmed":
-        return "template"
 
-    if "TODO" in content or "FIXME" in content:
-        return "development"
+@app.on_event("shutdown")
+async def _shutdown_catalog_watcher():
+    if _catalog_watcher_task is not None:
+        _catalog_watcher_task.cancel()
 
-    return "production" if scored["score"] >= 7.0 else "development"
 
-# =============================================================================
-# PLATAFORMA Y JERARQUÍA
-# =============================================================================
-
-class PlatformDetector:
-    """Detector de plataforma"""
-    
-    FOLDER_PLATFORM_MAP = {
-        "google": "google_ads",
-        "google-ads": "google_ads",
-        "google_ads": "google_ads",
-        "adwords": "google_ads",
-        "meta": "meta_ads",
-        "facebook": "meta_ads",
-        "instagram": "meta_ads",
-        "linkedin": "linkedin_ads",
-        "tiktok": "tiktok_ads",
-    }
+@app.on_event("startup")
+async def _startup_usage_retention():
+    """USAGE_RETENTION_INTERVAL_HOURS > 0: borra logs crudos y rollups viejos (apply_retention)"""
+    global _usage_retention_task
+    from services.usage_tracker import get_usage_tracker, retention_interval, run_retention_forever
+    interval = retention_interval()
+    if interval <= 0:
+        return
+    _usage_retention_task = asyncio.get_running_loop().create_task(
+        run_retention_forever(get_usage_tracker(), interval)
+    )
 
-    PLATFORM_KEYWORDS = {
-        "google_ads": ["adwords", "google ads", "responsive search ad", "rsa", "match type", "search terms"],
-        "meta_ads": ["facebook", "instagram", "meta ads", "lookalike", "audience"],
-        "linkedin_ads": ["linkedin", "sponsored content"],
-        "tiktok_ads": ["tiktok", "infeed", "spark ads"]
-    }
 
-    @staticmethod
-    def detect(rel_path: str, content: str, agent_id: str) -> Dict[str, Any]:
-        """Detecta jerarquía"""
-        p = rel_path.replace("\\", "/")
-        parts = [x.lower() for x in p.split("/") if x]
-
-        module = parts[0] if parts else "unknown"
-        result = {"module": module, "submodule": None, "platform": None, "category": None, "full_path": p}
-
-        if module == "marketing":
-            result["submodule"] = PlatformDetector._detect_submodule(parts)
-            result["platform"] = PlatformDetector._detect_platform(parts, content, agent_id)
-            if result["platform"]:
-                result["submodule"] = "advertising"
-
-        result["category"] = PlatformDetector._detect_category(content)
-        return result
-
-    @staticmethod
-    def _detect_submodule(parts: List[str]) -> str:
-        if len(parts) >= 2:
-            second = parts[1]
-            if any(x in second for x in ["ad", "ads", "advertising"]):
-                return "advertising"
-            if any(x in second for x in ["analytics", "report"]):
-                return "analytics"
-            if any(x in second for x in ["lead", "prospect"]):
-                return "lead_management"
-            if any(x in second for x in ["content", "social"]):
-                return "content"
-        return "general"
-
-    @staticmethod
-    def _detect_platform(parts: List[str], content: str, agent_id: str) -> Optional[str]:
-        combined = f"{agent_id} {(content or '')[:2500]}".lower()
-
-        for part in parts:
-            for folder_key, platform in PlatformDetector.FOLDER_PLATFORM_MAP.items():
-                if folder_key in part:
-                    return platform
-
-        platform_scores = {}
-        for platform, kws in PlatformDetector.PLATFORM_KEYWORDS.items():
-            s = sum(1 for kw in kws if kw in combined)
-            if s:
-                platform_scores[platform] = s
-        if platform_scores:
-            return max(platform_scores.items(), key=lambda x: x[1])[0]
-
-        return None
-
-    @staticmethod
-    def _detect_category(content: str) -> Optional[str]:
-        c = (content or "").lower()
-        rules = [
-            (("lead", "prospect", "conversion"), "lead_generation"),
-            (("budget", "roi", "roas", "cost"), "budget_optimization"),
-            (("content", "creative", "copy"), "content_creation"),
-            (("analytics", "report", "dashboard"), "analytics"),
-            (("segment", "personalization"), "segmentation"),
-        ]
-        for kws, cat in rules:
-            if any(kw in c for kw in kws):
-                return cat
-        return None
+@app.on_event("shutdown")
+async def _shutdown_usage_retention():
+    if _usage_retention_task is not None:
+        _usage_retention_task.cancel()
 
-# =============================================================================
-# DESCUBRIMIENTO
-# =============================================================================
 
-def find_agents_folder() -> Optional[Path]:
-    """Busca agents/"""
-    search_paths = [
-        Path(__file__).parent / "agents",
-        Path.cwd() / "agents",
-        Path.cwd().parent / "agents"
-    ]
-    for path in search_paths:
-        if path.exists() and path.is_dir():
-            return path
-    return None
+@app.on_event("startup")
+async def _startup_process_pool():
+    """Arranca y precalienta los workers si algun agente declara execution_mode=process"""
+    from services.agent_process_pool import execution_mode_for, get_process_pool
+    heavy = [a for a in current_catalog().agents.values() if execution_mode_for(a) == "process"]
+    if heavy:
+        # En segundo plano: el arranque de la app no espera los imports pesados
+        asyncio.get_running_loop().run_in_executor(None, get_process_pool().warm, heavy)
 
-@lru_cache(maxsize=1)
-def intelligent_discovery() -> Tuple[Dict[str, dict], Dict[str, Any]]:
-    """Descubrimiento inteligente"""
-    
-    agents: Dict[str, dict] = {}
-    stats: Dict[str, Any] = {
-        "discovery": {"total_files": 0, "analyzed": 0, "ignored": 0, "class_candidates": 0, "agents_validated": 0},
-        "hierarchy": {"modules": {}, "submodules": {}, "platforms": {}, "categories": {}},
-        "quality": {"by_status": {"production": 0, "development": 0, "template": 0},
-                    "by_type": {"Agent": 0, "IA": 0},
-                    "labels": {k: 0 for k in LABEL_ORDER},
-                    "api_versions": {}},
-    }
 
-    agents_path = find_agents_folder()
-    if not agents_path:
-        print("❌ No se encontró carpeta 'agents/'")
-        return agents, stats
+@app.on_event("startup")
+async def _startup_agent_prewarm():
+    """Precarga los agentes mas usados (AGENT_PREWARM_*); /health no reporta listo hasta terminar"""
+    from services.agent_prewarm import get_prewarmer, prewarm_enabled
+    if prewarm_enabled():
+        get_prewarmer().start()
 
-    print(f"📂 agents/ encontrado: {agents_path}")
-    print("🔍 Escaneando (v5.4.4 - scoring optimizado)...\n")
 
-    for filepath in sorted(agents_path.rglob("*.py")):
-        stats["discovery"]["total_files"] += 1
-        rel_path = str(filepath.relative_to(agents_path)).replace("\\", "/")
+@app.on_event("startup")
+async def _startup_job_queue():
+    """Workers de jobs asincronos (JOB_QUEUE_ENABLED); re-encola los jobs con lease vencido"""
+    from services.job_queue import get_job_queue, job_queue_enabled
+    if job_queue_enabled():
+        try:
+            get_job_queue().start()
+        except Exception as e:
+            print(f"Job queue disabled: {e}")
 
-        if should_ignore_path(rel_path):
-            stats["discovery"]["ignored"] += 1
-            continue
 
-        stats["discovery"]["analyzed"] += 1
+@app.on_event("shutdown")
+async def _shutdown_job_queue():
+    from services import job_queue
+    if job_queue._queue is not None:
+        await job_queue._queue.stop()
 
-        try:
-            content = filepath.read_text(encoding="utf-8", errors="ignore")
-        except Exception:
-            continue
 
-        try:
-            tree = ast.parse(content)
-        except SyntaxError:
-            continue
-
-        base_id = filepath.stem.lower()
-
-        for node in ast.walk(tree):
-            if not isinstance(node, ast.ClassDef):
-                continue
-
-            stats["discovery"]["class_candidates"] += 1
-
-            scored = score_agent_class_v2_enhanced(
-                node=node,
-                filename=filepath.name,
-                content=content,
-                tree=tree,
-                filepath=str(filepath)
-            )
-
-            if scored["label"] in ("agent_possible", "agent_likely", "agent_highly_likely", "agent_confirmed"):
-                stats["discovery"]["agents_validated"] += 1
-                stats["quality"]["labels"][scored["label"]] += 1
-
-                hierarchy = PlatformDetector.detect(rel_path, content, base_id)
-                agent_type = scored["metadata"]["detected_type"]
-                status = determine_real_status(content, scored, node)
-
-                stats["quality"]["by_status"][status] += 1
-                stats["quality"]["by_type"][agent_type] += 1
-
-                api_version = scored["metadata"].get("api_version", "unknown")
-                stats["quality"]["api_versions"][api_version] = stats["quality"]["api_versions"].get(api_version, 0) + 1
-
-                m = hierarchy["module"]
-                stats["hierarchy"]["modules"][m] = stats["hierarchy"]["modules"].get(m, 0) + 1
-
-                if hierarchy.get("submodule"):
-                    k = f"{m}:{hierarchy['submodule']}"
-                    stats["hierarchy"]["submodules"][k] = stats["hierarchy"]["submodules"].get(k, 0) + 1
-
-                if hierarchy.get("platform"):
-                    stats["hierarchy"]["platforms"][hierarchy["platform"]] = stats["hierarchy"]["platforms"].get(hierarchy["platform"], 0) + 1
-
-                if hierarchy.get("category"):
-                    stats["hierarchy"]["categories"][hierarchy["category"]] = stats["hierarchy"]["categories"].get(hierarchy["category"], 0) + 1
-
-                agent_id = f"{base_id}__{node.name.lower()}"
-
-                agents[agent_id] = {
-                    "id": agent_id,
-                    "name": base_id.replace("_", " ").title(),
-                    "class_name": node.name,
-                    "filename": filepath.name,
-                    "file_path": rel_path,
-                    "module": hierarchy["module"],
-                    "submodule": hierarchy.get("submodule"),
-                    "platform": hierarchy.get("platform"),
-                    "category": hierarchy.get("category"),
-                    "type": agent_type,
-                    "status": status,
-
-                    "confidence": scored["confidence"],
-                    "score": scored["score"],
-                    "label": scored["label"],
-                    "reasons": scored["reasons"],
-                    "signal_groups": scored["metadata"].get("content_signal_groups", []),
-                    "action_methods": scored["metadata"].get("action_methods_found", []),
-                    "inherits_from": scored["metadata"].get("inherits_from", ""),
-                    "decorators": scored["metadata"].get("decorators", []),
-
-                    "api_version": scored["metadata"].get("api_version", "unknown"),
-                    "dependencies": scored["metadata"].get("dependencies", []),
-                    "llm_calls": scored["metadata"].get("llm_call_count", 0),
-
-                    "lines": content.count("\n") + 1,
-                    "size_kb": round(filepath.stat().st_size / 1024, 2),
-                    "validation_method": "intelligent_scoring_v5.4.4",
-                }
+@app.on_event("shutdown")
+async def _shutdown_audit_writer():
+    """Escribe los eventos de auditoria aun encolados"""
+    from backend.middleware.audit import shutdown_audit_writer
+    await shutdown_audit_writer()
 
-                icon = {"production": "✅", "development": "⚙️", "template": "📄"}.get(status, "❓")
-                # 🔧 FIX 3: Logging de debugging
-                if scored["score"] >= 5.5:  # Solo log agentes importantes
-                    print(f"{icon} {agent_id:45} | {hierarchy['module']:12} | {scored['label']:20} ({scored['score']}) | API: {scored['metadata']['api_version']}")
 
-    print(f"\n{'='*120}")
-    print("📊 DESCUBRIMIENTO COMPLETADO v5.4.4")
-    print(f"{'='*120}\n")
+@app.on_event("shutdown")
+async def _shutdown_usage_counters():
+    """Escribe los contadores de uso pendientes en usage_tracking"""
+    from services import usage_counters
+    if usage_counters._counters is not None:
+        await usage_counters._counters.stop()
 
-    return agents, stats
 
-# =============================================================================
-# INICIALIZACIÓN
-# =============================================================================
+@app.on_event("shutdown")
+async def _shutdown_rate_limiters():
+    """Empuja los contadores pendientes al store compartido (RATE_LIMIT_BACKEND)"""
+    from backend.middleware import rate_limit
+    from services import security
+    for limiter in [rate_limit._limiter, *security._limiters.values()]:
+        limiter.flush()
 
-print("\n" + "="*120)
-print("🚀 NADAKKI v5.4.4 - OPTIMIZADO (Scoring mejorado + API version fix + Marketing Stats)")
-print("="*120)
 
-ALL_AGENTS, DISCOVERY_STATS = intelligent_discovery()
+@app.on_event("shutdown")
+async def _shutdown_agent_pool():
+    from services.agent_pool import shutdown_sync_pool
+    from services.agent_process_pool import shutdown_process_pool
+    shutdown_sync_pool(wait=False)
+    shutdown_process_pool()
 
 print("✅ COMPATIBILIDAD DASHBOARD: 100%")
 print("✅ COMPATIBLE PYTHON: 3.8+")
@@ -858,92 +389,59 @@ async def get_all_agents(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
 
-    x_tenant_id: Optional[str] = Header(None)
+    x_tenant_id: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Endpoint principal - Obtiene agentes con filtros avanzados"""
-    agents_list = list(ALL_AGENTS.values())
-    filtered = agents_list
-
-    def label_rank(l: str) -> int:
-        return LABEL_MIN_MAP.get((l or "not_agent").lower(), 0)
-
-    min_rank = label_rank(label_min)
-
-    if module:
-        filtered = [a for a in filtered if (a.get("module") or "").lower() == module.lower()]
-    if submodule:
-        filtered = [a for a in filtered if (a.get("submodule") or "").lower() == submodule.lower()]
-    if platform:
-        filtered = [a for a in filtered if (a.get("platform") or "").lower() == platform.lower()]
-    if category:
-        filtered = [a for a in filtered if (a.get("category") or "").lower() == category.lower()]
-    if status:
-        filtered = [a for a in filtered if (a.get("status") or "").lower() == status.lower()]
-
-    filtered = [a for a in filtered if float(a.get("score", 0.0)) >= min_score]
-    filtered = [a for a in filtered if float(a.get("score", 0.0)) <= max_score]
-    filtered = [a for a in filtered if float(a.get("confidence", 0.0)) >= confidence_min]
-    filtered = [a for a in filtered if label_rank(a.get("label")) >= min_rank]
-    
-    if confirmed_only:
-        filtered = [a for a in filtered if a.get("label") == "agent_confirmed"]
-    
-    if has_platform is not None:
-        if has_platform:
-            filtered = [a for a in filtered if a.get("platform")]
-        else:
-            filtered = [a for a in filtered if not a.get("platform")]
-    
-    if api_version:
-        filtered = [a for a in filtered if (a.get("api_version") or "").lower() == api_version.lower()]
-
-    if search:
-        s = search.lower()
-        filtered = [
-            a for a in filtered
-            if (s in a.get("id", "").lower()
-                or s in a.get("name", "").lower()
-                or s in a.get("class_name", "").lower()
-                or any(s in r.lower() for r in a.get("reasons", [])))
-        ]
-
-    total = len(filtered)
-    paginated = filtered[offset:offset + limit]
-
-    # Enrich agents with execute_endpoint and filter backup action_methods
-    enriched = []
-    for agent in paginated:
-        a = dict(agent)  # shallow copy
-        agent_id = a.get("id", "")
-        is_backup = "_backup_" in agent_id
-        action_methods = a.get("action_methods", [])
-        has_execute = "execute" in action_methods or "run" in action_methods
-
-        if is_backup:
-            # Backup agents: remove execute/run from visible action_methods
-            a["action_methods"] = [m for m in action_methods if m not in ("execute", "run")]
-            a["execute_endpoint"] = None
-        elif has_execute:
-            a["execute_endpoint"] = "/agents/execute"
-        else:
-            a["execute_endpoint"] = None
-        enriched.append(a)
+    """Endpoint principal - Obtiene agentes con filtros avanzados (motor indexado, respuesta pre-serializada + ETag)"""
+    params = dict(
+        module=module,
+        submodule=submodule,
+        platform=platform,
+        category=category,
+        status=status,
+        search=search,
+        min_score=min_score,
+        max_score=max_score,
+        confidence_min=confidence_min,
+        label_min=label_min,
+        confirmed_only=confirmed_only,
+        has_platform=has_platform,
+        api_version=api_version,
+        limit=limit,
+        offset=offset,
+    )
+    tenant = x_tenant_id or "default"
+    key = (tenant,) + tuple(params.values())
+
+    engine = current_catalog().engine
+    cached = CATALOG_RESPONSES.get(engine.version, key)
+    if cached is None:
+        total, enriched = engine.query(**params)
+        cached = CATALOG_RESPONSES.put(engine.version, key, {
+            "success": True,
+            "data": {
+                "agents": enriched,
+                "pagination": {
+                    "total": total,
+                    "limit": limit,
+                    "offset": offset,
+                    "has_more": (offset + limit) < total
+                }
+            },
+            "timestamp": datetime.utcnow().isoformat(),
+            "tenant": tenant,
+            "discovery_method": "intelligent_scoring_v5.4.4"
+        })
+
+    return _catalog_response(cached, if_none_match)
 
-    return {
-        "success": True,
-        "data": {
-            "agents": enriched,
-            "pagination": {
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_more": (offset + limit) < total
-            }
-        },
-        "timestamp": datetime.utcnow().isoformat(),
-        "tenant": x_tenant_id or "default",
-        "discovery_method": "intelligent_scoring_v5.4.4"
-    }
+
+def _catalog_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """200 con bytes pre-codificados, o 304 si el cliente ya tiene esta versión"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/catalog/{module_name}/agents")
@@ -963,7 +461,8 @@ async def get_catalog_module_agents(
     api_version: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    x_tenant_id: Optional[str] = Header(None)
+    x_tenant_id: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Alias: GET /api/catalog/{module}/agents -> delegates to get_all_agents"""
     return await get_all_agents(
@@ -982,19 +481,21 @@ async def get_catalog_module_agents(
         api_version=api_version,
         limit=limit,
         offset=offset,
-        x_tenant_id=x_tenant_id
+        x_tenant_id=x_tenant_id,
+        if_none_match=if_none_match
     )
 @app.get("/api/v1/agents/{agent_id}/analysis")
 async def get_agent_analysis(agent_id: str = PathParam(...)):
     """Análisis profundo de un agente"""
-    if agent_id not in ALL_AGENTS:
+    agents = current_catalog().agents
+    if agent_id not in agents:
         return {
             "success": False,
             "error": "Agent not found",
             "timestamp": datetime.utcnow().isoformat()
         }
 
-    agent = ALL_AGENTS[agent_id].copy()
+    agent = agents[agent_id].copy()
 
     agents_path = find_agents_folder()
     if agents_path:
@@ -1053,21 +554,33 @@ async def get_agent_analysis(agent_id: str = PathParam(...)):
 @app.get("/api/v1/reality")
 async def get_reality_report():
     """Reporte de realidad - Estadísticas completas"""
+    catalog = current_catalog()
+    stats = catalog.stats
     return {
         "success": True,
         "data": {
-            "stats": DISCOVERY_STATS,
-            "agents_total": len(ALL_AGENTS),
-            "by_module": DISCOVERY_STATS["hierarchy"]["modules"],
-            "by_platform": DISCOVERY_STATS["hierarchy"]["platforms"],
-            "by_status": DISCOVERY_STATS["quality"]["by_status"],
-            "by_label": DISCOVERY_STATS["quality"]["labels"],
-            "by_api_version": DISCOVERY_STATS["quality"]["api_versions"],
+            "stats": stats,
+            "agents_total": len(catalog.agents),
+            "catalog_version": catalog.version,
+            "by_module": stats["hierarchy"]["modules"],
+            "by_platform": stats["hierarchy"]["platforms"],
+            "by_status": stats["quality"]["by_status"],
+            "by_label": stats["quality"]["labels"],
+            "by_api_version": stats["quality"]["api_versions"],
         },
         "timestamp": datetime.utcnow().isoformat(),
         "version": "5.4.4"
     }
 
+@app.post("/api/v1/catalog/reload")
+async def reload_catalog():
+    """Hot-reload: re-escanea solo archivos cambiados y publica una nueva versión del catálogo"""
+    agents_path = find_agents_folder()
+    if not agents_path:
+        return {"success": False, "error": "Agents path not found", "timestamp": datetime.utcnow().isoformat()}
+    report = await get_refresher(agents_path).refresh_async()
+    return {"success": True, "data": report, "timestamp": datetime.utcnow().isoformat()}
+
 @app.get("/api/v1/health/db")
 async def health_db():
     """Database health check."""
@@ -1078,10 +591,16 @@ async def health_db():
 @app.get("/api/v1/health")
 async def health_check():
     """Health check - Estado del sistema"""
-    total = len(ALL_AGENTS)
-    confirmed = DISCOVERY_STATS["quality"]["labels"].get("agent_confirmed", 0)
+    catalog = current_catalog()
+    stats = catalog.stats
+    total = len(catalog.agents)
+    confirmed = stats["quality"]["labels"].get("agent_confirmed", 0)
     status = "healthy" if total > 0 and confirmed > 0 else ("warning" if total > 0 else "critical")
 
+    from services.agent_prewarm import get_prewarmer
+    prewarm = get_prewarmer().stats()
+    prewarm.pop("agents"), prewarm.pop("errors")
+
     uptime_seconds = round(_time_mod.time() - _APP_START_TIME)
 
     # DB + RLS + gates status (lightweight)
@@ -1107,29 +626,36 @@ async def health_check():
     except Exception:
         pass
 
-    return {
-        "status": status,
+    body = {
+        "status": status if prewarm["ready"] else "warming_up",
+        "ready": prewarm["ready"],
+        "prewarm": prewarm,
         "agents_total": total,
         "confirmed_agents": confirmed,
         "db_connected": db_connected,
         "rls_active": rls_active,
         "gates_status": gates_status,
         "uptime_seconds": uptime_seconds,
-        "labels_distribution": DISCOVERY_STATS["quality"]["labels"],
-        "api_versions_used": DISCOVERY_STATS["quality"]["api_versions"],
+        "labels_distribution": stats["quality"]["labels"],
+        "api_versions_used": stats["quality"]["api_versions"],
         "marketing_stats_enabled": marketing_router is not None,
         "timestamp": datetime.utcnow().isoformat(),
         "version": "5.4.4",
     }
+    if not prewarm["ready"]:
+        # Balanceadores: el worker aun precarga agentes, no enviar trafico todavia
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 @app.get("/")
 async def root():
     """Root endpoint"""
+    catalog = current_catalog()
     return {
         "system": "NADAKKI Intelligent Discovery v5.4.4",
         "philosophy": "Detect reality, not assumptions",
-        "agents_discovered": len(ALL_AGENTS),
-        "labels": DISCOVERY_STATS["quality"]["labels"],
+        "agents_discovered": len(catalog.agents),
+        "labels": catalog.stats["quality"]["labels"],
         "dashboard_compatibility": "100%",
         "marketing_stats_available": marketing_router is not None,
         "endpoints": {
@@ -2,23 +2,34 @@
 Agent Execution Router
 - POST /api/v1/agents/{agent_id}/execute  (legacy path-based)
 - POST /agents/execute                     (new body-based with flexible ID matching)
+- POST /agents/execute/stream              (SSE: progress events per phase, then the result)
+- POST /agents/execute/batch               (many items, bounded concurrency, bulk audit/usage)
 
 Carga y ejecuta agentes del catalogo de forma segura con dry_run por defecto.
 Includes audit logging, rate limiting, and live gate.
 Backup agents (_backup_ in ID) are excluded from execution.
 """
 
+import asyncio
+import json
 import logging
+import os
 import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi import APIRouter, HTTPException, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from services.agent_runner import execute_agent, AgentLoadError
-from services.audit_logger import generate_trace_id, write_log
-from services.security import rate_limit_check, live_gate_check
+from services.agent_bulkhead import BulkheadFullError, get_bulkheads
+from services.agent_catalog import AgentResolver, current_catalog
+from services.agent_pool import pool_stats
+from services.agent_process_pool import process_pool_stats
+from services.agent_runner import execute_agent, execute_agent_cached, AgentLoadError, AgentTimeoutError, cache_stats
+from services.agent_stream import ProgressChannel, format_sse
+from services.audit_logger import generate_trace_id, write_log, write_logs
+from services.security import rate_limit_hit, live_gate_check
 
 logger = logging.getLogger("AgentExecution")
 
@@ -44,10 +55,40 @@ class FlexExecuteRequest(BaseModel):
     role: Optional[str] = Field(None, description="User role for live gate")
 
 
+class BatchItem(BaseModel):
+    agent_id: Optional[str] = Field(None, description="Agent ID; defaults to the batch agent_id")
+    payload: Dict[str, Any] = Field(default_factory=dict)
+
+
+class BatchExecuteRequest(BaseModel):
+    agent_id: Optional[str] = Field(None, description="Agent for every item (one agent, many payloads)")
+    items: List[BatchItem] = Field(default_factory=list)
+    payloads: List[Dict[str, Any]] = Field(default_factory=list, description="Shorthand: payloads for agent_id")
+    dry_run: bool = Field(True, description="Modo seguro, no ejecuta acciones reales")
+    tenant_id: str = Field("default", description="ID del tenant")
+    role: Optional[str] = Field(None, description="User role for live gate")
+    concurrency: Optional[int] = Field(None, ge=1, description="Max items running at once")
+    stream: bool = Field(False, description="Stream NDJSON results as items finish")
+
+
+def _batch_max_items() -> int:
+    return int(os.environ.get("AGENT_BATCH_MAX_ITEMS", "1000"))
+
+
+def _batch_concurrency(requested: Optional[int]) -> int:
+    default = int(os.environ.get("AGENT_BATCH_CONCURRENCY", "8"))
+    ceiling = int(os.environ.get("AGENT_BATCH_MAX_CONCURRENCY", "32"))
+    return max(1, min(requested or default, ceiling))
+
+
 def _get_all_agents() -> Dict[str, dict]:
-    """Importa ALL_AGENTS desde main (lazy para evitar circular)."""
-    from main import ALL_AGENTS
-    return ALL_AGENTS
+    """Agentes de la version actual del catalogo (cambia con hot-reload)."""
+    catalog = current_catalog()
+    if catalog is None:
+        # Catalogo aun no publicado: importar main ejecuta el discovery (lazy para evitar circular)
+        import main  # noqa: F401
+        catalog = current_catalog()
+    return catalog.agents
 
 
 def _is_backup_agent(agent_id: str) -> bool:
@@ -68,52 +109,29 @@ def _is_executable(agent: dict) -> bool:
     return "execute" in action_methods or "run" in action_methods
 
 
+def _resolver_for(agents: Dict[str, dict]) -> AgentResolver:
+    """Resolver indexado del snapshot actual; otro dict (tests, scripts) se indexa al vuelo."""
+    catalog = current_catalog()
+    if catalog is not None and agents is catalog.agents:
+        return catalog.resolver
+    return AgentResolver(agents)
+
+
 def _resolve_agent_id(agent_id: str, agents: Dict[str, dict]) -> Optional[dict]:
     """
     Resolve an agent by ID with flexible matching:
     - If agent_id contains '__': exact match (long ID format)
     - If agent_id is short: find agent whose long ID ends with '__<short_id>'
+      (production agent preferred when several match)
+    - Otherwise: alias table / file stem / class name (case-insensitive)
     Backup agents are excluded from matching.
     """
-    # Long ID: exact match
-    if "__" in agent_id:
-        agent = agents.get(agent_id)
-        if agent and not _is_backup_agent(agent_id):
-            return agent
-        return None
-
-    # Short ID: find match where long ID ends with __<short_id>
-    suffix = f"__{agent_id}"
-    candidates = []
-    for aid, agent in agents.items():
-        if _is_backup_agent(aid):
-            continue
-        if aid.endswith(suffix):
-            candidates.append(agent)
-
-    if len(candidates) == 1:
-        return candidates[0]
-    if len(candidates) > 1:
-        # Return first non-backup production agent, or just first
-        for c in candidates:
-            if c.get("status") == "production":
-                return c
-        return candidates[0]
-    return None
+    return _resolver_for(agents).resolve(agent_id)
 
 
 def _get_suggestions(agent_id: str, agents: Dict[str, dict]) -> List[str]:
-    """Get similar agent ID suggestions for 404 responses."""
-    search = agent_id.lower()
-    suggestions = []
-    for aid in agents:
-        if _is_backup_agent(aid):
-            continue
-        if search in aid.lower():
-            suggestions.append(aid)
-        if len(suggestions) >= 5:
-            break
-    return suggestions
+    """Get similar agent ID suggestions for 404 responses (substring matches first, then trigram similarity)."""
+    return _resolver_for(agents).suggest(agent_id)
 
 
 def _validate_and_check(agent: dict, agent_id: str) -> Optional[dict]:
@@ -138,33 +156,25 @@ def _validate_and_check(agent: dict, agent_id: str) -> Optional[dict]:
     return None
 
 
-# ---------------------------------------------------------------------------
-# NEW: POST /agents/execute (body-based, flexible ID matching)
-# ---------------------------------------------------------------------------
-@router.post("/agents/execute")
-async def execute_agent_flex(
+def _admit_flex(
     body: FlexExecuteRequest,
     request: Request,
-    x_tenant_id: Optional[str] = Header(None),
-    x_trace_id: Optional[str] = Header(None),
-    x_user_id: Optional[str] = Header(None),
-    x_role: Optional[str] = Header(None),
-):
-    """Execute an agent by ID (supports short and long ID formats). Backup agents excluded."""
-
+    tenant_id: str,
+    trace_id: str,
+    mode: str,
+    role: Optional[str],
+    x_user_id: Optional[str],
+) -> dict:
+    """Rate limit, live gate, resolucion y validacion. Devuelve el agente o lanza HTTPException."""
     agent_id = body.agent_id
-    tenant_id = x_tenant_id or body.tenant_id or "default"
-    trace_id = x_trace_id or generate_trace_id()
-    mode = "dry" if body.dry_run else "live"
-    role = x_role or body.role
-    start_time = time.time()
 
     # --- Rate limit ---
     client_ip = request.client.host if request.client else "unknown"
     rate_key = f"{tenant_id}:{client_ip}"
-    if not rate_limit_check(rate_key):
+    decision = rate_limit_hit(rate_key)
+    if not decision.allowed:
         _audit(trace_id, agent_id, tenant_id, mode, "rate_limited", 0, x_user_id, 429)
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=decision.headers())
 
     # --- Live gate ---
     gate_error = live_gate_check(dry_run=body.dry_run, role=role)
@@ -195,20 +205,56 @@ async def execute_agent_flex(
         _audit(trace_id, agent_id, tenant_id, mode, "not_executable", 0, x_user_id, status_code)
         raise HTTPException(status_code=status_code, detail=validation_error["detail"])
 
+    return agent
+
+
+# ---------------------------------------------------------------------------
+# NEW: POST /agents/execute (body-based, flexible ID matching)
+# ---------------------------------------------------------------------------
+@router.post("/agents/execute")
+async def execute_agent_flex(
+    body: FlexExecuteRequest,
+    request: Request,
+    response: Response,
+    x_tenant_id: Optional[str] = Header(None),
+    x_trace_id: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None),
+    x_role: Optional[str] = Header(None),
+):
+    """Execute an agent by ID (supports short and long ID formats). Backup agents excluded."""
+
+    agent_id = body.agent_id
+    tenant_id = x_tenant_id or body.tenant_id or "default"
+    trace_id = x_trace_id or generate_trace_id()
+    mode = "dry" if body.dry_run else "live"
+    role = x_role or body.role
+    start_time = time.time()
+
+    agent = _admit_flex(body, request, tenant_id, trace_id, mode, role, x_user_id)
+
     resolved_id = agent.get("id", agent_id)
     file_path = agent.get("file_path", "")
     class_name = agent.get("class_name", "")
 
     try:
-        result = await execute_agent(
+        result, cache_status = await execute_agent_cached(
             file_path=file_path,
             class_name=class_name,
             payload=body.payload,
             dry_run=body.dry_run,
             tenant_id=tenant_id,
+            agent=agent,
         )
+        response.headers["X-Agent-Cache"] = cache_status
         latency_ms = round((time.time() - start_time) * 1000)
         _audit(trace_id, resolved_id, tenant_id, mode, "ok", latency_ms, x_user_id, 200)
+    except BulkheadFullError as e:
+        _audit(trace_id, resolved_id, tenant_id, mode, "saturated", 0, x_user_id, 503, str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AgentTimeoutError as e:
+        latency_ms = round((time.time() - start_time) * 1000)
+        _audit(trace_id, resolved_id, tenant_id, mode, "timeout", latency_ms, x_user_id, 504, str(e))
+        raise HTTPException(status_code=504, detail=str(e))
     except AgentLoadError as e:
         latency_ms = round((time.time() - start_time) * 1000)
         _audit(trace_id, resolved_id, tenant_id, mode, "load_error", latency_ms, x_user_id, 500, str(e))
@@ -232,6 +278,309 @@ async def execute_agent_flex(
     }
 
 
+# ---------------------------------------------------------------------------
+# STREAM: POST /agents/execute/stream (server-sent events)
+# ---------------------------------------------------------------------------
+@router.post("/agents/execute/stream")
+async def execute_agent_stream(
+    body: FlexExecuteRequest,
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None),
+    x_trace_id: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None),
+    x_role: Optional[str] = Header(None),
+):
+    """
+    Same contract as /agents/execute, streamed as SSE: `started`, one `progress`
+    event per phase the agent reports through context["progress"], then `result`
+    (or `error`). Agents that report nothing still get started + result.
+    """
+    agent_id = body.agent_id
+    tenant_id = x_tenant_id or body.tenant_id or "default"
+    trace_id = x_trace_id or generate_trace_id()
+    mode = "dry" if body.dry_run else "live"
+    role = x_role or body.role
+    start_time = time.time()
+
+    agent = _admit_flex(body, request, tenant_id, trace_id, mode, role, x_user_id)
+    resolved_id = agent.get("id", agent_id)
+
+    # Plan limit antes de abrir el stream (UsageTrackingMiddleware solo cubre /agents/execute)
+    from backend.middleware.usage import _check_plan_limit, _increment_usage
+    usage_slug = x_tenant_id or "credicefi"
+    limit_error = await _check_plan_limit(usage_slug)
+    if limit_error:
+        raise HTTPException(status_code=429, detail={"error": "Plan execution limit exceeded", "detail": limit_error})
+
+    channel = ProgressChannel()
+    task = asyncio.ensure_future(execute_agent(
+        file_path=agent.get("file_path", ""),
+        class_name=agent.get("class_name", ""),
+        payload=body.payload,
+        dry_run=body.dry_run,
+        tenant_id=tenant_id,
+        agent=agent,
+        progress=channel.progress,
+    ))
+    # El bulkhead se toma antes del primer await del task: un agente saturado
+    # todavia se puede responder con 503 + Retry-After en vez de abrir el stream.
+    await asyncio.sleep(0)
+    if task.done() and isinstance(task.exception(), BulkheadFullError):
+        e = task.exception()
+        _audit(trace_id, resolved_id, tenant_id, mode, "saturated", 0, x_user_id, 503, str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    async def sse():
+        status, status_code, error = "cancelled", 499, None
+        try:
+            yield format_sse("started", {
+                "trace_id": trace_id, "agent_id": resolved_id, "requested_id": agent_id, "dry_run": body.dry_run,
+            })
+            async for event, data in channel.events(task):
+                if event == "heartbeat":
+                    yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(event, data, data.get("seq"))
+
+            latency_ms = round((time.time() - start_time) * 1000)
+            try:
+                result = task.result()
+                status, status_code = "ok", 200
+                yield format_sse("result", {
+                    "success": True, "agent_id": resolved_id, "trace_id": trace_id, "result": result,
+                    "latency_ms": latency_ms, "progress_events": channel.seq, "dropped_events": channel.dropped,
+                    "timestamp": datetime.utcnow().isoformat(),
+                })
+                asyncio.ensure_future(_increment_usage(usage_slug))
+            except BulkheadFullError as e:
+                status, status_code, error = "saturated", 503, str(e)
+            except AgentTimeoutError as e:
+                status, status_code, error = "timeout", 504, str(e)
+            except AgentLoadError as e:
+                status, status_code, error = "load_error", 500, str(e)
+            except Exception as e:
+                logger.exception(f"Error ejecutando {resolved_id} (stream)")
+                status, status_code, error = "error", 500, f"Execution error: {e}"
+            if error is not None:
+                yield format_sse("error", {"success": False, "status": status_code, "error": error, "trace_id": trace_id})
+        finally:
+            # Cliente desconectado o stream terminado: el agente deja de recibir progreso
+            channel.close()
+            if not task.done():
+                task.cancel()
+            latency_ms = round((time.time() - start_time) * 1000)
+            _audit(trace_id, resolved_id, tenant_id, mode, status, latency_ms, x_user_id, status_code, error)
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Trace-Id": trace_id},
+    )
+
+
+# ---------------------------------------------------------------------------
+# BATCH: POST /agents/execute/batch
+# ---------------------------------------------------------------------------
+@router.post("/agents/execute/batch")
+async def execute_agent_batch(
+    body: BatchExecuteRequest,
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None),
+    x_trace_id: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None),
+    x_role: Optional[str] = Header(None),
+):
+    """
+    Execute many items in one request. Rate limit, live gate and plan limit are
+    checked once; each distinct agent is resolved and validated once; items run
+    with bounded concurrency. Results come back in item order (or streamed as
+    NDJSON in completion order with stream=true). Audit and usage are written in bulk.
+    """
+    tenant_id = x_tenant_id or body.tenant_id or "default"
+    trace_id = x_trace_id or generate_trace_id()
+    mode = "dry" if body.dry_run else "live"
+    role = x_role or body.role
+
+    items = list(body.items) + [BatchItem(agent_id=body.agent_id, payload=p) for p in body.payloads]
+    if not items:
+        raise HTTPException(status_code=422, detail="Batch has no items")
+    if len(items) > _batch_max_items():
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(items)} > {_batch_max_items()} items")
+
+    client_ip = request.client.host if request.client else "unknown"
+    decision = rate_limit_hit(f"{tenant_id}:{client_ip}")
+    if not decision.allowed:
+        _audit(trace_id, body.agent_id or "batch", tenant_id, mode, "rate_limited", 0, x_user_id, 429)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=decision.headers())
+
+    gate_error = live_gate_check(dry_run=body.dry_run, role=role)
+    if gate_error:
+        _audit(trace_id, body.agent_id or "batch", tenant_id, mode, "live_blocked", 0, x_user_id, 403, gate_error)
+        raise HTTPException(status_code=403, detail=gate_error)
+
+    # Plan limit: una sola verificacion para todo el lote, contra la cuota que queda
+    # para len(items) ejecuciones (slug como en UsageTrackingMiddleware)
+    from backend.middleware.usage import _check_plan_limit, _increment_usage
+    usage_slug = x_tenant_id or "credicefi"
+    limit_error = await _check_plan_limit(usage_slug, len(items))
+    if limit_error:
+        raise HTTPException(status_code=429, detail={"error": "Plan execution limit exceeded", "detail": limit_error})
+
+    # Resolver y validar cada agent_id distinto una sola vez
+    agents = _get_all_agents()
+    resolved: Dict[str, Tuple[Optional[dict], Optional[dict]]] = {}
+    for item in items:
+        aid = item.agent_id
+        if aid is None or aid in resolved:
+            continue
+        agent = _resolve_agent_id(aid, agents)
+        if agent is None:
+            resolved[aid] = (None, {"status": 404, "detail": "Agent not found", "suggestions": _get_suggestions(aid, agents)})
+        else:
+            resolved[aid] = (agent, _validate_and_check(agent, aid))
+
+    # El lote no abre mas items a la vez de los que admiten los bulkheads: de lo
+    # contrario los items de sobra fallarian con 503 aunque el lote sea toda la carga
+    bulkheads = get_bulkheads()
+    concurrency = _batch_concurrency(body.concurrency)
+    if bulkheads.tenant_limit:
+        concurrency = min(concurrency, bulkheads.tenant_limit)
+    semaphore = asyncio.Semaphore(concurrency)
+    agent_slots: Dict[str, asyncio.Semaphore] = {}
+    for agent, error in resolved.values():
+        if agent is not None and error is None and agent.get("id") not in agent_slots:
+            limit = bulkheads.limit_for(agent)
+            agent_slots[agent.get("id")] = asyncio.Semaphore(min(concurrency, limit) if limit else concurrency)
+    audit_entries: List[Dict[str, Any]] = []
+
+    async def run_item(index: int, item: BatchItem) -> Dict[str, Any]:
+        item_trace = f"{trace_id}-{index}"
+        if item.agent_id is None:
+            return {"index": index, "success": False, "status": 422, "error": "agent_id is required"}
+        agent, error = resolved[item.agent_id]
+        if error is not None:
+            status_code = error["status"]
+            audit_entries.append(_audit_entry(
+                item_trace, item.agent_id, tenant_id, mode,
+                "not_found" if agent is None else "not_executable", 0, x_user_id, status_code,
+            ))
+            out = {"index": index, "agent_id": item.agent_id, "success": False, "status": status_code, "error": error["detail"]}
+            if "suggestions" in error:
+                out["suggestions"] = error["suggestions"]
+            return out
+
+        resolved_id = agent.get("id", item.agent_id)
+        retry_after = None
+        async with agent_slots[agent.get("id")], semaphore:
+            start = time.time()
+            try:
+                result, cache_status = await execute_agent_cached(
+                    file_path=agent.get("file_path", ""),
+                    class_name=agent.get("class_name", ""),
+                    payload=item.payload,
+                    dry_run=body.dry_run,
+                    tenant_id=tenant_id,
+                    agent=agent,
+                )
+                status_code, status, err = 200, "ok", None
+            except BulkheadFullError as e:
+                result, cache_status, status_code, status, err = None, None, 503, "saturated", str(e)
+                retry_after = e.retry_after
+            except AgentTimeoutError as e:
+                result, cache_status, status_code, status, err = None, None, 504, "timeout", str(e)
+            except AgentLoadError as e:
+                result, cache_status, status_code, status, err = None, None, 500, "load_error", str(e)
+            except Exception as e:
+                logger.exception(f"Error ejecutando {resolved_id} (batch item {index})")
+                result, cache_status, status_code, status, err = None, None, 500, "error", f"Execution error: {e}"
+            latency_ms = round((time.time() - start) * 1000)
+
+        audit_entries.append(_audit_entry(item_trace, resolved_id, tenant_id, mode, status, latency_ms, x_user_id, status_code, err))
+        out = {"index": index, "agent_id": resolved_id, "success": err is None, "status": status_code, "latency_ms": latency_ms}
+        if err is None:
+            out["result"] = result
+            out["cache"] = cache_status
+        else:
+            out["error"] = err
+            if retry_after is not None:
+                out["retry_after"] = retry_after
+        return out
+
+    def finish(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            write_logs(audit_entries)
+        except Exception as exc:
+            logger.warning(f"Batch audit write failed: {exc}")
+        succeeded = sum(1 for r in results if r["success"])
+        if succeeded:
+            try:
+                asyncio.get_running_loop().create_task(_increment_usage(usage_slug, succeeded))
+            except RuntimeError:
+                pass
+        return {"total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded}
+
+    if body.stream:
+        async def ndjson():
+            tasks = [asyncio.ensure_future(run_item(i, item)) for i, item in enumerate(items)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_done, default=str) + "\n"
+            finally:
+                # Cliente desconectado: se cancela lo pendiente, pero lo que ya
+                # termino se audita y se cuenta igual
+                for t in tasks:
+                    t.cancel()
+                summary = finish([t.result() for t in tasks if t.done() and not t.cancelled()])
+            yield json.dumps({"summary": summary, "trace_id": trace_id}) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"X-Trace-Id": trace_id})
+
+    results = await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items)))
+    summary = finish(results)
+    return {
+        "success": summary["failed"] == 0,
+        "trace_id": trace_id,
+        "dry_run": body.dry_run,
+        **summary,
+        "results": results,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Runtime metrics
+# ---------------------------------------------------------------------------
+@router.get("/agents/runtime/cache")
+async def agent_runtime_cache():
+    """Hit/miss de los caches de modulos e instancias de este worker."""
+    return cache_stats()
+
+
+@router.get("/agents/runtime/pool")
+async def agent_runtime_pool():
+    """Profundidad de cola, workers activos y tiempos de espera del pool de agentes sync."""
+    return pool_stats()
+
+
+@router.get("/agents/runtime/bulkheads")
+async def agent_runtime_bulkheads():
+    """Saturacion por agente y por tenant: slots activos, limite, rechazos y timeouts."""
+    return get_bulkheads().stats()
+
+
+@router.get("/agents/runtime/prewarm")
+async def agent_runtime_prewarm():
+    """Resultado del warm-up de arranque: agentes precargados, fallidos y tiempo usado."""
+    from services.agent_prewarm import get_prewarmer
+    return get_prewarmer().stats()
+
+
+@router.get("/agents/runtime/processes")
+async def agent_runtime_processes():
+    """Workers del pool de procesos (agentes con execution_mode=process)."""
+    return process_pool_stats()
+
+
 # ---------------------------------------------------------------------------
 # LEGACY: POST /api/v1/agents/{agent_id}/execute (path-based)
 # ---------------------------------------------------------------------------
@@ -240,6 +589,7 @@ async def execute_agent_endpoint(
     agent_id: str,
     body: ExecuteRequest,
     request: Request,
+    response: Response,
     x_tenant_id: Optional[str] = Header(None),
     x_trace_id: Optional[str] = Header(None),
     x_user_id: Optional[str] = Header(None),
@@ -256,11 +606,13 @@ async def execute_agent_endpoint(
     # --- Rate limit (per tenant + IP) ---
     client_ip = request.client.host if request.client else "unknown"
     rate_key = f"{tenant_id}:{client_ip}"
-    if not rate_limit_check(rate_key):
+    decision = rate_limit_hit(rate_key)
+    if not decision.allowed:
         _audit(trace_id, agent_id, tenant_id, mode, "rate_limited", 0, x_user_id, 429)
         raise HTTPException(
             status_code=429,
             detail="Rate limit exceeded. Try again later.",
+            headers=decision.headers(),
         )
 
     # --- Live gate ---
@@ -297,15 +649,24 @@ async def execute_agent_endpoint(
     class_name = agent.get("class_name", "")
 
     try:
-        result = await execute_agent(
+        result, cache_status = await execute_agent_cached(
             file_path=file_path,
             class_name=class_name,
             payload=body.payload,
             dry_run=body.dry_run,
             tenant_id=tenant_id,
+            agent=agent,
         )
+        response.headers["X-Agent-Cache"] = cache_status
         latency_ms = round((time.time() - start_time) * 1000)
         _audit(trace_id, resolved_id, tenant_id, mode, "ok", latency_ms, x_user_id, 200)
+    except BulkheadFullError as e:
+        _audit(trace_id, resolved_id, tenant_id, mode, "saturated", 0, x_user_id, 503, str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AgentTimeoutError as e:
+        latency_ms = round((time.time() - start_time) * 1000)
+        _audit(trace_id, resolved_id, tenant_id, mode, "timeout", latency_ms, x_user_id, 504, str(e))
+        raise HTTPException(status_code=504, detail=str(e))
     except AgentLoadError as e:
         latency_ms = round((time.time() - start_time) * 1000)
         _audit(trace_id, resolved_id, tenant_id, mode, "load_error", latency_ms, x_user_id, 500, str(e))
@@ -328,7 +689,7 @@ async def execute_agent_endpoint(
     }
 
 
-def _audit(
+def _audit_entry(
     trace_id: str,
     agent_id: str,
     tenant_id: str,
@@ -338,7 +699,7 @@ def _audit(
     user_id: Optional[str],
     http_status: int,
     error: Optional[str] = None,
-):
+) -> Dict[str, Any]:
     entry = {
         "trace_id": trace_id,
         "agent_id": agent_id,
@@ -353,6 +714,21 @@ def _audit(
         entry["user_id"] = user_id
     if error:
         entry["error"] = error
+    return entry
+
+
+def _audit(
+    trace_id: str,
+    agent_id: str,
+    tenant_id: str,
+    mode: str,
+    status: str,
+    latency_ms: int,
+    user_id: Optional[str],
+    http_status: int,
+    error: Optional[str] = None,
+):
+    entry = _audit_entry(trace_id, agent_id, tenant_id, mode, status, latency_ms, user_id, http_status, error)
     try:
         write_log(entry)
     except Exception as exc:
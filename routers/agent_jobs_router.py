@@ -0,0 +1,183 @@
+"""
+Agent Jobs Router — asynchronous agent executions (submit / poll / cancel)
+- POST   /agents/jobs              submit (202 + job_id)
+- GET    /agents/jobs              jobs of the tenant
+- GET    /agents/jobs/stats        queue status
+- GET    /agents/jobs/{job_id}     status + result
+- DELETE /agents/jobs/{job_id}     cancel
+
+Same validation as POST /agents/execute (rate limit, live gate, plan
+limit, agent resolution); the execution itself runs in services.job_queue.
+Job store calls (sqlite) run in the default executor, off the event loop.
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from routers.agent_execution_router import (
+    _audit,
+    _get_all_agents,
+    _get_suggestions,
+    _resolve_agent_id,
+    _validate_and_check,
+)
+from services.audit_logger import generate_trace_id
+from services.job_queue import FINAL_STATES, get_job_queue
+from services.security import live_gate_check, rate_limit_hit
+
+router = APIRouter(prefix="/agents/jobs", tags=["Agent Jobs"])
+
+
+class JobSubmitRequest(BaseModel):
+    agent_id: str = Field(..., description="Agent ID (short or long format)")
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    dry_run: bool = Field(True, description="Modo seguro, no ejecuta acciones reales")
+    tenant_id: str = Field("default", description="ID del tenant")
+    role: Optional[str] = Field(None, description="User role for live gate")
+    priority: int = Field(0, ge=-10, le=10, description="Higher runs first")
+    max_attempts: int = Field(1, ge=1, le=5, description="Retries on execution errors / restarts")
+
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "job_id": job["id"],
+        "agent_id": job["agent_id"],
+        "tenant_id": job["tenant_id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "dry_run": job["dry_run"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+    }
+    if job["status"] in FINAL_STATES:
+        out["result"] = job["result"]
+        out["error"] = job["error"]
+    elif job["cancel_requested"]:
+        out["cancel_requested"] = True
+    return out
+
+
+async def _offload(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+
+async def _tenant_job(job_id: str, tenant_id: str) -> Dict[str, Any]:
+    job = await _offload(get_job_queue().get, job_id)
+    # Jobs de otro tenant se reportan como inexistentes
+    if job is None or job["tenant_id"] != tenant_id:
+        raise HTTPException(status_code=404, detail={"error": "Job not found", "job_id": job_id})
+    return job
+
+
+@router.post("", status_code=202)
+async def submit_job(
+    body: JobSubmitRequest,
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None),
+    x_trace_id: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None),
+    x_role: Optional[str] = Header(None),
+):
+    """Queue an agent execution and return immediately with its job_id."""
+    agent_id = body.agent_id
+    tenant_id = x_tenant_id or body.tenant_id or "default"
+    trace_id = x_trace_id or generate_trace_id()
+    mode = "dry" if body.dry_run else "live"
+
+    client_ip = request.client.host if request.client else "unknown"
+    decision = rate_limit_hit(f"{tenant_id}:{client_ip}")
+    if not decision.allowed:
+        _audit(trace_id, agent_id, tenant_id, mode, "rate_limited", 0, x_user_id, 429)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=decision.headers())
+
+    gate_error = live_gate_check(dry_run=body.dry_run, role=x_role or body.role)
+    if gate_error:
+        _audit(trace_id, agent_id, tenant_id, mode, "live_blocked", 0, x_user_id, 403, gate_error)
+        raise HTTPException(status_code=403, detail=gate_error)
+
+    agents = _get_all_agents()
+    agent = _resolve_agent_id(agent_id, agents)
+    if agent is None:
+        _audit(trace_id, agent_id, tenant_id, mode, "not_found", 0, x_user_id, 404)
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Agent not found", "agent_id": agent_id, "suggestions": _get_suggestions(agent_id, agents)},
+        )
+
+    validation_error = _validate_and_check(agent, agent_id)
+    if validation_error:
+        _audit(trace_id, agent_id, tenant_id, mode, "not_executable", 0, x_user_id, validation_error["status"])
+        raise HTTPException(status_code=validation_error["status"], detail=validation_error["detail"])
+
+    # Plan limit antes de encolar (el uso se cuenta al terminar el job)
+    from backend.middleware.usage import _check_plan_limit
+    usage_slug = x_tenant_id or "credicefi"
+    limit_error = await _check_plan_limit(usage_slug)
+    if limit_error:
+        raise HTTPException(status_code=429, detail={"error": "Plan execution limit exceeded", "detail": limit_error})
+
+    job = await _offload(
+        get_job_queue().submit,
+        tenant_id=tenant_id,
+        agent=agent,
+        payload=body.payload,
+        dry_run=body.dry_run,
+        priority=body.priority,
+        max_attempts=body.max_attempts,
+        usage_slug=usage_slug,
+        user_id=x_user_id,
+    )
+    return JSONResponse(
+        status_code=202,
+        content={"success": True, "trace_id": trace_id, "poll_url": f"/agents/jobs/{job['id']}", **_public(job)},
+        headers={"Location": f"/agents/jobs/{job['id']}"},
+    )
+
+
+@router.get("/stats")
+async def job_queue_stats():
+    """Jobs por estado, workers y running por tenant."""
+    return await _offload(get_job_queue().stats)
+
+
+@router.get("")
+async def list_jobs(
+    x_tenant_id: Optional[str] = Header(None),
+    tenant_id: str = Query("default", description="Tenant (X-Tenant-ID has precedence)"),
+    status: Optional[str] = Query(None, description="queued | running | succeeded | failed | cancelled"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    jobs = await _offload(get_job_queue().list, x_tenant_id or tenant_id, status, limit)
+    return {"success": True, "count": len(jobs), "jobs": [_public(j) for j in jobs]}
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    x_tenant_id: Optional[str] = Header(None),
+    tenant_id: str = Query("default", description="Tenant (X-Tenant-ID has precedence)"),
+):
+    return _public(await _tenant_job(job_id, x_tenant_id or tenant_id))
+
+
+@router.delete("/{job_id}")
+async def cancel_job(
+    job_id: str,
+    x_tenant_id: Optional[str] = Header(None),
+    tenant_id: str = Query("default", description="Tenant (X-Tenant-ID has precedence)"),
+):
+    """Queued jobs are cancelled at once; running ones are cancelled cooperatively."""
+    await _tenant_job(job_id, x_tenant_id or tenant_id)
+    status = await _offload(get_job_queue().cancel, job_id)
+    if status in ("succeeded", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    return {"success": True, "job_id": job_id, "status": status}
@@ -0,0 +1,76 @@
+"""
+Benchmark: AgentResolver.suggest vs the linear scan over every agent id.
+
+Builds synthetic catalogs shaped like the real one ('<word>ia__<word>agent')
+at several sizes and times suggestions for typos, common fragments
+('agent', 'ia_') and short queries. The linear scan grows with the catalog;
+suggest() walks at most AgentResolver.MAX_POSTINGS postings, so its time
+should stay flat.
+
+Usage:
+    python scripts/bench_agent_resolver.py [--sizes 300,5000,50000] [--rounds R]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from services.agent_catalog import AgentResolver  # noqa: E402
+
+QUERIES = ("agent", "ia_", "ba")
+
+
+def _catalog(size: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bcdfglmnprstv" for v in "aeiou"]
+    agents = {}
+    while len(agents) < size:
+        word = "".join(rng.choice(syllables) for _ in range(4))
+        aid = f"{word}ia__{word}agent"
+        agents[aid] = {"id": aid, "file_path": f"marketing/{word}ia.py", "class_name": f"{word}agent"}
+    return agents
+
+
+def _linear(ids, query: str, limit: int = AgentResolver.SUGGESTIONS):
+    """Scan anterior de suggest (referencia)."""
+    return [aid for aid in ids if query in aid.lower()][:limit]
+
+
+def _time(fn, queries, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - t0) / (rounds * len(queries)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default="300,5000,50000")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'agents':>8} {'linear us':>10} {'suggest us':>11}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        agents = _catalog(size)
+        resolver = AgentResolver(agents)
+        ids = list(agents)
+        rng = random.Random(size)
+        typos = []
+        for target in rng.sample(ids, 20):
+            word = target.split("ia__")[0]
+            i = rng.randrange(2, len(word) - 1)
+            typos.append(word[:i] + "x" + word[i + 1:] + "ia")
+        queries = typos + list(QUERIES)
+        linear = _time(lambda q: _linear(ids, q), queries, args.rounds)
+        suggest = _time(resolver.suggest, queries, args.rounds)
+        print(f"{size:>8} {linear:>10.1f} {suggest:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: BillingManager.track_evaluation, previous lock + SQLite path vs
+the evaluation ledger (core/evaluation_ledger.py).
+
+Runs --threads threads doing --evaluations each over --tenants tenants and
+reports evaluations per second. The ledger time includes the final flush(),
+so every evaluation is checkpointed in SQLite.
+
+Usage:
+    python scripts/bench_billing_ledger.py [--threads N] [--evaluations E] [--tenants T]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+
+class PreviousTracker:
+    """track_evaluation anterior de core/billing_system.py (referencia)."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+
+    def track_evaluation(self, tenant_id: str):
+        with self.lock:
+            current_month = datetime.now().strftime('%Y-%m')
+            plan_type = self.manager._get_tenant_plan(tenant_id)
+            plan_config = self.manager.plans[plan_type]
+            with sqlite3.connect(self.manager.db_path) as conn:
+                row = conn.execute(
+                    "SELECT evaluations_count, overage_count FROM tenant_usage WHERE tenant_id = ? AND year_month = ?",
+                    (tenant_id, current_month),
+                ).fetchone()
+                new_count = row[0] + 1 if row else 1
+                new_overage = max(0, new_count - plan_config.monthly_evaluations)
+                if row:
+                    conn.execute(
+                        "UPDATE tenant_usage SET evaluations_count = ?, overage_count = ?, "
+                        "updated_at = CURRENT_TIMESTAMP WHERE tenant_id = ? AND year_month = ?",
+                        (new_count, new_overage, tenant_id, current_month),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO tenant_usage (tenant_id, year_month, evaluations_count, plan_type, "
+                        "monthly_limit, overage_count) VALUES (?, ?, ?, ?, ?, ?)",
+                        (tenant_id, current_month, new_count, plan_type.value,
+                         plan_config.monthly_evaluations, new_overage),
+                    )
+                conn.execute(
+                    "INSERT INTO billing_events (tenant_id, event_type, event_data) VALUES (?, ?, ?)",
+                    (tenant_id, 'evaluation_tracked', json.dumps({
+                        'evaluations_count': new_count,
+                        'monthly_limit': plan_config.monthly_evaluations,
+                        'overage_count': new_overage,
+                        'plan_type': plan_type.value
+                    })),
+                )
+                conn.commit()
+
+    def flush(self):
+        pass
+
+
+def _run(tracker, threads: int, evaluations: int, tenants: int) -> float:
+    def worker(offset: int) -> None:
+        for i in range(evaluations):
+            tracker.track_evaluation(f"tenant-{(offset + i) % tenants}")
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    tracker.flush()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--evaluations", type=int, default=500)
+    parser.add_argument("--tenants", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La instancia global de core.billing_system crea billing.db en el cwd
+        os.chdir(tmp)
+        from core.billing_system import BillingManager
+
+        previous = PreviousTracker(BillingManager(str(Path(tmp) / "previous.db")))
+        elapsed_previous = _run(previous, args.threads, args.evaluations, args.tenants)
+
+        manager = BillingManager(str(Path(tmp) / "ledger.db"))
+
+        class LedgerTracker:
+            track_evaluation = staticmethod(manager.track_evaluation)
+            flush = staticmethod(manager.ledger.flush)
+
+        elapsed_ledger = _run(LedgerTracker, args.threads, args.evaluations, args.tenants)
+        manager.ledger.close()
+        os.chdir(_PROJECT_ROOT)
+
+    total = args.threads * args.evaluations
+    print(f"{total} evaluations, {args.threads} threads, {args.tenants} tenants")
+    for name, elapsed in (("previous", elapsed_previous), ("ledger", elapsed_ledger)):
+        print(f"  {name:<9} {total / elapsed:>10,.0f} eval/s   {elapsed * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: serial vs parallel agent discovery on the real agents/ tree.
+
+Runs a cold scan (no discovery index) in each mode and checks that both
+produce the same catalog.
+
+Usage:
+    python scripts/bench_discovery.py [--workers N] [--repeat R]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from services.agent_discovery import run_discovery  # noqa: E402
+
+
+def _timed(agents_path: Path, workers: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        agents, stats = run_discovery(agents_path, index=None, workers=workers)
+        elapsed = time.perf_counter() - start
+    return elapsed, agents, stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    agents_path = _PROJECT_ROOT / "agents"
+    files = sum(1 for _ in agents_path.rglob("*.py"))
+    print(f"agents/: {files} .py files | cpus={os.cpu_count()} | workers={args.workers}")
+
+    results = {}
+    for label, workers in (("serial", 1), ("parallel", args.workers)):
+        times = []
+        for _ in range(args.repeat):
+            elapsed, agents, stats = _timed(agents_path, workers)
+            times.append(elapsed)
+        results[label] = (min(times), agents, stats)
+        print(f"{label:9} best={min(times):.3f}s  runs={', '.join(f'{t:.3f}' for t in times)}  agents={len(agents)}")
+
+    serial_t, serial_agents, serial_stats = results["serial"]
+    parallel_t, parallel_agents, parallel_stats = results["parallel"]
+
+    same = (
+        list(serial_agents) == list(parallel_agents)
+        and json.dumps(serial_agents, sort_keys=True) == json.dumps(parallel_agents, sort_keys=True)
+        and serial_stats == parallel_stats
+    )
+    print(f"speedup={serial_t / parallel_t:.2f}x  identical_results={same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
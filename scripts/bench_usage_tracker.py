@@ -0,0 +1,198 @@
+"""
+Benchmark: UsageTracker.log_request throughput (logged requests / second).
+
+Compares, on a fresh SQLite file each:
+- baseline:  previous implementation (connect + insert + commit per call,
+             then COUNT/SUM/AVG over the tenant's month and the limit check
+             on new connections);
+- sync:      UsageTracker(batched=False), incremental summary, one
+             transaction per call;
+- batched:   UsageTracker(), queue + single WAL writer; the time includes
+             the final flush(), so every request is on disk.
+
+The baseline slows down as the month fills up, so it is measured over the
+same number of requests as the others.
+
+Dashboard section: loads --days of raw logs for one tenant (--per-day
+requests a day over 3 agents) plus hourly rollups for --tenants other
+tenants, builds the rollups with reconcile_summaries(), and times a
+daily chart over the whole range read from the raw logs (what a dashboard
+did before) against get_timeseries() for typical charts.
+
+Usage:
+    python scripts/bench_usage_tracker.py [--requests N] [--tenants T] [--days D] [--per-day P]
+"""
+
+import argparse
+import io
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from services.usage_tracker import UsageTracker  # noqa: E402
+
+_AGENTS = ("credit_evaluator", "fraud_detector", "lead_scorer")
+
+
+class BaselineTracker:
+    """Camino de escritura anterior de services/usage_tracker.py (referencia)."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Mismo esquema (el anterior no llegaba a crear usage_summary por "limit")
+        with redirect_stdout(io.StringIO()):
+            UsageTracker(db_path, batched=False)
+
+    def log_request(self, tenant_id, endpoint, response_status=200, response_time_ms=0.0, tokens_used=0):
+        timestamp = datetime.now().isoformat()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT INTO usage_logs (log_id, tenant_id, timestamp, endpoint, method, response_status, "
+            "response_time_ms, tokens_used, agent_used, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(uuid.uuid4()), tenant_id, timestamp, endpoint, "POST", response_status,
+             response_time_ms, tokens_used, None, timestamp),
+        )
+        conn.commit()
+        conn.close()
+
+        year_month = datetime.now().strftime("%Y-%m")
+        conn = sqlite3.connect(self.db_path)
+        stats = conn.execute(
+            "SELECT COUNT(*), SUM(tokens_used), AVG(response_time_ms), "
+            "(SUM(CASE WHEN response_status BETWEEN 200 AND 299 THEN 1 ELSE 0 END) * 100.0 / COUNT(*)) "
+            "FROM usage_logs WHERE tenant_id = ? AND strftime('%Y-%m', timestamp) = ?",
+            (tenant_id, year_month),
+        ).fetchone()
+        conn.execute(
+            'INSERT OR REPLACE INTO usage_summary (tenant_id, year_month, total_requests, total_tokens, '
+            'avg_response_time_ms, success_rate, "limit", usage_percentage, last_updated) '
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (tenant_id, year_month, stats[0], stats[1], stats[2], stats[3], 999999,
+             stats[0] / 999999 * 100, datetime.now().isoformat()),
+        )
+        conn.commit()
+        conn.close()
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            'SELECT total_requests, "limit", usage_percentage FROM usage_summary '
+            "WHERE tenant_id = ? AND year_month = ?",
+            (tenant_id, year_month),
+        ).fetchone()
+        conn.commit()
+        conn.close()
+
+    def flush(self):
+        pass
+
+
+def _run(tracker, requests: int, tenants: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(requests):
+        tracker.log_request(
+            f"tenant-{i % tenants}", "/api/v1/evaluate",
+            response_status=200, response_time_ms=float(i % 500), tokens_used=100,
+        )
+    tracker.flush()
+    return time.perf_counter() - t0
+
+
+def _timed(fn, repeat: int = 20) -> float:
+    """Mediana en ms"""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def _dashboard(db_path: str, days: int, per_day: int, tenants: int) -> None:
+    with redirect_stdout(io.StringIO()):
+        tracker = UsageTracker(db_path)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    step = 86400 / per_day
+
+    conn = sqlite3.connect(db_path)
+    for day in range(days):
+        base = start + timedelta(days=day)
+        rows = []
+        for i in range(per_day):
+            ts = (base + timedelta(seconds=i * step)).isoformat()
+            rows.append((str(uuid.uuid4()), "acme", ts, "/api/v1/evaluate", "POST", 200 if i % 20 else 500,
+                         float(50 + i % 400), 100, _AGENTS[i % 3], ts))
+        conn.executemany("INSERT INTO usage_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    hours = [(f"tenant-{t}", (start + timedelta(hours=h)).isoformat()[:13], agent, 100, 2, 10000, 5000.0)
+             for t in range(tenants) for h in range(days * 24) for agent in _AGENTS]
+    conn.executemany("INSERT INTO usage_rollup_hour VALUES (?, ?, ?, ?, ?, ?, ?)", hours)
+    conn.commit()
+
+    t0 = time.perf_counter()
+    tracker.reconcile_summaries()
+    rebuild = time.perf_counter() - t0
+
+    raw_ms = _timed(lambda: conn.execute(
+        "SELECT substr(timestamp, 1, 10), COUNT(*), SUM(tokens_used), AVG(response_time_ms) FROM usage_logs "
+        "WHERE tenant_id = ? AND timestamp >= ? AND timestamp < ? GROUP BY 1",
+        ("acme", start.isoformat(), end.isoformat()),
+    ).fetchall(), repeat=5)
+    conn.close()
+
+    print(f"\ndashboard: {days} days x {per_day:,} requests/day raw for one tenant, "
+          f"+ {len(hours):,} hourly rollup rows ({tenants} tenants)")
+    print(f"  rollups rebuilt from raw logs in {rebuild:.1f} s")
+    print(f"  {'raw scan, daily chart over the range':<44} {raw_ms:>8.2f} ms")
+    charts = (
+        ("daily chart over the range", start, end, "day"),
+        ("hourly chart, last 7 days", end - timedelta(days=7), end, "hour"),
+        ("monthly chart over the range", start, end, "month"),
+        ("daily chart, unaligned 30 days (hourly)", end - timedelta(days=30, hours=5), end, "day"),
+    )
+    for label, a, b, granularity in charts:
+        ms = _timed(lambda: tracker.get_timeseries("acme", a, b, granularity))
+        source = tracker.get_timeseries("acme", a, b, granularity)["source"]
+        print(f"  {label:<44} {ms:>8.2f} ms   ({source})")
+    tracker.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-day", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for name, factory in (
+            ("baseline", lambda path: BaselineTracker(path)),
+            ("sync", lambda path: UsageTracker(path, batched=False)),
+            ("batched", lambda path: UsageTracker(path)),
+        ):
+            with redirect_stdout(io.StringIO()):
+                tracker = factory(str(Path(tmp) / f"{name}.db"))
+            elapsed = _run(tracker, args.requests, args.tenants)
+            if hasattr(tracker, "close"):
+                tracker.close()
+            results.append((name, elapsed))
+
+        print(f"{args.requests} requests, {args.tenants} tenants")
+        base = results[0][1]
+        for name, elapsed in results:
+            print(f"  {name:<9} {args.requests / elapsed:>10,.0f} req/s   {elapsed * 1000:>8.1f} ms   x{base / elapsed:.1f}")
+
+        _dashboard(str(Path(tmp) / "dashboard.db"), args.days, args.per_day, args.tenants)
+
+
+if __name__ == "__main__":
+    main()
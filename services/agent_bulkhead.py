@@ -0,0 +1,173 @@
+"""
+Agent Bulkheads — per-agent and per-tenant concurrency limits.
+
+A slow or hung agent may only hold its own slots: once an agent (or a
+tenant) has `limit` executions in flight, further calls are rejected at
+once with BulkheadFullError carrying a Retry-After estimate (the agent's
+recent average latency) instead of queueing behind it.
+
+Limits:
+- per agent: MAX_CONCURRENCY declared by the agent (catalog metadata
+  max_concurrency), else AGENT_MAX_CONCURRENCY (default 16, 0 = unlimited)
+- per tenant: AGENT_TENANT_MAX_CONCURRENCY (default 32, 0 = unlimited)
+
+Agent ids and tenant ids come from the request, so idle compartments
+are kept in an LRU of AGENT_BULKHEAD_MAX_KEYS entries per scope
+(default 1024); compartments with executions in flight are never evicted.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from services.env import env_int
+
+_EWMA_ALPHA = 0.2
+
+
+def execution_timeout(agent: Optional[Dict[str, Any]]) -> Optional[float]:
+    """EXECUTION_TIMEOUT del agente, si no AGENT_EXECUTION_TIMEOUT (default 120s, 0 = sin timeout)."""
+    if agent is not None and agent.get("execution_timeout"):
+        return float(agent["execution_timeout"])
+    try:
+        value = float(os.environ.get("AGENT_EXECUTION_TIMEOUT", "120"))
+    except ValueError:
+        value = 120.0
+    return value if value > 0 else None
+
+
+class BulkheadFullError(Exception):
+    """Agent or tenant has no free execution slot."""
+
+    def __init__(self, scope: str, key: str, limit: int, retry_after: int):
+        self.scope = scope
+        self.key = key
+        self.limit = limit
+        self.retry_after = retry_after
+        super().__init__(f"{scope} '{key}' at its concurrency limit ({limit}); retry in {retry_after}s")
+
+
+class _Compartment:
+    __slots__ = ("active", "limit", "peak", "admitted", "rejected", "timeouts", "errors", "latency_ewma")
+
+    def __init__(self, limit: int = 0):
+        self.active = 0
+        self.limit = limit
+        self.peak = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latency_ewma = 0.0
+
+
+class BulkheadRegistry:
+    """Thread-safe counters; acquire() never blocks."""
+
+    def __init__(self, agent_limit: int = 16, tenant_limit: int = 32, max_keys: int = 1024):
+        self.agent_limit = max(0, agent_limit)
+        self.tenant_limit = max(0, tenant_limit)
+        self.max_keys = max(1, max_keys)
+        self._agents: "OrderedDict[str, _Compartment]" = OrderedDict()
+        self._tenants: "OrderedDict[str, _Compartment]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> "BulkheadRegistry":
+        return cls(
+            env_int("AGENT_MAX_CONCURRENCY", 16),
+            env_int("AGENT_TENANT_MAX_CONCURRENCY", 32),
+            env_int("AGENT_BULKHEAD_MAX_KEYS", 1024),
+        )
+
+    def limit_for(self, agent: Dict[str, Any]) -> int:
+        declared = agent.get("max_concurrency")
+        return int(declared) if declared else self.agent_limit
+
+    @staticmethod
+    def _retry_after(comp: _Compartment) -> int:
+        return max(1, int(math.ceil(comp.latency_ewma))) if comp.latency_ewma else 1
+
+    def _compartment(self, table: "OrderedDict[str, _Compartment]", key: str) -> _Compartment:
+        """Compartimento de `key` (el mas reciente del LRU); desaloja los inactivos mas viejos."""
+        comp = table.get(key)
+        if comp is not None:
+            table.move_to_end(key)
+            return comp
+        comp = table[key] = _Compartment()
+        if len(table) > self.max_keys:
+            for old in [k for k, c in table.items() if c.active == 0 and k != key][: len(table) - self.max_keys]:
+                del table[old]
+                self.evicted += 1
+        return comp
+
+    def acquire(self, agent_id: str, tenant_id: str, agent_limit: int) -> None:
+        with self._lock:
+            agent = self._compartment(self._agents, agent_id)
+            tenant = self._compartment(self._tenants, tenant_id)
+            agent.limit = agent_limit
+
+            if agent_limit and agent.active >= agent_limit:
+                agent.rejected += 1
+                raise BulkheadFullError("agent", agent_id, agent_limit, self._retry_after(agent))
+            if self.tenant_limit and tenant.active >= self.tenant_limit:
+                tenant.rejected += 1
+                raise BulkheadFullError("tenant", tenant_id, self.tenant_limit, self._retry_after(agent))
+
+            for comp in (agent, tenant):
+                comp.active += 1
+                comp.admitted += 1
+                comp.peak = max(comp.peak, comp.active)
+
+    def release(self, agent_id: str, tenant_id: str, elapsed: float, outcome: str = "ok") -> None:
+        """outcome: ok | error | timeout | cancelled."""
+        with self._lock:
+            for comp in (self._agents[agent_id], self._tenants[tenant_id]):
+                comp.active -= 1
+                if outcome == "timeout":
+                    comp.timeouts += 1
+                elif outcome == "error":
+                    comp.errors += 1
+                comp.latency_ewma = (
+                    elapsed if not comp.latency_ewma
+                    else _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * comp.latency_ewma
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        def view(comp: _Compartment, limit: int) -> Dict[str, Any]:
+            return {
+                "active": comp.active,
+                "limit": limit or None,
+                "saturation": round(comp.active / limit, 3) if limit else 0.0,
+                "peak": comp.peak,
+                "admitted": comp.admitted,
+                "rejected": comp.rejected,
+                "timeouts": comp.timeouts,
+                "errors": comp.errors,
+                "avg_latency_ms": round(comp.latency_ewma * 1000, 1),
+            }
+
+        with self._lock:
+            return {
+                "default_agent_limit": self.agent_limit or None,
+                "tenant_limit": self.tenant_limit or None,
+                "evicted": self.evicted,
+                "agents": {k: view(c, c.limit) for k, c in self._agents.items()},
+                "tenants": {k: view(c, self.tenant_limit) for k, c in self._tenants.items()},
+            }
+
+
+_registry: Optional[BulkheadRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_bulkheads() -> BulkheadRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = BulkheadRegistry.from_env()
+    return _registry
@@ -0,0 +1,522 @@
+"""
+Agent Catalog — indexed query engine over the discovered agents.
+
+Built once after discovery so the catalog endpoints filter through
+inverted/sorted/trigram indexes instead of scanning every agent on every
+request. Results keep catalog (discovery) order and pagination semantics.
+
+Also holds the pre-encoded response cache: each filter combination is
+serialized once per catalog version and served with a strong ETag, the
+agent-id resolver used by the execution endpoints, and the current
+catalog snapshot, which hot-reload swaps atomically.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from services.agent_discovery import LABEL_MIN_MAP
+
+logger = logging.getLogger("nadakki.catalog")
+
+_CATEGORICAL_FIELDS = ("module", "submodule", "platform", "category", "status", "api_version")
+_SEARCH_FIELDS = ("id", "name", "class_name")
+
+_EMPTY: FrozenSet[int] = frozenset()
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_DEFAULT_ALIASES_PATH = _PROJECT_ROOT / "config" / "agent_aliases.json"
+
+
+def enrich_agent(agent: dict) -> dict:
+    """Catalog view of an agent: adds execute_endpoint, hides execute/run on backups."""
+    a = dict(agent)  # shallow copy
+    agent_id = a.get("id", "")
+    is_backup = "_backup_" in agent_id
+    action_methods = a.get("action_methods", [])
+    has_execute = "execute" in action_methods or "run" in action_methods
+
+    if is_backup:
+        # Backup agents: remove execute/run from visible action_methods
+        a["action_methods"] = [m for m in action_methods if m not in ("execute", "run")]
+        a["execute_endpoint"] = None
+    elif has_execute:
+        a["execute_endpoint"] = "/agents/execute"
+    else:
+        a["execute_endpoint"] = None
+    return a
+
+
+def encode_json(payload: Any) -> bytes:
+    """Same bytes FastAPI's JSONResponse would produce for plain JSON data."""
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def catalog_version(agents: Dict[str, dict]) -> str:
+    """Content hash of the catalog; changes whenever ALL_AGENTS changes."""
+    return hashlib.sha256(encode_json(agents)).hexdigest()[:16]
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CatalogQueryEngine:
+    """
+    Read-only query engine for one catalog snapshot.
+
+    - inverted indexes (lowercased value -> positions) for categorical fields
+    - label rank buckets and has_platform partitions
+    - sorted (value, position) arrays for score and confidence
+    - trigram postings over id/name/class_name/reasons for `search`
+    - precomputed enriched records, returned as-is (treat them as read-only)
+    """
+
+    def __init__(self, agents: Dict[str, dict]):
+        records = list(agents.values())
+        self.size = len(records)
+        self.version = catalog_version(agents)
+        self._enriched: List[dict] = [enrich_agent(a) for a in records]
+
+        self._postings: Dict[str, Dict[str, Set[int]]] = {f: {} for f in _CATEGORICAL_FIELDS}
+        self._labels: Dict[str, Set[int]] = {}
+        self._ranks: Dict[int, Set[int]] = {}
+        self._with_platform: Set[int] = set()
+        self._without_platform: Set[int] = set()
+        self._scores: List[float] = []
+        self._confidences: List[float] = []
+        self._search_fields: List[Tuple[str, ...]] = []
+        self._trigrams: Dict[str, Set[int]] = {}
+
+        for pos, a in enumerate(records):
+            for field in _CATEGORICAL_FIELDS:
+                key = (a.get(field) or "").lower()
+                self._postings[field].setdefault(key, set()).add(pos)
+
+            label = a.get("label")
+            self._labels.setdefault(label, set()).add(pos)
+            rank = LABEL_MIN_MAP.get((label or "not_agent").lower(), 0)
+            self._ranks.setdefault(rank, set()).add(pos)
+
+            (self._with_platform if a.get("platform") else self._without_platform).add(pos)
+
+            self._scores.append(float(a.get("score", 0.0)))
+            self._confidences.append(float(a.get("confidence", 0.0)))
+
+            fields = tuple(
+                [a.get(f, "").lower() for f in _SEARCH_FIELDS]
+                + [r.lower() for r in a.get("reasons", [])]
+            )
+            self._search_fields.append(fields)
+            for text in fields:
+                for gram in _trigrams(text):
+                    self._trigrams.setdefault(gram, set()).add(pos)
+
+        self._score_sorted = sorted((s, i) for i, s in enumerate(self._scores))
+        self._score_keys = [s for s, _ in self._score_sorted]
+        self._conf_sorted = sorted((c, i) for i, c in enumerate(self._confidences))
+        self._conf_keys = [c for c, _ in self._conf_sorted]
+
+    # -- index lookups ------------------------------------------------------
+
+    def _score_range(self, lo: float, hi: float) -> Set[int]:
+        start = bisect_left(self._score_keys, lo)
+        end = bisect_right(self._score_keys, hi)
+        return {i for _, i in self._score_sorted[start:end]}
+
+    def _confidence_at_least(self, lo: float) -> Set[int]:
+        start = bisect_left(self._conf_keys, lo)
+        return {i for _, i in self._conf_sorted[start:]}
+
+    def _search_candidates(self, s: str) -> Optional[Set[int]]:
+        """Positions that may contain `s` (None = index can't narrow it)."""
+        if len(s) < 3:
+            return None
+        grams = sorted((self._trigrams.get(g, _EMPTY) for g in _trigrams(s)), key=len)
+        return set(grams[0]).intersection(*grams[1:])
+
+    def _matches(self, pos: int, s: str) -> bool:
+        return any(s in text for text in self._search_fields[pos])
+
+    @staticmethod
+    def _intersect(sets: List[Iterable[int]]) -> Set[int]:
+        sets = sorted(sets, key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            if not result:
+                break
+            result.intersection_update(other)
+        return result
+
+    # -- query --------------------------------------------------------------
+
+    def query(
+        self,
+        module: Optional[str] = None,
+        submodule: Optional[str] = None,
+        platform: Optional[str] = None,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        search: Optional[str] = None,
+        min_score: float = 0.0,
+        max_score: float = 10.0,
+        confidence_min: float = 0.0,
+        label_min: str = "not_agent",
+        confirmed_only: bool = False,
+        has_platform: Optional[bool] = None,
+        api_version: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> Tuple[int, List[dict]]:
+        """Returns (total_matches, enriched page) with the same semantics as the legacy filters."""
+        sets: List[Iterable[int]] = []
+
+        for field, value in (
+            ("module", module),
+            ("submodule", submodule),
+            ("platform", platform),
+            ("category", category),
+            ("status", status),
+            ("api_version", api_version),
+        ):
+            if value:
+                sets.append(self._postings[field].get(value.lower(), _EMPTY))
+
+        if confirmed_only:
+            sets.append(self._labels.get("agent_confirmed", _EMPTY))
+
+        min_rank = LABEL_MIN_MAP.get((label_min or "not_agent").lower(), 0)
+        if min_rank > 0:
+            ranked: Set[int] = set()
+            for rank, positions in self._ranks.items():
+                if rank >= min_rank:
+                    ranked |= positions
+            sets.append(ranked)
+
+        if has_platform is not None:
+            sets.append(self._with_platform if has_platform else self._without_platform)
+
+        candidates: Optional[Set[int]] = self._intersect(sets) if sets else None
+
+        # Range filters: skipped when they can't exclude anything
+        score_active = self._score_keys and (
+            min_score > self._score_keys[0] or max_score < self._score_keys[-1]
+        )
+        if score_active:
+            if candidates is None:
+                candidates = self._score_range(min_score, max_score)
+            else:
+                candidates = {i for i in candidates if min_score <= self._scores[i] <= max_score}
+
+        if self._conf_keys and confidence_min > self._conf_keys[0]:
+            if candidates is None:
+                candidates = self._confidence_at_least(confidence_min)
+            else:
+                candidates = {i for i in candidates if self._confidences[i] >= confidence_min}
+
+        if search:
+            s = search.lower()
+            if candidates is None:
+                candidates = self._search_candidates(s)
+                if candidates is None:
+                    candidates = set(range(self.size))
+            candidates = {i for i in candidates if self._matches(i, s)}
+
+        if candidates is None:
+            total = self.size
+            page = range(offset, min(self.size, offset + limit))
+        else:
+            ordered = sorted(candidates)
+            total = len(ordered)
+            page = ordered[offset:offset + limit]
+
+        return total, [self._enriched[i] for i in page]
+
+
+# ---------------------------------------------------------------------------
+# Pre-encoded responses + ETags
+# ---------------------------------------------------------------------------
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CatalogResponseCache:
+    """
+    LRU of encoded catalog responses keyed by (catalog version, query key).
+
+    A new catalog version never hits entries built from an older one;
+    those age out of the LRU (or are dropped with clear()).
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        if maxsize is None:
+            maxsize = int(os.environ.get("CATALOG_RESPONSE_CACHE_SIZE", "512"))
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, Hashable], CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: str, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get((version, key))
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return cached
+
+    def put(self, version: str, key: Hashable, payload: Any) -> CachedResponse:
+        body = encode_json(payload)
+        cached = CachedResponse(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        if self.maxsize <= 0:
+            return cached
+        with self._lock:
+            self._entries[(version, key)] = cached
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return cached
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# ---------------------------------------------------------------------------
+# Agent-id resolution (short ids, aliases, suggestions)
+# ---------------------------------------------------------------------------
+
+def _is_backup(agent_id: str) -> bool:
+    return "_backup_" in agent_id
+
+
+def _pick(candidates: List[dict]) -> dict:
+    """Entre varios matches: el primero en produccion, si no el primero (orden del catalogo)."""
+    for c in candidates:
+        if c.get("status") == "production":
+            return c
+    return candidates[0]
+
+
+def _padded_trigrams(text: str) -> Set[str]:
+    return _trigrams(f"${text}$")
+
+
+def load_agent_aliases(path: Optional[Path] = None) -> Dict[str, str]:
+    """
+    Tabla explicita alias -> agent id (AGENT_ALIASES_PATH, default config/agent_aliases.json).
+    Archivo ausente o invalido = sin aliases explicitos.
+    """
+    path = Path(path or os.environ.get("AGENT_ALIASES_PATH") or _DEFAULT_ALIASES_PATH)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as exc:
+        logger.warning("Agent aliases unreadable (%s): %s", path, exc)
+        return {}
+    return {str(k).lower(): str(v) for k, v in raw.items()} if isinstance(raw, dict) else {}
+
+
+class AgentResolver:
+    """
+    O(1) agent-id resolution for one catalog snapshot.
+
+    - long ids ('file__class'): exact dict lookup, backups excluded
+    - short ids: suffix map with every '__<suffix>' of every id, so the
+      result is the same as scanning for id.endswith('__' + short)
+    - on a miss: explicit alias table, then derived aliases (lowercase
+      id, file stem, class name; '-' read as '_')
+    - suggestions: substring matches first, then padded-trigram Dice
+      similarity, from trigram postings (no scan of the catalog). Query
+      grams are read rarest first and at most MAX_POSTINGS postings are
+      walked, so common grams ('agent', 'ia_', '__') are skipped and the
+      work does not grow with the catalog (with tens of thousands of ids,
+      where every gram is common, typo suggestions become best-effort).
+      Queries under 3 characters read a 1-2 character substring index.
+    """
+
+    SUGGESTIONS = 5
+    MAX_POSTINGS = 64
+
+    def __init__(self, agents: Dict[str, dict], aliases: Optional[Dict[str, str]] = None):
+        self._agents = agents
+        self._ids: List[str] = []
+        self._lower: List[str] = []
+        self._short_grams: Dict[str, List[int]] = {}
+        suffixes: Dict[str, List[dict]] = {}
+        derived: Dict[str, List[dict]] = {}
+        self._grams: Dict[str, List[int]] = {}
+        self._gram_counts: List[int] = []
+
+        for aid, agent in agents.items():
+            if _is_backup(aid):
+                continue
+            pos = len(self._ids)
+            self._ids.append(aid)
+            lower = aid.lower()
+            self._lower.append(lower)
+            for short in {lower[i:i + n] for n in (1, 2) for i in range(len(lower) - n + 1)}:
+                self._short_grams.setdefault(short, []).append(pos)
+
+            start = aid.find("__")
+            while start != -1:
+                suffix = aid[start + 2:]
+                if "__" not in suffix:
+                    suffixes.setdefault(suffix, []).append(agent)
+                start = aid.find("__", start + 1)
+
+            keys = {aid.lower()}
+            file_path = agent.get("file_path") or ""
+            if file_path:
+                keys.add(Path(file_path).stem.lower())
+            if agent.get("class_name"):
+                keys.add(agent["class_name"].lower())
+            for key in keys:
+                derived.setdefault(key, []).append(agent)
+
+            grams = _padded_trigrams(lower)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(pos)
+
+        self._short: Dict[str, dict] = {k: _pick(v) for k, v in suffixes.items()}
+        self._derived: Dict[str, dict] = {k: _pick(v) for k, v in derived.items()}
+        self._aliases: Dict[str, dict] = {}
+        for alias, target in (aliases or {}).items():
+            agent = self._resolve_exact(target)
+            if agent is not None:
+                self._aliases[alias] = agent
+            else:
+                logger.warning("Agent alias %r points to unknown agent %r", alias, target)
+
+    def _resolve_exact(self, agent_id: str) -> Optional[dict]:
+        if "__" in agent_id:
+            if _is_backup(agent_id):
+                return None
+            return self._agents.get(agent_id)
+        return self._short.get(agent_id)
+
+    def resolve(self, agent_id: str) -> Optional[dict]:
+        agent = self._resolve_exact(agent_id)
+        if agent is not None:
+            return agent
+        key = agent_id.strip().lower()
+        for candidate in (key, key.replace("-", "_")):
+            agent = self._aliases.get(candidate) or self._derived.get(candidate)
+            if agent is None and candidate != agent_id:
+                agent = self._resolve_exact(candidate)
+            if agent is not None:
+                return agent
+        return None
+
+    def _candidates(self, grams: Set[str]) -> Dict[int, int]:
+        """posicion -> trigramas en comun, recorriendo a lo sumo MAX_POSTINGS postings"""
+        overlap: Dict[int, int] = {}
+        budget = self.MAX_POSTINGS
+        # Del trigrama mas raro al mas comun: los comunes ('agent', 'ia_', '__') casi no discriminan
+        for postings in sorted((self._grams[g] for g in grams if g in self._grams), key=len):
+            if len(postings) > budget:
+                if overlap:
+                    break
+                postings = postings[:budget]  # solo trigramas comunes
+            budget -= len(postings)
+            for pos in postings:
+                overlap[pos] = overlap.get(pos, 0) + 1
+        return overlap
+
+    def suggest(self, agent_id: str, limit: int = SUGGESTIONS) -> List[str]:
+        search = agent_id.lower()
+        if len(search) < 3:
+            # Muy corto para trigramas utiles: substring, desde el indice de 1-2 caracteres
+            positions = self._short_grams.get(search, []) if search else range(len(self._ids))
+            return [self._ids[pos] for pos in positions[:limit]]
+        grams = _padded_trigrams(search)
+        overlap = self._candidates(grams)
+        if not overlap:
+            return []
+
+        # (no es substring, -Dice, posicion)
+        size, lower, counts = len(grams), self._lower, self._gram_counts
+        ranked = [
+            (search not in lower[pos], -2.0 * n / (size + counts[pos]), pos) for pos, n in overlap.items()
+        ]
+        return [self._ids[pos] for _, _, pos in heapq.nsmallest(limit, ranked)]
+
+
+# ---------------------------------------------------------------------------
+# Current catalog snapshot (atomic swap on hot-reload)
+# ---------------------------------------------------------------------------
+
+class CatalogSnapshot:
+    """One immutable catalog version: agents + stats + query engine."""
+
+    def __init__(self, agents: Dict[str, dict], stats: Dict[str, Any]):
+        self.agents = agents
+        self.stats = stats
+        self.engine = CatalogQueryEngine(agents)
+        self.resolver = AgentResolver(agents, load_agent_aliases())
+        self.version = self.engine.version
+        self.loaded_at = time.time()
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_listeners: List[Callable[[CatalogSnapshot], None]] = []
+_publish_lock = threading.Lock()
+
+
+def current_catalog() -> Optional[CatalogSnapshot]:
+    """The catalog version requests should use (read the reference once per request)."""
+    return _snapshot
+
+
+def publish_catalog(agents: Dict[str, dict], stats: Dict[str, Any]) -> CatalogSnapshot:
+    """Build a snapshot (indexes included) and swap it in with a single reference assignment."""
+    global _snapshot
+    snapshot = CatalogSnapshot(agents, stats)
+    with _publish_lock:
+        _snapshot = snapshot
+        for callback in list(_listeners):
+            try:
+                callback(snapshot)
+            except Exception as exc:
+                logger.warning("Catalog change listener failed: %s", exc)
+    return snapshot
+
+
+def on_catalog_change(callback: Callable[[CatalogSnapshot], None]) -> None:
+    _listeners.append(callback)
@@ -0,0 +1,818 @@
+"""
+Agent Discovery — AST scanning and scoring of agent files (v5.4.4).
+
+Pure functions with no app side effects, so they can run in worker
+processes (parallel discovery) as well as in main.intelligent_discovery.
+"""
+
+import ast
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services.discovery_index import DiscoveryIndex, content_hash
+
+logger = logging.getLogger("nadakki.discovery")
+
+# =============================================================================
+# CONFIGURACIÓN ROBUSTA
+# =============================================================================
+
+FOLDER_BLACKLIST: Set[str] = {
+    "__pycache__", ".git", ".venv", "venv", "node_modules",
+    "backup", "legacy", "tests", "testing", "test"
+}
+
+NON_AGENT_KEYWORDS: Set[str] = {
+    "test_", "_test", "mock_", "fake_", "dummy_", "example_", "demo_",
+    "base_", "abstract_", "mixin_", "interface_"
+}
+
+def safe_unparse(node) -> str:
+    """Compatible Python 3.8+"""
+    try:
+        if hasattr(ast, "unparse"):
+            return ast.unparse(node)
+    except Exception:
+        pass
+    return getattr(node, "id", "") or getattr(node, "attr", "") or node.__class__.__name__
+
+def detect_module_context(filepath: str) -> str:
+    """Detecta módulo real"""
+    p = (filepath or "").replace("\\", "/").lower()
+    parts = [x for x in p.split("/") if x]
+
+    if "agents" in parts:
+        idx = parts.index("agents")
+        if idx + 1 < len(parts):
+            return parts[idx + 1]
+
+    for seg in parts:
+        if seg not in ("src", "app", "backend", "services", "api"):
+            return seg
+    return ""
+
+def should_ignore_path(rel_path: str) -> bool:
+    """Ignora por RUTA"""
+    p = rel_path.replace("\\", "/").lower()
+    parts = p.split("/")
+
+    for part in parts:
+        if part in FOLDER_BLACKLIST:
+            return True
+
+    filename = parts[-1] if parts else ""
+
+    if any(kw in filename for kw in NON_AGENT_KEYWORDS):
+        if ("agent" in filename) or ("ia" in filename):
+            return False
+        return filename.endswith("_test.py") or filename.startswith("test_")
+
+    return False
+
+# =============================================================================
+# DETECTOR INTELIGENTE
+# =============================================================================
+
+class IntelligentAgentDetector:
+    """Detector adaptable"""
+    
+    ACTION_METHODS = {
+        "execute", "run", "process", "handle", "create",
+        "generate", "optimize", "manage", "analyze", "predict",
+        "invoke", "call", "start", "begin"
+    }
+
+    AGENT_CLASS_KEYWORDS = {
+        "agent", "ia", "manager", "strategist", "generator",
+        "optimizer", "creator", "analyzer", "predictor", "assistant", 
+        "runner", "handler", "processor", "orchestrator"
+    }
+
+    NON_CONCRETE_KEYWORDS = {
+        "base", "abstract", "test", "mock", "fake", "dummy", 
+        "example", "demo", "placeholder", "mixin", "interface"
+    }
+
+    @staticmethod
+    def has_substantial_body(method_node) -> bool:
+        """Verifica lógica real"""
+        if not hasattr(method_node, "body"):
+            return False
+        body = method_node.body
+        if not body:
+            return False
+
+        if len(body) == 1:
+            first = body[0]
+            if isinstance(first, ast.Pass):
+                return False
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and first.value.value is Ellipsis:
+                return False
+            if isinstance(first, ast.Raise):
+                exc = first.exc
+                if isinstance(exc, ast.Call):
+                    func_name = getattr(exc.func, "id", "") or getattr(exc.func, "attr", "")
+                    if "notimplementederror" in (func_name or "").lower():
+                        return False
+        return True
+
+    @staticmethod
+    def detect_agent_type(node: ast.ClassDef, content: str) -> str:
+        """Detecta tipo: IA vs Agent"""
+        n = node.name.lower()
+        c = (content or "").lower()
+        if any(x in c for x in ("openai", "anthropic", "claude", "gpt", "llm", "embedding")):
+            return "IA"
+        if any(x in n for x in ("ia", "ai", "intelligence")):
+            return "IA"
+        return "Agent"
+
+    @staticmethod
+    def detect_api_version(content: str, imports: List[str]) -> str:
+        """
+        🔧 FIX 2: Detecta API version mejorado
+        Busca en imports + contenido
+        """
+        c = content.lower()
+        
+        # Por imports
+        if "openai" in imports:
+            if "openai.OpenAI" in content or "from openai import" in content:
+                return "openai_v1"
+            elif "openai.Completion" in content:
+                return "openai_v0"
+        
+        if "anthropic" in imports:
+            if "anthropic.Anthropic" in content or "from anthropic import" in content:
+                return "anthropic_v1"
+        
+        if "cohere" in imports:
+            return "cohere"
+        
+        if "together" in imports:
+            return "together"
+        
+        if "langchain" in imports:
+            return "langchain"
+        
+        if "llamaindex" in imports:
+            return "llamaindex"
+        
+        # Por contenido (fallback)
+        if "openai" in c:
+            if "openai.OpenAI(" in c:
+                return "openai_v1"
+            elif "openai.Completion" in c:
+                return "openai_v0"
+        
+        if "anthropic" in c:
+            return "anthropic_v1"
+        
+        if "cohere" in c:
+            return "cohere"
+        
+        return "unknown"
+
+    @staticmethod
+    def extract_imports(tree: ast.AST) -> List[str]:
+        """Extrae imports"""
+        imports = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    imports.append(alias.name.split(".")[0])
+            elif isinstance(node, ast.ImportFrom):
+                if node.module:
+                    imports.append(node.module.split(".")[0])
+        
+        return sorted(list(set(imports)))
+
+    @staticmethod
+    def count_llm_calls(content: str) -> int:
+        """Cuenta llamadas a LLMs"""
+        count = 0
+        llm_patterns = [
+            r"openai\.",
+            r"anthropic\.",
+            r"cohere\.",
+            r"together\.",
+            r"\.create\(",
+            r"\.generate\(",
+            r"ChatCompletion",
+            r"Message\.create",
+        ]
+        
+        for pattern in llm_patterns:
+            count += len(re.findall(pattern, content, re.IGNORECASE))
+        
+        return count
+
+# =============================================================================
+# SIGNAL GROUPS Y ANTI-SIGNALS
+# =============================================================================
+
+SIGNAL_GROUPS = {
+    "llm": ["openai", "chatcompletion", "anthropic", "claude", "gpt", "embedding", "llm"],
+    "http": ["requests.", "httpx.", "aiohttp", "api_key", "client."],
+    "framework": ["fastapi", "pydantic", "langchain", "llamaindex", "crewai"],
+    "marketing_ads": ["adwords", "google ads", "campaign", "ad group", "search terms", "rsa", "roas", "ctr"],
+    "orchestration": ["orchestrat", "workflow", "pipeline"]
+}
+
+ANTI_SIGNALS = [
+    ("google_analytics", ["google analytics", "ga4", "gtag", "measurement id"], 1.2),
+    ("pure_utils", ["argparse", "click.command", "typer.", "def main("], 1.0),
+    ("models_only", ["basemodel", "pydantic.basemodel", "class config"], 0.8),
+]
+
+LABEL_ORDER = ["not_agent", "agent_possible", "agent_likely", "agent_highly_likely", "agent_confirmed"]
+LABEL_MIN_MAP = {k: i for i, k in enumerate(LABEL_ORDER)}
+
+# =============================================================================
+# 🔧 FIX 1: SCORING OPTIMIZADO (menos conservador)
+# =============================================================================
+
+def score_agent_class_v2_enhanced(
+    node: ast.ClassDef,
+    filename: str,
+    content: str,
+    tree: ast.AST,
+    filepath: str = ""
+) -> Dict[str, Any]:
+    """Scoring optimizado con thresholds mejorados"""
+    
+    class_name = (node.name or "").lower()
+    filename_lower = (filename or "").lower()
+    content_lower = (content or "").lower()
+
+    reasons: List[str] = []
+    score = 0.0
+    metadata: Dict[str, Any] = {
+        "has_inheritance": False,
+        "inherits_from": "",
+        "has_decorators": False,
+        "decorators": [],
+        "method_count": 0,
+        "substantial_methods": 0,
+        "content_signal_groups": [],
+        "detected_type": "unknown",
+        "action_methods_found": [],
+        "api_version": "unknown",
+        "dependencies": [],
+        "llm_call_count": 0
+    }
+
+    module_context = detect_module_context(filepath) if filepath else ""
+    weights = {
+        "inheritance": 3.5,
+        "class_keywords": 1.8,
+        "action_methods": 3.5,
+        "docstring_length": 1.2,
+        "docstring_keywords": 0.7,
+        "filename_agent": 0.7,
+        "decorators": 2.0,
+        "module_bonus": 1.0 if module_context in ["marketing", "ads", "advertising"] else 0.0,
+    }
+
+    # 1. HERENCIA
+    for base in node.bases:
+        base_name = ""
+        if isinstance(base, ast.Name):
+            base_name = (base.id or "").lower()
+        elif isinstance(base, ast.Attribute):
+            base_name = (getattr(base, "attr", "") or "").lower()
+
+        if any(k in base_name for k in ("agent", "ia", "runner", "tool", "assistant", "processor", "handler")):
+            score += weights["inheritance"]
+            metadata["has_inheritance"] = True
+            metadata["inherits_from"] = base_name
+            reasons.append(f"inheritance:{base_name}")
+            break
+
+    # 2. DECORADORES
+    if node.decorator_list:
+        for decorator in node.decorator_list:
+            decorator_str = safe_unparse(decorator).lower()
+            metadata["decorators"].append(decorator_str)
+            if any(dec in decorator_str for dec in ("agent", "tool", "function", "llm", "task")):
+                score += weights["decorators"]
+                metadata["has_decorators"] = True
+                reasons.append(f"decorator:{decorator_str[:30]}")
+
+    # 3. NOMBRE DE CLASE
+    class_keywords_found = [kw for kw in IntelligentAgentDetector.AGENT_CLASS_KEYWORDS if kw in class_name]
+    if class_keywords_found:
+        score += weights["class_keywords"]
+        reasons.append(f"class_keywords:{','.join(sorted(set(class_keywords_found)))}")
+
+    # 4. DOCSTRING
+    doc = ast.get_docstring(node) or ""
+    if doc.strip():
+        d = doc.strip()
+        if len(d) >= 20:
+            score += weights["docstring_length"]
+            reasons.append("docstring>=20")
+        elif len(d) >= 10:
+            score += weights["docstring_length"] * 0.5
+            reasons.append("docstring>=10")
+
+        doc_lower = d.lower()
+        doc_keywords = ["agent", "ia", "execute", "run", "process", "optimize", "generate", "analyze"]
+        doc_keywords_found = [kw for kw in doc_keywords if kw in doc_lower]
+        if doc_keywords_found:
+            score += weights["docstring_keywords"]
+            reasons.append(f"docstring_keywords:{','.join(sorted(set(doc_keywords_found)))}")
+
+    # 5. MÉTODOS
+    action_methods_found: List[str] = []
+    for item in node.body:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            metadata["method_count"] += 1
+            if IntelligentAgentDetector.has_substantial_body(item):
+                metadata["substantial_methods"] += 1
+                if item.name in IntelligentAgentDetector.ACTION_METHODS:
+                    action_methods_found.append(item.name)
+
+    metadata["action_methods_found"] = sorted(set(action_methods_found))
+
+    if action_methods_found:
+        score += min(weights["action_methods"], 2.5 + 0.6 * len(set(action_methods_found)))
+        reasons.append(f"action_methods:{','.join(sorted(set(action_methods_found)))}")
+    elif metadata["substantial_methods"] > 0:
+        score += weights["action_methods"] * 0.3
+        reasons.append(f"substantial_methods:{metadata['substantial_methods']}")
+
+    # 6. SEÑALES POR GRUPOS
+    group_hits = 0
+    group_details = []
+    for group, kws in SIGNAL_GROUPS.items():
+        hits = sum(1 for kw in kws if kw in content_lower)
+        if hits:
+            group_hits += 1
+            group_details.append({group: hits})
+    if group_hits:
+        score += min(group_hits * 0.8, 2.4)
+        metadata["content_signal_groups"] = group_details
+        reasons.append(f"content_signal_groups:{group_hits}")
+
+    # 7. NOMBRE ARCHIVO
+    if ("agent" in filename_lower) or ("ia" in filename_lower):
+        score += weights["filename_agent"]
+        reasons.append("filename_mentions_agent")
+
+    # 8. BONUS CONTEXTO
+    if weights["module_bonus"] > 0:
+        score += weights["module_bonus"]
+        reasons.append(f"module_bonus:{module_context}")
+
+    # 9. TIPO
+    agent_type = IntelligentAgentDetector.detect_agent_type(node, content)
+    metadata["detected_type"] = agent_type
+
+    # 🔧 FIX 2: API version con imports
+    imports_list = IntelligentAgentDetector.extract_imports(tree)
+    metadata["dependencies"] = imports_list
+    metadata["api_version"] = IntelligentAgentDetector.detect_api_version(content, imports_list)
+    metadata["llm_call_count"] = IntelligentAgentDetector.count_llm_calls(content)
+
+    # 10. ANTI-SIGNALS
+    for name, kws, penalty in ANTI_SIGNALS:
+        if sum(1 for kw in kws if kw in content_lower) >= 2:
+            score -= penalty
+            reasons.append(f"penalty:{name}")
+
+    if any(x in content_lower for x in ("pytest", "unittest", "mock.", "fixture")):
+        score -= 2.5
+        reasons.append("penalty:test_or_mock_content")
+
+    if any(nc in class_name for nc in IntelligentAgentDetector.NON_CONCRETE_KEYWORDS):
+        score -= 1.5
+        reasons.append("penalty:non_concrete_keyword")
+
+    if metadata["method_count"] < 2 and (not action_methods_found) and (not metadata["has_inheritance"]):
+        score -= 1.0
+        reasons.append("penalty:too_few_methods")
+
+    # Clamp
+    score = max(0.0, min(10.0, round(score, 2)))
+
+    # 🔧 FIX 1: Labels con thresholds optimizados
+    label = "not_agent"
+    if score >= 7.0:  # Antes >= 7.5
+        label = "agent_confirmed"
+    elif score >= 5.5:  # Antes >= 6.0
+        label = "agent_highly_likely"
+    elif score >= 4.0:  # Antes >= 4.5
+        label = "agent_likely"
+    elif score >= 3.0:
+        label = "agent_possible"
+
+    # GO/NO-GO
+    strong = metadata["has_inheritance"] or bool(action_methods_found)
+    if label == "agent_confirmed" and not (strong or group_hits >= 2):
+        label = "agent_highly_likely"
+        reasons.append("downgrade:missing_strong_or_multi_signal")
+
+    return {
+        "score": score,
+        "label": label,
+        "reasons": reasons,
+        "metadata": metadata,
+        "confidence": round(score / 10.0, 3),
+        "module_context": module_context,
+        "group_hits": group_hits
+    }
+
+# =============================================================================
+# STATUS DETERMINATION
+# =============================================================================
+
+def determine_real_status(content: str, scored: Dict, node: ast.ClassDef) -> str:
+    """Determina status"""
+    c = content.lower()
+
+    if "# production" in c or "@production" in c:
+        return "production"
+    if "# development" in c or "# dev" in c or "@dev" in c:
+        return "development"
+    if "# template" in c or "# example" in c:
+        return "template"
+
+    has_real_logic = False
+    for item in node.body:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if item.name in ["execute", "run", "process", "handle", "create"]:
+                if IntelligentAgentDetector.has_substantial_body(item):
+                    has_real_logic = True
+                else:
+                    return "template"
+
+    if not has_real_logic and scored["label"] != "agent_confirmed":
+        return "template"
+
+    if "TODO" in content or "FIXME" in content:
+        return "development"
+
+    return "production" if scored["score"] >= 7.0 else "development"
+
+# =============================================================================
+# PLATAFORMA Y JERARQUÍA
+# =============================================================================
+
+class PlatformDetector:
+    """Detector de plataforma"""
+    
+    FOLDER_PLATFORM_MAP = {
+        "google": "google_ads",
+        "google-ads": "google_ads",
+        "google_ads": "google_ads",
+        "adwords": "google_ads",
+        "meta": "meta_ads",
+        "facebook": "meta_ads",
+        "instagram": "meta_ads",
+        "linkedin": "linkedin_ads",
+        "tiktok": "tiktok_ads",
+    }
+
+    PLATFORM_KEYWORDS = {
+        "google_ads": ["adwords", "google ads", "responsive search ad", "rsa", "match type", "search terms"],
+        "meta_ads": ["facebook", "instagram", "meta ads", "lookalike", "audience"],
+        "linkedin_ads": ["linkedin", "sponsored content"],
+        "tiktok_ads": ["tiktok", "infeed", "spark ads"]
+    }
+
+    @staticmethod
+    def detect(rel_path: str, content: str, agent_id: str) -> Dict[str, Any]:
+        """Detecta jerarquía"""
+        p = rel_path.replace("\\", "/")
+        parts = [x.lower() for x in p.split("/") if x]
+
+        module = parts[0] if parts else "unknown"
+        result = {"module": module, "submodule": None, "platform": None, "category": None, "full_path": p}
+
+        if module == "marketing":
+            result["submodule"] = PlatformDetector._detect_submodule(parts)
+            result["platform"] = PlatformDetector._detect_platform(parts, content, agent_id)
+            if result["platform"]:
+                result["submodule"] = "advertising"
+
+        result["category"] = PlatformDetector._detect_category(content)
+        return result
+
+    @staticmethod
+    def _detect_submodule(parts: List[str]) -> str:
+        if len(parts) >= 2:
+            second = parts[1]
+            if any(x in second for x in ["ad", "ads", "advertising"]):
+                return "advertising"
+            if any(x in second for x in ["analytics", "report"]):
+                return "analytics"
+            if any(x in second for x in ["lead", "prospect"]):
+                return "lead_management"
+            if any(x in second for x in ["content", "social"]):
+                return "content"
+        return "general"
+
+    @staticmethod
+    def _detect_platform(parts: List[str], content: str, agent_id: str) -> Optional[str]:
+        combined = f"{agent_id} {(content or '')[:2500]}".lower()
+
+        for part in parts:
+            for folder_key, platform in PlatformDetector.FOLDER_PLATFORM_MAP.items():
+                if folder_key in part:
+                    return platform
+
+        platform_scores = {}
+        for platform, kws in PlatformDetector.PLATFORM_KEYWORDS.items():
+            s = sum(1 for kw in kws if kw in combined)
+            if s:
+                platform_scores[platform] = s
+        if platform_scores:
+            return max(platform_scores.items(), key=lambda x: x[1])[0]
+
+        return None
+
+    @staticmethod
+    def _detect_category(content: str) -> Optional[str]:
+        c = (content or "").lower()
+        rules = [
+            (("lead", "prospect", "conversion"), "lead_generation"),
+            (("budget", "roi", "roas", "cost"), "budget_optimization"),
+            (("content", "creative", "copy"), "content_creation"),
+            (("analytics", "report", "dashboard"), "analytics"),
+            (("segment", "personalization"), "segmentation"),
+        ]
+        for kws, cat in rules:
+            if any(kw in c for kw in kws):
+                return cat
+        return None
+
+# =============================================================================
+# DESCUBRIMIENTO (serial / paralelo)
+# =============================================================================
+
+def empty_stats() -> Dict[str, Any]:
+    return {
+        "discovery": {"total_files": 0, "analyzed": 0, "ignored": 0, "class_candidates": 0, "agents_validated": 0},
+        "hierarchy": {"modules": {}, "submodules": {}, "platforms": {}, "categories": {}},
+        "quality": {"by_status": {"production": 0, "development": 0, "template": 0},
+                    "by_type": {"Agent": 0, "IA": 0},
+                    "labels": {k: 0 for k in LABEL_ORDER},
+                    "api_versions": {}},
+    }
+
+def _accumulate_agent_stats(stats: Dict[str, Any], agent: dict) -> None:
+    """Suma un agente validado a las estadísticas de jerarquía y calidad"""
+    stats["discovery"]["agents_validated"] += 1
+    stats["quality"]["labels"][agent["label"]] += 1
+    stats["quality"]["by_status"][agent["status"]] += 1
+    stats["quality"]["by_type"][agent["type"]] += 1
+
+    api_version = agent.get("api_version", "unknown")
+    stats["quality"]["api_versions"][api_version] = stats["quality"]["api_versions"].get(api_version, 0) + 1
+
+    m = agent["module"]
+    stats["hierarchy"]["modules"][m] = stats["hierarchy"]["modules"].get(m, 0) + 1
+
+    if agent.get("submodule"):
+        k = f"{m}:{agent['submodule']}"
+        stats["hierarchy"]["submodules"][k] = stats["hierarchy"]["submodules"].get(k, 0) + 1
+
+    if agent.get("platform"):
+        stats["hierarchy"]["platforms"][agent["platform"]] = stats["hierarchy"]["platforms"].get(agent["platform"], 0) + 1
+
+    if agent.get("category"):
+        stats["hierarchy"]["categories"][agent["category"]] = stats["hierarchy"]["categories"].get(agent["category"], 0) + 1
+
+EXECUTION_MODES = ("inline", "process")
+
+
+def _constant_assignments(body: list, names: Set[str]) -> Dict[str, Any]:
+    found: Dict[str, Any] = {}
+    for stmt in body:
+        if isinstance(stmt, ast.Assign):
+            targets, value = stmt.targets, stmt.value
+        elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+            targets, value = [stmt.target], stmt.value
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id in names:
+                try:
+                    found[target.id] = ast.literal_eval(value)
+                except Exception:
+                    pass
+    return found
+
+
+def _positive_number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+        return float(value)
+    return None
+
+
+def execution_hints(tree: ast.AST, node: ast.ClassDef) -> Dict[str, Any]:
+    """
+    Metadata de ejecucion declarada por el agente (atributo de clase o constante de modulo):
+        EXECUTION_MODE = "process"   # inline (default) | process
+        EXECUTION_TIMEOUT = 30       # segundos (hard timeout de la ejecucion)
+        RESULT_CACHE_TTL = 300       # segundos: cachea resultados dry-run deterministas
+        MAX_CONCURRENCY = 4          # bulkhead: ejecuciones simultaneas del agente
+    """
+    names = {"EXECUTION_MODE", "EXECUTION_TIMEOUT", "RESULT_CACHE_TTL", "MAX_CONCURRENCY"}
+    declared = _constant_assignments(tree.body, names)
+    declared.update(_constant_assignments(node.body, names))
+
+    mode = str(declared.get("EXECUTION_MODE", "inline")).lower()
+    return {
+        "execution_mode": mode if mode in EXECUTION_MODES else "inline",
+        "execution_timeout": _positive_number(declared.get("EXECUTION_TIMEOUT")),
+        "result_cache_ttl": _positive_number(declared.get("RESULT_CACHE_TTL")),
+        "max_concurrency": int(_positive_number(declared.get("MAX_CONCURRENCY")) or 0) or None,
+    }
+
+
+def scan_agent_file(filepath: Path, rel_path: str, data: bytes) -> Dict[str, Any]:
+    """
+    Analiza un archivo (AST + scoring) y devuelve su entrada de índice:
+    class_candidates y la lista de registros de agentes validados.
+    """
+    # Mismo resultado que read_text(): newlines universales
+    content = data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+    entry: Dict[str, Any] = {"class_candidates": 0, "agents": []}
+
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return entry
+
+    base_id = filepath.stem.lower()
+    size_kb = round(len(data) / 1024, 2)
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        entry["class_candidates"] += 1
+
+        scored = score_agent_class_v2_enhanced(
+            node=node,
+            filename=filepath.name,
+            content=content,
+            tree=tree,
+            filepath=str(filepath)
+        )
+
+        if scored["label"] in ("agent_possible", "agent_likely", "agent_highly_likely", "agent_confirmed"):
+            hierarchy = PlatformDetector.detect(rel_path, content, base_id)
+            agent_type = scored["metadata"]["detected_type"]
+            status = determine_real_status(content, scored, node)
+
+            agent_id = f"{base_id}__{node.name.lower()}"
+
+            entry["agents"].append({
+                "id": agent_id,
+                "name": base_id.replace("_", " ").title(),
+                "class_name": node.name,
+                "filename": filepath.name,
+                "file_path": rel_path,
+                "module": hierarchy["module"],
+                "submodule": hierarchy.get("submodule"),
+                "platform": hierarchy.get("platform"),
+                "category": hierarchy.get("category"),
+                "type": agent_type,
+                "status": status,
+
+                "confidence": scored["confidence"],
+                "score": scored["score"],
+                "label": scored["label"],
+                "reasons": scored["reasons"],
+                "signal_groups": scored["metadata"].get("content_signal_groups", []),
+                "action_methods": scored["metadata"].get("action_methods_found", []),
+                "inherits_from": scored["metadata"].get("inherits_from", ""),
+                "decorators": scored["metadata"].get("decorators", []),
+
+                "api_version": scored["metadata"].get("api_version", "unknown"),
+                "dependencies": scored["metadata"].get("dependencies", []),
+                "llm_calls": scored["metadata"].get("llm_call_count", 0),
+
+                "lines": content.count("\n") + 1,
+                "size_kb": size_kb,
+                "validation_method": "intelligent_scoring_v5.4.4",
+                **execution_hints(tree, node),
+            })
+
+    return entry
+
+def _log_agent(agent: dict) -> None:
+    # 🔧 FIX 3: Logging de debugging
+    if agent["score"] >= 5.5:  # Solo log agentes importantes
+        icon = {"production": "✅", "development": "⚙️", "template": "📄"}.get(agent["status"], "❓")
+        print(f"{icon} {agent['id']:45} | {agent['module']:12} | {agent['label']:20} ({agent['score']}) | API: {agent['api_version']}")
+
+def scanner_fingerprint() -> str:
+    """Versión del scanner: si cambia el código de scoring, el índice se invalida"""
+    try:
+        source = Path(__file__).read_bytes()
+    except OSError:
+        source = b""
+    return f"intelligent_scoring_v5.4.4:{content_hash(source)[:16]}"
+
+def discovery_workers() -> int:
+    """DISCOVERY_WORKERS: 1 = serial (default), 0 = one per CPU, N = N processes"""
+    try:
+        workers = int(os.environ.get("DISCOVERY_WORKERS", "1"))
+    except ValueError:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def _scan_path(job: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+    """Unidad de trabajo (serial o en proceso hijo): lee, parsea y puntúa un archivo"""
+    filepath_str, rel_path = job
+    filepath = Path(filepath_str)
+    try:
+        st = filepath.stat()
+        data = filepath.read_bytes()
+    except Exception:
+        return None
+    entry = scan_agent_file(filepath, rel_path, data)
+    entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size, sha256=content_hash(data))
+    return entry
+
+def _scan_jobs(jobs: List[Tuple[str, str]], workers: int) -> List[Optional[Dict[str, Any]]]:
+    """Escanea jobs preservando el orden de entrada (merge determinista)"""
+    if workers > 1 and len(jobs) >= 2 * workers:
+        try:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(_scan_path, jobs, chunksize=chunksize))
+        except Exception as exc:
+            logger.warning("Parallel discovery failed, falling back to serial: %s", exc)
+    return [_scan_path(job) for job in jobs]
+
+def run_discovery(
+    agents_path: Path,
+    index: Optional[DiscoveryIndex] = None,
+    workers: int = 1
+) -> Tuple[Dict[str, dict], Dict[str, Any]]:
+    """
+    Escanea agents_path y construye (agents, stats).
+    Con `index`, los archivos sin cambios se reutilizan sin parsear.
+    Con workers > 1, los archivos a escanear se reparten en un pool de procesos;
+    el resultado es idéntico al modo serial.
+    """
+    agents: Dict[str, dict] = {}
+    stats = empty_stats()
+
+    # 1. Enumerar (orden estable) y resolver hits del índice
+    files: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+    jobs: List[Tuple[str, str]] = []
+    for filepath in sorted(agents_path.rglob("*.py")):
+        stats["discovery"]["total_files"] += 1
+        rel_path = str(filepath.relative_to(agents_path)).replace("\\", "/")
+
+        if should_ignore_path(rel_path):
+            stats["discovery"]["ignored"] += 1
+            continue
+
+        stats["discovery"]["analyzed"] += 1
+
+        entry = index.lookup(rel_path, filepath) if index is not None else None
+        if entry is None:
+            jobs.append((str(filepath), rel_path))
+        files.append((rel_path, entry))
+
+    # 2. Escanear los archivos nuevos o modificados
+    scanned = dict(zip((rel for _, rel in jobs), _scan_jobs(jobs, workers)))
+
+    # 3. Merge en orden de archivo
+    seen: Set[str] = set()
+    for rel_path, entry in files:
+        fresh = entry is None
+        if fresh:
+            entry = scanned.get(rel_path)
+            if entry is None:
+                continue
+            if index is not None:
+                index.store(rel_path, entry)
+
+        seen.add(rel_path)
+        stats["discovery"]["class_candidates"] += entry["class_candidates"]
+        for agent in entry["agents"]:
+            _accumulate_agent_stats(stats, agent)
+            agents[agent["id"]] = agent
+            if fresh:
+                _log_agent(agent)
+
+    if index is not None:
+        index.prune(seen)
+        index.save()
+        stats["discovery"]["index"] = index.report()
+
+    return agents, stats
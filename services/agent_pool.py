@@ -0,0 +1,256 @@
+"""
+Agent Pool — bounded thread pool for synchronous agents.
+
+Most agents implement a sync (often CPU-bound) execute(); calling it from
+the request handler blocks the event loop for every tenant. execute_agent
+hands those calls to this pool instead, while async agents keep running
+on the loop.
+
+Fairness: pending calls are queued per tenant and dispatched round-robin
+across tenants, so one tenant's burst cannot starve the others. An
+optional per-tenant cap limits how many workers one tenant can hold.
+
+A call that times out (or whose request is cancelled) while running
+cannot be killed; it is abandoned instead: its slot is released at once
+and the stuck thread runs on in the spare "headroom" threads until it
+finishes, so hung agents don't shrink the pool.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from services.env import env_int
+
+logger = logging.getLogger("nadakki.agent_pool")
+
+_WAIT_SAMPLES = 512
+
+
+def sync_offload_enabled() -> bool:
+    return os.environ.get("AGENT_SYNC_OFFLOAD", "true").lower() == "true"
+
+
+class FairThreadPool:
+    """
+    ThreadPoolExecutor fed by per-tenant FIFO queues (round-robin dispatch).
+
+    submit() never blocks: calls wait in their tenant queue until a worker
+    slot is free. Thread-safe and independent of any particular event loop.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        per_tenant_max: int = 0,
+        name: str = "agent-sync",
+        abandon_headroom: Optional[int] = None,
+    ):
+        self.max_workers = max(1, max_workers)
+        # 0 = sin limite por tenant (solo round-robin)
+        self.per_tenant_max = max(0, per_tenant_max)
+        # Threads extra para llamadas abandonadas que siguen corriendo
+        self.abandon_headroom = self.max_workers if abandon_headroom is None else max(0, abandon_headroom)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers + self.abandon_headroom, thread_name_prefix=name
+        )
+        self._running: Dict[concurrent.futures.Future, str] = {}
+        self._abandoned: Set[concurrent.futures.Future] = set()
+        self.abandoned_total = 0
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, Deque[Tuple[Callable[[], Any], concurrent.futures.Future, float]]]" = OrderedDict()
+        self._active_by_tenant: Dict[str, int] = {}
+        self._active = 0
+        self._queued = 0
+        self._closed = False
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.max_queue_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    # -- submission ---------------------------------------------------------
+
+    def submit(self, tenant_id: str, fn: Callable[[], Any]) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("agent pool is shut down")
+            self._queues.setdefault(tenant_id, deque()).append((fn, future, time.perf_counter()))
+            self._queued += 1
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued)
+            self._dispatch_locked()
+        return future
+
+    async def run(self, tenant_id: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn() in the pool and await its result from the current event loop.
+        Raises asyncio.TimeoutError after `timeout` seconds (queue wait included).
+        """
+        future = self.submit(tenant_id, fn)
+        try:
+            if timeout is None:
+                return await asyncio.wrap_future(future)
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # Still queued -> never runs. Already running -> abandoned, result discarded.
+            if not future.cancel():
+                self.abandon(future)
+            raise
+
+    def abandon(self, future: concurrent.futures.Future) -> bool:
+        """Release the slot of a running call nobody waits for anymore (if headroom allows)."""
+        with self._lock:
+            tenant_id = self._running.get(future)
+            if tenant_id is None or future in self._abandoned or len(self._abandoned) >= self.abandon_headroom:
+                return False
+            self._abandoned.add(future)
+            self.abandoned_total += 1
+            self._release_locked(tenant_id)
+            self._dispatch_locked()
+            return True
+
+    def _release_locked(self, tenant_id: str) -> None:
+        self._active -= 1
+        remaining = self._active_by_tenant.get(tenant_id, 1) - 1
+        if remaining > 0:
+            self._active_by_tenant[tenant_id] = remaining
+        else:
+            self._active_by_tenant.pop(tenant_id, None)
+
+    # -- dispatch -----------------------------------------------------------
+
+    def _next_item_locked(self):
+        for tenant_id in list(self._queues):
+            queue = self._queues[tenant_id]
+            if self.per_tenant_max and self._active_by_tenant.get(tenant_id, 0) >= self.per_tenant_max:
+                continue
+            item = queue.popleft()
+            self._queued -= 1
+            # Rotar: el tenant servido pasa al final de la ronda
+            del self._queues[tenant_id]
+            if queue:
+                self._queues[tenant_id] = queue
+            return tenant_id, item
+        return None
+
+    def _dispatch_locked(self) -> None:
+        while self._active < self.max_workers and self._queued:
+            picked = self._next_item_locked()
+            if picked is None:
+                return
+            tenant_id, (fn, future, enqueued) = picked
+            if not future.set_running_or_notify_cancel():
+                self.cancelled += 1
+                continue
+            wait = time.perf_counter() - enqueued
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._waits.append(wait)
+            self._active += 1
+            self._active_by_tenant[tenant_id] = self._active_by_tenant.get(tenant_id, 0) + 1
+            self._running[future] = tenant_id
+            self._executor.submit(self._run_item, tenant_id, fn, future)
+
+    def _run_item(self, tenant_id: str, fn: Callable[[], Any], future: concurrent.futures.Future) -> None:
+        result = error = None
+        try:
+            result = fn()
+        except BaseException as exc:
+            error = exc
+        ok = error is None
+        # Contadores y slot antes de resolver el future: quien espera ya ve stats consistentes
+        with self._lock:
+            self._running.pop(future, None)
+            if future in self._abandoned:
+                # Su slot ya se libero en abandon()
+                self._abandoned.discard(future)
+            else:
+                self._release_locked(tenant_id)
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._dispatch_locked()
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    # -- lifecycle / metrics ------------------------------------------------
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            self._closed = True
+            for queue in self._queues.values():
+                for _, future, _ in queue:
+                    if future.cancel():
+                        self.cancelled += 1
+            self._queues.clear()
+            self._queued = 0
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            started = self.completed + self.failed + self._active
+            return {
+                "max_workers": self.max_workers,
+                "per_tenant_max": self.per_tenant_max,
+                "active": self._active,
+                "abandoned_running": len(self._abandoned),
+                "abandoned_total": self.abandoned_total,
+                "abandon_headroom": self.abandon_headroom,
+                "queue_depth": self._queued,
+                "queue_depth_by_tenant": {t: len(q) for t, q in self._queues.items()},
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "wait_ms": {
+                    "avg": round(self._wait_total / started * 1000, 3) if started else 0.0,
+                    "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3) if waits else 0.0,
+                    "max": round(self._wait_max * 1000, 3),
+                },
+            }
+
+
+_pool: Optional[FairThreadPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sync_pool() -> FairThreadPool:
+    """Pool del worker, creado en el primer uso con AGENT_THREAD_POOL_SIZE / AGENT_TENANT_MAX_ACTIVE."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                size = env_int("AGENT_THREAD_POOL_SIZE", min(32, (os.cpu_count() or 1) + 4))
+                _pool = FairThreadPool(size, env_int("AGENT_TENANT_MAX_ACTIVE", 0))
+                logger.info("Agent sync pool: workers=%d per_tenant_max=%d", _pool.max_workers, _pool.per_tenant_max)
+    return _pool
+
+
+def pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {"enabled": sync_offload_enabled(), "started": False}
+    return {"enabled": sync_offload_enabled(), "started": True, **_pool.stats()}
+
+
+def shutdown_sync_pool(wait: bool = False) -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
@@ -0,0 +1,282 @@
+"""
+Agent Prewarm — carga los agentes mas usados al arrancar el worker.
+
+Tras un deploy la primera llamada a cada agente paga import + instanciacion
+(picos de p99). Al arrancar se leen los conteos recientes por agente y se
+precargan los top-N (modulo en cache + una instancia por su tenant mas
+frecuente) en segundo plano, dentro de un presupuesto de tiempo. Mientras
+dura, /health responde 503 "warming_up".
+
+Fuentes de uso (se suman):
+- usage_logs.agent_used de services/usage_tracker.py (USAGE_DB_PATH)
+- audit_logs: tabla en PostgreSQL si hay DB, si no la cola de data/audit_logs.jsonl
+  (usage_tracking solo guarda conteos por tenant/dia, no por agente)
+
+Env:
+    AGENT_PREWARM_ENABLED   true
+    AGENT_PREWARM_TOP_N     20
+    AGENT_PREWARM_BUDGET    15   segundos para todo el warm-up
+    AGENT_PREWARM_DAYS      7    ventana de uso considerada
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.env import env_float
+
+logger = logging.getLogger("nadakki.agent_prewarm")
+
+# Bytes leidos del final del JSONL de auditoria (no se recorre el archivo completo)
+_JSONL_TAIL_BYTES = 4 * 1024 * 1024
+
+
+def prewarm_enabled() -> bool:
+    return os.environ.get("AGENT_PREWARM_ENABLED", "true").lower() == "true"
+
+
+def usage_db_path() -> Path:
+    return Path(os.environ.get("USAGE_DB_PATH") or "usage.db")
+
+
+# ---------------------------------------------------------------------------
+# Conteos de uso: (agent_ref, tenant_id) -> llamadas
+# ---------------------------------------------------------------------------
+def usage_log_counts(db_path: Path, since: datetime) -> Counter:
+    """usage_logs del UsageTracker (SQLite, solo lectura)."""
+    counts: Counter = Counter()
+    if not db_path.exists():
+        return counts
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=1.0)
+        try:
+            rows = conn.execute(
+                "SELECT agent_used, tenant_id, COUNT(*) FROM usage_logs "
+                "WHERE agent_used IS NOT NULL AND timestamp >= ? GROUP BY agent_used, tenant_id",
+                (since.isoformat(),),
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as exc:
+        logger.debug("usage_logs no disponible (%s): %s", db_path, exc)
+        return counts
+    for agent_used, tenant_id, n in rows:
+        counts[(agent_used, tenant_id or "default")] += n
+    return counts
+
+
+def audit_jsonl_counts(log_file: Path, since: datetime, tail_bytes: int = _JSONL_TAIL_BYTES) -> Counter:
+    """Ejecuciones ok en la cola del JSONL de auditoria."""
+    counts: Counter = Counter()
+    try:
+        with open(log_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - tail_bytes))
+            if size > tail_bytes:
+                f.readline()  # linea parcial
+            data = f.read()
+    except OSError:
+        return counts
+    cutoff = since.isoformat()
+    for raw in data.splitlines():
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            continue
+        if entry.get("status") != "ok" or not entry.get("agent_id"):
+            continue
+        if (entry.get("timestamp") or "") < cutoff:
+            continue
+        counts[(entry["agent_id"], entry.get("tenant_id") or "default")] += 1
+    return counts
+
+
+async def audit_db_counts(since: datetime, limit: int) -> Counter:
+    from sqlalchemy import text
+    from services.db import get_session
+
+    async with get_session() as session:
+        result = await session.execute(
+            text(
+                "SELECT agent_id, tenant_id, COUNT(*) AS n FROM audit_logs "
+                "WHERE created_at >= :since AND status = 'ok' "
+                "GROUP BY agent_id, tenant_id ORDER BY n DESC LIMIT :lim"
+            ),
+            {"since": since, "lim": limit},
+        )
+        return Counter({(r[0], r[1] or "default"): r[2] for r in result.fetchall()})
+
+
+async def recent_usage(days: float, limit: int) -> Counter:
+    since = datetime.utcnow() - timedelta(days=days)
+    loop = asyncio.get_running_loop()
+    counts = await loop.run_in_executor(None, usage_log_counts, usage_db_path(), since)
+
+    from services.db import db_available
+    if db_available():
+        try:
+            counts.update(await audit_db_counts(since, limit))
+            return counts
+        except Exception as exc:
+            logger.warning("Prewarm: lectura de audit_logs fallida, usando JSONL: %s", exc)
+
+    from services import audit_logger
+    counts.update(await loop.run_in_executor(None, audit_jsonl_counts, audit_logger._LOG_FILE, since))
+    return counts
+
+
+def rank_agents(counts: Counter, resolve, top_n: int) -> List[Tuple[Dict[str, Any], str, int]]:
+    """
+    Agrupa por agente del catalogo (resolve: ref -> registro o None) y devuelve
+    [(agente, tenant mas frecuente, llamadas)] para los top_n.
+    """
+    totals: Counter = Counter()
+    tenants: Dict[str, Counter] = {}
+    records: Dict[str, Dict[str, Any]] = {}
+    for (ref, tenant_id), n in counts.items():
+        agent = resolve(ref)
+        if agent is None:
+            continue
+        agent_id = agent.get("id", ref)
+        records[agent_id] = agent
+        totals[agent_id] += n
+        tenants.setdefault(agent_id, Counter())[tenant_id] += n
+    return [
+        (records[agent_id], tenants[agent_id].most_common(1)[0][0], n)
+        for agent_id, n in totals.most_common(top_n)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Warm-up
+# ---------------------------------------------------------------------------
+class Prewarmer:
+    """Estado del warm-up de este worker (consultado por /health)."""
+
+    def __init__(self, top_n: int = 20, budget: float = 15.0, days: float = 7.0):
+        self.top_n = top_n
+        self.budget = budget
+        self.days = days
+        self.state = "idle"  # idle | running | done | budget_exhausted | failed
+        self.warmed: List[Dict[str, Any]] = []
+        self.failed: List[Dict[str, Any]] = []
+        self.skipped = 0
+        self.candidates = 0
+        self.elapsed_ms = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Prewarmer":
+        return cls(
+            top_n=int(env_float("AGENT_PREWARM_TOP_N", 20)),
+            budget=env_float("AGENT_PREWARM_BUDGET", 15.0),
+            days=env_float("AGENT_PREWARM_DAYS", 7.0),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.state != "running"
+
+    def warm(self, ranked: List[Tuple[Dict[str, Any], str, int]], deadline: float) -> None:
+        """Bloqueante (executor): carga modulo + instancia de cada agente hasta agotar el presupuesto."""
+        from services.agent_process_pool import execution_mode_for
+        from services.agent_runner import safe_load
+
+        for agent, tenant_id, calls in ranked:
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.state = "budget_exhausted"
+                    self.skipped = self.candidates - len(self.warmed) - len(self.failed)
+                return
+            agent_id = agent.get("id")
+            if execution_mode_for(agent) == "process":
+                # El pool de procesos se precalienta en su propio startup hook
+                with self._lock:
+                    self.candidates -= 1
+                continue
+            start = time.monotonic()
+            try:
+                safe_load(agent.get("file_path", ""), agent.get("class_name", ""), tenant_id=tenant_id)
+                with self._lock:
+                    self.warmed.append({
+                        "agent_id": agent_id, "calls": calls,
+                        "ms": round((time.monotonic() - start) * 1000, 1),
+                    })
+            except Exception as exc:
+                with self._lock:
+                    self.failed.append({"agent_id": agent_id, "error": str(exc)[:200]})
+
+    def start(self) -> "asyncio.Task":
+        """Marca el worker como no listo y lanza run() en segundo plano."""
+        self.state = "running"
+        return asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        self.state = "running"
+        start = time.monotonic()
+        deadline = start + self.budget
+        try:
+            from services.agent_catalog import current_catalog
+
+            catalog = current_catalog()
+            if catalog is None:
+                self.state = "done"
+                return
+            counts = await asyncio.wait_for(recent_usage(self.days, self.top_n * 10), max(0.1, self.budget))
+            ranked = rank_agents(counts, catalog.resolver.resolve, self.top_n)
+            self.candidates = len(ranked)
+            remaining = deadline - time.monotonic()
+            if ranked and remaining > 0:
+                # El thread sigue hasta el siguiente chequeo del deadline; no se espera mas alla del presupuesto
+                loop = asyncio.get_running_loop()
+                await asyncio.wait_for(
+                    asyncio.shield(loop.run_in_executor(None, self.warm, ranked, deadline)), remaining + 0.5,
+                )
+            if self.state == "running":
+                self.state = "done"
+        except asyncio.TimeoutError:
+            self.state = "budget_exhausted"
+        except Exception as exc:
+            logger.warning("Prewarm fallido: %s", exc)
+            self.state = "failed"
+        finally:
+            self.elapsed_ms = round((time.monotonic() - start) * 1000)
+            logger.info(
+                "Prewarm %s: %d agentes en %dms (%d fallidos)",
+                self.state, len(self.warmed), self.elapsed_ms, len(self.failed),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.ready,
+                "top_n": self.top_n,
+                "budget_s": self.budget,
+                "candidates": self.candidates,
+                "warmed": len(self.warmed),
+                "failed": len(self.failed),
+                "skipped": self.skipped,
+                "elapsed_ms": self.elapsed_ms,
+                "agents": list(self.warmed),
+                "errors": list(self.failed),
+            }
+
+
+_prewarmer: Optional[Prewarmer] = None
+
+
+def get_prewarmer() -> Prewarmer:
+    global _prewarmer
+    if _prewarmer is None:
+        _prewarmer = Prewarmer.from_env()
+    return _prewarmer
@@ -0,0 +1,400 @@
+"""
+Agent Process Pool — warm worker processes for CPU-heavy agents.
+
+Threads don't help agents that spend their time in pure Python (Monte
+Carlo loops, model fitting) because of the GIL. Agents whose catalog
+record has execution_mode == "process" run instead in a small set of
+long-lived worker processes that keep their modules imported
+(agent_runner's module cache lives on in each worker).
+
+- routing: agent id -> worker (stable hash), so an agent stays warm in one process
+- transport: multiprocessing.connection with length-prefixed pickle frames
+- per-agent timeout: the caller gets its AgentTimeoutError at once; the
+  worker is killed and respawned (recycled) by a background thread, and
+  the agent modules it had loaded are warmed again in the new process
+  before it accepts an exec, under their own AGENT_PROCESS_WARM_TIMEOUT
+  (if that runs out the worker is respawned cold and modules load lazily)
+- AGENT_PROCESS_MAX_TASKS recycles a worker after N executions (leaks)
+
+Workers are started with `python -m services.agent_process_pool`, not
+multiprocessing's spawn, so the application module (and its discovery)
+is never re-imported in a child.
+"""
+
+import logging
+import os
+import pickle
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from multiprocessing.connection import Client, Listener, arbitrary_address, default_family
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.agent_runner import AgentLoadError, AgentTimeoutError
+from services.env import env_int
+
+logger = logging.getLogger("nadakki.agent_process_pool")
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+_CONNECT_TIMEOUT = 15.0
+
+
+def default_timeout() -> float:
+    try:
+        return float(os.environ.get("AGENT_PROCESS_TIMEOUT", "60"))
+    except ValueError:
+        return 60.0
+
+
+def warm_timeout() -> float:
+    try:
+        return float(os.environ.get("AGENT_PROCESS_WARM_TIMEOUT", "120"))
+    except ValueError:
+        return 120.0
+
+
+def process_agent_overrides() -> Set[str]:
+    """AGENT_PROCESS_AGENTS: ids (coma) forzados a modo process sin tocar el archivo del agente."""
+    raw = os.environ.get("AGENT_PROCESS_AGENTS", "")
+    return {a.strip() for a in raw.split(",") if a.strip()}
+
+
+def execution_mode_for(agent: Dict[str, Any]) -> str:
+    if agent.get("id") in process_agent_overrides():
+        return "process"
+    return agent.get("execution_mode") or "inline"
+
+
+class AgentWorker:
+    """One warm worker process. Requests are serialized (one at a time) by `lock`."""
+
+    def __init__(self, index: int, max_tasks: int = 0):
+        self.index = index
+        self.max_tasks = max_tasks
+        self.lock = threading.Lock()
+        self.loaded: Set[str] = set()
+        self.proc: Optional[subprocess.Popen] = None
+        self.conn = None
+        self.tasks = 0
+        self.total_tasks = 0
+        self.restarts = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.closed = False
+        self._seq = 0
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self, warm: bool = True) -> None:
+        authkey = secrets.token_bytes(32)
+        address = arbitrary_address(default_family)
+        env = dict(os.environ, NADAKKI_AGENT_WORKER_AUTHKEY=authkey.hex())
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "services.agent_process_pool", address],
+            cwd=str(_PROJECT_ROOT),
+            env=env,
+            stdin=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + _CONNECT_TIMEOUT
+        while True:
+            try:
+                self.conn = Client(address, authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError, OSError):
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.kill()
+                    raise AgentLoadError(f"Agent worker {self.index} failed to start")
+                time.sleep(0.02)
+        self.tasks = 0
+        if warm and self.loaded:
+            self._rewarm()
+
+    def _rewarm(self) -> None:
+        """Reimporta los modulos del proceso anterior antes del proximo exec.
+
+        Tiene su propio timeout: si se sumara al del exec siguiente, un agente
+        con imports pesados volveria a agotar su timeout y a reciclar el worker.
+        """
+        paths = sorted(self.loaded)
+        try:
+            status, value = self._receive(self._send("warm", paths), warm_timeout())
+        except (AgentTimeoutError, EOFError, OSError, pickle.UnpicklingError) as e:
+            logger.warning("Re-warm of worker %d failed (%s); restarting it cold", self.index, e)
+            self.kill()
+            self.loaded.clear()
+            self.start(warm=False)
+            return
+        self.loaded = set(value) if status == "ok" else set()
+
+    def kill(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.kill()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            self.proc = None
+
+    def recycle(self) -> None:
+        """Mata el worker y lo levanta de nuevo en otro thread: el request no espera el re-warm"""
+        self.kill()
+        self.restarts += 1
+        threading.Thread(target=self._restart, name=f"agent-worker-{self.index}-restart", daemon=True).start()
+
+    def _restart(self) -> None:
+        # Toma el lock cuando el request que lo recicló lo suelte
+        with self.lock:
+            if self.closed or self.alive():
+                return
+            try:
+                self.start()
+            except AgentLoadError as e:
+                # El proximo call() lo reintenta
+                logger.warning("Restart of worker %d failed: %s", self.index, e)
+                return
+            if self.closed:
+                self.kill()  # shutdown() llego durante el arranque
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None and self.conn is not None
+
+    # -- protocol -----------------------------------------------------------
+
+    def _send(self, op: str, args: Any) -> int:
+        self._seq += 1
+        self.conn.send_bytes(pickle.dumps((self._seq, op, args), protocol=_PICKLE_PROTOCOL))
+        return self._seq
+
+    def _receive(self, seq: int, timeout: float) -> Tuple[str, Any]:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                raise AgentTimeoutError(f"Agent worker {self.index} timed out after {timeout:g}s")
+            reply_seq, status, value = pickle.loads(self.conn.recv_bytes())
+            if reply_seq == seq:
+                return status, value
+
+    def call(self, op: str, args: Any, timeout: float) -> Any:
+        """Send one request and wait for its reply (caller holds `lock`)."""
+        if not self.alive():
+            if self.proc is not None:
+                self.crashes += 1
+                self.kill()
+            self.start()
+        try:
+            seq = self._send(op, args)
+            status, value = self._receive(seq, timeout)
+        except AgentTimeoutError:
+            self.timeouts += 1
+            self.recycle()
+            raise
+        except (EOFError, OSError, pickle.UnpicklingError) as e:
+            self.crashes += 1
+            self.recycle()
+            raise AgentLoadError(f"Agent worker {self.index} crashed: {e}")
+
+        self.tasks += 1
+        self.total_tasks += 1
+        if self.max_tasks and self.tasks >= self.max_tasks:
+            self.recycle()
+
+        if status == "ok":
+            return value
+        if status == "load_error":
+            raise AgentLoadError(value)
+        raise RuntimeError(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.proc.pid if self.proc is not None else None,
+            "alive": self.alive(),
+            "busy": self.lock.locked(),
+            "loaded_modules": len(self.loaded),
+            "tasks": self.total_tasks,
+            "restarts": self.restarts,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+        }
+
+
+class AgentProcessPool:
+    """N warm workers; each agent id is always routed to the same worker."""
+
+    def __init__(self, workers: int, max_tasks: int = 0):
+        self.workers = [AgentWorker(i, max_tasks) for i in range(max(1, workers))]
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._started:
+                return
+            for worker in self.workers:
+                worker.closed = False
+                worker.start()
+            self._started = True
+            logger.info("Agent process pool started: %d workers", len(self.workers))
+
+    def worker_for(self, agent_id: str) -> AgentWorker:
+        return self.workers[zlib.crc32(agent_id.encode("utf-8")) % len(self.workers)]
+
+    def execute(
+        self,
+        agent_id: str,
+        file_path: str,
+        class_name: str,
+        payload: Dict[str, Any],
+        tenant_id: str,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Blocking: run instance.execute(payload) in the agent's worker."""
+        self.start()
+        timeout = timeout or default_timeout()
+        worker = self.worker_for(agent_id)
+        # Esperar al worker tambien cuenta contra el timeout del agente
+        if not worker.lock.acquire(timeout=timeout):
+            raise AgentTimeoutError(f"Agent worker {worker.index} busy for {timeout:g}s")
+        try:
+            result = worker.call("exec", (file_path, class_name, payload, tenant_id), timeout)
+            worker.loaded.add(file_path)
+            return result
+        finally:
+            worker.lock.release()
+
+    def warm(self, agents: Iterable[Dict[str, Any]], timeout: Optional[float] = None) -> int:
+        """Importa en su worker los modulos de los agentes dados. Devuelve cuantos quedaron cargados."""
+        self.start()
+        by_worker: Dict[int, List[str]] = {}
+        for agent in agents:
+            worker = self.worker_for(agent["id"])
+            by_worker.setdefault(worker.index, []).append(agent["file_path"])
+        warmed = 0
+        for index, paths in by_worker.items():
+            worker = self.workers[index]
+            with worker.lock:
+                try:
+                    ok = worker.call("warm", sorted(set(paths)), timeout or default_timeout())
+                except Exception as e:
+                    logger.warning("Warm-up of worker %d failed: %s", index, e)
+                    continue
+            worker.loaded.update(ok)
+            warmed += len(ok)
+        return warmed
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.closed = True
+            worker.kill()
+        self._started = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self._started,
+            "workers": [w.stats() for w in self.workers],
+            "default_timeout": default_timeout(),
+        }
+
+
+_pool: Optional[AgentProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> AgentProcessPool:
+    """AGENT_PROCESS_WORKERS workers (default 2); arrancan en el primer uso o en warm()."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = AgentProcessPool(
+                    env_int("AGENT_PROCESS_WORKERS", 2),
+                    env_int("AGENT_PROCESS_MAX_TASKS", 0),
+                )
+    return _pool
+
+
+def process_pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {"started": False, "workers": []}
+    return _pool.stats()
+
+
+def shutdown_process_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+
+def _worker_main(address: str) -> None:
+    import asyncio
+
+    from services.agent_runner import load_agent_module, safe_load
+
+    authkey = bytes.fromhex(os.environ.pop("NADAKKI_AGENT_WORKER_AUTHKEY"))
+    listener = Listener(address, authkey=authkey)
+    conn = listener.accept()
+    loop = asyncio.new_event_loop()
+
+    def handle(op: str, args: Any) -> Any:
+        if op == "exec":
+            file_path, class_name, payload, tenant_id = args
+            instance = safe_load(file_path, class_name, tenant_id=tenant_id)
+            if not hasattr(instance, "execute"):
+                raise AgentLoadError(f"{class_name} no tiene metodo execute()")
+            result = instance.execute(payload)
+            if asyncio.iscoroutine(result):
+                result = loop.run_until_complete(result)
+            return result
+        if op == "warm":
+            loaded = []
+            for file_path in args:
+                try:
+                    load_agent_module(file_path)
+                    loaded.append(file_path)
+                except AgentLoadError as e:
+                    logger.warning("Warm-up skipped %s: %s", file_path, e)
+            return loaded
+        raise ValueError(f"unknown op {op!r}")
+
+    while True:
+        try:
+            seq, op, args = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            break
+        try:
+            reply = (seq, "ok", handle(op, args))
+        except AgentLoadError as e:
+            reply = (seq, "load_error", str(e))
+        except Exception as e:
+            reply = (seq, "error", f"{type(e).__name__}: {e}")
+        try:
+            data = pickle.dumps(reply, protocol=_PICKLE_PROTOCOL)
+        except Exception as e:
+            data = pickle.dumps((seq, "error", f"Result not serializable: {e}"), protocol=_PICKLE_PROTOCOL)
+        conn.send_bytes(data)
+
+    listener.close()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(_PROJECT_ROOT))
+    _worker_main(sys.argv[1])
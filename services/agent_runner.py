@@ -1,18 +1,39 @@
 """
 Agent Runner - Carga y ejecucion segura de agentes por file_path
 Usa importlib.util.spec_from_file_location porque file_path es ruta de archivo, no modulo Python.
+
+Los modulos cargados se cachean por worker (clave: file_path + mtime/size),
+asi una ejecucion repetida del mismo agente solo paga instance.execute().
+Opcionalmente las instancias se reutilizan por (clase, tenant), y los
+resultados dry-run de agentes que declaran RESULT_CACHE_TTL se cachean
+por (tenant, agente, version del archivo, hash del payload).
 """
 
 import asyncio
+import concurrent.futures
+import hashlib
 import importlib.util
+import inspect
+import json
+import logging
+import os
 import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from services.agent_pool import get_sync_pool, sync_offload_enabled
+from services.env import env_int
+
+logger = logging.getLogger("nadakki.agent_runner")
 
 
 # Raiz del proyecto (donde esta main.py)
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
-_AGENTS_ROOT = _PROJECT_ROOT / "agents"
+_AGENTS_ROOT = Path(os.environ.get("AGENTS_ROOT") or _PROJECT_ROOT / "agents")
 
 
 class AgentLoadError(Exception):
@@ -20,6 +41,11 @@ class AgentLoadError(Exception):
     pass
 
 
+class AgentTimeoutError(Exception):
+    """El agente excedio su timeout de ejecucion."""
+    pass
+
+
 def _validate_path(file_path: str) -> Path:
     """Valida que file_path sea seguro y exista dentro de agents/."""
     # Rechazar traversal
@@ -51,25 +77,281 @@ def _setup_import_paths(file_path: str):
             sys.path.insert(0, parent)
 
 
-def safe_load(file_path: str, class_name: str) -> Any:
+def _module_name(file_path: str) -> str:
+    # Flat module name — dots in name cause Python to look up parent packages
+    return f"_dyn_agent_{file_path.replace('/', '_').replace('.py', '')}"
+
+
+# ---------------------------------------------------------------------------
+# Module + instance caches (per worker process)
+# ---------------------------------------------------------------------------
+
+class _ModuleCache:
     """
-    Carga dinamica de un agente desde file_path (relativo a agents/).
+    LRU file_path -> (mtime_ns, size, module).
 
-    Args:
-        file_path: Ruta relativa a agents/ (ej: "marketing/abtestingia.py")
-        class_name: Nombre de la clase a instanciar (ej: "ABTestingAgentOperative")
+    Un cambio de mtime o size en disco invalida la entrada y el modulo se
+    vuelve a ejecutar en la siguiente carga.
+    """
 
-    Returns:
-        Instancia de la clase del agente
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[int, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, file_path: str, stamp: Tuple[int, int]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and (entry[0], entry[1]) == stamp:
+                self._entries.move_to_end(file_path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            if entry is not None:
+                self.reloads += 1
+            return None
+
+    def put(self, file_path: str, stamp: Tuple[int, int], module: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[file_path] = (stamp[0], stamp[1], module)
+            self._entries.move_to_end(file_path)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                sys.modules.pop(_module_name(evicted), None)
+                self.evictions += 1
+
+    def peek(self, file_path: str, stamp: Tuple[int, int]) -> Optional[Any]:
+        """Como get() pero sin contar hit/miss ni tocar el orden LRU."""
+        entry = self._entries.get(file_path)
+        if entry is not None and (entry[0], entry[1]) == stamp:
+            return entry[2]
+        return None
+
+    def discard(self, file_path: str) -> bool:
+        with self._lock:
+            return self._entries.pop(file_path, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+        }
+
+
+class _InstancePool:
+    """
+    LRU (file_path, class_name, tenant_id) -> (module, instance, created_at).
 
-    Raises:
-        AgentLoadError: Si el path es inseguro, el archivo no existe,
-                        o la clase no se encuentra.
+    Una instancia solo se reutiliza si su modulo sigue siendo el cacheado
+    y no supero el TTL. Pensado para agentes sin estado por request.
     """
-    resolved = _validate_path(file_path)
 
-    # Flat module name — dots in name cause Python to look up parent packages
-    module_name = f"_dyn_agent_{file_path.replace('/', '_').replace('.py', '')}"
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[Any, Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str, str], module: Any) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                owner, instance, created = entry
+                if owner is module and (self.ttl <= 0 or now - created < self.ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return instance
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str, str], module: Any, instance: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (module, instance, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard_file(self, file_path: str) -> int:
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == file_path]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": instance_cache_enabled(),
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+class _ResultCache:
+    """
+    LRU key -> (expires_at, result) de resultados dry-run, con single-flight:
+    requests identicos concurrentes esperan la ejecucion en curso en vez de
+    lanzar otra. Los resultados cacheados se comparten: tratarlos como read-only.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, ...], concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def lookup(self, key: Tuple[str, ...]) -> Tuple[str, Any]:
+        """('hit', result) | ('wait', future) | ('lead', future)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return "hit", entry[1]
+                del self._entries[key]
+                self.expired += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return "wait", future
+            future = self._inflight[key] = concurrent.futures.Future()
+            self.misses += 1
+            return "lead", future
+
+    def complete(self, key: Tuple[str, ...], future: concurrent.futures.Future, ttl: float, result: Any) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if self.maxsize > 0:
+                self._entries[key] = (time.monotonic() + ttl, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(result)
+
+    def abandon(self, key: Tuple[str, ...], future: concurrent.futures.Future, exc: BaseException) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if isinstance(exc, asyncio.CancelledError):
+            # El request lider fue cancelado: los que esperaban ejecutan por su cuenta
+            future.cancel()
+        else:
+            future.set_exception(exc)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": result_cache_enabled(),
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+def result_cache_enabled() -> bool:
+    return os.environ.get("AGENT_RESULT_CACHE", "true").lower() == "true"
+
+
+def instance_cache_enabled() -> bool:
+    return os.environ.get("AGENT_INSTANCE_CACHE", "false").lower() == "true"
+
+
+_module_cache = _ModuleCache(env_int("AGENT_MODULE_CACHE_SIZE", 256))
+_instance_pool = _InstancePool(
+    env_int("AGENT_INSTANCE_CACHE_SIZE", 512),
+    float(os.environ.get("AGENT_INSTANCE_TTL", "600")),
+)
+_result_cache = _ResultCache(env_int("AGENT_RESULT_CACHE_SIZE", 1024))
+# exec_module de un mismo archivo una sola vez aunque lleguen requests concurrentes
+_load_locks: Dict[str, threading.Lock] = {}
+_load_locks_guard = threading.Lock()
+
+
+def _load_lock(file_path: str) -> threading.Lock:
+    with _load_locks_guard:
+        lock = _load_locks.get(file_path)
+        if lock is None:
+            lock = _load_locks[file_path] = threading.Lock()
+        return lock
+
+
+def evict_agent_modules(file_paths: Iterable[str]) -> int:
+    """Drop loaded agent modules for the given files (relative to agents/). Returns count evicted."""
+    evicted = 0
+    for file_path in file_paths:
+        cached = _module_cache.discard(file_path)
+        _instance_pool.discard_file(file_path)
+        if sys.modules.pop(_module_name(file_path), None) is not None or cached:
+            evicted += 1
+    return evicted
+
+
+def clear_agent_caches() -> None:
+    """Vacia los caches de modulos e instancias (los contadores se mantienen)."""
+    for file_path in list(_module_cache._entries):
+        sys.modules.pop(_module_name(file_path), None)
+    _module_cache.clear()
+    _instance_pool.clear()
+    _result_cache.clear()
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        "modules": _module_cache.stats(),
+        "instances": _instance_pool.stats(),
+        "results": _result_cache.stats(),
+    }
+
+
+def _exec_agent_module(file_path: str, resolved: Path) -> Any:
+    module_name = _module_name(file_path)
 
     # Enable absolute imports like 'from core.agents.action_plan import ...'
     _setup_import_paths(file_path)
@@ -85,7 +367,59 @@ def safe_load(file_path: str, class_name: str) -> Any:
     except AgentLoadError:
         raise
     except Exception as e:
+        sys.modules.pop(module_name, None)
         raise AgentLoadError(f"Error cargando modulo {file_path}: {e}")
+    return module
+
+
+def load_agent_module(file_path: str) -> Any:
+    """Modulo del agente, ejecutado solo si no esta cacheado o cambio en disco."""
+    resolved = _validate_path(file_path)
+    try:
+        st = resolved.stat()
+    except OSError as e:
+        raise AgentLoadError(f"Archivo no encontrado: {file_path} ({e})")
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    module = _module_cache.get(file_path, stamp)
+    if module is not None:
+        return module
+
+    with _load_lock(file_path):
+        # Otro request pudo haberlo cargado mientras esperabamos el lock
+        module = _module_cache.peek(file_path, stamp)
+        if module is not None:
+            return module
+        _instance_pool.discard_file(file_path)
+        module = _exec_agent_module(file_path, resolved)
+        _module_cache.put(file_path, stamp, module)
+        return module
+
+
+def safe_load(file_path: str, class_name: str, tenant_id: Optional[str] = None) -> Any:
+    """
+    Carga dinamica de un agente desde file_path (relativo a agents/).
+
+    Args:
+        file_path: Ruta relativa a agents/ (ej: "marketing/abtestingia.py")
+        class_name: Nombre de la clase a instanciar (ej: "ABTestingAgentOperative")
+        tenant_id: Si AGENT_INSTANCE_CACHE=true, reutiliza la instancia de este tenant
+
+    Returns:
+        Instancia de la clase del agente
+
+    Raises:
+        AgentLoadError: Si el path es inseguro, el archivo no existe,
+                        o la clase no se encuentra.
+    """
+    module = load_agent_module(file_path)
+
+    pooled = tenant_id is not None and instance_cache_enabled()
+    key = (file_path, class_name, tenant_id or "")
+    if pooled:
+        instance = _instance_pool.get(key, module)
+        if instance is not None:
+            return instance
 
     cls = getattr(module, class_name, None)
     if cls is None:
@@ -94,10 +428,29 @@ def safe_load(file_path: str, class_name: str) -> Any:
         )
 
     try:
-        return cls()
+        instance = cls()
     except Exception as e:
         raise AgentLoadError(f"Error instanciando {class_name}: {e}")
 
+    if pooled:
+        _instance_pool.put(key, module, instance)
+    return instance
+
+
+def is_async_agent(instance: Any) -> bool:
+    """True si execute() es una coroutine function (corre directo en el event loop)."""
+    method = getattr(instance, "execute", None)
+    return inspect.iscoroutinefunction(method) or inspect.iscoroutinefunction(getattr(method, "__call__", None))
+
+
+def accepts_progress(instance: Any) -> bool:
+    """True si execute() acepta progress= (parametro explicito o **kwargs, que llega a su context)."""
+    try:
+        params = inspect.signature(instance.execute).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == "progress" or p.kind is inspect.Parameter.VAR_KEYWORD for p in params)
+
 
 async def execute_agent(
     file_path: str,
@@ -105,6 +458,9 @@ async def execute_agent(
     payload: Dict[str, Any],
     dry_run: bool = True,
     tenant_id: str = "default",
+    agent: Optional[Dict[str, Any]] = None,
+    progress: Optional[Callable[..., None]] = None,
+    timeout: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
     Carga y ejecuta un agente.
@@ -115,26 +471,170 @@ async def execute_agent(
         payload: Datos de entrada para el agente
         dry_run: Si True, agrega flag dry_run al payload
         tenant_id: ID del tenant
+        agent: Registro del catalogo. Activa bulkheads y timeout por agente;
+               con execution_mode "process" corre en el pool de procesos
+        progress: Callback progress(phase, data=None) para agentes multi-fase
+                  (ver services.agent_stream); se ignora en modo process
+        timeout: Reemplaza el timeout del agente (execution_timeout); la cola
+                 de jobs pasa el suyo (JOB_TIMEOUT)
 
     Returns:
         Resultado de la ejecucion del agente
+
+    Raises:
+        BulkheadFullError: el agente o el tenant no tienen slots libres
+        AgentTimeoutError: se excedio el timeout de ejecucion
     """
-    instance = safe_load(file_path, class_name)
+    if agent is None:
+        return await _run_agent(file_path, class_name, payload, dry_run, tenant_id, None, None, progress)
 
-    if not hasattr(instance, "execute"):
-        raise AgentLoadError(
-            f"{class_name} no tiene metodo execute()"
+    from services.agent_bulkhead import execution_timeout, get_bulkheads
+
+    bulkheads = get_bulkheads()
+    agent_id = agent.get("id") or file_path
+    bulkheads.acquire(agent_id, tenant_id, bulkheads.limit_for(agent))
+    start = time.monotonic()
+    outcome = "cancelled"
+    try:
+        result = await _run_agent(
+            file_path, class_name, payload, dry_run, tenant_id, agent,
+            timeout if timeout is not None else execution_timeout(agent), progress,
         )
+        outcome = "ok"
+        return result
+    except AgentTimeoutError:
+        outcome = "timeout"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        bulkheads.release(agent_id, tenant_id, time.monotonic() - start, outcome)
 
+
+async def _run_agent(
+    file_path: str,
+    class_name: str,
+    payload: Dict[str, Any],
+    dry_run: bool,
+    tenant_id: str,
+    agent: Optional[Dict[str, Any]],
+    timeout: Optional[float],
+    progress: Optional[Callable[..., None]] = None,
+) -> Any:
     # Merge tenant_id and dry_run into payload — compatible with all agent signatures
     execution_payload = {**payload, "tenant_id": tenant_id}
     if dry_run:
         execution_payload["dry_run"] = True
 
-    result = instance.execute(execution_payload)
+    if agent is not None:
+        from services.agent_process_pool import execution_mode_for, get_process_pool
+
+        if execution_mode_for(agent) == "process":
+            # El pool de procesos aplica su propio timeout y recicla el worker
+            _validate_path(file_path)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, partial(
+                get_process_pool().execute,
+                agent.get("id", file_path), file_path, class_name, execution_payload, tenant_id,
+                timeout if timeout is not None else agent.get("execution_timeout"),
+            ))
+
+    instance = safe_load(file_path, class_name, tenant_id=tenant_id)
 
-    # Handle async execute methods
-    if asyncio.iscoroutine(result):
-        result = await result
+    if not hasattr(instance, "execute"):
+        raise AgentLoadError(
+            f"{class_name} no tiene metodo execute()"
+        )
+
+    call = partial(instance.execute, execution_payload)
+    if progress is not None and accepts_progress(instance):
+        call = partial(instance.execute, execution_payload, progress=progress)
+
+    try:
+        if is_async_agent(instance) or not sync_offload_enabled():
+            result = call()
+        else:
+            # execute() sincrono: fuera del event loop, en el pool acotado y justo por tenant.
+            # Al vencer el timeout el thread queda abandonado (su slot se libera).
+            result = await get_sync_pool().run(tenant_id, call, timeout)
+
+        # Handle async execute methods (cancelacion cooperativa al vencer el timeout)
+        if asyncio.iscoroutine(result):
+            result = await asyncio.wait_for(result, timeout) if timeout else await result
+    except asyncio.TimeoutError:
+        raise AgentTimeoutError(f"{class_name} excedio el timeout de {timeout:g}s")
 
     return result
+
+
+# ---------------------------------------------------------------------------
+# Dry-run result cache
+# ---------------------------------------------------------------------------
+
+CACHE_HIT, CACHE_MISS, CACHE_COALESCED, CACHE_BYPASS = "HIT", "MISS", "COALESCED", "BYPASS"
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Hash canonico del payload (orden de claves irrelevante)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def result_cache_ttl(agent: Optional[Dict[str, Any]]) -> float:
+    """RESULT_CACHE_TTL declarado por el agente, o AGENT_RESULT_CACHE_DEFAULT_TTL (0 = sin cache)."""
+    if agent is not None and agent.get("result_cache_ttl"):
+        return float(agent["result_cache_ttl"])
+    try:
+        return float(os.environ.get("AGENT_RESULT_CACHE_DEFAULT_TTL", "0"))
+    except ValueError:
+        return 0.0
+
+
+async def execute_agent_cached(
+    file_path: str,
+    class_name: str,
+    payload: Dict[str, Any],
+    dry_run: bool = True,
+    tenant_id: str = "default",
+    agent: Optional[Dict[str, Any]] = None,
+) -> Tuple[Any, str]:
+    """
+    execute_agent() con cache de resultados dry-run. Devuelve (result, estado)
+    con estado HIT | MISS | COALESCED | BYPASS (para el header X-Agent-Cache).
+    """
+    ttl = result_cache_ttl(agent)
+    if not dry_run or ttl <= 0 or agent is None or not result_cache_enabled():
+        result = await execute_agent(file_path, class_name, payload, dry_run, tenant_id, agent=agent)
+        return result, CACHE_BYPASS
+
+    resolved = _validate_path(file_path)
+    st = resolved.stat()
+    key = (
+        tenant_id,
+        agent.get("id") or file_path,
+        class_name,
+        f"{st.st_mtime_ns}:{st.st_size}",
+        payload_hash(payload),
+    )
+
+    state, value = _result_cache.lookup(key)
+    if state == "hit":
+        return value, CACHE_HIT
+    if state == "wait":
+        # shield: cancelar este request no debe cancelar el future compartido
+        try:
+            return await asyncio.shield(asyncio.wrap_future(value)), CACHE_COALESCED
+        except asyncio.CancelledError:
+            if not value.cancelled():
+                raise
+        result = await execute_agent(file_path, class_name, payload, dry_run, tenant_id, agent=agent)
+        return result, CACHE_BYPASS
+
+    try:
+        result = await execute_agent(file_path, class_name, payload, dry_run, tenant_id, agent=agent)
+    except BaseException as exc:
+        _result_cache.abandon(key, value, exc)
+        raise
+    _result_cache.complete(key, value, ttl, result)
+    return result, CACHE_MISS
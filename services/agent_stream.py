@@ -0,0 +1,114 @@
+"""
+Agent Stream — progress events from a running agent, as server-sent events.
+
+The runner hands agents an optional `progress(phase, data=None)` callback
+(it arrives in the agent's `context`, or as a `progress=` keyword). Each
+call becomes an SSE event as soon as the phase completes, so the client
+sees the first phase instead of waiting for the whole pipeline.
+
+Backpressure: events go through a bounded queue. A sync agent running in
+the thread pool blocks in progress() until the client has taken enough
+events; an async agent cannot block the event loop, so when the queue is
+full its oldest pending progress event is dropped (counted in `dropped`).
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from services.env import env_int
+
+
+def stream_queue_size() -> int:
+    return max(1, env_int("AGENT_STREAM_QUEUE_SIZE", 64))
+
+
+def stream_heartbeat() -> float:
+    """Segundos sin eventos antes de enviar un comentario keep-alive (0 = nunca)."""
+    return float(env_int("AGENT_STREAM_HEARTBEAT", 15))
+
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    payload = json.dumps(data, default=str, separators=(",", ":"))
+    lines.extend(f"data: {chunk}" for chunk in payload.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+class ProgressChannel:
+    """Bounded queue of (event, data) between one agent execution and one SSE response."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue(maxsize or stream_queue_size())
+        self._start = time.monotonic()
+        self.seq = 0
+        self.dropped = 0
+        self.closed = False
+
+    def _event(self, phase: str, data: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        self.seq += 1
+        return "progress", {
+            "seq": self.seq,
+            "phase": phase,
+            "elapsed_ms": round((time.monotonic() - self._start) * 1000),
+            "data": data or {},
+        }
+
+    def progress(self, phase: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """Callback para el agente. Nunca lanza: un stream cerrado ignora el evento."""
+        if self.closed:
+            return
+        if threading.get_ident() == self._loop_thread:
+            item = self._event(phase, data)
+            if self._queue.full():
+                self._queue.get_nowait()
+                self.dropped += 1
+            self._queue.put_nowait(item)
+            return
+
+        # Thread del pool: bloquea hasta que haya espacio (backpressure real)
+        future = asyncio.run_coroutine_threadsafe(self._put(phase, data), self._loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.closed:
+                    future.cancel()
+                    return
+            except (RuntimeError, concurrent.futures.CancelledError):
+                return
+
+    async def _put(self, phase: str, data: Optional[Dict[str, Any]]) -> None:
+        await self._queue.put(self._event(phase, data))
+
+    async def events(self, task: "asyncio.Future") -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Progress events until `task` finishes; the caller reads the result from the task."""
+        heartbeat = stream_heartbeat()
+        idle = 0.0
+        while True:
+            if task.done() and self._queue.empty():
+                return
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter, task}, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                idle = 0.0
+                yield getter.result()
+                continue
+            getter.cancel()
+            if not done:
+                idle += 1.0
+                if heartbeat and idle >= heartbeat:
+                    idle = 0.0
+                    yield "heartbeat", {}
+
+    def close(self) -> None:
+        self.closed = True
@@ -47,43 +47,74 @@ def write_log(entry: Dict[str, Any]) -> None:
     _write_jsonl(entry)
 
 
+def write_logs(entries: List[Dict[str, Any]]) -> None:
+    """Write many audit entries at once (one INSERT batch or one JSONL append)."""
+    if not entries:
+        return
+    from services.db import db_available
+
+    if db_available():
+        try:
+            asyncio.get_running_loop().create_task(_write_db_many(entries))
+            return
+        except RuntimeError:
+            pass  # no event loop — fall through to JSONL
+        except Exception as exc:
+            logger.warning(f"DB audit bulk write scheduled failed: {exc}")
+
+    _write_jsonl_many(entries)
+
+
 def _write_jsonl(entry: Dict[str, Any]) -> None:
+    _write_jsonl_many([entry])
+
+
+def _write_jsonl_many(entries: List[Dict[str, Any]]) -> None:
     _ensure_dir()
-    line = json.dumps(entry, default=str)
+    lines = "".join(json.dumps(entry, default=str) + "\n" for entry in entries)
     with _lock:
         with open(_LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
+            f.write(lines)
+
+
+_INSERT_SQL = text("""
+    INSERT INTO audit_logs
+        (trace_id, tenant_id, agent_id, mode, status, http_status,
+         latency_ms, user_id, error)
+    VALUES
+        (:trace_id, :tenant_id, :agent_id, :mode, :status, :http_status,
+         :latency_ms, :user_id, :error)
+""")
+
+
+def _db_params(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "trace_id": entry.get("trace_id", ""),
+        "tenant_id": entry.get("tenant_id", "default"),
+        "agent_id": entry.get("agent_id", ""),
+        "mode": entry.get("mode"),
+        "status": entry.get("status"),
+        "http_status": entry.get("http_status"),
+        "latency_ms": entry.get("latency_ms"),
+        "user_id": entry.get("user_id"),
+        "error": entry.get("error"),
+    }
 
 
 async def _write_db(entry: Dict[str, Any]) -> None:
+    await _write_db_many([entry])
+
+
+async def _write_db_many(entries: List[Dict[str, Any]]) -> None:
     from services.db import get_session
     try:
         async with get_session() as session:
-            await session.execute(
-                text("""
-                    INSERT INTO audit_logs
-                        (trace_id, tenant_id, agent_id, mode, status, http_status,
-                         latency_ms, user_id, error)
-                    VALUES
-                        (:trace_id, :tenant_id, :agent_id, :mode, :status, :http_status,
-                         :latency_ms, :user_id, :error)
-                """),
-                {
-                    "trace_id": entry.get("trace_id", ""),
-                    "tenant_id": entry.get("tenant_id", "default"),
-                    "agent_id": entry.get("agent_id", ""),
-                    "mode": entry.get("mode"),
-                    "status": entry.get("status"),
-                    "http_status": entry.get("http_status"),
-                    "latency_ms": entry.get("latency_ms"),
-                    "user_id": entry.get("user_id"),
-                    "error": entry.get("error"),
-                },
-            )
+            # executemany: una sola ida y vuelta para todo el lote
+            await session.execute(_INSERT_SQL, [_db_params(e) for e in entries])
             await session.commit()
     except Exception as exc:
         logger.warning(f"DB audit write failed, falling back to JSONL: {exc}")
-        _write_jsonl(entry)
+        _write_jsonl_many(entries)
 
 
 # ── Read ────────────────────────────────────────────────────────────────────
@@ -0,0 +1,380 @@
+"""
+Batch Writer — bounded in-process queue drained by one background task.
+
+Request paths call submit() (O(1), never awaits); the writer task hands
+the queued items to an async `sink(batch)` every `batch_size` items or
+`flush_interval` seconds, whichever comes first, so the database sees
+one bulk statement per batch instead of one round trip per request.
+
+When the queue fills up:
+- above `high_watermark` of its capacity only 1 in `sample_rate` of the
+  items accepted by `sampleable` is kept (sampled_out counts the rest);
+- at capacity new items are dropped (dropped counts them).
+
+The task is started lazily by the first submit() made inside a running
+loop (or explicitly with start()), and stop() drains the queue on
+shutdown. If the loop goes away (e.g. a test client), the next submit()
+starts a new task on the current loop; queued items are kept.
+
+ThreadBatchWriter is the same idea for synchronous code (sqlite3 callers):
+one daemon thread owns the sink, so a single long-lived connection can
+commit a batch per transaction while callers only enqueue. Nothing is
+sampled; a full queue makes submit() wait up to `put_timeout` before the
+item is dropped. Errors the caller marks as transient with `retryable`
+(e.g. "database is locked") retry the same batch with backoff for up to
+`retry_for` seconds instead of discarding it.
+"""
+
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger("nadakki.batch_writer")
+
+
+class AsyncBatchWriter:
+    """Bounded queue + background bulk writer. submit() must be called from the event loop thread."""
+
+    def __init__(
+        self,
+        sink: Callable[[List[Any]], Awaitable[None]],
+        name: str = "batch",
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        sample_rate: int = 10,
+        high_watermark: float = 0.75,
+        sampleable: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.sink = sink
+        self.name = name
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.sample_rate = max(1, sample_rate)
+        self.high_mark = int(self.max_queue * high_watermark)
+        self.sampleable = sampleable
+        self._queue: Deque[Any] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._sample_seq = 0
+        # Metricas
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    # -- productor -------------------------------------------------------------
+
+    def submit(self, item: Any) -> bool:
+        """Encola sin esperar. False si el item se descarto (cola llena o muestreo)."""
+        depth = len(self._queue)
+        if depth >= self.max_queue:
+            self.dropped += 1
+            return False
+        if depth >= self.high_mark and self.sample_rate > 1 and (self.sampleable is None or self.sampleable(item)):
+            self._sample_seq += 1
+            if self._sample_seq % self.sample_rate:
+                self.sampled_out += 1
+                return False
+        self._queue.append(item)
+        self.enqueued += 1
+        depth += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if not self._running():
+            self._autostart()
+        elif depth >= self.batch_size and self._wake is not None:
+            self._wake.set()
+        return True
+
+    def take(self, n: Optional[int] = None) -> List[Any]:
+        """Saca hasta n items (todos si n es None) del frente de la cola."""
+        queue = self._queue
+        count = len(queue) if n is None else min(n, len(queue))
+        return [queue.popleft() for _ in range(count)]
+
+    # -- consumidor ------------------------------------------------------------
+
+    def _running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _autostart(self) -> None:
+        if self._stopping:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sin loop: se drena en el proximo start()/submit() dentro del loop
+        self.start()
+
+    def start(self) -> "asyncio.Task":
+        if not self._running():
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self) -> None:
+        self._wake = asyncio.Event()
+        while not self._stopping:
+            if len(self._queue) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            await self.flush_once()
+
+    async def flush_once(self) -> int:
+        batch = self.take(self.batch_size)
+        if not batch:
+            return 0
+        start = time.monotonic()
+        try:
+            await self.sink(batch)
+            self.written += len(batch)
+            self.batches += 1
+        except asyncio.CancelledError:
+            # El loop se cierra: el batch vuelve al frente para el proximo writer
+            self._queue.extendleft(reversed(batch))
+            raise
+        except Exception as exc:
+            self.failed += len(batch)
+            logger.warning("%s writer: batch de %d descartado: %s", self.name, len(batch), exc)
+        self.last_flush_ms = round((time.monotonic() - start) * 1000, 1)
+        return len(batch)
+
+    async def flush(self) -> None:
+        """Escribe todo lo encolado."""
+        while await self.flush_once():
+            pass
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el task y drena la cola (shutdown)."""
+        self._stopping = True
+        task = self._task
+        if task is not None and not task.done():
+            if self._wake is not None:
+                self._wake.set()
+            try:
+                await asyncio.wait_for(task, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s writer: %d items sin escribir al apagar", self.name, len(self._queue))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running(),
+            "queue_depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "batches": self.batches,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+class _FlushMarker:
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ThreadBatchWriter:
+    """Bounded queue + one writer thread calling `sink(batch)`. submit() is thread-safe."""
+
+    def __init__(
+        self,
+        sink: Callable[[List[Any]], None],
+        name: str = "batch",
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        put_timeout: float = 1.0,
+        retryable: Optional[Callable[[Exception], bool]] = None,
+        retry_for: float = 300.0,
+    ):
+        self.sink = sink
+        self.name = name
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retryable = retryable
+        self.retry_for = retry_for
+        self._queue: "queue.Queue[Any]" = queue.Queue(self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        # Metricas
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.retries = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    # -- productor -------------------------------------------------------------
+
+    def submit(self, item: Any) -> bool:
+        """Encola; solo espera si la cola esta llena. False si el item se descarto."""
+        if not self._running():
+            self.start()
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("%s writer: cola llena, item descartado", self.name)
+            return False
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todo lo encolado antes de la llamada este escrito."""
+        if not self._running():
+            self._drain()
+            return True
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    # -- consumidor ------------------------------------------------------------
+
+    def _running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._running():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _next_batch(self) -> List[Any]:
+        """Bloquea hasta el primer item; junta hasta batch_size o flush_interval o un flush()."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not isinstance(batch[-1], _FlushMarker):
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            markers = [item for item in batch if isinstance(item, _FlushMarker)]
+            self._write([item for item in batch if not isinstance(item, _FlushMarker)])
+            for marker in markers:
+                marker.done.set()
+            if self._stopping and self._queue.empty():
+                return
+
+    def _drain(self) -> None:
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+            else:
+                items.append(item)
+        for i in range(0, len(items), self.batch_size):
+            self._write(items[i:i + self.batch_size])
+
+    def _write(self, batch: List[Any]) -> None:
+        if not batch:
+            return
+        start = time.monotonic()
+        delay = 0.05
+        while True:
+            try:
+                self.sink(batch)
+                self.written += len(batch)
+                self.batches += 1
+                break
+            except Exception as exc:
+                if self.retryable is not None and self.retryable(exc) and time.monotonic() - start < self.retry_for:
+                    # Error transitorio (p. ej. otro escritor con el lock): mismo batch, con backoff
+                    self.retries += 1
+                    time.sleep(delay)
+                    delay = min(delay * 2, 2.0)
+                    continue
+                self.failed += len(batch)
+                logger.warning("%s writer: batch de %d descartado: %s", self.name, len(batch), exc)
+                break
+        self.last_flush_ms = round((time.monotonic() - start) * 1000, 1)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el thread tras escribir lo encolado (shutdown / atexit)."""
+        atexit.unregister(self.stop)
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._stopping = True
+            marker = _FlushMarker()
+            try:
+                self._queue.put(marker, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning("%s writer: %d items sin escribir al apagar", self.name, len(self))
+                return
+        self._drain()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running(),
+            "queue_depth": len(self),
+            "max_depth": self.max_depth,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "retries": self.retries,
+            "last_flush_ms": self.last_flush_ms,
+        }
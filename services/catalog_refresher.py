@@ -0,0 +1,110 @@
+"""
+Catalog Refresher — live hot-reload of the agent catalog.
+
+Polls agents/ through the discovery index: unchanged files cost one
+stat(), changed/added files are re-scored, removed files are pruned.
+When the catalog content changes a new snapshot is published atomically
+(services.agent_catalog) and loaded modules of the touched files are
+evicted so the next execution imports the new code.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from services.agent_catalog import catalog_version, current_catalog, publish_catalog
+from services.agent_discovery import discovery_workers, run_discovery, scanner_fingerprint
+from services.agent_runner import evict_agent_modules
+from services.discovery_index import DiscoveryIndex, default_index_path, index_enabled
+
+logger = logging.getLogger("nadakki.catalog_refresher")
+
+
+def reload_interval() -> float:
+    """CATALOG_RELOAD_INTERVAL seconds between polls (0 = watcher disabled)."""
+    try:
+        return max(0.0, float(os.environ.get("CATALOG_RELOAD_INTERVAL", "0")))
+    except ValueError:
+        return 0.0
+
+
+class CatalogRefresher:
+    """Incremental re-discovery + atomic publish. refresh() is thread-safe."""
+
+    def __init__(self, agents_path: Path, index: DiscoveryIndex, workers: int = 1):
+        self.agents_path = agents_path
+        self.index = index
+        self.workers = workers
+        self.refreshes = 0
+        self.swaps = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, agents_path: Path) -> "CatalogRefresher":
+        # Without a persisted index the first pass re-scans everything (in memory)
+        path = default_index_path() if index_enabled() else None
+        index = DiscoveryIndex(path, scanner_fingerprint()).load()
+        return cls(agents_path, index, workers=discovery_workers())
+
+    def refresh(self) -> Dict[str, Any]:
+        """Re-scan changed files; publish a new catalog version if anything changed."""
+        with self._lock:
+            self.index.begin_pass()
+            agents, stats = run_discovery(self.agents_path, self.index, workers=self.workers)
+            changed = list(self.index.changed)
+            removed = list(self.index.pruned)
+            self.refreshes += 1
+
+            evicted = evict_agent_modules(changed + removed) if (changed or removed) else 0
+
+            current = current_catalog()
+            published = False
+            version = current.version if current is not None else None
+            if changed or removed or current is None:
+                new_version = catalog_version(agents)
+                if new_version != version:
+                    version = publish_catalog(agents, stats).version
+                    published = True
+                    self.swaps += 1
+                    logger.info(
+                        "Catalog reloaded: version=%s changed=%d removed=%d agents=%d",
+                        version, len(changed), len(removed), len(agents),
+                    )
+
+            return {
+                "published": published,
+                "version": version,
+                "changed": changed,
+                "removed": removed,
+                "modules_evicted": evicted,
+                "agents_total": len(agents),
+            }
+
+    async def refresh_async(self) -> Dict[str, Any]:
+        """refresh() off the event loop (scoring is CPU-bound)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.refresh)
+
+    async def run_forever(self, interval: float) -> None:
+        logger.info("Catalog hot-reload watching %s every %.1fs", self.agents_path, interval)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_async()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Catalog refresh failed: %s", exc)
+
+
+_refresher: Optional[CatalogRefresher] = None
+
+
+def get_refresher(agents_path: Path) -> CatalogRefresher:
+    global _refresher
+    if _refresher is None:
+        _refresher = CatalogRefresher.from_env(agents_path)
+    return _refresher
@@ -55,9 +55,18 @@ def db_available() -> bool:
 
 @asynccontextmanager
 async def get_session(tenant_id: Optional[str] = None):
-    """Yield an AsyncSession. Sets RLS tenant context if tenant_id provided."""
+    """
+    Yield an AsyncSession. Sets RLS tenant context if tenant_id provided.
+    tenant_id may be a slug: it is mapped to the UUID through the tenant directory cache.
+    """
     if _session_factory is None:
         raise RuntimeError("Database not initialized")
+    if tenant_id:
+        from services.tenant_directory import get_tenant_directory, is_uuid
+        if not is_uuid(tenant_id):
+            tenant = await get_tenant_directory().resolve(tenant_id)
+            if tenant is not None:
+                tenant_id = tenant.id
     async with _session_factory() as session:
         if tenant_id:
             await session.execute(
@@ -0,0 +1,164 @@
+"""
+Discovery Index — on-disk cache of per-file agent discovery results.
+
+Each entry is keyed by the file path relative to agents/ and stores the
+file mtime, size and SHA-256 of its content together with the agent
+records produced by scanning it. On startup only files whose content
+changed are parsed and scored again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("nadakki.discovery_index")
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_DEFAULT_INDEX_PATH = _PROJECT_ROOT / "data" / "discovery_index.json"
+
+_INDEX_FORMAT = 1
+
+
+def index_enabled() -> bool:
+    return os.environ.get("DISCOVERY_INDEX_ENABLED", "true").lower() == "true"
+
+
+def default_index_path() -> Path:
+    return Path(os.environ.get("DISCOVERY_INDEX_PATH") or _DEFAULT_INDEX_PATH)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiscoveryIndex:
+    """
+    Persisted map rel_path -> {mtime_ns, size, sha256, ...scan result}.
+
+    The index is invalidated as a whole when `fingerprint` (the scanner
+    version) differs from the one it was saved with.
+    """
+
+    def __init__(self, path: Optional[Path], fingerprint: str):
+        # path=None keeps the index in memory only (no load/save)
+        self.path = Path(path) if path is not None else None
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self.begin_pass()
+
+    def begin_pass(self) -> None:
+        """Reset per-scan counters (the index itself is kept)."""
+        self.hits = 0
+        self.rescanned = 0
+        self.removed = 0
+        self.changed: List[str] = []
+        self.pruned: List[str] = []
+
+    def load(self) -> "DiscoveryIndex":
+        """Load entries from disk. A missing, corrupt or stale file yields an empty index."""
+        if self.path is None:
+            return self
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return self
+        except Exception as exc:
+            logger.warning("Discovery index unreadable (%s), rebuilding: %s", self.path, exc)
+            return self
+
+        if raw.get("format") != _INDEX_FORMAT or raw.get("fingerprint") != self.fingerprint:
+            logger.info("Discovery index fingerprint changed, rebuilding")
+            self._dirty = True
+            return self
+
+        self.entries = raw.get("entries") or {}
+        return self
+
+    def lookup(self, rel_path: str, filepath: Path) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry for `rel_path` if the file is unchanged.
+
+        mtime + size match is trusted without reading the file; otherwise the
+        content hash decides (touched-but-identical files are still hits).
+        """
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return None
+
+        try:
+            st = filepath.stat()
+        except OSError:
+            return None
+
+        if entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            self.hits += 1
+            return entry
+
+        try:
+            digest = content_hash(filepath.read_bytes())
+        except OSError:
+            return None
+
+        if digest == entry.get("sha256"):
+            entry["mtime_ns"] = st.st_mtime_ns
+            entry["size"] = st.st_size
+            self._dirty = True
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, rel_path: str, entry: Dict[str, Any]) -> None:
+        previous = self.entries.get(rel_path)
+        if previous is None or previous.get("sha256") != entry.get("sha256"):
+            self.changed.append(rel_path)
+        self.entries[rel_path] = entry
+        self.rescanned += 1
+        self._dirty = True
+
+    def prune(self, seen: set) -> None:
+        """Drop entries for files that no longer exist (or are now ignored)."""
+        stale = [p for p in self.entries if p not in seen]
+        for p in stale:
+            del self.entries[p]
+        self.pruned.extend(stale)
+        if stale:
+            self.removed += len(stale)
+            self._dirty = True
+
+    def save(self) -> bool:
+        """Atomically write the index if it changed. Failures are logged, never raised."""
+        if not self._dirty or self.path is None:
+            return False
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"format": _INDEX_FORMAT, "fingerprint": self.fingerprint, "entries": self.entries},
+                    f,
+                    separators=(",", ":"),
+                )
+            os.replace(tmp, self.path)
+            self._dirty = False
+            return True
+        except Exception as exc:
+            logger.warning("Discovery index write failed (%s): %s", self.path, exc)
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            return False
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path) if self.path is not None else None,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "rescanned": self.rescanned,
+            "removed": self.removed,
+        }
@@ -0,0 +1,22 @@
+"""
+Env — lectura de parametros numericos desde variables de entorno.
+
+Un valor ausente o mal escrito devuelve el default: una variable rota no
+impide arrancar la app. Cada modulo documenta sus variables en su docstring.
+"""
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
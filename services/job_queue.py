@@ -0,0 +1,612 @@
+"""
+Job Queue — asynchronous execution of long-running agents.
+
+POST a job, poll it, cancel it: the HTTP request no longer stays open for
+the whole execute_agent call. Jobs live in a local SQLite store (WAL),
+so queued work survives a restart. Every worker process shares the
+store: a running job belongs to its owner (one id per JobStore) and
+holds a lease that the owner renews every JOB_LEASE_SECONDS / 3. Jobs
+whose lease expired (the owner died or was stopped) are re-queued by
+any process, up to max_attempts; finishing a job is conditional on
+still owning it.
+
+Workers are asyncio tasks on the app loop. Each claims the next job by
+priority, then by the tenant with the fewest running jobs (round-robin
+between tenants with equal load), then by age, and runs it through
+services.agent_runner.execute_agent (sync agents still go to the thread
+or process pool from there). Store calls (sqlite, with a 5s busy_timeout
+when several processes share the file) run in the default executor, never
+on the loop itself. Finished jobs keep their result for JOB_RESULT_TTL
+seconds.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.env import env_int
+
+logger = logging.getLogger("nadakki.job_queue")
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_DEFAULT_STORE_PATH = _PROJECT_ROOT / "data" / "agent_jobs.db"
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+_CLAIM_WINDOW = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_jobs (
+    id TEXT PRIMARY KEY,
+    tenant_id TEXT NOT NULL,
+    usage_slug TEXT,
+    agent_id TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dry_run INTEGER NOT NULL DEFAULT 1,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 1,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    user_id TEXT,
+    created_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    expires_at REAL,
+    owner TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_claim ON agent_jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_tenant ON agent_jobs (tenant_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_expiry ON agent_jobs (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+
+def job_queue_enabled() -> bool:
+    return os.environ.get("JOB_QUEUE_ENABLED", "true").lower() == "true"
+
+
+def default_store_path() -> Path:
+    return Path(os.environ.get("JOB_STORE_PATH") or _DEFAULT_STORE_PATH)
+
+
+class JobStore:
+    """SQLite persistence for jobs. Thread-safe (one connection + lock); one owner id per instance."""
+
+    def __init__(self, path: Path, lease_seconds: float = 60.0):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript(_SCHEMA)
+            # Stores creados antes de los leases
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(agent_jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE agent_jobs ADD COLUMN {column} {kind}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["agent"] = json.loads(job["agent"])
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["dry_run"] = bool(job["dry_run"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO agent_jobs (id, tenant_id, usage_slug, agent_id, agent, payload, dry_run, priority, "
+                "status, max_attempts, user_id, created_at, run_after) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job["id"], job["tenant_id"], job.get("usage_slug"), job["agent_id"],
+                    json.dumps(job["agent"], default=str), json.dumps(job["payload"], default=str),
+                    int(job["dry_run"]), job["priority"], QUEUED, job["max_attempts"], job.get("user_id"),
+                    job["created_at"], job["created_at"],
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, tenant_id: str, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM agent_jobs WHERE tenant_id = ?"
+        params: List[Any] = [tenant_id]
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row(r) for r in rows]
+
+    def candidates(self, now: float, limit: int = _CLAIM_WINDOW) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, tenant_id, priority, created_at FROM agent_jobs "
+                "WHERE status = ? AND run_after <= ? ORDER BY priority DESC, created_at LIMIT ?",
+                (QUEUED, now, limit),
+            ).fetchall()
+
+    def claim(self, job_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """queued -> running (owned by this store); None if another worker (or process) got it first."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = ?",
+                (RUNNING, now, self.owner, now, job_id, QUEUED),
+            )
+            if cur.rowcount != 1:
+                return None
+            row = self._conn.execute("SELECT * FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def finish(self, job_id: str, status: str, ttl: float, result: Any = None, error: Optional[str] = None) -> bool:
+        """running -> final state. False if this store no longer owns the job (its lease expired)."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ?, owner = NULL "
+                "WHERE id = ? AND status = ? AND owner = ?",
+                (
+                    status, json.dumps(result, default=str) if result is not None else None, error,
+                    now, now + ttl if ttl > 0 else None, job_id, RUNNING, self.owner,
+                ),
+            )
+            return cur.rowcount == 1
+
+    def requeue(self, job_id: str, error: str, delay: float, refund_attempt: bool = False) -> bool:
+        """refund_attempt: el intento no cuenta (p. ej. rechazo por bulkhead saturado)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET status = ?, error = ?, run_after = ?, started_at = NULL,"
+                " attempts = attempts - ?, owner = NULL WHERE id = ? AND status = ? AND owner = ?",
+                (QUEUED, error, time.time() + delay, 1 if refund_attempt else 0, job_id, RUNNING, self.owner),
+            )
+            return cur.rowcount == 1
+
+    def heartbeat(self, now: float) -> int:
+        """Renueva el lease de los jobs que este store esta ejecutando."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?", (now, RUNNING, self.owner)
+            )
+            return cur.rowcount
+
+    def release(self) -> int:
+        """Shutdown: vence ya el lease de los jobs propios para que cualquier proceso los recupere."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET heartbeat_at = 0 WHERE status = ? AND owner = ?", (RUNNING, self.owner)
+            )
+            return cur.rowcount
+
+    def request_cancel(self, job_id: str, ttl: float) -> Optional[str]:
+        """Queued jobs are cancelled at once; running ones get cancel_requested. Returns the new status."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET status = ?, finished_at = ?, expires_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, now + ttl if ttl > 0 else None, job_id, QUEUED),
+            )
+            if cur.rowcount == 1:
+                return CANCELLED
+            cur = self._conn.execute(
+                "UPDATE agent_jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            )
+            if cur.rowcount == 1:
+                return RUNNING
+            row = self._conn.execute("SELECT status FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def cancel_requested(self, job_ids: List[str]) -> List[str]:
+        if not job_ids:
+            return []
+        marks = ",".join("?" for _ in job_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM agent_jobs WHERE cancel_requested = 1 AND id IN ({marks})", job_ids
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    def recover(self, now: Optional[float] = None) -> int:
+        """
+        Jobs whose lease expired (owner died or stopped) go back to the queue, or
+        fail if out of attempts. Jobs other live workers are running are not touched.
+        """
+        now = now if now is not None else time.time()
+        expired = now - self.lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE agent_jobs SET status = ?, error = 'interrupted: worker lease expired', finished_at = ?, "
+                    "owner = NULL WHERE status = ? AND COALESCE(heartbeat_at, 0) < ? AND attempts >= max_attempts",
+                    (FAILED, now, RUNNING, expired),
+                )
+                cur = self._conn.execute(
+                    "UPDATE agent_jobs SET status = ?, started_at = NULL, run_after = ?, owner = NULL "
+                    "WHERE status = ? AND COALESCE(heartbeat_at, 0) < ?",
+                    (QUEUED, now, RUNNING, expired),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cur.rowcount
+
+    def purge_expired(self, now: float) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM agent_jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM agent_jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+
+class JobQueue:
+    """Worker pool that drains a JobStore on the running event loop."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 4,
+        tenant_max_running: int = 0,
+        result_ttl: float = 86400.0,
+        job_timeout: float = 3600.0,
+        poll_interval: float = 1.0,
+        retry_delay: float = 5.0,
+    ):
+        self.store = store
+        self.workers = max(1, workers)
+        # 0 = sin limite por tenant (solo el orden justo del claim)
+        self.tenant_max_running = max(0, tenant_max_running)
+        self.result_ttl = result_ttl
+        self.job_timeout = job_timeout
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._running_by_tenant: Dict[str, int] = {}
+        self._last_served: Dict[str, int] = {}
+        self._served = 0
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.retried = 0
+        self.deferred = 0
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(
+            JobStore(default_store_path(), float(os.environ.get("JOB_LEASE_SECONDS", "60"))),
+            workers=env_int("JOB_WORKERS", 4),
+            tenant_max_running=env_int("JOB_TENANT_MAX_RUNNING", 0),
+            result_ttl=float(os.environ.get("JOB_RESULT_TTL", "86400")),
+            job_timeout=float(os.environ.get("JOB_TIMEOUT", "3600")),
+        )
+
+    # -- API ----------------------------------------------------------------
+
+    def submit(
+        self,
+        tenant_id: str,
+        agent: Dict[str, Any],
+        payload: Dict[str, Any],
+        dry_run: bool = True,
+        priority: int = 0,
+        max_attempts: int = 1,
+        usage_slug: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "tenant_id": tenant_id,
+            "usage_slug": usage_slug,
+            "agent_id": agent.get("id", ""),
+            # Solo lo necesario para ejecutar: el job no depende de la version del catalogo
+            "agent": {k: agent.get(k) for k in ("id", "file_path", "class_name", "execution_mode", "execution_timeout")},
+            "payload": payload,
+            "dry_run": dry_run,
+            "priority": priority,
+            "max_attempts": max(1, max_attempts),
+            "user_id": user_id,
+            "created_at": time.time(),
+        }
+        self.store.insert(job)
+        self._notify()
+        return self.store.get(job["id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list(self, tenant_id: str, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return self.store.list(tenant_id, status, limit)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        status = self.store.request_cancel(job_id, self.result_ttl)
+        if status == RUNNING:
+            task = self._tasks.get(job_id)
+            if task is not None and self._loop is not None:
+                self._loop.call_soon_threadsafe(task.cancel)
+        return status
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start workers on the running loop (call from an async context)."""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        # El primer paso de _housekeeping re-encola los jobs con lease vencido
+        self._workers = [self._loop.create_task(self._worker(i)) for i in range(self.workers)]
+        self._workers.append(self._loop.create_task(self._housekeeping()))
+
+    async def stop(self) -> None:
+        """Cancel workers; jobs interrupted here give up their lease and are re-queued by recover()."""
+        self._stopping = True
+        for task in self._workers + list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        try:
+            await self._offload(self.store.release)
+        except Exception as exc:
+            logger.warning("Job lease release failed: %s", exc)
+
+    @staticmethod
+    async def _offload(fn, *args, **kwargs) -> Any:
+        """Llamada al store fuera del event loop (un lock ocupado espera hasta busy_timeout)"""
+        return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+
+    def _notify(self) -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # -- scheduling ---------------------------------------------------------
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        rows = self.store.candidates(now)
+        with self._lock:
+            eligible = [
+                r for r in rows
+                if not self.tenant_max_running or self._running_by_tenant.get(r["tenant_id"], 0) < self.tenant_max_running
+            ]
+            eligible.sort(key=lambda r: (
+                -r["priority"],
+                self._running_by_tenant.get(r["tenant_id"], 0),
+                self._last_served.get(r["tenant_id"], -1),
+                r["created_at"],
+            ))
+        for row in eligible:
+            job = self.store.claim(row["id"], now)
+            if job is not None:
+                with self._lock:
+                    tenant = job["tenant_id"]
+                    self._running_by_tenant[tenant] = self._running_by_tenant.get(tenant, 0) + 1
+                    self._served += 1
+                    self._last_served[tenant] = self._served
+                return job
+        return None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            try:
+                job = await self._offload(self._claim_next)
+            except Exception as exc:
+                logger.warning("Job claim failed: %s", exc)
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.ensure_future(self._run(job))
+            self._tasks[job["id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # Cancelaron al worker (shutdown): el job vuelve a la cola cuando vence su lease
+                    task.cancel()
+                    raise
+            finally:
+                self._tasks.pop(job["id"], None)
+                with self._lock:
+                    tenant = job["tenant_id"]
+                    left = self._running_by_tenant.get(tenant, 1) - 1
+                    if left > 0:
+                        self._running_by_tenant[tenant] = left
+                    else:
+                        self._running_by_tenant.pop(tenant, None)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        from services.agent_bulkhead import BulkheadFullError
+        from services.agent_runner import AgentLoadError, execute_agent
+
+        agent = job["agent"]
+        start = time.time()
+        try:
+            result = await asyncio.wait_for(
+                execute_agent(
+                    file_path=agent.get("file_path") or "",
+                    class_name=agent.get("class_name") or "",
+                    payload=job["payload"],
+                    dry_run=job["dry_run"],
+                    tenant_id=job["tenant_id"],
+                    agent=agent,
+                    # El job tiene su propio limite: no el AGENT_EXECUTION_TIMEOUT de los requests
+                    timeout=self.job_timeout,
+                ),
+                self.job_timeout,
+            )
+        except asyncio.CancelledError:
+            if self._stopping:
+                raise
+            if await self._finish(job, CANCELLED, error="cancelled"):
+                self.cancelled += 1
+                _audit_job(job, "cancelled", start, 499, "cancelled")
+            return
+        except BulkheadFullError as exc:
+            # Agente/tenant saturado: no es un fallo del job, vuelve a la cola sin gastar intento
+            if await self._offload(self.store.requeue, job["id"], str(exc), exc.retry_after, refund_attempt=True):
+                self.deferred += 1
+            return
+        except Exception as exc:
+            if isinstance(exc, asyncio.TimeoutError):
+                error = f"Job timed out after {self.job_timeout:g}s"
+            elif isinstance(exc, AgentLoadError):
+                error = str(exc)
+            else:
+                error = f"Execution error: {exc}"
+            if job["attempts"] < job["max_attempts"] and not isinstance(exc, AgentLoadError):
+                if await self._offload(self.store.requeue, job["id"], error, self.retry_delay * job["attempts"]):
+                    self.retried += 1
+            elif await self._finish(job, FAILED, error=error):
+                self.failed += 1
+                _audit_job(job, "error", start, 500, error)
+            return
+
+        if not await self._finish(job, SUCCEEDED, result=result):
+            return
+        self.completed += 1
+        _audit_job(job, "ok", start, 200)
+        if job.get("usage_slug"):
+            from backend.middleware.usage import _increment_usage
+            asyncio.ensure_future(_increment_usage(job["usage_slug"]))
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        if await self._offload(self.store.finish, job["id"], status, self.result_ttl, result=result, error=error):
+            return True
+        # Otro proceso lo dio por perdido (lease vencido) y ya lo re-encolo o lo cerro
+        logger.warning("Job %s lost its lease; %s outcome discarded", job["id"], status)
+        return False
+
+    async def _housekeeping(self) -> None:
+        """
+        Renew the leases of our running jobs, re-queue jobs whose lease expired,
+        purge expired results and pick up cancellations made by other processes.
+        """
+        last_purge = last_heartbeat = 0.0
+        while True:
+            try:
+                for job_id in await self._offload(self.store.cancel_requested, list(self._tasks)):
+                    task = self._tasks.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                now = time.time()
+                if now - last_heartbeat >= self.store.lease_seconds / 3:
+                    await self._offload(self.store.heartbeat, now)
+                    last_heartbeat = now
+                    recovered = await self._offload(self.store.recover, now)
+                    if recovered:
+                        logger.info("Job queue: %d jobs with an expired lease re-queued", recovered)
+                    self._notify()
+                if now - last_purge >= 60:
+                    purged = await self._offload(self.store.purge_expired, now)
+                    last_purge = now
+                    if purged:
+                        logger.info("Job queue: %d expired jobs purged", purged)
+            except Exception as exc:
+                logger.warning("Job housekeeping failed: %s", exc)
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = dict(self._running_by_tenant)
+        return {
+            "enabled": job_queue_enabled(),
+            "workers": self.workers,
+            "started": bool(self._workers),
+            "tenant_max_running": self.tenant_max_running,
+            "result_ttl_seconds": self.result_ttl,
+            "jobs": self.store.counts(),
+            "running_by_tenant": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "retried": self.retried,
+            "deferred": self.deferred,
+        }
+
+
+def _audit_job(job: Dict[str, Any], status: str, start: float, http_status: int, error: Optional[str] = None) -> None:
+    from services.audit_logger import write_log
+
+    entry = {
+        "trace_id": job["id"][:16],
+        "agent_id": job["agent_id"],
+        "tenant_id": job["tenant_id"],
+        "mode": "dry" if job["dry_run"] else "live",
+        "status": status,
+        "http_status": http_status,
+        "latency_ms": round((time.time() - start) * 1000),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    if job.get("user_id"):
+        entry["user_id"] = job["user_id"]
+    if error:
+        entry["error"] = error
+    try:
+        write_log(entry)
+    except Exception as exc:
+        logger.warning("Job audit write failed: %s", exc)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue.from_env()
+    return _queue
@@ -0,0 +1,149 @@
+"""
+Rate Limit Store — shared counters so several workers enforce one limit.
+
+Each uvicorn worker has its own SlidingWindowLimiter; with N workers a
+tenant gets N x the limit. A RateLimitStore holds the per-window counts
+of every worker: ClusterLimiter (services/rate_limiter.py) pushes its
+local increments in batches and reads back the cluster totals for the
+keys it has seen, in one round trip per sync.
+
+    sync(scope, increments, keys, since) -> {key: {window_id: count}}
+
+- scope:       namespace of the limiter ("global", "security:30/60", ...)
+- window_id:   index of the fixed window, floor(epoch / window)
+- increments:  [(key, window_id, n)] accumulated since the last sync
+- keys:        keys whose totals are wanted (window_id >= since)
+
+SQLiteRateLimitStore is the single-host implementation (one WAL file
+shared by every worker). A Redis store only has to implement sync():
+a pipeline of HINCRBY/EXPIRE per increment plus HGETALL per key.
+
+Env:
+    RATE_LIMIT_BACKEND     local | sqlite   (default local: per-process limits)
+    RATE_LIMIT_DB_PATH     data/rate_limits.db
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("nadakki.rate_limit_store")
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_DEFAULT_DB_PATH = _PROJECT_ROOT / "data" / "rate_limits.db"
+
+# Limite de variables por sentencia en SQLite antiguo (999)
+_IN_CHUNK = 500
+# Syncs entre purgas de ventanas vencidas
+_PURGE_EVERY = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_counters (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    window_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (scope, key, window_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expiry ON rate_limit_counters (window_id);
+"""
+
+Increment = Tuple[str, int, int]
+Totals = Dict[str, Dict[int, int]]
+
+
+def rate_limit_backend() -> str:
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "local").lower()
+    return backend if backend in ("local", "sqlite") else "local"
+
+
+def default_db_path() -> Path:
+    return Path(os.environ.get("RATE_LIMIT_DB_PATH") or _DEFAULT_DB_PATH)
+
+
+class RateLimitStore(ABC):
+    """Interfaz de almacenamiento compartido (ver docstring del modulo)."""
+
+    @abstractmethod
+    def sync(self, scope: str, increments: List[Increment], keys: Iterable[str], since: int) -> Totals:
+        """Suma increments y devuelve los totales de keys con window_id >= since."""
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """Contadores por (scope, key, ventana) en un SQLite WAL compartido entre procesos."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._syncs = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=2000")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def sync(self, scope: str, increments: List[Increment], keys: Iterable[str], since: int) -> Totals:
+        keys = list(keys)
+        totals: Totals = {}
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if increments:
+                    conn.executemany(
+                        "INSERT INTO rate_limit_counters (scope, key, window_id, count) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (scope, key, window_id) DO UPDATE SET count = count + excluded.count",
+                        [(scope, key, window_id, n) for key, window_id, n in increments],
+                    )
+                for i in range(0, len(keys), _IN_CHUNK):
+                    chunk = keys[i:i + _IN_CHUNK]
+                    rows = conn.execute(
+                        "SELECT key, window_id, count FROM rate_limit_counters "
+                        f"WHERE scope = ? AND window_id >= ? AND key IN ({','.join('?' * len(chunk))})",
+                        [scope, since, *chunk],
+                    ).fetchall()
+                    for key, window_id, count in rows:
+                        totals.setdefault(key, {})[window_id] = count
+                self._syncs += 1
+                if self._syncs % _PURGE_EVERY == 0:
+                    # Ventanas anteriores a la previa ya no cuentan para nadie
+                    conn.execute(
+                        "DELETE FROM rate_limit_counters WHERE scope = ? AND window_id < ?", (scope, since),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return totals
+
+
+_store: Optional[RateLimitStore] = None
+_store_lock = threading.Lock()
+
+
+def get_rate_limit_store() -> Optional[RateLimitStore]:
+    """Store compartido segun RATE_LIMIT_BACKEND; None para limites por proceso."""
+    global _store
+    if rate_limit_backend() == "local":
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = SQLiteRateLimitStore(default_db_path())
+            except sqlite3.Error as exc:
+                logger.warning("Rate limit store no disponible, limites por proceso: %s", exc)
+                return None
+        return _store
@@ -0,0 +1,397 @@
+"""
+Rate Limiter — sliding-window counter, O(1) time and memory per key.
+
+Each key keeps three numbers: the start of the current fixed window, the
+count of the previous window and the count of the current one. The
+sliding-window estimate is
+
+    estimate = prev * (1 - elapsed / window) + curr
+
+which approximates "at most `limit` requests in any `window` seconds"
+without storing timestamps. Retry-After is the exact time until the
+estimate leaves room for one more request.
+
+Keys untouched for two windows carry no state worth keeping; they are
+evicted incrementally (oldest-touched first) every few calls, so memory
+follows the number of active keys, not every tenant ever seen.
+
+Used by services.security.rate_limit_check (per tenant:ip, per endpoint)
+and by the global per-tenant middleware (backend/middleware/rate_limit.py).
+make_limiter() returns a ClusterLimiter instead when the counts must be
+shared by several workers:
+
+    RATE_LIMIT_BACKEND        local | sqlite (services/rate_limit_store.py)
+    RATE_LIMIT_TOLERANCE      5     max unsynced requests per key per worker
+    RATE_LIMIT_SYNC_INTERVAL  0.25  seconds between batched syncs
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from services.env import env_float
+
+logger = logging.getLogger("nadakki.rate_limiter")
+
+# Cada _EVICT_EVERY llamadas se desalojan hasta _EVICT_BATCH keys inactivas (O(1) amortizado)
+_EVICT_EVERY = 16
+_EVICT_BATCH = 64
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # segundos hasta que se admita un request (0 si allowed)
+    reset_after: float  # segundos hasta que la ventana quede vacia
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class SlidingWindowLimiter:
+    """`limit` requests per `window` seconds per key. Thread-safe."""
+
+    __slots__ = ("limit", "window", "_state", "_lock", "_ops", "evicted")
+
+    def __init__(self, limit: int, window: float):
+        if limit <= 0 or window <= 0:
+            raise ValueError("limit and window must be positive")
+        self.limit = int(limit)
+        self.window = float(window)
+        # key -> [window_start, prev_count, curr_count]; orden = ultimo acceso
+        self._state: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ops = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    # -- internals (with lock held) ------------------------------------------
+
+    def _roll(self, entry: List[float], now: float) -> None:
+        start = entry[0]
+        if now - start >= self.window:
+            windows = int((now - start) // self.window)
+            entry[1] = entry[2] if windows == 1 else 0
+            entry[2] = 0
+            entry[0] = start + windows * self.window
+
+    def _estimate(self, entry: List[float], now: float) -> float:
+        elapsed = now - entry[0]
+        return entry[1] * (1.0 - elapsed / self.window) + entry[2]
+
+    def _retry_after(self, entry: List[float], now: float) -> float:
+        """Tiempo hasta que estimate + 1 <= limit."""
+        n, w = self.limit, self.window
+        start, prev, curr = entry[0], entry[1], entry[2]
+        elapsed = now - start
+        if curr + 1 <= n and prev > 0:
+            # Dentro de la ventana actual, a medida que prev pierde peso
+            t = w * (1.0 - (n - 1 - curr) / prev) - elapsed
+            if elapsed + t < w:
+                return max(0.0, t)
+        # En la ventana siguiente: prev' = curr, curr' = 0
+        wait_next = w * (1.0 - (n - 1) / curr) if curr > n - 1 else 0.0
+        return (w - elapsed) + max(0.0, wait_next)
+
+    def _reset_after(self, entry: List[float], now: float) -> float:
+        if entry[2]:
+            return entry[0] + 2 * self.window - now
+        if entry[1]:
+            return entry[0] + self.window - now
+        return 0.0
+
+    def _evict(self, now: float) -> None:
+        horizon = 2 * self.window
+        for _ in range(_EVICT_BATCH):
+            if not self._state:
+                return
+            key, entry = next(iter(self._state.items()))
+            if now - entry[0] < horizon:
+                return
+            del self._state[key]
+            self.evicted += 1
+
+    def _decision(self, entry: List[float], now: float, allowed: bool) -> RateLimitDecision:
+        remaining = max(0, int(self.limit - self._estimate(entry, now)))
+        retry = 0.0 if allowed else self._retry_after(entry, now)
+        return RateLimitDecision(allowed, self.limit, remaining, retry, max(0.0, self._reset_after(entry, now)))
+
+    # -- public ---------------------------------------------------------------
+
+    def hit(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        """Consume un request de `key` si cabe."""
+        now = time.time() if now is None else now
+        limit, window = self.limit, self.window
+        with self._lock:
+            state = self._state
+            entry = state.get(key)
+            if entry is None:
+                entry = state[key] = [now, 0, 0]
+            else:
+                state.move_to_end(key)
+                if now - entry[0] >= window:
+                    self._roll(entry, now)
+            estimate = entry[1] * (1.0 - (now - entry[0]) / window) + entry[2]
+            allowed = estimate + 1 <= limit
+            if allowed:
+                entry[2] += 1
+                estimate += 1
+                decision = RateLimitDecision(
+                    True, limit, max(0, int(limit - estimate)), 0.0, self._reset_after(entry, now),
+                )
+            else:
+                decision = self._decision(entry, now, False)
+            self._ops += 1
+            if not self._ops % _EVICT_EVERY:
+                self._evict(now)
+        return decision
+
+    def peek(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        """Estado de `key` sin consumir."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._state.get(key)
+            if entry is None:
+                return RateLimitDecision(True, self.limit, self.limit, 0.0, 0.0)
+            entry = list(entry)
+        self._roll(entry, now)
+        allowed = self._estimate(entry, now) + 1 <= self.limit
+        return self._decision(entry, now, allowed)
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._state.clear()
+            else:
+                self._state.pop(key, None)
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Sin store compartido no hay nada pendiente (ver ClusterLimiter)."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "window_seconds": self.window, "keys": len(self._state), "evicted": self.evicted}
+
+
+class ClusterLimiter(SlidingWindowLimiter):
+    """
+    SlidingWindowLimiter whose counts are shared through a RateLimitStore
+    (services/rate_limit_store.py) by every worker on the host.
+
+    Windows are aligned to the epoch so all workers count the same windows.
+    Admitted requests accumulate locally and are pushed in one batch, which
+    also refreshes the cluster totals of every key touched since the last
+    sync. A sync happens every `sync_interval` seconds, or earlier once a
+    key has `tolerance` unsynced requests: the cluster may overshoot by at
+    most `tolerance` requests per key per worker, plus what the other workers
+    admit within one sync interval (and while a sync is in flight).
+    tolerance=1 syncs every admitted request.
+
+    hit() runs on the event loop and never touches the store: syncs run in
+    a background thread (hit() only wakes it), so a store busy with other
+    workers' transactions never stalls requests. background=False runs the
+    syncs inline in hit() instead (scripts, tests with a simulated clock).
+
+    If the store fails the limiter keeps working on local counts and retries
+    the pending increments on the next sync.
+    """
+
+    __slots__ = ("store", "scope", "tolerance", "sync_interval", "background", "_dirty", "_spill", "_last_sync",
+                 "_sync_lock", "_wake", "_thread", "syncs", "sync_errors")
+
+    def __init__(self, limit: int, window: float, store, scope: str,
+                 tolerance: int = 5, sync_interval: float = 0.25, background: bool = True):
+        super().__init__(limit, window)
+        self.store = store
+        self.scope = scope
+        self.tolerance = max(1, int(tolerance))
+        self.sync_interval = sync_interval
+        self.background = background
+        # key -> [window_start, prev, curr, pending]; prev/curr = totales del cluster conocidos + locales
+        self._dirty: set = set()
+        self._spill: List[tuple] = []  # pendientes de ventanas ya cerradas (o de un sync fallido)
+        self._last_sync = float("-inf")  # el primer hit sincroniza
+        self._sync_lock = threading.Lock()  # serializa los syncs (thread, flush)
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.syncs = 0
+        self.sync_errors = 0
+
+    def _window_id(self, start: float) -> int:
+        return int(round(start / self.window))
+
+    def _roll_pending(self, key: str, entry: List[float], now: float) -> None:
+        if now - entry[0] >= self.window:
+            if entry[3]:
+                self._spill.append((key, self._window_id(entry[0]), entry[3]))
+                entry[3] = 0
+            self._roll(entry, now)
+
+    # -- sync (I/O: fuera del event loop salvo background=False) ----------------
+
+    def sync(self, now: Optional[float] = None) -> bool:
+        """Empuja los incrementos pendientes y trae los totales del cluster. False si el store fallo."""
+        with self._sync_lock:
+            now = time.time() if now is None else now
+            with self._lock:
+                state = self._state
+                for key in self._dirty:
+                    entry = state.get(key)
+                    if entry is not None:
+                        self._roll_pending(key, entry, now)
+                increments, self._spill = self._spill, []
+                for key in self._dirty:
+                    entry = state.get(key)
+                    if entry is not None and entry[3]:
+                        increments.append((key, self._window_id(entry[0]), entry[3]))
+                        entry[3] = 0
+                keys, self._dirty = list(self._dirty), set()
+                self._last_sync = now
+            if not increments and not keys:
+                return True
+            try:
+                totals = self.store.sync(self.scope, increments, keys, int(now // self.window) - 1)
+            except Exception as exc:
+                with self._lock:
+                    # Se reintenta en el proximo sync
+                    self._spill.extend(increments)
+                    self._dirty.update(k for k in keys if k in self._state)
+                self.sync_errors += 1
+                logger.warning("Rate limit sync fallido (%s), usando contadores locales: %s", self.scope, exc)
+                return False
+            with self._lock:
+                # Lo admitido durante el sync sigue en entry[3] (o en _spill si cerro la ventana)
+                spilled: Dict[tuple, int] = {}
+                for key, window_id, n in self._spill:
+                    spilled[(key, window_id)] = spilled.get((key, window_id), 0) + n
+                for key in keys:
+                    entry = self._state.get(key)
+                    if entry is None:
+                        continue
+                    self._roll_pending(key, entry, now)
+                    counts = totals.get(key, {})
+                    window_id = self._window_id(entry[0])
+                    entry[1] = counts.get(window_id - 1, 0) + spilled.get((key, window_id - 1), 0)
+                    entry[2] = counts.get(window_id, 0) + entry[3]
+            self.syncs += 1
+            return True
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            if self._dirty or self._spill:
+                try:
+                    self.sync()
+                except Exception as exc:
+                    logger.warning("Rate limit sync thread (%s): %s", self.scope, exc)
+
+    def _request_sync(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            # _lock y no _sync_lock: este ultimo queda tomado mientras dura el I/O de un sync
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name=f"rate-limit-sync-{self.scope}", daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    # -- public -------------------------------------------------------------------
+
+    def _touch(self, key: str, now: float) -> Tuple[List[float], bool]:
+        """Entrada de `key` al dia y marcada para el proximo sync (con el lock tomado)."""
+        state = self._state
+        entry = state.get(key)
+        created = entry is None
+        if created:
+            entry = state[key] = [(now // self.window) * self.window, 0, 0, 0]
+        else:
+            state.move_to_end(key)
+            self._roll_pending(key, entry, now)
+        self._dirty.add(key)
+        return entry, created
+
+    def hit(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.time() if now is None else now
+        if not self.background and now - self._last_sync >= self.sync_interval:
+            with self._lock:
+                self._touch(key, now)
+            self.sync(now)
+        with self._lock:
+            entry, created = self._touch(key, now)
+            limit = self.limit
+            estimate = entry[1] * (1.0 - (now - entry[0]) / self.window) + entry[2]
+            allowed = estimate + 1 <= limit
+            if allowed:
+                entry[2] += 1
+                entry[3] += 1
+                decision = RateLimitDecision(
+                    True, limit, max(0, int(limit - estimate - 1)), 0.0, self._reset_after(entry, now),
+                )
+            else:
+                decision = self._decision(entry, now, False)
+            sync_now = allowed and entry[3] >= self.tolerance
+            self._ops += 1
+            if not self._ops % _EVICT_EVERY:
+                self._evict(now)
+        if not self.background:
+            if sync_now:
+                self.sync(now)
+        elif sync_now or created or self._thread is None:
+            # Clave nueva (traer su total del cluster) o `tolerance` pendientes: el thread sincroniza ya
+            self._request_sync()
+        return decision
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Empuja los incrementos pendientes (p.ej. al apagar el worker)."""
+        if self._dirty or self._spill:
+            self.sync(now)
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._state.clear()
+                self._dirty.clear()
+                self._spill = []
+            else:
+                self._state.pop(key, None)
+                self._dirty.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            pending = sum(entry[3] for entry in self._state.values()) + sum(n for _, _, n in self._spill)
+        stats.update({
+            "backend": type(self.store).__name__, "scope": self.scope, "tolerance": self.tolerance,
+            "sync_interval": self.sync_interval, "background": self.background, "syncs": self.syncs,
+            "sync_errors": self.sync_errors, "pending": pending,
+        })
+        return stats
+
+
+def make_limiter(limit: int, window: float, scope: str) -> SlidingWindowLimiter:
+    """
+    Limiter por proceso, o compartido entre workers si RATE_LIMIT_BACKEND
+    lo configura (ver services/rate_limit_store.py).
+    """
+    from services.rate_limit_store import get_rate_limit_store
+
+    store = get_rate_limit_store()
+    if store is None:
+        return SlidingWindowLimiter(limit, window)
+    return ClusterLimiter(
+        limit, window, store, scope,
+        tolerance=int(env_float("RATE_LIMIT_TOLERANCE", 5)),
+        sync_interval=env_float("RATE_LIMIT_SYNC_INTERVAL", 0.25),
+    )
@@ -3,25 +3,46 @@ Security utilities — rate limiter + live gate.
 """
 
 import os
-import time
 import threading
 import logging
-from collections import defaultdict
-from typing import Optional
+from typing import Dict, Optional, Tuple
+
+from services.rate_limiter import RateLimitDecision, SlidingWindowLimiter, make_limiter
 
 logger = logging.getLogger("nadakki.security")
 
 # ---------------------------------------------------------------------------
-# Rate Limiter (in-memory sliding window)
+# Rate Limiter (sliding-window counter, per process or shared: services/rate_limiter.py)
 # ---------------------------------------------------------------------------
 
 _DEFAULT_WINDOW_SECONDS = 60
 _DEFAULT_MAX_REQUESTS = 30
 
-_buckets: dict = defaultdict(list)  # key -> [timestamps]
+_limiters: Dict[Tuple[int, float], SlidingWindowLimiter] = {}
 _lock = threading.Lock()
 
 
+def _limiter_for(max_requests: int, window_seconds: float) -> SlidingWindowLimiter:
+    limiter = _limiters.get((max_requests, window_seconds))
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get((max_requests, window_seconds))
+            if limiter is None:
+                limiter = _limiters[(max_requests, window_seconds)] = make_limiter(
+                    max_requests, window_seconds, f"security:{max_requests}/{window_seconds}",
+                )
+    return limiter
+
+
+def rate_limit_hit(
+    key: str,
+    max_requests: int = _DEFAULT_MAX_REQUESTS,
+    window_seconds: int = _DEFAULT_WINDOW_SECONDS,
+) -> RateLimitDecision:
+    """Consume one request for `key`; the decision carries remaining / Retry-After."""
+    return _limiter_for(max_requests, window_seconds).hit(key)
+
+
 def rate_limit_check(
     key: str,
     max_requests: int = _DEFAULT_MAX_REQUESTS,
@@ -31,17 +52,7 @@ def rate_limit_check(
     Returns True if the request is ALLOWED, False if rate-limited.
     Key should be tenant_id:ip or similar.
     """
-    now = time.time()
-    cutoff = now - window_seconds
-
-    with _lock:
-        timestamps = _buckets[key]
-        # Prune old entries
-        _buckets[key] = [t for t in timestamps if t > cutoff]
-        if len(_buckets[key]) >= max_requests:
-            return False
-        _buckets[key].append(now)
-        return True
+    return rate_limit_hit(key, max_requests, window_seconds).allowed
 
 
 def rate_limit_remaining(
@@ -49,11 +60,7 @@ def rate_limit_remaining(
     max_requests: int = _DEFAULT_MAX_REQUESTS,
     window_seconds: int = _DEFAULT_WINDOW_SECONDS,
 ) -> int:
-    now = time.time()
-    cutoff = now - window_seconds
-    with _lock:
-        active = [t for t in _buckets.get(key, []) if t > cutoff]
-    return max(0, max_requests - len(active))
+    return _limiter_for(max_requests, window_seconds).peek(key).remaining
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,262 @@
+"""
+Tenant Directory — slug/UUID -> (id, slug, plan) cache shared by the
+middleware layer (audit, usage, plan limits) and services.db.get_session.
+
+Every request used to resolve X-Tenant-ID with its own `SELECT ... FROM
+tenants`. The directory answers from memory: entries live TENANT_CACHE_TTL
+seconds, unknown slugs are cached as misses for TENANT_CACHE_NEGATIVE_TTL
+seconds (so a bad header does not hit the DB on every request), and all
+tenants are preloaded at startup. Concurrent misses for the same key share
+one query; batches (audit writer) resolve all their keys in one query.
+
+Writers of the tenants table call invalidate(slug/id) after committing
+(onboarding, plan changes).
+
+Env:
+    TENANT_CACHE_TTL            300
+    TENANT_CACHE_NEGATIVE_TTL   30
+    TENANT_CACHE_MAX_ENTRIES    10000
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+
+from services.env import env_float
+
+logger = logging.getLogger("nadakki.tenant_directory")
+
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+
+_LOOKUP = text(
+    "SELECT id, slug, plan FROM tenants "
+    "WHERE slug = ANY(CAST(:slugs AS text[])) OR id = ANY(CAST(:ids AS uuid[]))"
+)
+_PRELOAD = text("SELECT id, slug, plan FROM tenants")
+
+
+def is_uuid(value: str) -> bool:
+    return bool(_UUID_RE.match(value))
+
+
+class TenantRecord(NamedTuple):
+    id: str
+    slug: str
+    plan: str
+
+
+class TenantDirectory:
+    """TTL cache (positive and negative) in front of the tenants table."""
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max(1, max_entries)
+        # key (slug o uuid en minusculas) -> (record o None, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Optional[TenantRecord], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.preloaded = 0
+
+    @classmethod
+    def from_env(cls) -> "TenantDirectory":
+        return cls(
+            ttl=env_float("TENANT_CACHE_TTL", 300.0),
+            negative_ttl=env_float("TENANT_CACHE_NEGATIVE_TTL", 30.0),
+            max_entries=int(env_float("TENANT_CACHE_MAX_ENTRIES", 10000)),
+        )
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return key.lower() if is_uuid(key) else key
+
+    # -- cache ----------------------------------------------------------------
+
+    def lookup(self, key: str) -> Tuple[bool, Optional[TenantRecord]]:
+        """(en cache, registro). Sin I/O."""
+        key = self._key(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            record, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return False, None
+            if record is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, record
+
+    def _store(self, key: str, record: Optional[TenantRecord], ttl: float) -> None:
+        entries = self._entries
+        entries[key] = (record, time.monotonic() + ttl)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def put(self, record: TenantRecord) -> None:
+        with self._lock:
+            self._store(record.slug, record, self.ttl)
+            self._store(record.id.lower(), record, self.ttl)
+
+    def put_missing(self, key: str) -> None:
+        with self._lock:
+            self._store(self._key(key), None, self.negative_ttl)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Olvida `key` (slug o UUID, con su alias) o todo el directorio."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                return
+            entry = self._entries.pop(self._key(key), None)
+            if entry is not None and entry[0] is not None:
+                record = entry[0]
+                self._entries.pop(record.slug, None)
+                self._entries.pop(record.id.lower(), None)
+
+    # -- carga ----------------------------------------------------------------
+
+    @staticmethod
+    def _record(row) -> TenantRecord:
+        return TenantRecord(str(row[0]), row[1], row[2] or "starter")
+
+    async def _query(self, keys: List[str], session=None) -> Dict[str, TenantRecord]:
+        slugs = [k for k in keys if not is_uuid(k)]
+        ids = [k for k in keys if is_uuid(k)]
+        params = {"slugs": slugs, "ids": ids}
+        self.queries += 1
+        if session is not None:
+            result = await session.execute(_LOOKUP, params)
+            rows = result.fetchall()
+        else:
+            from services.db import get_session
+            async with get_session() as own:
+                result = await own.execute(_LOOKUP, params)
+                rows = result.fetchall()
+        found: Dict[str, TenantRecord] = {}
+        for row in rows:
+            record = self._record(row)
+            found[record.slug] = record
+            found[record.id.lower()] = record
+        return found
+
+    async def resolve_many(self, keys: Iterable[str], session=None) -> Dict[str, Optional[TenantRecord]]:
+        """
+        Registro (o None si no existe) por cada key: lo que no este en cache se
+        carga con una sola query. Sin DB o si la query falla devuelve None y no cachea.
+        """
+        out: Dict[str, Optional[TenantRecord]] = {}
+        missing: List[str] = []
+        for key in set(keys):
+            cached, record = self.lookup(key)
+            if cached:
+                out[key] = record
+            else:
+                missing.append(key)
+        if not missing:
+            return out
+
+        from services.db import db_available
+        if not db_available():
+            out.update((key, None) for key in missing)
+            return out
+
+        loop = asyncio.get_running_loop()
+        waiting: Dict[str, asyncio.Future] = {}
+        mine: List[str] = []
+        for key in missing:
+            future = self._inflight.get(self._key(key))
+            if future is not None and not future.done() and future.get_loop() is loop:
+                waiting[key] = future
+            else:
+                self._inflight[self._key(key)] = loop.create_future()
+                mine.append(key)
+
+        if mine:
+            with self._lock:
+                self.misses += len(mine)
+            found: Optional[Dict[str, TenantRecord]] = None
+            try:
+                found = await self._query([self._key(k) for k in mine], session)
+            except Exception as exc:
+                logger.debug("Tenant lookup failed: %s", exc)
+            finally:
+                # Tambien si se cancela: quien espera la misma key no debe quedar colgado
+                for key in mine:
+                    record = found.get(self._key(key)) if found is not None else None
+                    if found is not None:
+                        if record is None:
+                            self.put_missing(key)
+                        else:
+                            self.put(record)
+                    future = self._inflight.pop(self._key(key), None)
+                    if future is not None and not future.done():
+                        future.set_result(record)
+                    out[key] = record
+
+        for key, future in waiting.items():
+            out[key] = await asyncio.shield(future)
+        return out
+
+    async def resolve(self, key: str, session=None) -> Optional[TenantRecord]:
+        """Slug o UUID -> TenantRecord (None si no existe o no hay DB)."""
+        cached, record = self.lookup(key)
+        if cached:
+            return record
+        return (await self.resolve_many([key], session))[key]
+
+    async def preload(self) -> int:
+        """Carga todos los tenants (startup). Devuelve cuantos."""
+        from services.db import db_available, get_session
+        if not db_available():
+            return 0
+        async with get_session() as session:
+            result = await session.execute(_PRELOAD)
+            rows = result.fetchall()
+        for row in rows:
+            self.put(self._record(row))
+        self.queries += 1
+        self.preloaded = len(rows)
+        logger.info("Tenant directory: %d tenants precargados", len(rows))
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            negative = sum(1 for record, _ in self._entries.values() if record is None)
+            return {
+                "entries": len(self._entries),
+                "negative_entries": negative,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "queries": self.queries,
+                "preloaded": self.preloaded,
+                "ttl_s": self.ttl,
+                "negative_ttl_s": self.negative_ttl,
+            }
+
+
+_directory: Optional[TenantDirectory] = None
+_directory_lock = threading.Lock()
+
+
+def get_tenant_directory() -> TenantDirectory:
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = TenantDirectory.from_env()
+    return _directory
@@ -0,0 +1,280 @@
+"""
+Usage Counters — write-behind execution counters for plan-limit checks.
+
+The usage middleware used to hit the DB twice per POST /agents/execute:
+a monthly SUM over usage_tracking before the request and an upsert after
+it. Now each worker keeps, per tenant UUID:
+
+    base      monthly total in usage_tracking at the last sync (seeded on first check)
+    unsynced  executions counted here and not yet reflected in base
+
+and answers the limit check with base + unsynced. Increments are added
+in memory and flushed every USAGE_FLUSH_INTERVAL seconds as one batched
+upsert; the same round trip re-reads the monthly totals of the tenants
+checked recently, which brings in what the other workers counted.
+
+Cross-worker accuracy is bounded by USAGE_LIMIT_TOLERANCE (T):
+- a worker never holds more than T unwritten executions per tenant (it
+  flushes that tenant, and re-reads its total, when it reaches T);
+- once remaining <= T the check flushes and re-reads before answering.
+So the cluster overshoots a plan limit by at most workers x T executions.
+Far from the limit the hot path makes no DB call at all; writes are one
+upsert per T executions per tenant (or per interval, whichever is first).
+
+Env:
+    USAGE_FLUSH_INTERVAL    2     seconds between batched upserts
+    USAGE_LIMIT_TOLERANCE   10    max unwritten executions per tenant per worker
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from services.env import env_float
+
+logger = logging.getLogger("nadakki.usage_counters")
+
+# Tenants consultados en este lapso se refrescan en cada flush
+_ACTIVE_WINDOW = 60.0
+
+_MONTH_TOTAL = text(
+    "SELECT COALESCE(SUM(executions_count), 0) FROM usage_tracking "
+    "WHERE tenant_id = :tid AND date >= date_trunc('month', CURRENT_DATE)"
+)
+_MONTH_TOTALS = text(
+    "SELECT tenant_id, COALESCE(SUM(executions_count), 0) FROM usage_tracking "
+    "WHERE tenant_id = ANY(CAST(:tids AS uuid[])) AND date >= date_trunc('month', CURRENT_DATE) "
+    "GROUP BY tenant_id"
+)
+_UPSERT = text(
+    "INSERT INTO usage_tracking (tenant_id, date, executions_count) "
+    "SELECT d.tid, CURRENT_DATE, d.n FROM unnest(CAST(:tids AS uuid[]), CAST(:counts AS integer[])) AS d(tid, n) "
+    "ON CONFLICT (tenant_id, date) "
+    "DO UPDATE SET executions_count = usage_tracking.executions_count + excluded.executions_count"
+)
+
+
+def _month() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+class _TenantUsage:
+    __slots__ = ("base", "unsynced", "month", "checked_at")
+
+    def __init__(self):
+        self.base: Optional[int] = None  # None = sin sembrar
+        self.unsynced = 0
+        self.month = _month()
+        self.checked_at = 0.0
+
+    @property
+    def total(self) -> int:
+        return (self.base or 0) + self.unsynced
+
+
+class UsageCounters:
+    """Per-tenant monthly execution counters, flushed in batches. Used from the event loop."""
+
+    def __init__(self, flush_interval: float = 2.0, tolerance: int = 10):
+        self.flush_interval = flush_interval
+        self.tolerance = max(0, tolerance)
+        self._usage: Dict[str, _TenantUsage] = {}
+        self._pending: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._flushing: set = set()
+        self.seeds = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.near_limit_syncs = 0
+        self.flushed = 0
+
+    @classmethod
+    def from_env(cls) -> "UsageCounters":
+        return cls(
+            flush_interval=env_float("USAGE_FLUSH_INTERVAL", 2.0),
+            tolerance=int(env_float("USAGE_LIMIT_TOLERANCE", 10)),
+        )
+
+    def _entry(self, tenant_id: str) -> _TenantUsage:
+        usage = self._usage.get(tenant_id)
+        if usage is None:
+            usage = self._usage[tenant_id] = _TenantUsage()
+        elif usage.month != _month():
+            # Mes nuevo: el total del mes anterior ya no cuenta
+            usage.base = None
+            usage.month = _month()
+        return usage
+
+    # -- incrementos ----------------------------------------------------------
+
+    def add(self, tenant_id: str, count: int = 1) -> None:
+        """Cuenta `count` ejecuciones (sin I/O; se escriben en el proximo flush)."""
+        if count <= 0:
+            return
+        self._entry(tenant_id).unsynced += count
+        pending = self._pending[tenant_id] = self._pending.get(tenant_id, 0) + count
+        self._ensure_flusher()
+        if pending >= max(1, self.tolerance):
+            # Ningun worker acumula mas de `tolerance` ejecuciones sin escribir (ni sin releer el total)
+            self._flush_soon(tenant_id)
+
+    # -- limites --------------------------------------------------------------
+
+    async def _seed(self, tenant_id: str, usage: _TenantUsage) -> None:
+        from services.db import get_session
+
+        async with get_session() as session:
+            result = await session.execute(_MONTH_TOTAL, {"tid": tenant_id})
+            usage.base = int(result.scalar() or 0)
+        self.seeds += 1
+
+    async def check(self, tenant_id: str, limit: int, count: int = 1) -> Tuple[bool, int]:
+        """
+        (permitido, uso del mes): si caben `count` ejecuciones mas dentro de `limit`.
+        Solo va a la DB al sembrar o cerca del limite.
+        """
+        usage = self._entry(tenant_id)
+        usage.checked_at = time.monotonic()
+        if usage.base is None:
+            await self._seed(tenant_id, usage)
+        if usage.total + count > limit:
+            return False, usage.total  # base solo crece dentro del mes: excedido seguro
+        if limit - usage.total - count < self.tolerance:
+            self.near_limit_syncs += 1
+            await self.flush(only=tenant_id)
+        return usage.total + count <= limit, usage.total
+
+    # -- flush ----------------------------------------------------------------
+
+    def _ensure_flusher(self) -> None:
+        if self._stopping or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sin loop: queda pendiente hasta el proximo flush
+        self._task = loop.create_task(self._run())
+
+    def _flush_soon(self, tenant_id: str) -> None:
+        if tenant_id in self._flushing:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flushing.add(tenant_id)
+        task = loop.create_task(self.flush(only=tenant_id))
+        task.add_done_callback(lambda _: self._flushing.discard(tenant_id))
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self, only: Optional[str] = None) -> None:
+        """
+        Upsert de los incrementos pendientes y relectura de los totales del mes
+        (de `only`, o de los tenants consultados recientemente), en una sesion.
+        Los flushes se serializan: una relectura vieja no pisa una mas nueva.
+        """
+        from services.db import db_available
+
+        if not db_available():
+            return
+        loop = asyncio.get_running_loop()
+        if self._flush_loop is not loop:
+            self._flush_lock, self._flush_loop = asyncio.Lock(), loop
+        async with self._flush_lock:
+            await self._flush(only)
+
+    async def _flush(self, only: Optional[str]) -> None:
+        from services.db import get_session
+
+        if only is not None:
+            batch = {only: self._pending.pop(only)} if only in self._pending else {}
+            refresh = [only]
+        else:
+            batch, self._pending = self._pending, {}
+            horizon = time.monotonic() - _ACTIVE_WINDOW
+            refresh = [tid for tid, u in self._usage.items() if u.base is not None and u.checked_at >= horizon]
+        if not batch and not refresh:
+            return
+
+        committed = False
+        totals: Optional[Dict[str, int]] = None
+        try:
+            async with get_session() as session:
+                if batch:
+                    await session.execute(_UPSERT, {"tids": list(batch), "counts": list(batch.values())})
+                    await session.commit()
+                    committed = True
+                if refresh:
+                    result = await session.execute(_MONTH_TOTALS, {"tids": refresh})
+                    totals = {str(row[0]): int(row[1]) for row in result.fetchall()}
+        except BaseException as exc:
+            if not committed:
+                # Se reintenta en el proximo flush
+                for tid, n in batch.items():
+                    self._pending[tid] = self._pending.get(tid, 0) + n
+            if not isinstance(exc, Exception):
+                raise
+            self.flush_errors += 1
+            logger.warning("Usage flush failed (%d tenants): %s", len(batch), exc)
+            if not committed:
+                return
+
+        for tid, n in batch.items():
+            usage = self._usage.get(tid)
+            if usage is not None:
+                usage.unsynced -= n
+                if totals is None and usage.base is not None:
+                    usage.base += n  # ya esta en la DB aunque no se pudo releer
+        if totals is not None:
+            for tid in refresh:
+                usage = self._usage.get(tid)
+                if usage is not None and usage.base is not None:
+                    usage.base = totals.get(tid, 0)
+        self.flushes += 1
+        self.flushed += sum(batch.values())
+
+    async def stop(self) -> None:
+        """Shutdown: detiene el flusher y escribe lo pendiente."""
+        self._stopping = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tenants": len(self._usage),
+            "pending_tenants": len(self._pending),
+            "pending_executions": sum(self._pending.values()),
+            "flush_interval_s": self.flush_interval,
+            "tolerance": self.tolerance,
+            "seeds": self.seeds,
+            "flushes": self.flushes,
+            "flushed_executions": self.flushed,
+            "flush_errors": self.flush_errors,
+            "near_limit_syncs": self.near_limit_syncs,
+        }
+
+
+_counters: Optional[UsageCounters] = None
+
+
+def get_usage_counters() -> UsageCounters:
+    global _counters
+    if _counters is None:
+        _counters = UsageCounters.from_env()
+    return _counters
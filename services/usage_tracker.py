@@ -1,15 +1,154 @@
 """
 Usage Tracker Service - Tracking de uso para billing
 Registra requests, calcula consumo mensual, genera alertas
+
+El resumen mensual (usage_summary) se mantiene de forma incremental: cada
+log suma sus contadores (requests, tokens, exitos, suma de tiempos) y su
+bucket de latencia (usage_latency_buckets, sketch log-escalado con error
+relativo de ~1%), asi que registrar un request cuesta lo mismo el dia 1 que
+el dia 30. reconcile_summaries() reconstruye los resumenes desde usage_logs
+cuando se necesite (migraciones, correcciones manuales).
+
+Escritura (batched=True, por defecto): log_request no toca la DB. Encola el
+log en una cola acotada que drena un solo thread con una conexion WAL de
+larga vida, un commit por batch; los limites y alertas se calculan con
+contadores en memoria por tenant/mes (sembrados desde usage_summary). Las
+lecturas hacen flush() antes, asi que ven todo lo registrado. Con
+batched=False cada log_request escribe y hace commit en el acto.
+
+Rollups: el mismo batch suma cada log a usage_rollup_hour/day/month por
+(tenant, bucket, agente), con el bucket como prefijo ISO del timestamp
+("2025-03-07T14", "2025-03-07", "2025-03"). get_timeseries() responde los
+dashboards desde el rollup mas grueso que cubre el rango y la granularidad
+pedidos; apply_retention() borra los logs crudos y las horas/dias viejos,
+que siguen agregados en los rollups mas gruesos. run_retention_forever() la
+corre al arrancar la app y luego cada USAGE_RETENTION_INTERVAL_HOURS, en el
+executor para no bloquear el event loop.
+
+Env:
+    USAGE_LOG_QUEUE_SIZE          10000  logs encolados como maximo
+    USAGE_LOG_BATCH_SIZE          500    logs por transaccion
+    USAGE_LOG_FLUSH_MS            200    espera maxima antes de escribir un batch parcial
+    USAGE_LOG_RETRY_SECONDS       300    reintentos de un batch con la DB bloqueada
+    USAGE_DB_PATH                 usage.db
+    USAGE_RAW_RETENTION_DAYS      90     logs crudos
+    USAGE_HOURLY_RETENTION_DAYS   180    rollup por hora
+    USAGE_DAILY_RETENTION_DAYS    1095   rollup por dia (el mensual no se borra)
+    USAGE_RETENTION_INTERVAL_HOURS 24    horas entre pasadas de retencion (0 = desactivada)
 """
 
+import asyncio
 import sqlite3
 import json
+import logging
+import math
+import os
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Dict, Iterable, NamedTuple, Optional, List, Sequence, Tuple
 from pathlib import Path
 from dataclasses import dataclass, asdict
 
+from services.batch_writer import ThreadBatchWriter
+from services.env import env_int
+
+logger = logging.getLogger("nadakki.usage_tracker")
+
+# Sketch de latencias: bucket i cubre (GAMMA^(i-1), GAMMA^i] ms
+_LATENCY_ACCURACY = 0.01
+_GAMMA = (1 + _LATENCY_ACCURACY) / (1 - _LATENCY_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_MIN_LATENCY_MS = 0.01
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _latency_bucket(response_time_ms: float) -> int:
+    return math.ceil(math.log(max(response_time_ms, _MIN_LATENCY_MS)) / _LOG_GAMMA)
+
+
+def _bucket_value(bucket: int) -> float:
+    """Estimacion del bucket (error relativo <= _LATENCY_ACCURACY)"""
+    return 2 * _GAMMA ** bucket / (_GAMMA + 1)
+
+
+def _quantiles_from_buckets(buckets: Sequence[Tuple[int, int]], quantiles: Iterable[float]) -> Dict[str, float]:
+    """buckets ordenados [(bucket, count)] -> {"p50": ms, ...}"""
+    total = sum(count for _, count in buckets)
+    out: Dict[str, float] = {}
+    for q in quantiles:
+        key = f"p{q * 100:g}"
+        if total == 0:
+            out[key] = 0.0
+            continue
+        rank = q * (total - 1)
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen > rank:
+                out[key] = round(_bucket_value(bucket), 2)
+                break
+    return out
+
+
+def _month_bounds(year_month: str) -> Tuple[str, str]:
+    """'2025-03' -> ('2025-03-01', '2025-04-01'): rango comparable con timestamps ISO"""
+    year, month = int(year_month[:4]), int(year_month[5:7])
+    following = f"{year + 1}-01" if month == 12 else f"{year}-{month + 1:02d}"
+    return f"{year_month}-01", f"{following}-01"
+
+
+def _is_success(response_status: int) -> bool:
+    return 200 <= response_status <= 299
+
+
+def _is_locked(exc: Exception) -> bool:
+    """Otro escritor (reconcile, cleanup, otro proceso) tiene el lock: el batch se reintenta"""
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in str(exc) or "busy" in str(exc))
+
+
+# Rollups de mas grueso a mas fino: (granularidad, tabla, largo del bucket)
+ROLLUPS = (
+    ("month", "usage_rollup_month", 7),
+    ("day", "usage_rollup_day", 10),
+    ("hour", "usage_rollup_hour", 13),
+)
+GRANULARITIES = {granularity: size for granularity, _, size in ROLLUPS}
+
+
+def _local_naive(moment: datetime) -> datetime:
+    """Los timestamps de usage_logs son hora local sin zona"""
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo is not None else moment
+
+
+def _truncate(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity in ("day", "month"):
+        moment = moment.replace(hour=0)
+    if granularity == "month":
+        moment = moment.replace(day=1)
+    return moment
+
+
+def _ceil(moment: datetime, granularity: str) -> datetime:
+    start = _truncate(moment, granularity)
+    if start == moment:
+        return start
+    if granularity == "hour":
+        return start + timedelta(hours=1)
+    if granularity == "day":
+        return start + timedelta(days=1)
+    return datetime.fromisoformat(_month_bounds(start.strftime("%Y-%m"))[1])
+
+
+ALERT_THRESHOLDS = [
+    (50, "warning", "50% del límite mensual alcanzado"),
+    (80, "alert", "80% del límite mensual alcanzado"),
+    (95, "critical", "95% del límite mensual - límite próximo"),
+    (100, "limit_reached", "Límite mensual alcanzado")
+]
+
 @dataclass
 class UsageLog:
     """Log de un request individual"""
@@ -23,6 +162,14 @@ class UsageLog:
     tokens_used: int
     agent_used: Optional[str] = None
 
+class _AlertRow(NamedTuple):
+    """Alerta pendiente de escribir (mismo orden que el INSERT)"""
+    tenant_id: str
+    alert_type: str
+    threshold_percentage: float
+    triggered_at: str
+    message: str
+
 @dataclass
 class UsageSummary:
     """Resumen mensual de uso"""
@@ -41,15 +188,36 @@ class UsageTracker:
     Sistema de tracking de uso para billing multi-tenant
     """
     
-    def __init__(self, db_path: str = "usage.db"):
+    def __init__(self, db_path: str = "usage.db", batched: bool = True):
         self.db_path = db_path
+        self.batched = batched
+        # (tenant_id, year_month) -> requests del mes / alertas abiertas
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._alerted: Dict[Tuple[str, str], set] = {}
+        self._counts_lock = threading.Lock()
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writer = ThreadBatchWriter(
+            self._write_batch,
+            name="usage",
+            max_queue=env_int("USAGE_LOG_QUEUE_SIZE", 10000),
+            batch_size=env_int("USAGE_LOG_BATCH_SIZE", 500),
+            flush_interval=env_int("USAGE_LOG_FLUSH_MS", 200) / 1000,
+            retryable=_is_locked,
+            retry_for=env_int("USAGE_LOG_RETRY_SECONDS", 300),
+        )
         self._init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+    
     def _init_database(self):
         """Inicializa base de datos de uso"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
+        # WAL: las lecturas no bloquean al writer (el modo queda en el archivo)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         # Tabla de logs detallados
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS usage_logs (
@@ -66,13 +234,19 @@ class UsageTracker:
             )
         """)
         
-        # Crear índice para búsquedas rápidas
+        # Índices cubrientes: la reconciliación por tenant/mes y los conteos
+        # por fecha (limpieza, pre-warm de agentes) no tocan la tabla
+        cursor.execute("DROP INDEX IF EXISTS idx_tenant_timestamp")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_usage_logs_tenant_ts
+            ON usage_logs(tenant_id, timestamp, response_status, response_time_ms, tokens_used)
+        """)
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_tenant_timestamp 
-            ON usage_logs(tenant_id, timestamp)
+            CREATE INDEX IF NOT EXISTS idx_usage_logs_ts
+            ON usage_logs(timestamp, agent_used, tenant_id)
         """)
         
-        # Tabla de resúmenes mensuales
+        # Tabla de resúmenes mensuales (contadores acumulados; avg y success_rate derivados)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS usage_summary (
                 tenant_id TEXT NOT NULL,
@@ -81,13 +255,26 @@ class UsageTracker:
                 total_tokens INTEGER DEFAULT 0,
                 avg_response_time_ms REAL DEFAULT 0,
                 success_rate REAL DEFAULT 100.0,
-                limit INTEGER NOT NULL,
+                "limit" INTEGER NOT NULL,
                 usage_percentage REAL DEFAULT 0,
                 last_updated TEXT NOT NULL,
+                success_count INTEGER DEFAULT 0,
+                response_time_sum REAL DEFAULT 0,
                 PRIMARY KEY (tenant_id, year_month)
             )
         """)
         
+        # Sketch de latencias por tenant/mes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usage_latency_buckets (
+                tenant_id TEXT NOT NULL,
+                year_month TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (tenant_id, year_month, bucket)
+            ) WITHOUT ROWID
+        """)
+        
         # Tabla de alertas
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS usage_alerts (
@@ -100,9 +287,50 @@ class UsageTracker:
                 message TEXT NOT NULL
             )
         """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_usage_alerts_open
+            ON usage_alerts(tenant_id, alert_type, resolved_at, triggered_at)
+        """)
+        
+        # Rollups por tenant/bucket/agente ('' = sin agente)
+        existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for _, table, _ in ROLLUPS:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    tenant_id TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    agent TEXT NOT NULL DEFAULT '',
+                    requests INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    response_time_sum REAL NOT NULL,
+                    PRIMARY KEY (tenant_id, bucket, agent)
+                ) WITHOUT ROWID
+            """)
+        
+        # Metadatos (p. ej. desde cuándo hay logs completos)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usage_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(usage_summary)")}
+        migrated = False
+        for column, ddl in (("success_count", "INTEGER DEFAULT 0"), ("response_time_sum", "REAL DEFAULT 0")):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE usage_summary ADD COLUMN {column} {ddl}")
+                migrated = True
+        if "usage_rollup_hour" not in existing and "usage_logs" in existing:
+            migrated = migrated or cursor.execute("SELECT 1 FROM usage_logs LIMIT 1").fetchone() is not None
         
         conn.commit()
         conn.close()
+        
+        if migrated:
+            # Resúmenes o rollups que faltan: se rehacen desde los logs
+            self.reconcile_summaries()
         print("✅ Base de datos de uso inicializada")
     
     def log_request(
@@ -126,87 +354,350 @@ class UsageTracker:
         
         log_id = str(uuid.uuid4())
         timestamp = datetime.now().isoformat()
+        log = UsageLog(
+            log_id, tenant_id, timestamp, endpoint, method,
+            response_status, response_time_ms, tokens_used, agent_used
+        )
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if not self.batched:
+            conn = self._connect()
+            try:
+                # Log + resumen + alertas en una transacción
+                self._record_logs(conn, [log])
+                alerts = self._check_limits(tenant_id, conn=conn)
+                conn.commit()
+            finally:
+                conn.close()
+            logged = True
+        else:
+            logged = self._writer.submit(log)
+            alerts = self._count_request(tenant_id, timestamp[:7]) if logged else []
         
-        # Insertar log
-        cursor.execute("""
+        return {
+            "logged": logged,
+            "log_id": log_id,
+            "timestamp": timestamp,
+            "alerts": alerts
+        }
+    
+    def _count_request(self, tenant_id: str, year_month: str) -> List[Dict]:
+        """Suma el request al contador en memoria y devuelve las alertas nuevas (encoladas)"""
+        
+        key = (tenant_id, year_month)
+        limit = self._get_tenant_limit(tenant_id)
+        new_alerts = []
+        while True:
+            # La lectura a SQLite va fuera del lock: no frena a los demás tenants
+            seed = None if key in self._counts else self._seed_counts(key)
+            with self._counts_lock:
+                if key not in self._counts:
+                    if seed is None:
+                        # reconcile_summaries vació los contadores entre la lectura y el lock
+                        continue
+                    self._counts[key], self._alerted[key] = seed
+                total_requests = self._counts[key] = self._counts[key] + 1
+                usage_percentage = (total_requests / limit * 100) if limit > 0 else 0
+                if usage_percentage < ALERT_THRESHOLDS[0][0]:
+                    return []
+                alerted = self._alerted[key]
+                for threshold, alert_type, message in ALERT_THRESHOLDS:
+                    if usage_percentage >= threshold and alert_type not in alerted:
+                        alerted.add(alert_type)
+                        new_alerts.append((threshold, alert_type, message))
+            break
+        
+        alerts = []
+        for threshold, alert_type, message in new_alerts:
+            self._writer.submit(_AlertRow(
+                tenant_id, alert_type, threshold,
+                datetime.now().isoformat(),
+                f"{message} ({total_requests}/{limit} requests)"
+            ))
+            alerts.append({
+                "type": alert_type,
+                "threshold": threshold,
+                "message": message,
+                "usage": f"{total_requests}/{limit}",
+                "percentage": usage_percentage
+            })
+        return alerts
+    
+    def _seed_counts(self, key: Tuple[str, str]) -> Tuple[int, set]:
+        """Contador y alertas abiertas del tenant/mes desde la DB (primera vez que se ve)"""
+        
+        tenant_id, year_month = key
+        month_start, month_end = _month_bounds(year_month)
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT total_requests FROM usage_summary
+                WHERE tenant_id = ? AND year_month = ?
+            """, (tenant_id, year_month)).fetchone()
+            open_alerts = conn.execute("""
+                SELECT alert_type FROM usage_alerts
+                WHERE tenant_id = ?
+                AND resolved_at IS NULL
+                AND triggered_at >= ? AND triggered_at < ?
+            """, (tenant_id, month_start, month_end)).fetchall()
+        finally:
+            conn.close()
+        return (row[0] if row else 0), {r[0] for r in open_alerts}
+    
+    def _write_batch(self, batch: List):
+        """Sink del writer: logs + alertas del batch en una transacción"""
+        
+        conn = self._writer_conn
+        if conn is None:
+            conn = self._writer_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+        logs = [item for item in batch if isinstance(item, UsageLog)]
+        alerts = [item for item in batch if isinstance(item, _AlertRow)]
+        try:
+            if logs:
+                self._record_logs(conn, logs)
+            if alerts:
+                conn.executemany("""
+                    INSERT INTO usage_alerts (
+                        tenant_id, alert_type, threshold_percentage,
+                        triggered_at, message
+                    ) VALUES (?, ?, ?, ?, ?)
+                """, alerts)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que los logs encolados estén escritos"""
+        return self._writer.flush(timeout) if self.batched else True
+    
+    def close(self):
+        """Escribe lo pendiente y cierra la conexión del writer"""
+        self._writer.stop()
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+    
+    def writer_stats(self) -> Dict:
+        stats = self._writer.stats()
+        with self._counts_lock:
+            stats["tracked_tenant_months"] = len(self._counts)
+        return stats
+    
+    def _record_logs(self, conn: sqlite3.Connection, logs: List[UsageLog]):
+        """Inserta los logs y suma sus contadores al resumen (sin commit)"""
+        
+        conn.executemany("""
             INSERT INTO usage_logs (
                 log_id, tenant_id, timestamp, endpoint, method,
                 response_status, response_time_ms, tokens_used,
                 agent_used, created_at
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            log_id, tenant_id, timestamp, endpoint, method,
-            response_status, response_time_ms, tokens_used,
-            agent_used, timestamp
-        ))
+        """, [
+            (
+                log.log_id, log.tenant_id, log.timestamp, log.endpoint, log.method,
+                log.response_status, log.response_time_ms, log.tokens_used,
+                log.agent_used, log.timestamp
+            )
+            for log in logs
+        ])
         
-        conn.commit()
-        conn.close()
+        # Agregar por tenant/mes (y por bucket de rollup): una actualización por grupo, no por log
+        groups: Dict[Tuple[str, str], List[float]] = {}
+        buckets: Counter = Counter()
+        hours: Dict[Tuple[str, str, str], List[float]] = {}
+        for log in logs:
+            key = (log.tenant_id, log.timestamp[:7])
+            success = _is_success(log.response_status)
+            acc = groups.setdefault(key, [0, 0, 0, 0.0])
+            acc[0] += 1
+            acc[1] += log.tokens_used or 0
+            acc[2] += 1 if success else 0
+            acc[3] += log.response_time_ms
+            buckets[key + (_latency_bucket(log.response_time_ms),)] += 1
+            
+            acc = hours.setdefault((log.tenant_id, log.timestamp[:13], log.agent_used or ""), [0, 0, 0, 0.0])
+            acc[0] += 1
+            acc[1] += 0 if success else 1
+            acc[2] += log.tokens_used or 0
+            acc[3] += log.response_time_ms
         
-        # Actualizar resumen mensual
-        self._update_monthly_summary(tenant_id)
+        self._add_to_summaries(conn, groups)
+        self._add_to_rollups(conn, hours)
+        conn.executemany("""
+            INSERT INTO usage_latency_buckets (tenant_id, year_month, bucket, count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (tenant_id, year_month, bucket)
+            DO UPDATE SET count = count + excluded.count
+        """, [key + (count,) for key, count in buckets.items()])
+    
+    def _add_to_rollups(self, conn: sqlite3.Connection, hours: Dict[Tuple[str, str, str], List[float]]):
+        """hours: (tenant_id, hora, agente) -> [requests, errores, tokens, suma_ms]; suma en los tres rollups"""
         
-        # Verificar límites y generar alertas
-        alerts = self._check_limits(tenant_id)
+        for _, table, size in ROLLUPS:
+            rows: Dict[Tuple[str, str, str], List[float]] = {}
+            for (tenant_id, hour, agent), acc in hours.items():
+                total = rows.setdefault((tenant_id, hour[:size], agent), [0, 0, 0, 0.0])
+                for i, value in enumerate(acc):
+                    total[i] += value
+            conn.executemany(f"""
+                INSERT INTO {table} (tenant_id, bucket, agent, requests, errors, tokens, response_time_sum)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (tenant_id, bucket, agent) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    errors = errors + excluded.errors,
+                    tokens = tokens + excluded.tokens,
+                    response_time_sum = response_time_sum + excluded.response_time_sum
+            """, [key + tuple(acc) for key, acc in rows.items()])
+    
+    def _add_to_summaries(self, conn: sqlite3.Connection, groups: Dict[Tuple[str, str], List[float]]):
+        """groups: (tenant_id, year_month) -> [requests, tokens, exitos, suma_ms]"""
         
-        return {
-            "logged": True,
-            "log_id": log_id,
-            "timestamp": timestamp,
-            "alerts": alerts
-        }
+        now = datetime.now().isoformat()
+        conn.executemany("""
+            INSERT INTO usage_summary (
+                tenant_id, year_month, total_requests, total_tokens,
+                avg_response_time_ms, success_rate, "limit",
+                usage_percentage, last_updated, success_count, response_time_sum
+            ) VALUES (
+                :tenant_id, :year_month, :requests, :tokens,
+                :time_sum * 1.0 / :requests, :successes * 100.0 / :requests, :limit,
+                CASE WHEN :limit > 0 THEN :requests * 100.0 / :limit ELSE 0 END,
+                :now, :successes, :time_sum
+            )
+            ON CONFLICT (tenant_id, year_month) DO UPDATE SET
+                total_requests = total_requests + excluded.total_requests,
+                total_tokens = total_tokens + excluded.total_tokens,
+                success_count = success_count + excluded.success_count,
+                response_time_sum = response_time_sum + excluded.response_time_sum,
+                avg_response_time_ms = (response_time_sum + excluded.response_time_sum)
+                    / (total_requests + excluded.total_requests),
+                success_rate = (success_count + excluded.success_count) * 100.0
+                    / (total_requests + excluded.total_requests),
+                "limit" = excluded."limit",
+                usage_percentage = CASE WHEN excluded."limit" > 0
+                    THEN (total_requests + excluded.total_requests) * 100.0 / excluded."limit"
+                    ELSE 0 END,
+                last_updated = excluded.last_updated
+        """, [
+            {
+                "tenant_id": tenant_id, "year_month": year_month,
+                "requests": acc[0], "tokens": acc[1], "successes": acc[2], "time_sum": acc[3],
+                "limit": self._get_tenant_limit(tenant_id), "now": now,
+            }
+            for (tenant_id, year_month), acc in groups.items()
+        ])
     
-    def _update_monthly_summary(self, tenant_id: str):
-        """Actualiza el resumen mensual del tenant"""
+    def reconcile_summaries(
+        self,
+        tenant_id: Optional[str] = None,
+        year_month: Optional[str] = None
+    ) -> int:
+        """
+        Reconstruye usage_summary, el sketch de latencias y los rollups del
+        mes desde usage_logs.
         
-        year_month = datetime.now().strftime("%Y-%m")
+        Sin year_month rehace todos los meses con logs. Los meses cortados por
+        cleanup_old_logs / apply_retention (anteriores a logs_complete_since)
+        no se rehacen nunca, tampoco si se piden: sus logs ya no están completos
+        y el resumen y el rollup mensual son lo único que queda de ellos.
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        Returns:
+            int: resúmenes reconstruidos
+        """
         
-        # Calcular estadísticas del mes actual
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_requests,
-                SUM(tokens_used) as total_tokens,
-                AVG(response_time_ms) as avg_response_time,
-                (SUM(CASE WHEN response_status BETWEEN 200 AND 299 THEN 1 ELSE 0 END) * 100.0 / COUNT(*)) as success_rate
-            FROM usage_logs
-            WHERE tenant_id = ?
-            AND strftime('%Y-%m', timestamp) = ?
-        """, (tenant_id, year_month))
+        self.flush()
+        conn = self._connect()
+        cursor = conn.cursor()
+        # Bloquea al writer mientras se reconstruye: sus batches reintentan hasta que
+        # termine (USAGE_LOG_RETRY_SECONDS), así que no se pierden sus incrementos
+        cursor.execute("BEGIN IMMEDIATE")
         
-        stats = cursor.fetchone()
+        if year_month is not None:
+            months = [year_month]
+        else:
+            cursor.execute("SELECT DISTINCT substr(timestamp, 1, 7) FROM usage_logs")
+            months = sorted(row[0] for row in cursor.fetchall())
+        cursor.execute("SELECT value FROM usage_meta WHERE key = 'logs_complete_since'")
+        row = cursor.fetchone()
+        if row:
+            # Primer mes con todos sus logs
+            cut_month = row[0][:7]
+            first_complete = cut_month if row[0][8:].startswith("01T00:00:00") else _month_bounds(cut_month)[1][:7]
+            skipped = [m for m in months if m < first_complete]
+            if skipped and year_month is not None:
+                logger.warning("reconcile_summaries: %s ya no tiene todos sus logs (cortados antes de %s); se conserva",
+                               year_month, row[0])
+            months = [m for m in months if m >= first_complete]
         
-        if stats and stats[0] > 0:
-            # Obtener límite del tenant
-            limit = self._get_tenant_limit(tenant_id)
-            
-            total_requests = stats[0] or 0
-            total_tokens = stats[1] or 0
-            avg_response_time = stats[2] or 0
-            success_rate = stats[3] or 100.0
-            usage_percentage = (total_requests / limit * 100) if limit > 0 else 0
-            
-            # Insertar o actualizar resumen
-            cursor.execute("""
-                INSERT OR REPLACE INTO usage_summary (
-                    tenant_id, year_month, total_requests, total_tokens,
-                    avg_response_time_ms, success_rate, limit,
-                    usage_percentage, last_updated
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                tenant_id, year_month, total_requests, total_tokens,
-                avg_response_time, success_rate, limit,
-                usage_percentage, datetime.now().isoformat()
-            ))
-            
+        rebuilt = 0
+        try:
+            for month in months:
+                start, end = _month_bounds(month)
+                tenant_filter = "AND tenant_id = ?" if tenant_id is not None else ""
+                params = (start, end) + ((tenant_id,) if tenant_id is not None else ())
+                
+                cursor.execute(f"""
+                    SELECT tenant_id, COUNT(*), COALESCE(SUM(tokens_used), 0),
+                           SUM(CASE WHEN response_status BETWEEN 200 AND 299 THEN 1 ELSE 0 END),
+                           SUM(response_time_ms)
+                    FROM usage_logs
+                    WHERE timestamp >= ? AND timestamp < ? {tenant_filter}
+                    GROUP BY tenant_id
+                """, params)
+                groups = {(row[0], month): list(row[1:]) for row in cursor.fetchall()}
+                
+                buckets: Counter = Counter()
+                cursor.execute(f"""
+                    SELECT tenant_id, response_time_ms FROM usage_logs
+                    WHERE timestamp >= ? AND timestamp < ? {tenant_filter}
+                """, params)
+                for tid, response_time_ms in cursor:
+                    buckets[(tid, month, _latency_bucket(response_time_ms))] += 1
+                
+                cursor.execute(f"""
+                    SELECT tenant_id, substr(timestamp, 1, 13), COALESCE(agent_used, ''), COUNT(*),
+                           SUM(CASE WHEN response_status BETWEEN 200 AND 299 THEN 0 ELSE 1 END),
+                           COALESCE(SUM(tokens_used), 0), SUM(response_time_ms)
+                    FROM usage_logs
+                    WHERE timestamp >= ? AND timestamp < ? {tenant_filter}
+                    GROUP BY 1, 2, 3
+                """, params)
+                hours = {tuple(row[:3]): list(row[3:]) for row in cursor.fetchall()}
+                
+                for table in ("usage_summary", "usage_latency_buckets"):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE year_month = ? {tenant_filter}",
+                        (month,) + ((tenant_id,) if tenant_id is not None else ()),
+                    )
+                for _, table, _ in ROLLUPS:
+                    # Los buckets del mes empiezan con 'YYYY-MM'
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE bucket >= ? AND bucket < ? {tenant_filter}",
+                        (month, end[:7]) + ((tenant_id,) if tenant_id is not None else ()),
+                    )
+                self._add_to_summaries(conn, groups)
+                self._add_to_rollups(conn, hours)
+                conn.executemany("""
+                    INSERT INTO usage_latency_buckets (tenant_id, year_month, bucket, count)
+                    VALUES (?, ?, ?, ?)
+                """, [key + (count,) for key, count in buckets.items()])
+                rebuilt += len(groups)
             conn.commit()
+        finally:
+            conn.close()
         
-        conn.close()
+        # Los contadores en memoria se vuelven a sembrar desde los resúmenes nuevos
+        with self._counts_lock:
+            self._counts.clear()
+            self._alerted.clear()
+        
+        return rebuilt
+    
+    def _update_monthly_summary(self, tenant_id: str):
+        """Recalcula el resumen del mes actual del tenant desde los logs"""
+        self.reconcile_summaries(tenant_id, datetime.now().strftime("%Y-%m"))
     
     def _get_tenant_limit(self, tenant_id: str) -> int:
         """
@@ -215,18 +706,21 @@ class UsageTracker:
         """
         return 999999  # Enterprise por defecto
     
-    def _check_limits(self, tenant_id: str) -> List[Dict]:
+    def _check_limits(self, tenant_id: str, conn: Optional[sqlite3.Connection] = None) -> List[Dict]:
         """
         Verifica límites y genera alertas si es necesario
         """
         
         year_month = datetime.now().strftime("%Y-%m")
+        month_start, month_end = _month_bounds(year_month)
         
-        conn = sqlite3.connect(self.db_path)
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
-            SELECT total_requests, limit, usage_percentage
+            SELECT total_requests, "limit", usage_percentage
             FROM usage_summary
             WHERE tenant_id = ? AND year_month = ?
         """, (tenant_id, year_month))
@@ -238,22 +732,15 @@ class UsageTracker:
         if result:
             total_requests, limit, usage_percentage = result
             
-            alert_thresholds = [
-                (50, "warning", "50% del límite mensual alcanzado"),
-                (80, "alert", "80% del límite mensual alcanzado"),
-                (95, "critical", "95% del límite mensual - límite próximo"),
-                (100, "limit_reached", "Límite mensual alcanzado")
-            ]
-            
-            for threshold, alert_type, message in alert_thresholds:
+            for threshold, alert_type, message in ALERT_THRESHOLDS:
                 if usage_percentage >= threshold:
                     cursor.execute("""
                         SELECT alert_id FROM usage_alerts
                         WHERE tenant_id = ?
                         AND alert_type = ?
-                        AND strftime('%Y-%m', triggered_at) = ?
                         AND resolved_at IS NULL
-                    """, (tenant_id, alert_type, year_month))
+                        AND triggered_at >= ? AND triggered_at < ?
+                    """, (tenant_id, alert_type, month_start, month_end))
                     
                     existing_alert = cursor.fetchone()
                     
@@ -277,18 +764,46 @@ class UsageTracker:
                             "percentage": usage_percentage
                         })
         
-        conn.commit()
-        conn.close()
+        if own_conn:
+            conn.commit()
+            conn.close()
         
         return alerts
     
+    def get_latency_percentiles(
+        self,
+        tenant_id: str,
+        year_month: Optional[str] = None,
+        quantiles: Iterable[float] = DEFAULT_QUANTILES
+    ) -> Dict[str, float]:
+        """Percentiles de response_time_ms del mes desde el sketch ({"p50": ms, ...})"""
+        
+        self.flush()
+        
+        if year_month is None:
+            year_month = datetime.now().strftime("%Y-%m")
+        
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT bucket, count FROM usage_latency_buckets
+                WHERE tenant_id = ? AND year_month = ?
+                ORDER BY bucket
+            """, (tenant_id, year_month)).fetchall()
+        finally:
+            conn.close()
+        
+        return _quantiles_from_buckets(rows, quantiles)
+    
     def get_monthly_usage(self, tenant_id: str, year_month: Optional[str] = None) -> Optional[Dict]:
         """Obtiene resumen mensual de uso"""
         
+        self.flush()
+        
         if year_month is None:
             year_month = datetime.now().strftime("%Y-%m")
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -302,12 +817,17 @@ class UsageTracker:
         if not row:
             return None
         
+        percentiles = self.get_latency_percentiles(tenant_id, year_month)
+        
         return {
             "tenant_id": row[0],
             "year_month": row[1],
             "total_requests": row[2],
             "total_tokens": row[3],
             "avg_response_time_ms": row[4],
+            "p50_response_time_ms": percentiles["p50"],
+            "p95_response_time_ms": percentiles["p95"],
+            "p99_response_time_ms": percentiles["p99"],
             "success_rate": row[5],
             "limit": row[6],
             "usage_percentage": row[7],
@@ -336,7 +856,9 @@ class UsageTracker:
     ) -> List[Dict]:
         """Obtiene histórico de uso de los últimos N meses"""
         
-        conn = sqlite3.connect(self.db_path)
+        self.flush()
+        
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -362,10 +884,104 @@ class UsageTracker:
         
         return history
     
+    def get_timeseries(
+        self,
+        tenant_id: str,
+        start: datetime,
+        end: Optional[datetime] = None,
+        granularity: str = "day",
+        agent: Optional[str] = None,
+        by_agent: bool = False
+    ) -> Dict:
+        """
+        Serie de uso del tenant en [start, end) por hora, día o mes.
+        
+        Lee el rollup más grueso que sirve: el de la granularidad pedida si el
+        rango está alineado a ella, si no uno más fino (los bordes se
+        redondean a la hora). Si la retención ya borró ese rollup para el
+        rango, se usa el siguiente más grueso y "granularity" lo indica.
+        """
+        
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity debe ser una de {sorted(GRANULARITIES)}")
+        self.flush()
+        
+        end = _local_naive(end) if end is not None else datetime.now()
+        start, end = _truncate(_local_naive(start), "hour"), _ceil(end, "hour")
+        
+        conn = self._connect()
+        try:
+            horizons = dict(conn.execute(
+                "SELECT key, value FROM usage_meta WHERE key LIKE 'rollup_%_complete_since'"
+            ).fetchall())
+            
+            # Candidatos: granularidad pedida o más fina, de más gruesa a más fina
+            candidates = [r for r in ROLLUPS if r[2] >= GRANULARITIES[granularity]]
+            available = [
+                r for r in ROLLUPS
+                if start.isoformat() >= horizons.get(f"rollup_{r[0]}_complete_since", "")
+            ]
+            chosen = next(
+                (r for r in candidates if r in available
+                 and _truncate(start, r[0]) == start and _ceil(end, r[0]) == end),
+                None,
+            )
+            if chosen is None:
+                # Sin alineación o sin datos finos: el más fino disponible
+                chosen = next((r for r in reversed(ROLLUPS) if r in available), ROLLUPS[0])
+            source_granularity, table, size = chosen
+            if size < GRANULARITIES[granularity]:
+                granularity = source_granularity
+            out_size = GRANULARITIES[granularity]
+            
+            agent_column = ", agent" if by_agent else ""
+            agent_filter = "AND agent = ?" if agent is not None else ""
+            params = [tenant_id, start.isoformat()[:size], _ceil(end, source_granularity).isoformat()[:size]]
+            if agent is not None:
+                params.append(agent)
+            rows = conn.execute(f"""
+                SELECT substr(bucket, 1, {out_size}) AS period{agent_column},
+                       SUM(requests), SUM(errors), SUM(tokens), SUM(response_time_sum)
+                FROM {table}
+                WHERE tenant_id = ? AND bucket >= ? AND bucket < ? {agent_filter}
+                GROUP BY period{agent_column}
+                ORDER BY period{agent_column}
+            """, params).fetchall()
+        finally:
+            conn.close()
+        
+        points = []
+        for row in rows:
+            if by_agent:
+                period, agent_name, requests, errors, tokens, time_sum = row
+            else:
+                period, requests, errors, tokens, time_sum = row
+            point = {
+                "period": period,
+                "requests": requests,
+                "errors": errors,
+                "tokens": tokens,
+                "avg_response_time_ms": round(time_sum / requests, 2) if requests else 0.0
+            }
+            if by_agent:
+                point["agent"] = agent_name or None
+            points.append(point)
+        
+        return {
+            "tenant_id": tenant_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "granularity": granularity,
+            "source": table,
+            "points": points
+        }
+    
     def get_active_alerts(self, tenant_id: str) -> List[Dict]:
         """Obtiene alertas activas del tenant"""
         
-        conn = sqlite3.connect(self.db_path)
+        self.flush()
+        
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -395,9 +1011,11 @@ class UsageTracker:
     def cleanup_old_logs(self, days: int = 90):
         """Elimina logs antiguos para mantener la BD limpia"""
         
+        self.flush()
+        
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -407,12 +1025,90 @@ class UsageTracker:
         
         deleted = cursor.rowcount
         
+        # Los resúmenes se conservan; reconcile_summaries no rehace meses sin logs completos
+        cursor.execute("""
+            INSERT INTO usage_meta (key, value) VALUES ('logs_complete_since', ?)
+            ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+        """, (cutoff_date,))
+        
         conn.commit()
         conn.close()
         
         print(f"🗑️ Eliminados {deleted} logs antiguos (>{days} días)")
         
         return deleted
+    
+    def apply_retention(
+        self,
+        raw_days: Optional[int] = None,
+        hourly_days: Optional[int] = None,
+        daily_days: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        Downsampling por retención: logs crudos, rollup por hora y por día
+        más viejos que su plazo se borran (quedan agregados en el rollup
+        siguiente; el mensual se conserva siempre).
+        
+        Returns:
+            dict: filas borradas por nivel
+        """
+        
+        raw_days = raw_days if raw_days is not None else env_int("USAGE_RAW_RETENTION_DAYS", 90)
+        hourly_days = hourly_days if hourly_days is not None else env_int("USAGE_HOURLY_RETENTION_DAYS", 180)
+        daily_days = daily_days if daily_days is not None else env_int("USAGE_DAILY_RETENTION_DAYS", 1095)
+        
+        deleted = {"raw": self.cleanup_old_logs(raw_days)}
+        now = datetime.now()
+        conn = self._connect()
+        try:
+            for granularity, days in (("hour", hourly_days), ("day", daily_days)):
+                # Solo buckets completos: el corte se alinea al inicio de su periodo
+                cutoff = _truncate(now - timedelta(days=days), granularity).isoformat()
+                table, size = dict((g, (t, n)) for g, t, n in ROLLUPS)[granularity]
+                cursor = conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (cutoff[:size],))
+                deleted[granularity] = cursor.rowcount
+                conn.execute("""
+                    INSERT INTO usage_meta (key, value) VALUES (?, ?)
+                    ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+                """, (f"rollup_{granularity}_complete_since", cutoff))
+            conn.commit()
+        finally:
+            conn.close()
+        
+        return deleted
+
+
+_tracker: Optional[UsageTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Tracker del proceso sobre USAGE_DB_PATH (el mismo archivo que lee agent_prewarm)"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = UsageTracker(os.environ.get("USAGE_DB_PATH") or "usage.db")
+    return _tracker
+
+
+def retention_interval() -> float:
+    """Segundos entre pasadas de apply_retention (<= 0: desactivada)"""
+    return env_int("USAGE_RETENTION_INTERVAL_HOURS", 24) * 3600.0
+
+
+async def run_retention_forever(tracker: UsageTracker, interval: float) -> None:
+    """Aplica la retencion ahora y luego cada interval segundos, fuera del event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            deleted = await loop.run_in_executor(None, tracker.apply_retention)
+            logger.info("Usage retention applied: %s", deleted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Usage retention failed: %s", exc)
+        await asyncio.sleep(interval)
 
 
 # ============================================================================
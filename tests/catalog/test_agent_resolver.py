@@ -0,0 +1,134 @@
+"""Tests for the indexed agent-id resolver (services.agent_catalog.AgentResolver)."""
+import json
+import random
+
+import pytest
+
+from services.agent_catalog import AgentResolver, CatalogSnapshot, load_agent_aliases
+
+
+def _agent(aid, status="development", file_path=None, class_name=None):
+    base, cls = aid.split("__", 1)
+    return {
+        "id": aid,
+        "status": status,
+        "file_path": file_path or f"marketing/{base}.py",
+        "class_name": class_name or cls.title(),
+    }
+
+
+AGENTS = {a["id"]: a for a in [
+    _agent("leadscoringia__leadscoringia"),
+    _agent("leadscoringia_backup_2024__leadscoringia", status="production"),
+    _agent("abtestingia__circuitbreaker"),
+    _agent("abtestingia__abtestingagentoperative", status="production", class_name="ABTestingAgentOperative"),
+    _agent("old__abtestingagentoperative"),
+    _agent("weird___tail"),
+]}
+
+
+def _legacy(agent_id, agents):
+    if "__" in agent_id:
+        agent = agents.get(agent_id)
+        return agent if agent and "_backup_" not in agent_id else None
+    matches = [a for aid, a in agents.items() if "_backup_" not in aid and aid.endswith(f"__{agent_id}")]
+    if not matches:
+        return None
+    return next((m for m in matches if m.get("status") == "production"), matches[0])
+
+
+@pytest.mark.parametrize("agent_id", [
+    "leadscoringia__leadscoringia",
+    "leadscoringia_backup_2024__leadscoringia",
+    "leadscoringia",
+    "abtestingagentoperative",
+    "circuitbreaker",
+    "tail",
+    "_tail",
+    "nope",
+    "nope__nope",
+])
+def test_same_result_as_linear_scan(agent_id):
+    assert AgentResolver(AGENTS).resolve(agent_id) is _legacy(agent_id, AGENTS)
+
+
+def test_derived_and_explicit_aliases():
+    resolver = AgentResolver(AGENTS, {"ab-test": "abtestingagentoperative", "broken": "missing__x"})
+    production = AGENTS["abtestingia__abtestingagentoperative"]
+
+    assert resolver.resolve("ab-test") is production
+    assert resolver.resolve("AB-TEST") is production
+    assert resolver.resolve("LEADSCORINGIA__LEADSCORINGIA") is AGENTS["leadscoringia__leadscoringia"]
+    assert resolver.resolve("abtestingia") is production  # file stem, production preferred
+    assert resolver.resolve("broken") is None
+
+
+def test_suggestions_ranked_and_without_backups():
+    resolver = AgentResolver(AGENTS)
+    suggestions = resolver.suggest("leadscoring")
+    assert suggestions[0] == "leadscoringia__leadscoringia"
+    assert all("_backup_" not in s for s in suggestions)
+
+    # typo: no substring match, still found through trigram similarity
+    assert resolver.suggest("abtestnigia")[0].startswith("abtestingia__")
+    assert resolver.suggest("zzzzzz") == []
+    assert len(resolver.suggest("ia", limit=2)) == 2
+
+
+def _synthetic_catalog(size, seed=7):
+    """Ids con la forma del catalogo real: palabra + 'ia__' + palabra + 'agent'"""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bcdfglmnprstv" for v in "aeiou"]
+    agents = {}
+    while len(agents) < size:
+        word = "".join(rng.choice(syllables) for _ in range(4))
+        aid = f"{word}ia__{word}agent"
+        agents[aid] = _agent(aid)
+    return agents
+
+
+def test_suggest_finds_typos_in_a_large_catalog():
+    agents = _synthetic_catalog(2000)
+    resolver = AgentResolver(agents)
+    rng = random.Random(1)
+    for target in rng.sample(list(agents), 50):
+        word = target.split("ia__")[0]
+        i = rng.randrange(2, len(word) - 1)
+        typo = word[:i] + "x" + word[i + 1:] + "ia"
+        assert target in resolver.suggest(typo), typo
+
+
+def test_suggest_work_does_not_grow_with_the_catalog(monkeypatch):
+    from services import agent_catalog
+
+    agents = _synthetic_catalog(20000)
+    resolver = AgentResolver(agents)
+    # Cada trigrama tiene cientos de postings: solo se recorren MAX_POSTINGS
+    walked = []
+    real_candidates = AgentResolver._candidates
+    monkeypatch.setattr(agent_catalog.AgentResolver, "_candidates",
+                        lambda self, grams: walked.append(real_candidates(self, grams)) or walked[-1])
+    target = list(agents)[12345]
+    assert resolver.suggest(target[:12])[0] == target
+    assert len(resolver.suggest("agent")) == AgentResolver.SUGGESTIONS
+    assert walked and all(len(candidates) <= AgentResolver.MAX_POSTINGS for candidates in walked)
+
+    # Consultas cortas: indice de 1-2 caracteres, mismo resultado que el scan
+    assert resolver.suggest("zq") == []
+    assert resolver.suggest("ba", limit=3) == [aid for aid in agents if "ba" in aid][:3]
+
+
+def test_alias_file(tmp_path):
+    path = tmp_path / "aliases.json"
+    path.write_text(json.dumps({"Scoring": "leadscoringia"}), encoding="utf-8")
+    assert load_agent_aliases(path) == {"scoring": "leadscoringia"}
+    assert load_agent_aliases(tmp_path / "missing.json") == {}
+
+
+def test_snapshot_rebuilds_resolver():
+    first = CatalogSnapshot(AGENTS, {})
+    changed = dict(AGENTS)
+    changed["newagent__newagent"] = _agent("newagent__newagent")
+    second = CatalogSnapshot(changed, {})
+    assert first.resolver.resolve("newagent") is None
+    assert second.resolver.resolve("newagent") is changed["newagent__newagent"]
@@ -0,0 +1,105 @@
+"""Tests for the indexed catalog query engine behind /api/catalog."""
+import random
+
+import pytest
+
+from services.agent_catalog import CatalogQueryEngine, enrich_agent
+from services.agent_discovery import LABEL_MIN_MAP
+
+
+def _reference_query(agents, module=None, submodule=None, platform=None, category=None,
+                     status=None, search=None, min_score=0.0, max_score=10.0,
+                     confidence_min=0.0, label_min="not_agent", confirmed_only=False,
+                     has_platform=None, api_version=None, limit=100, offset=0):
+    """Legacy list-comprehension filters of main.get_all_agents."""
+    def label_rank(l):
+        return LABEL_MIN_MAP.get((l or "not_agent").lower(), 0)
+
+    filtered = list(agents.values())
+    for field, value in (("module", module), ("submodule", submodule), ("platform", platform),
+                         ("category", category), ("status", status)):
+        if value:
+            filtered = [a for a in filtered if (a.get(field) or "").lower() == value.lower()]
+    filtered = [a for a in filtered if float(a.get("score", 0.0)) >= min_score]
+    filtered = [a for a in filtered if float(a.get("score", 0.0)) <= max_score]
+    filtered = [a for a in filtered if float(a.get("confidence", 0.0)) >= confidence_min]
+    filtered = [a for a in filtered if label_rank(a.get("label")) >= label_rank(label_min)]
+    if confirmed_only:
+        filtered = [a for a in filtered if a.get("label") == "agent_confirmed"]
+    if has_platform is not None:
+        filtered = [a for a in filtered if bool(a.get("platform")) == has_platform]
+    if api_version:
+        filtered = [a for a in filtered if (a.get("api_version") or "").lower() == api_version.lower()]
+    if search:
+        s = search.lower()
+        filtered = [
+            a for a in filtered
+            if (s in a.get("id", "").lower()
+                or s in a.get("name", "").lower()
+                or s in a.get("class_name", "").lower()
+                or any(s in r.lower() for r in a.get("reasons", [])))
+        ]
+    return len(filtered), [enrich_agent(a) for a in filtered[offset:offset + limit]]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    from main import ALL_AGENTS
+    return ALL_AGENTS
+
+
+@pytest.fixture(scope="module")
+def engine(catalog):
+    return CatalogQueryEngine(catalog)
+
+
+def test_no_filters_returns_catalog_order(catalog, engine):
+    total, page = engine.query(limit=1000)
+    assert total == len(catalog)
+    assert [a["id"] for a in page] == list(catalog)
+
+
+def test_enriched_records(engine):
+    _, page = engine.query(limit=1000)
+    for a in page:
+        if "_backup_" in a["id"]:
+            assert a["execute_endpoint"] is None
+            assert "execute" not in a["action_methods"]
+        elif "execute" in a["action_methods"] or "run" in a["action_methods"]:
+            assert a["execute_endpoint"] == "/agents/execute"
+
+
+def test_matches_legacy_filters(catalog, engine):
+    agents = list(catalog.values())
+    rng = random.Random(1234)
+    values = {f: sorted({(a.get(f) or "") for a in agents}) + ["", "MARKETING", "nope"]
+              for f in ("module", "submodule", "platform", "category", "status", "api_version")}
+    words = [a["id"][1:5] for a in agents[:40]] + ["ia", "agent", "marketing", "x", "zzzq", "penalty:"]
+
+    for _ in range(400):
+        kwargs = {f: rng.choice(values[f] + [None] * 4) for f in values}
+        kwargs.update(
+            search=rng.choice(words + [None] * 10),
+            min_score=rng.choice([0.0, 0.0, 3.0, 5.5, 7.0]),
+            max_score=rng.choice([10.0, 10.0, 6.0, 8.5]),
+            confidence_min=rng.choice([0.0, 0.0, 0.5, 0.7]),
+            label_min=rng.choice(["not_agent", "agent_likely", "AGENT_CONFIRMED", "bogus"]),
+            confirmed_only=rng.random() < 0.2,
+            has_platform=rng.choice([None, None, True, False]),
+            limit=rng.choice([1, 5, 100]),
+            offset=rng.choice([0, 0, 3, 50]),
+        )
+        assert engine.query(**kwargs) == _reference_query(catalog, **kwargs), kwargs
+
+
+def test_catalog_endpoint_uses_engine():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    resp = client.get("/api/catalog", params={"module": "marketing", "search": "agent", "limit": 5})
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    assert len(data["agents"]) <= 5
+    assert all(a["module"] == "marketing" for a in data["agents"])
+    assert data["pagination"]["has_more"] == (data["pagination"]["total"] > 5)
@@ -0,0 +1,92 @@
+"""Tests for live hot-reload of the agent catalog."""
+import sys
+
+import pytest
+
+from services import agent_catalog
+from services.agent_catalog import current_catalog, publish_catalog
+from services.agent_discovery import run_discovery
+from services.agent_runner import _module_name
+from services.catalog_refresher import CatalogRefresher
+from services.discovery_index import DiscoveryIndex
+
+AGENT_SOURCE = '''
+class CampaignOptimizerAgent:
+    """Agent that optimizes and analyzes marketing campaign budgets."""
+
+    def execute(self, payload):
+        return {"budget": payload.get("budget", 0) * 0.9}
+
+    def optimize(self, payload):
+        return {"ok": True}
+'''
+
+
+@pytest.fixture
+def restore_catalog():
+    previous = current_catalog()
+    listeners = list(agent_catalog._listeners)
+    agent_catalog._listeners.clear()
+    yield
+    agent_catalog._listeners[:] = listeners
+    agent_catalog._snapshot = previous
+
+
+@pytest.fixture
+def refresher(tmp_path, restore_catalog):
+    root = tmp_path / "agents"
+    (root / "marketing").mkdir(parents=True)
+    (root / "marketing" / "campaignoptimizeria.py").write_text(AGENT_SOURCE, encoding="utf-8")
+
+    index = DiscoveryIndex(tmp_path / "index.json", "test").load()
+    publish_catalog(*run_discovery(root, index))
+    return CatalogRefresher(root, index)
+
+
+def test_no_changes_keeps_version(refresher):
+    before = current_catalog()
+    report = refresher.refresh()
+    assert report["published"] is False
+    assert report["changed"] == [] and report["removed"] == []
+    assert current_catalog() is before
+
+
+def test_added_changed_removed_files_swap_catalog(refresher):
+    root = refresher.agents_path
+    v0 = current_catalog().version
+
+    (root / "marketing" / "budgetia.py").write_text(
+        AGENT_SOURCE.replace("CampaignOptimizerAgent", "BudgetAgent"), encoding="utf-8")
+    report = refresher.refresh()
+    assert report["published"] is True
+    assert report["changed"] == ["marketing/budgetia.py"]
+    assert "budgetia__budgetagent" in current_catalog().agents
+    assert current_catalog().version != v0
+
+    (root / "marketing" / "budgetia.py").unlink()
+    report = refresher.refresh()
+    assert report["removed"] == ["marketing/budgetia.py"]
+    assert "budgetia__budgetagent" not in current_catalog().agents
+    assert current_catalog().version == v0
+
+
+def test_changed_file_evicts_loaded_module(refresher):
+    rel = "marketing/campaignoptimizeria.py"
+    sys.modules[_module_name(rel)] = object()
+
+    target = refresher.agents_path / rel
+    target.write_text(AGENT_SOURCE + "\n# cambio\n", encoding="utf-8")
+    report = refresher.refresh()
+
+    assert report["changed"] == [rel]
+    assert report["modules_evicted"] == 1
+    assert _module_name(rel) not in sys.modules
+
+
+def test_listeners_see_new_snapshot(refresher):
+    seen = []
+    agent_catalog.on_catalog_change(seen.append)
+    (refresher.agents_path / "marketing" / "otheria.py").write_text(
+        AGENT_SOURCE.replace("CampaignOptimizerAgent", "OtherAgent"), encoding="utf-8")
+    refresher.refresh()
+    assert seen and seen[-1] is current_catalog()
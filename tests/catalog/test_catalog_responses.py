@@ -0,0 +1,65 @@
+"""Tests for pre-encoded, ETag-aware catalog responses."""
+import pytest
+from fastapi.testclient import TestClient
+
+from services.agent_catalog import CatalogResponseCache, catalog_version, etag_matches
+
+
+@pytest.fixture(scope="module")
+def client():
+    from main import app
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/api/catalog", "/api/ai-studio/agents", "/api/catalog/marketing/agents"])
+def test_etag_and_304(client, path):
+    first = client.get(path, params={"limit": 7})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert first.json()["success"] is True
+
+    second = client.get(path, params={"limit": 7})
+    assert second.content == first.content
+    assert second.headers["etag"] == etag
+
+    not_modified = client.get(path, params={"limit": 7}, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+
+def test_distinct_filters_and_tenants_have_distinct_etags(client):
+    a = client.get("/api/catalog", params={"limit": 3})
+    b = client.get("/api/catalog", params={"limit": 4})
+    c = client.get("/api/catalog", params={"limit": 3}, headers={"X-Tenant-ID": "other"})
+    assert len({a.headers["etag"], b.headers["etag"], c.headers["etag"]}) == 3
+    assert c.json()["tenant"] == "other"
+
+    stale = client.get("/api/catalog", params={"limit": 4}, headers={"If-None-Match": a.headers["etag"]})
+    assert stale.status_code == 200
+
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_cache_is_keyed_by_catalog_version():
+    cache = CatalogResponseCache(maxsize=2)
+    v1 = catalog_version({"a": {"id": "a", "score": 1.0}})
+    v2 = catalog_version({"a": {"id": "a", "score": 2.0}})
+    assert v1 != v2
+
+    cache.put(v1, "k", {"n": 1})
+    assert cache.get(v1, "k").body == b'{"n":1}'
+    assert cache.get(v2, "k") is None
+
+    cache.put(v1, "k2", {"n": 2})
+    cache.put(v1, "k3", {"n": 3})
+    assert cache.get(v1, "k") is None  # evicted (LRU, maxsize=2)
+    assert cache.stats()["entries"] == 2
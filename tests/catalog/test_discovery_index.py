@@ -0,0 +1,122 @@
+"""Tests for the persisted discovery index and parallel mode used by main.intelligent_discovery."""
+import os
+
+import pytest
+
+from services.discovery_index import DiscoveryIndex
+
+AGENT_SOURCE = '''
+class LeadScoringAgent:
+    """Agent that scores and analyzes marketing leads for campaigns."""
+
+    def execute(self, payload):
+        score = payload.get("score", 0)
+        return {"score": score * 2}
+
+    def analyze(self, payload):
+        return {"ok": True, "campaign": payload.get("campaign")}
+'''
+
+
+@pytest.fixture(scope="module")
+def discovery():
+    from services import agent_discovery
+    return agent_discovery
+
+
+@pytest.fixture
+def agents_tree(tmp_path):
+    root = tmp_path / "agents"
+    (root / "marketing").mkdir(parents=True)
+    (root / "marketing" / "leadscoringia.py").write_text(AGENT_SOURCE, encoding="utf-8")
+    (root / "marketing" / "broken.py").write_text("class (:\n", encoding="utf-8")
+    return root
+
+
+def _index(tmp_path, fingerprint="v1"):
+    return DiscoveryIndex(tmp_path / "index.json", fingerprint).load()
+
+
+def test_cold_then_warm_matches_full_scan(discovery, agents_tree, tmp_path):
+    plain_agents, plain_stats = discovery.run_discovery(agents_tree)
+
+    cold = _index(tmp_path)
+    agents, stats = discovery.run_discovery(agents_tree, cold)
+    assert stats["discovery"]["index"]["rescanned"] == 2
+    assert stats["discovery"]["index"]["hits"] == 0
+
+    warm = _index(tmp_path)
+    agents2, stats2 = discovery.run_discovery(agents_tree, warm)
+    assert stats2["discovery"]["index"]["hits"] == 2
+    assert stats2["discovery"]["index"]["rescanned"] == 0
+
+    assert agents == plain_agents == agents2
+    stats2["discovery"].pop("index")
+    assert stats2 == plain_stats
+    assert "leadscoringia__leadscoringagent" in agents2
+
+
+def test_changed_file_is_rescanned(discovery, agents_tree, tmp_path):
+    discovery.run_discovery(agents_tree, _index(tmp_path))
+
+    target = agents_tree / "marketing" / "leadscoringia.py"
+    target.write_text(AGENT_SOURCE.replace("LeadScoringAgent", "LeadRankingAgent"), encoding="utf-8")
+
+    agents, stats = discovery.run_discovery(agents_tree, _index(tmp_path))
+    assert stats["discovery"]["index"]["rescanned"] == 1
+    assert stats["discovery"]["index"]["hits"] == 1
+    assert "leadscoringia__leadrankingagent" in agents
+    assert "leadscoringia__leadscoringagent" not in agents
+
+
+def test_touched_file_with_same_content_is_a_hit(discovery, agents_tree, tmp_path):
+    discovery.run_discovery(agents_tree, _index(tmp_path))
+
+    target = agents_tree / "marketing" / "leadscoringia.py"
+    st = target.stat()
+    os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+    _, stats = discovery.run_discovery(agents_tree, _index(tmp_path))
+    assert stats["discovery"]["index"]["hits"] == 2
+    assert stats["discovery"]["index"]["rescanned"] == 0
+
+
+def test_removed_file_is_pruned(discovery, agents_tree, tmp_path):
+    discovery.run_discovery(agents_tree, _index(tmp_path))
+    (agents_tree / "marketing" / "leadscoringia.py").unlink()
+
+    agents, stats = discovery.run_discovery(agents_tree, _index(tmp_path))
+    assert agents == {}
+    assert stats["discovery"]["index"]["removed"] == 1
+    assert "marketing/leadscoringia.py" not in _index(tmp_path).entries
+
+
+def test_fingerprint_change_invalidates(discovery, agents_tree, tmp_path):
+    discovery.run_discovery(agents_tree, _index(tmp_path, "v1"))
+    _, stats = discovery.run_discovery(agents_tree, _index(tmp_path, "v2"))
+    assert stats["discovery"]["index"]["rescanned"] == 2
+
+
+def test_parallel_scan_matches_serial(discovery, agents_tree, tmp_path):
+    for i in range(6):
+        src = AGENT_SOURCE.replace("LeadScoringAgent", f"LeadScoringAgent{i}")
+        (agents_tree / "marketing" / f"lead{i}ia.py").write_text(src, encoding="utf-8")
+
+    serial_agents, serial_stats = discovery.run_discovery(agents_tree, workers=1)
+    parallel_agents, parallel_stats = discovery.run_discovery(agents_tree, workers=2)
+
+    assert list(parallel_agents) == list(serial_agents)
+    assert parallel_agents == serial_agents
+    assert parallel_stats == serial_stats
+
+    _, indexed_stats = discovery.run_discovery(agents_tree, _index(tmp_path), workers=2)
+    assert indexed_stats["discovery"]["index"]["rescanned"] == 8
+
+
+def test_discovery_workers_setting(discovery, monkeypatch):
+    monkeypatch.setenv("DISCOVERY_WORKERS", "3")
+    assert discovery.discovery_workers() == 3
+    monkeypatch.setenv("DISCOVERY_WORKERS", "0")
+    assert discovery.discovery_workers() >= 1
+    monkeypatch.setenv("DISCOVERY_WORKERS", "many")
+    assert discovery.discovery_workers() == 1
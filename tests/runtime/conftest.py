@@ -0,0 +1,29 @@
+"""Shared fixtures for the agent runtime tests."""
+import pytest
+
+from services import agent_runner
+
+
+@pytest.fixture
+def agent_sources():
+    """{ruta relativa a agents/: codigo}; cada modulo de tests lo sobreescribe con sus agentes."""
+    return {}
+
+
+@pytest.fixture
+def agents_root(tmp_path, monkeypatch, agent_sources):
+    """Directorio agents/ temporal con agent_sources escritos y caches del runner vacios."""
+    root = tmp_path / "agents"
+    root.mkdir()
+    for file_path, source in agent_sources.items():
+        path = root / file_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source, encoding="utf-8")
+    # Los workers de procesos leen AGENTS_ROOT del entorno
+    monkeypatch.setenv("AGENTS_ROOT", str(root))
+    monkeypatch.setattr(agent_runner, "_AGENTS_ROOT", root)
+    monkeypatch.setattr(agent_runner, "_module_cache", agent_runner._ModuleCache(8))
+    monkeypatch.setattr(agent_runner, "_instance_pool", agent_runner._InstancePool(8, 600))
+    monkeypatch.setattr(agent_runner, "_result_cache", agent_runner._ResultCache(4))
+    yield root
+    agent_runner.clear_agent_caches()
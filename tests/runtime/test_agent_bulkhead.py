@@ -0,0 +1,162 @@
+"""Tests for per-agent/per-tenant bulkheads and execution timeouts."""
+import asyncio
+import threading
+
+import pytest
+
+from services import agent_bulkhead, agent_pool, agent_runner
+from services.agent_bulkhead import BulkheadFullError, BulkheadRegistry, execution_timeout
+from services.agent_runner import AgentTimeoutError, execute_agent
+
+AGENT_SOURCE = '''
+import asyncio
+
+STATE = {"cancelled": 0}
+
+class SlowAsyncAgent:
+    async def execute(self, payload):
+        try:
+            await asyncio.sleep(payload.get("sleep", 0))
+        except asyncio.CancelledError:
+            STATE["cancelled"] += 1
+            raise
+        return {"ok": True}
+
+class SlowSyncAgent:
+    def execute(self, payload):
+        payload["gate"].wait(5)
+        return {"ok": True}
+'''
+
+ASYNC_AGENT = {"id": "ops__slowasyncagent", "execution_timeout": 0.2}
+SYNC_AGENT = {"id": "ops__slowsyncagent", "execution_timeout": 0.2}
+
+
+@pytest.fixture
+def agent_sources():
+    return {"ops/slow.py": AGENT_SOURCE}
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(agent_bulkhead, "_registry", BulkheadRegistry(agent_limit=2, tenant_limit=3))
+
+
+def test_registry_rejects_per_agent_and_per_tenant():
+    reg = BulkheadRegistry(agent_limit=2, tenant_limit=3)
+    reg.acquire("a", "t1", reg.limit_for({}))
+    reg.acquire("a", "t1", reg.limit_for({}))
+    with pytest.raises(BulkheadFullError) as exc:
+        reg.acquire("a", "t1", reg.limit_for({}))
+    assert exc.value.scope == "agent" and exc.value.retry_after >= 1
+
+    reg.acquire("b", "t1", reg.limit_for({"max_concurrency": 5}))
+    with pytest.raises(BulkheadFullError) as exc:
+        reg.acquire("b", "t1", 5)
+    assert exc.value.scope == "tenant"
+    reg.acquire("b", "t2", 5)  # otro tenant no se ve afectado
+
+    reg.release("a", "t1", 3.0, "timeout")
+    reg.acquire("a", "t1", 2)
+    stats = reg.stats()
+    assert stats["agents"]["a"]["active"] == 2
+    assert stats["agents"]["a"]["rejected"] == 1
+    assert stats["agents"]["a"]["timeouts"] == 1
+    assert stats["agents"]["b"]["limit"] == 5
+    assert stats["tenants"]["t1"]["saturation"] == 1.0
+    # Retry-After sigue la latencia reciente del agente
+    with pytest.raises(BulkheadFullError) as exc:
+        reg.acquire("a", "t3", 2)
+    assert exc.value.retry_after == 3
+
+
+def test_idle_compartments_are_evicted():
+    reg = BulkheadRegistry(agent_limit=2, tenant_limit=3, max_keys=4)
+    reg.acquire("busy", "t-busy", 2)
+    for i in range(50):
+        reg.acquire(f"agent-{i}", f"tenant-{i}", 2)
+        reg.release(f"agent-{i}", f"tenant-{i}", 0.01)
+    stats = reg.stats()
+    assert len(stats["agents"]) == 4 and len(stats["tenants"]) == 4
+    # Lo que sigue en vuelo no se desaloja y se puede liberar
+    assert stats["agents"]["busy"]["active"] == 1 and "t-busy" in stats["tenants"]
+    reg.release("busy", "t-busy", 0.01)
+    assert stats["evicted"] > 0
+
+
+def test_execution_timeout_default(monkeypatch):
+    monkeypatch.setenv("AGENT_EXECUTION_TIMEOUT", "45")
+    assert execution_timeout({"execution_timeout": 5.0}) == 5.0
+    assert execution_timeout({}) == 45.0
+    monkeypatch.setenv("AGENT_EXECUTION_TIMEOUT", "0")
+    assert execution_timeout(None) is None
+
+
+def test_async_agent_is_cancelled_on_timeout(agents_root):
+    module = agent_runner.load_agent_module("ops/slow.py")
+    with pytest.raises(AgentTimeoutError):
+        asyncio.run(execute_agent("ops/slow.py", "SlowAsyncAgent", {"sleep": 5}, tenant_id="t1", agent=ASYNC_AGENT))
+    assert module.STATE["cancelled"] == 1
+
+    stats = agent_bulkhead.get_bulkheads().stats()["agents"][ASYNC_AGENT["id"]]
+    assert stats["active"] == 0 and stats["timeouts"] == 1
+
+
+def test_sync_agent_is_abandoned_and_slot_freed(agents_root, monkeypatch):
+    pool = agent_pool.FairThreadPool(1, abandon_headroom=1, name="test-bulkhead")
+    monkeypatch.setattr(agent_runner, "get_sync_pool", lambda: pool)
+    gate = threading.Event()
+    try:
+        with pytest.raises(AgentTimeoutError):
+            asyncio.run(execute_agent("ops/slow.py", "SlowSyncAgent", {"gate": gate}, tenant_id="t1", agent=SYNC_AGENT))
+        assert pool.stats()["abandoned_running"] == 1
+
+        # El unico slot quedo libre: una nueva ejecucion no espera al thread colgado
+        gate.set()
+        result = asyncio.run(execute_agent("ops/slow.py", "SlowSyncAgent", {"gate": gate}, tenant_id="t1", agent=SYNC_AGENT))
+        assert result == {"ok": True}
+    finally:
+        gate.set()
+        pool.shutdown(wait=True)
+    assert agent_bulkhead.get_bulkheads().stats()["agents"][SYNC_AGENT["id"]]["active"] == 0
+
+
+def test_saturated_agent_fails_fast(agents_root):
+    async def scenario():
+        running = [
+            asyncio.ensure_future(execute_agent("ops/slow.py", "SlowAsyncAgent", {"sleep": 0.1}, tenant_id="t1", agent=ASYNC_AGENT))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)
+        with pytest.raises(BulkheadFullError):
+            await execute_agent("ops/slow.py", "SlowAsyncAgent", {"sleep": 0}, tenant_id="t1", agent=ASYNC_AGENT)
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(scenario()) == [{"ok": True}, {"ok": True}]
+
+
+def test_endpoint_returns_503_with_retry_after(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from main import app
+    from routers import agent_execution_router
+
+    async def saturated(**kwargs):
+        raise BulkheadFullError("agent", kwargs["agent"].get("id", "x"), 2, 7)
+
+    monkeypatch.setattr(agent_execution_router, "execute_agent_cached", saturated)
+    monkeypatch.setattr(agent_execution_router, "_audit", lambda *a, **k: None)
+    client = TestClient(app)
+    resp = client.get("/api/catalog", params={"module": "marketing", "limit": 253})
+    agent_id = next((
+        a["id"] for a in resp.json()["data"]["agents"]
+        if "_archived" not in a.get("file_path", "") and a.get("status") != "template"
+        and "execute" in a.get("action_methods", []) and a.get("file_path", "").count("/") == 1
+    ), None)
+    if agent_id is None:
+        pytest.skip("No se encontro agente operativo con execute()")
+    resp = client.post("/agents/execute", headers={"X-Tenant-ID": "bulkhead"}, json={"agent_id": agent_id})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "7"
+
+    assert "agents" in client.get("/agents/runtime/bulkheads").json()
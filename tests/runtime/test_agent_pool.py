@@ -0,0 +1,153 @@
+"""Tests for the fair thread pool that runs synchronous agents off the event loop."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import agent_runner
+from services.agent_pool import FairThreadPool
+
+
+@pytest.fixture
+def pool():
+    p = FairThreadPool(1)
+    yield p
+    p.shutdown()
+
+
+def test_round_robin_across_tenants(pool):
+    gate = threading.Event()
+    order = []
+
+    pool.submit("blocker", gate.wait)
+    futures = [pool.submit("a", lambda i=i: order.append(f"a{i}")) for i in range(3)]
+    futures.append(pool.submit("b", lambda: order.append("b0")))
+    gate.set()
+    for f in futures:
+        f.result(timeout=5)
+
+    # b's single call is not stuck behind all of a's backlog
+    assert order.index("b0") == 1
+    assert pool.stats()["max_queue_depth"] == 4
+
+
+def test_per_tenant_cap():
+    p = FairThreadPool(2, per_tenant_max=1)
+    gate = threading.Event()
+    try:
+        p.submit("a", gate.wait)
+        p.submit("a", lambda: None)
+        time.sleep(0.05)
+        stats = p.stats()
+        assert stats["active"] == 1
+        assert stats["queue_depth_by_tenant"] == {"a": 1}
+        gate.set()
+    finally:
+        gate.set()
+        p.shutdown()
+
+
+def test_errors_and_metrics(pool):
+    def boom():
+        raise ValueError("bad payload")
+
+    with pytest.raises(ValueError):
+        pool.submit("a", boom).result(timeout=5)
+    assert pool.submit("a", lambda: 7).result(timeout=5) == 7
+
+    stats = pool.stats()
+    assert stats["failed"] == 1 and stats["completed"] == 1
+    assert stats["queue_depth"] == 0
+    assert set(stats["wait_ms"]) == {"avg", "p95", "max"}
+
+
+def test_cancelled_while_queued_never_runs(pool):
+    gate = threading.Event()
+    ran = []
+
+    async def scenario():
+        pool.submit("a", gate.wait)
+        task = asyncio.ensure_future(pool.run("b", lambda: ran.append(1)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    gate.set()
+    pool.submit("a", lambda: None).result(timeout=5)
+    assert ran == []
+    assert pool.stats()["cancelled"] == 1
+
+
+SYNC_AGENT = '''
+import threading
+
+class SlowAgent:
+    def execute(self, payload):
+        return {"thread": threading.current_thread().name}
+'''
+
+ASYNC_AGENT = '''
+import threading
+
+class AsyncAgent:
+    async def execute(self, payload):
+        return {"thread": threading.current_thread().name}
+'''
+
+
+def test_execute_agent_dispatch(tmp_path, monkeypatch):
+    root = tmp_path / "agents"
+    (root / "marketing").mkdir(parents=True)
+    (root / "marketing" / "slowia.py").write_text(SYNC_AGENT, encoding="utf-8")
+    (root / "marketing" / "asyncia.py").write_text(ASYNC_AGENT, encoding="utf-8")
+    monkeypatch.setattr(agent_runner, "_AGENTS_ROOT", root)
+    monkeypatch.setattr(agent_runner, "_module_cache", agent_runner._ModuleCache(8))
+
+    async def scenario():
+        sync_result = await agent_runner.execute_agent("marketing/slowia.py", "SlowAgent", {})
+        async_result = await agent_runner.execute_agent("marketing/asyncia.py", "AsyncAgent", {})
+        return sync_result, async_result, threading.current_thread().name
+
+    try:
+        sync_result, async_result, loop_thread = asyncio.run(scenario())
+        assert sync_result["thread"].startswith("agent-sync")
+        assert async_result["thread"] == loop_thread
+
+        monkeypatch.setenv("AGENT_SYNC_OFFLOAD", "false")
+        sync_result, _, loop_thread = asyncio.run(scenario())
+        assert sync_result["thread"] == loop_thread
+    finally:
+        agent_runner.clear_agent_caches()
+
+
+def test_sync_agent_does_not_block_loop(tmp_path, monkeypatch):
+    root = tmp_path / "agents"
+    (root / "marketing").mkdir(parents=True)
+    (root / "marketing" / "sleepyia.py").write_text(
+        "import time\nclass SleepyAgent:\n    def execute(self, payload):\n        time.sleep(0.3)\n        return {}\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(agent_runner, "_AGENTS_ROOT", root)
+    monkeypatch.setattr(agent_runner, "_module_cache", agent_runner._ModuleCache(8))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.ensure_future(ticker())
+        await agent_runner.execute_agent("marketing/sleepyia.py", "SleepyAgent", {})
+        t.cancel()
+        return ticks
+
+    try:
+        assert asyncio.run(scenario()) >= 10
+    finally:
+        agent_runner.clear_agent_caches()
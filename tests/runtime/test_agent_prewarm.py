@@ -0,0 +1,127 @@
+"""Tests for usage-driven agent pre-warming (services.agent_prewarm)."""
+import asyncio
+import json
+import sqlite3
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import agent_prewarm, agent_runner
+from services.agent_prewarm import Prewarmer, audit_jsonl_counts, rank_agents, usage_log_counts
+
+AGENT_SOURCE = '''
+class HotAgent:
+    def execute(self, payload):
+        return {"hot": True}
+
+class ColdAgent:
+    def execute(self, payload):
+        return {"cold": True}
+'''
+
+AGENTS = {
+    "ops__hotagent": {"id": "ops__hotagent", "file_path": "ops/hot.py", "class_name": "HotAgent"},
+    "ops__coldagent": {"id": "ops__coldagent", "file_path": "ops/hot.py", "class_name": "ColdAgent"},
+    "ops__broken": {"id": "ops__broken", "file_path": "ops/missing.py", "class_name": "Nope"},
+}
+
+
+@pytest.fixture
+def agent_sources():
+    return {"ops/hot.py": AGENT_SOURCE}
+
+
+def _usage_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE usage_logs (log_id TEXT, tenant_id TEXT, timestamp TEXT, agent_used TEXT)")
+    conn.executemany("INSERT INTO usage_logs VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_usage_log_counts_respects_window(tmp_path):
+    now = datetime.now()
+    db = tmp_path / "usage.db"
+    _usage_db(db, [
+        ("1", "t1", now.isoformat(), "hotagent"),
+        ("2", "t1", now.isoformat(), "hotagent"),
+        ("3", "t2", (now - timedelta(days=30)).isoformat(), "hotagent"),
+        ("4", "t1", now.isoformat(), None),
+    ])
+    assert usage_log_counts(db, now - timedelta(days=7)) == Counter({("hotagent", "t1"): 2})
+    assert usage_log_counts(tmp_path / "missing.db", now) == Counter()
+
+
+def test_audit_jsonl_counts_reads_only_ok_recent_entries(tmp_path):
+    now = datetime.utcnow()
+    log = tmp_path / "audit.jsonl"
+    entries = [
+        {"agent_id": "ops__hotagent", "tenant_id": "t1", "status": "ok", "timestamp": now.isoformat()},
+        {"agent_id": "ops__hotagent", "tenant_id": "t1", "status": "error", "timestamp": now.isoformat()},
+        {"agent_id": "ops__coldagent", "tenant_id": "t1", "status": "ok", "timestamp": (now - timedelta(days=9)).isoformat()},
+    ]
+    log.write_text("\n".join(json.dumps(e) for e in entries) + "\nnot json\n", encoding="utf-8")
+    assert audit_jsonl_counts(log, now - timedelta(days=7)) == Counter({("ops__hotagent", "t1"): 1})
+    # Solo la cola del archivo: la primera linea (parcial) se descarta
+    assert audit_jsonl_counts(log, now - timedelta(days=7), tail_bytes=60) == Counter()
+
+
+def test_rank_agents_merges_aliases_and_picks_top_tenant():
+    counts = Counter({
+        ("hotagent", "t1"): 3, ("ops__hotagent", "t2"): 5, ("ops__hotagent", "t1"): 4,
+        ("ops__coldagent", "t1"): 2, ("unknown", "t1"): 50,
+    })
+    resolve = {"hotagent": AGENTS["ops__hotagent"], **AGENTS}.get
+    ranked = rank_agents(counts, resolve, top_n=1)
+    assert [(a["id"], tenant, n) for a, tenant, n in ranked] == [("ops__hotagent", "t1", 12)]
+
+
+def test_prewarm_loads_top_agents_within_budget(agents_root, monkeypatch):
+    class Catalog:
+        resolver = type("R", (), {"resolve": staticmethod(AGENTS.get)})
+
+    async def usage(days, limit):
+        return Counter({("ops__hotagent", "t1"): 9, ("ops__broken", "t1"): 3, ("ops__coldagent", "t1"): 1})
+
+    monkeypatch.setattr(agent_prewarm, "recent_usage", usage)
+    monkeypatch.setattr("services.agent_catalog.current_catalog", lambda: Catalog)
+
+    warmer = Prewarmer(top_n=2, budget=5)
+
+    async def scenario():
+        task = warmer.start()
+        assert not warmer.ready
+        await task
+
+    asyncio.run(scenario())
+    stats = warmer.stats()
+    assert stats["state"] == "done" and stats["ready"]
+    assert [a["agent_id"] for a in stats["agents"]] == ["ops__hotagent"]
+    assert [e["agent_id"] for e in stats["errors"]] == ["ops__broken"]
+    assert agent_runner._module_cache.stats()["entries"] == 1
+
+
+def test_prewarm_stops_at_deadline(agents_root):
+    warmer = Prewarmer(top_n=5, budget=0)
+    warmer.candidates = 2
+    warmer.warm([(AGENTS["ops__hotagent"], "t1", 3), (AGENTS["ops__coldagent"], "t1", 1)], deadline=0)
+    assert warmer.state == "budget_exhausted"
+    assert warmer.stats()["skipped"] == 2 and warmer.warmed == []
+
+
+def test_health_reports_warming_up(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    warmer = Prewarmer()
+    monkeypatch.setattr(agent_prewarm, "_prewarmer", warmer)
+    client = TestClient(app)
+    warmer.state = "running"
+    resp = client.get("/health")
+    assert resp.status_code == 503
+    assert resp.json()["status"] == "warming_up" and resp.json()["ready"] is False
+    warmer.state = "done"
+    resp = client.get("/health")
+    assert resp.status_code == 200 and resp.json()["ready"] is True
@@ -0,0 +1,161 @@
+"""Tests for the warm process-pool execution mode (execution_mode = "process")."""
+import ast
+import asyncio
+import os
+import time
+
+import pytest
+
+from services import agent_runner
+from services.agent_discovery import execution_hints
+from services.agent_process_pool import AgentProcessPool, execution_mode_for
+from services.agent_runner import AgentLoadError, AgentTimeoutError
+
+HEAVY_AGENT = '''
+import os
+import time
+
+EXECUTION_MODE = "process"
+time.sleep(float(os.environ.get("MONTECARLO_IMPORT_SECONDS", "0")))
+IMPORTS = globals().get("IMPORTS", 0) + 1
+
+class MonteCarloAgent:
+    EXECUTION_TIMEOUT = 5
+
+    def execute(self, payload):
+        if payload.get("sleep"):
+            time.sleep(payload["sleep"])
+        if payload.get("fail"):
+            raise ValueError("bad input")
+        total = sum(i * i for i in range(payload.get("n", 1000)))
+        return {"total": total, "pid": os.getpid(), "imports": IMPORTS, "tenant": payload["tenant_id"]}
+'''
+
+
+@pytest.fixture
+def agent_sources():
+    return {"contabilidad/montecarlo.py": HEAVY_AGENT}
+
+
+@pytest.fixture
+def pool(agents_root):
+    p = AgentProcessPool(2)
+    yield p
+    p.shutdown()
+
+
+def _run(pool, agent_id="montecarlo__montecarloagent", timeout=None, **payload):
+    payload.setdefault("tenant_id", "t1")
+    return pool.execute(agent_id, "contabilidad/montecarlo.py", "MonteCarloAgent", payload, "t1", timeout)
+
+
+def _wait_restarted(worker, timeout=10.0):
+    """El reciclado corre en segundo plano: espera al proceso nuevo ya re-calentado"""
+    deadline = time.monotonic() + timeout
+    while not worker.alive() or worker.lock.locked():
+        assert time.monotonic() < deadline, "worker did not restart"
+        time.sleep(0.02)
+
+
+def test_execution_hints_from_module_and_class():
+    tree = ast.parse(HEAVY_AGENT)
+    node = next(n for n in tree.body if isinstance(n, ast.ClassDef))
+    assert execution_hints(tree, node) == {"execution_mode": "process", "execution_timeout": 5.0, "result_cache_ttl": None, "max_concurrency": None}
+
+    plain = ast.parse("class A:\n    EXECUTION_MODE = 'gpu'\n")
+    assert execution_hints(plain, plain.body[0]) == {"execution_mode": "inline", "execution_timeout": None, "result_cache_ttl": None, "max_concurrency": None}
+
+
+def test_execution_mode_override(monkeypatch):
+    agent = {"id": "x__y", "execution_mode": "inline"}
+    assert execution_mode_for(agent) == "inline"
+    monkeypatch.setenv("AGENT_PROCESS_AGENTS", "a__b, x__y")
+    assert execution_mode_for(agent) == "process"
+
+
+def test_runs_in_warm_worker(pool):
+    first = _run(pool, n=100)
+    second = _run(pool, n=100)
+    assert first["total"] == sum(i * i for i in range(100))
+    assert first["pid"] != os.getpid()
+    assert first["pid"] == second["pid"]  # same agent -> same worker
+    assert second["imports"] == 1  # module stayed imported
+
+
+def test_errors_are_propagated(pool):
+    with pytest.raises(RuntimeError, match="bad input"):
+        _run(pool, fail=True)
+    with pytest.raises(AgentLoadError):
+        pool.execute("x__y", "contabilidad/missing.py", "Nope", {}, "t1")
+
+
+def test_timeout_recycles_worker(pool):
+    pid = _run(pool)["pid"]
+    with pytest.raises(AgentTimeoutError):
+        _run(pool, timeout=0.3, sleep=3)
+
+    after = _run(pool)
+    assert after["pid"] != pid
+    worker = pool.worker_for("montecarlo__montecarloagent")
+    assert worker.timeouts == 1 and worker.restarts == 1
+
+
+def test_recycled_worker_is_warm_before_the_next_exec(pool, monkeypatch):
+    _run(pool)
+    worker = pool.worker_for("montecarlo__montecarloagent")
+    with pytest.raises(AgentTimeoutError):
+        _run(pool, timeout=0.3, sleep=3)
+    assert worker.loaded == {"contabilidad/montecarlo.py"}
+
+    # El import del proceso nuevo no cuenta contra el timeout del exec
+    monkeypatch.setenv("MONTECARLO_IMPORT_SECONDS", "0.5")
+    with pytest.raises(AgentTimeoutError):
+        _run(pool, timeout=0.3, sleep=3)
+    _wait_restarted(worker)
+    assert _run(pool, timeout=0.3)["imports"] == 1
+    assert worker.timeouts == 2
+
+
+def test_rewarm_timeout_restarts_the_worker_cold(pool, monkeypatch):
+    _run(pool)
+    monkeypatch.setenv("MONTECARLO_IMPORT_SECONDS", "2")
+    monkeypatch.setenv("AGENT_PROCESS_WARM_TIMEOUT", "0.2")
+    with pytest.raises(AgentTimeoutError):
+        _run(pool, timeout=0.3, sleep=3)
+    worker = pool.worker_for("montecarlo__montecarloagent")
+    _wait_restarted(worker)
+    assert worker.loaded == set() and worker.alive()
+
+
+def test_timeout_is_raised_before_the_worker_restarts(pool, monkeypatch):
+    _run(pool)
+    # Re-warm lento: el request que vencio no debe esperarlo
+    monkeypatch.setenv("MONTECARLO_IMPORT_SECONDS", "1.5")
+    start = time.monotonic()
+    with pytest.raises(AgentTimeoutError):
+        _run(pool, timeout=0.3, sleep=3)
+    assert time.monotonic() - start < 0.3 + 0.7
+    # El proximo request espera el reinicio dentro de su propio timeout y encuentra el modulo cargado
+    assert _run(pool, timeout=10)["imports"] == 1
+
+
+def test_warm_imports_before_first_request(pool):
+    agent = {"id": "montecarlo__montecarloagent", "file_path": "contabilidad/montecarlo.py"}
+    assert pool.warm([agent]) == 1
+    assert _run(pool)["imports"] == 1
+
+
+def test_execute_agent_routes_process_agents(agents_root, monkeypatch):
+    from services import agent_process_pool
+
+    p = AgentProcessPool(1)
+    monkeypatch.setattr(agent_process_pool, "_pool", p)
+    agent = {"id": "montecarlo__montecarloagent", "execution_mode": "process", "execution_timeout": 5.0}
+    try:
+        result = asyncio.run(agent_runner.execute_agent(
+            "contabilidad/montecarlo.py", "MonteCarloAgent", {"n": 10}, tenant_id="acme", agent=agent,
+        ))
+    finally:
+        p.shutdown()
+    assert result["tenant"] == "acme"
+    assert result["pid"] != os.getpid()
@@ -0,0 +1,123 @@
+"""Tests for the per-worker module and instance caches in services.agent_runner."""
+import asyncio
+import os
+
+import pytest
+
+from services import agent_runner
+from services.agent_runner import AgentLoadError, cache_stats, evict_agent_modules, safe_load
+
+AGENT_SOURCE = '''
+LOADS = globals().get("LOADS", 0) + 1
+
+class CounterAgent:
+    created = 0
+
+    def __init__(self):
+        CounterAgent.created += 1
+
+    def execute(self, payload):
+        return {"version": VERSION, "tenant": payload.get("tenant_id")}
+
+VERSION = %d
+'''
+
+
+@pytest.fixture
+def agent_sources():
+    return {"marketing/broken.py": "raise RuntimeError('boom')\n"}
+
+
+def _write(root, version, name="counteria.py"):
+    path = root / "marketing" / name
+    path.write_text(AGENT_SOURCE % version, encoding="utf-8")
+    return path
+
+
+def test_module_executed_once_while_file_unchanged(agents_root):
+    _write(agents_root, 1)
+    first = safe_load("marketing/counteria.py", "CounterAgent")
+    second = safe_load("marketing/counteria.py", "CounterAgent")
+
+    assert type(first) is type(second)
+    assert first is not second  # instance cache is off by default
+    stats = cache_stats()["modules"]
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+def test_changed_file_is_reloaded(agents_root):
+    path = _write(agents_root, 1)
+    assert safe_load("marketing/counteria.py", "CounterAgent").execute({})["version"] == 1
+
+    _write(agents_root, 22)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert safe_load("marketing/counteria.py", "CounterAgent").execute({})["version"] == 22
+    assert cache_stats()["modules"]["reloads"] == 1
+
+
+def test_instance_pool_per_class_and_tenant(agents_root, monkeypatch):
+    monkeypatch.setenv("AGENT_INSTANCE_CACHE", "true")
+    _write(agents_root, 1)
+
+    a1 = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a")
+    a2 = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a")
+    b1 = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="b")
+
+    assert a1 is a2
+    assert a1 is not b1
+    stats = cache_stats()["instances"]
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_instance_pool_ttl_and_eviction(agents_root, monkeypatch):
+    monkeypatch.setenv("AGENT_INSTANCE_CACHE", "true")
+    monkeypatch.setattr(agent_runner, "_instance_pool", agent_runner._InstancePool(1, 600))
+    _write(agents_root, 1)
+
+    a = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a")
+    safe_load("marketing/counteria.py", "CounterAgent", tenant_id="b")  # evicts "a"
+    assert safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a") is not a
+    assert cache_stats()["instances"]["evictions"] == 2
+
+    agent_runner._instance_pool.ttl = 0.000001
+    b = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="b")
+    assert safe_load("marketing/counteria.py", "CounterAgent", tenant_id="b") is not b
+
+
+def test_evict_drops_cached_module_and_instances(agents_root, monkeypatch):
+    monkeypatch.setenv("AGENT_INSTANCE_CACHE", "true")
+    _write(agents_root, 1)
+    a = safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a")
+
+    assert evict_agent_modules(["marketing/counteria.py"]) == 1
+    assert cache_stats()["modules"]["entries"] == 0
+    assert cache_stats()["instances"]["entries"] == 0
+    assert safe_load("marketing/counteria.py", "CounterAgent", tenant_id="a") is not a
+
+
+def test_module_lru_eviction(agents_root, monkeypatch):
+    monkeypatch.setattr(agent_runner, "_module_cache", agent_runner._ModuleCache(1))
+    _write(agents_root, 1, "one.py")
+    _write(agents_root, 2, "two.py")
+    safe_load("marketing/one.py", "CounterAgent")
+    safe_load("marketing/two.py", "CounterAgent")
+    assert cache_stats()["modules"]["evictions"] == 1
+    assert agent_runner._module_name("marketing/one.py") not in agent_runner.sys.modules
+
+
+def test_load_errors_are_not_cached(agents_root):
+    for _ in range(2):
+        with pytest.raises(AgentLoadError):
+            safe_load("marketing/broken.py", "Anything")
+    assert cache_stats()["modules"]["misses"] == 2
+
+
+def test_execute_agent_uses_cache(agents_root):
+    _write(agents_root, 3)
+    for _ in range(3):
+        result = asyncio.run(agent_runner.execute_agent("marketing/counteria.py", "CounterAgent", {}, tenant_id="t1"))
+    assert result == {"version": 3, "tenant": "t1"}
+    assert cache_stats()["modules"]["hits"] == 2
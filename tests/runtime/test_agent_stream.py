@@ -0,0 +1,128 @@
+"""Tests for progress streaming (services.agent_stream, POST /agents/execute/stream)."""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from services import agent_runner
+from services.agent_stream import ProgressChannel, format_sse
+from services.agent_runner import accepts_progress, execute_agent
+
+AGENT_SOURCE = '''
+import asyncio
+
+class PhasedAsyncAgent:
+    async def execute(self, payload, **context):
+        progress = context.get("progress")
+        for phase in ("validation", "core_logic", "decision_layer", "audit"):
+            await asyncio.sleep(0)
+            if progress:
+                progress(phase, {"tenant": payload["tenant_id"]})
+        return {"ok": True}
+
+class PhasedSyncAgent:
+    def execute(self, payload, progress=None):
+        for i in range(payload.get("phases", 3)):
+            if progress:
+                progress("step", {"i": i})
+        return {"ok": True}
+
+class PlainAgent:
+    def execute(self, payload):
+        return {"plain": True}
+'''
+
+
+@pytest.fixture
+def agent_sources():
+    return {"ops/phased.py": AGENT_SOURCE}
+
+
+async def _collect(class_name, payload, maxsize=None):
+    channel = ProgressChannel(maxsize)
+    task = asyncio.ensure_future(execute_agent("ops/phased.py", class_name, payload, tenant_id="t1", progress=channel.progress))
+    events = [data async for _, data in channel.events(task)]
+    return task.result(), events, channel
+
+
+def test_format_sse():
+    assert format_sse("progress", {"phase": "audit"}, 3) == 'id: 3\nevent: progress\ndata: {"phase":"audit"}\n\n'
+
+
+def test_accepts_progress(agents_root):
+    module = agent_runner.load_agent_module("ops/phased.py")
+    assert accepts_progress(module.PhasedAsyncAgent())
+    assert accepts_progress(module.PhasedSyncAgent())
+    assert not accepts_progress(module.PlainAgent())
+
+
+def test_async_agent_reports_phases_in_order(agents_root):
+    result, events, _ = asyncio.run(_collect("PhasedAsyncAgent", {}))
+    assert result == {"ok": True}
+    assert [e["phase"] for e in events] == ["validation", "core_logic", "decision_layer", "audit"]
+    assert [e["seq"] for e in events] == [1, 2, 3, 4]
+    assert events[0]["data"] == {"tenant": "t1"}
+
+
+def test_sync_agent_blocks_on_full_queue_instead_of_dropping(agents_root):
+    result, events, channel = asyncio.run(_collect("PhasedSyncAgent", {"phases": 20}, maxsize=2))
+    assert result == {"ok": True}
+    assert [e["data"]["i"] for e in events] == list(range(20))
+    assert channel.dropped == 0
+
+
+def test_agent_without_progress_still_runs(agents_root):
+    result, events, _ = asyncio.run(_collect("PlainAgent", {}))
+    assert result == {"plain": True} and events == []
+
+
+def test_closed_channel_releases_blocked_thread():
+    async def scenario():
+        channel = ProgressChannel(1)
+        channel.progress("fills-queue")
+        done = threading.Event()
+
+        def worker():
+            channel.progress("blocks")
+            done.set()
+
+        threading.Thread(target=worker, daemon=True).start()
+        await asyncio.sleep(0.1)
+        assert not done.is_set()
+        channel.close()
+        await asyncio.get_running_loop().run_in_executor(None, done.wait, 2)
+        return done.is_set()
+
+    assert asyncio.run(scenario())
+
+
+def test_stream_endpoint_emits_phases(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from main import app
+    from routers import agent_execution_router
+
+    monkeypatch.setattr(agent_execution_router, "_audit", lambda *a, **k: None)
+    client = TestClient(app)
+    agent_id = "leadscoria__leadscoragentoperative"
+    with client.stream(
+        "POST", "/agents/execute/stream",
+        headers={"X-Tenant-ID": "stream"},
+        json={"agent_id": agent_id, "payload": {"input_data": {"lead": {"company_size": "enterprise", "budget": 60000}}}},
+    ) as resp:
+        if resp.status_code == 404:
+            pytest.skip("leadscoria no esta en el catalogo")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events, data = [], {}
+        for line in resp.iter_lines():
+            if line.startswith("event: "):
+                events.append(line[7:])
+            elif line.startswith("data: "):
+                data[events[-1]] = json.loads(line[6:])
+
+    assert events[0] == "started" and events[-1] == "result"
+    assert events.count("progress") >= 4
+    assert data["result"]["success"] is True
+    assert data["result"]["progress_events"] == events.count("progress")
@@ -0,0 +1,146 @@
+"""Tests for POST /agents/execute/batch."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import audit_logger
+
+
+@pytest.fixture(scope="module")
+def client():
+    from main import app
+    return TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def real_agent_id(client):
+    resp = client.get("/api/catalog", params={"module": "marketing", "limit": 253})
+    for a in resp.json()["data"]["agents"]:
+        fp = a.get("file_path", "")
+        if "_archived" not in fp and a.get("status") != "template" and "execute" in a.get("action_methods", []) and fp.count("/") == 1:
+            return a["id"]
+    pytest.skip("No se encontro agente operativo con execute()")
+
+
+@pytest.fixture
+def audit_sink(monkeypatch):
+    calls = []
+    monkeypatch.setattr(audit_logger, "_write_jsonl_many", lambda entries: calls.append(list(entries)))
+    return calls
+
+
+def test_batch_results_in_order_with_bulk_audit(client, real_agent_id, audit_sink):
+    resp = client.post(
+        "/agents/execute/batch",
+        headers={"X-Tenant-ID": "batch-order"},
+        json={
+            "items": [
+                {"agent_id": real_agent_id, "payload": {"input_data": {"n": 1}}},
+                {"agent_id": "agente_inexistente_xyz", "payload": {}},
+                {"agent_id": real_agent_id, "payload": {"input_data": {"n": 2}}},
+                {"payload": {}},
+            ],
+            "concurrency": 2,
+        },
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [r["index"] for r in data["results"]] == [0, 1, 2, 3]
+    assert [r["status"] for r in data["results"]] == [200, 404, 200, 422]
+    assert data["succeeded"] == 2 and data["failed"] == 2
+    assert data["results"][0]["agent_id"] == data["results"][2]["agent_id"]
+
+    # One bulk write for the whole batch (item 3 never reached an agent)
+    assert len(audit_sink) == 1
+    assert sorted(e["http_status"] for e in audit_sink[0]) == [200, 200, 404]
+
+
+def test_batch_one_agent_many_payloads(client, real_agent_id, audit_sink):
+    resp = client.post(
+        "/agents/execute/batch",
+        headers={"X-Tenant-ID": "batch-payloads"},
+        json={"agent_id": real_agent_id, "payloads": [{"input_data": {}} for _ in range(5)]},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["total"] == 5
+    assert all(r["agent_id"] == resp.json()["results"][0]["agent_id"] for r in resp.json()["results"])
+
+
+def test_batch_stream_ndjson(client, real_agent_id, audit_sink):
+    resp = client.post(
+        "/agents/execute/batch",
+        headers={"X-Tenant-ID": "batch-stream"},
+        json={"agent_id": real_agent_id, "payloads": [{}, {}, {}], "stream": True},
+    )
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines() if line]
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    assert lines[-1]["summary"]["total"] == 3
+    assert len(audit_sink) == 1
+
+
+def test_batch_validation(client, monkeypatch):
+    assert client.post("/agents/execute/batch", json={"items": []}).status_code == 422
+    monkeypatch.setenv("AGENT_BATCH_MAX_ITEMS", "2")
+    resp = client.post("/agents/execute/batch", json={"agent_id": "x", "payloads": [{}, {}, {}]})
+    assert resp.status_code == 413
+
+
+def test_batch_quota_covers_every_item(client, real_agent_id, monkeypatch):
+    from backend.middleware import usage
+
+    async def check(slug, count=1):
+        return None if count <= 3 else f"Current usage: 97. Requested: {count}."
+
+    monkeypatch.setattr(usage, "_check_plan_limit", check)
+    resp = client.post("/agents/execute/batch", json={"agent_id": real_agent_id, "payloads": [{}] * 4})
+    assert resp.status_code == 429 and "Requested: 4" in resp.text
+    resp = client.post("/agents/execute/batch", json={"agent_id": real_agent_id, "payloads": [{}] * 3})
+    assert resp.status_code == 200
+
+
+def test_batch_stream_disconnect_still_audits_and_counts(real_agent_id, audit_sink, monkeypatch):
+    import asyncio
+
+    from starlette.requests import Request
+
+    from backend.middleware import usage
+    from routers.agent_execution_router import BatchExecuteRequest, execute_agent_batch
+
+    counted = []
+
+    async def increment(slug, count=1):
+        counted.append(count)
+
+    monkeypatch.setattr(usage, "_increment_usage", increment)
+    body = BatchExecuteRequest(agent_id=real_agent_id, payloads=[{}] * 6, concurrency=1, stream=True)
+    request = Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": ("127.0.0.1", 1)})
+
+    async def scenario():
+        response = await execute_agent_batch(body, request, "batch-disconnect", None, None, None)
+        stream = response.body_iterator
+        first = json.loads(await stream.__anext__())
+        await stream.aclose()  # el cliente se va despues de la primera linea
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(scenario())["success"]
+    assert len(audit_sink) == 1 and 1 <= len(audit_sink[0]) < 6
+    assert counted == [len(audit_sink[0])]
+
+
+def test_batch_concurrency_fits_the_agent_bulkhead(client, real_agent_id, audit_sink, monkeypatch):
+    from services import agent_bulkhead
+    from services.agent_bulkhead import BulkheadRegistry
+
+    registry = BulkheadRegistry(agent_limit=1, tenant_limit=2)
+    monkeypatch.setattr(agent_bulkhead, "_registry", registry)
+    resp = client.post(
+        "/agents/execute/batch",
+        headers={"X-Tenant-ID": "batch-bulkhead"},
+        json={"agent_id": real_agent_id, "payloads": [{"input_data": {"n": i}} for i in range(12)], "concurrency": 8},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["succeeded"] == 12
+    assert all(c["rejected"] == 0 for c in registry.stats()["agents"].values())
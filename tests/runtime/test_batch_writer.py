@@ -0,0 +1,173 @@
+"""Tests for the batched background writers and the audit bulk insert."""
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from backend.middleware import audit
+from services import db, tenant_directory
+from services.batch_writer import AsyncBatchWriter, ThreadBatchWriter
+from services.tenant_directory import TenantDirectory, TenantRecord
+
+
+def _recorder():
+    batches = []
+
+    async def sink(batch):
+        batches.append(list(batch))
+
+    return batches, sink
+
+
+def test_batches_by_size_and_interval():
+    batches, sink = _recorder()
+
+    async def scenario():
+        writer = AsyncBatchWriter(sink, batch_size=3, flush_interval=0.05)
+        for i in range(7):
+            writer.submit(i)
+        await asyncio.sleep(0.01)
+        by_size = [len(b) for b in batches]
+        await asyncio.sleep(0.1)  # el resto sale por tiempo
+        await writer.stop()
+        return writer, by_size
+
+    writer, by_size = asyncio.run(scenario())
+    assert by_size == [3, 3]
+    assert [x for b in batches for x in b] == list(range(7))
+    assert writer.stats()["written"] == 7 and writer.stats()["batches"] == 3
+
+
+def test_sampling_and_drops_when_full():
+    batches, sink = _recorder()
+    # Sin loop no arranca el task: la cola solo crece
+    writer = AsyncBatchWriter(sink, max_queue=10, sample_rate=2, high_watermark=0.5,
+                              sampleable=lambda item: item["status_code"] < 400)
+    for i in range(5):
+        assert writer.submit({"n": i, "status_code": 200})
+    kept = [writer.submit({"n": i, "status_code": 200}) for i in range(5, 15)]
+    assert kept.count(True) == 5 and writer.sampled_out == 5  # 1 de cada 2 sobre el 50%
+    assert not writer.submit({"n": 99, "status_code": 500})  # llena: ni los errores entran
+    assert writer.dropped == 1 and len(writer) == 10
+    assert writer.stats()["max_depth"] == 10
+
+
+def test_errors_are_never_sampled():
+    batches, sink = _recorder()
+    writer = AsyncBatchWriter(sink, max_queue=10, sample_rate=100, high_watermark=0.0,
+                              sampleable=lambda item: item["status_code"] < 400)
+    assert all(writer.submit({"status_code": 503}) for _ in range(10))
+    assert writer.sampled_out == 0
+
+
+def test_stop_flushes_and_failures_are_counted():
+    calls = []
+
+    async def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+
+    async def scenario():
+        writer = AsyncBatchWriter(flaky, batch_size=2, flush_interval=10)
+        for i in range(5):
+            writer.submit(i)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert sum(calls) == 5
+    assert writer.failed == 2 and writer.written == 3 and len(writer) == 0
+
+
+def test_audit_batch_is_one_statement(monkeypatch):
+    executed = []
+
+    class Session:
+        async def execute(self, stmt, params):
+            executed.append((str(stmt), params))
+
+        async def commit(self):
+            pass
+
+    @asynccontextmanager
+    async def get_session():
+        yield Session()
+
+    monkeypatch.setattr(db, "db_available", lambda: True)
+    monkeypatch.setattr(db, "get_session", get_session)
+
+    # Tenants ya en el directorio (preload): el batch no consulta tenants
+    acme = str(uuid.uuid4())
+    directory = TenantDirectory()
+    directory.put(TenantRecord(acme, "acme", "pro"))
+    directory.put_missing("other")
+    monkeypatch.setattr(tenant_directory, "_directory", directory)
+
+    user = str(uuid.uuid4())
+    writer = AsyncBatchWriter(lambda batch: audit._write_audit_batch(batch))
+    monkeypatch.setattr(audit, "_writer", writer)
+    audit.schedule_audit_event("acme", user, "GET", "/ping", 200, 3)
+    audit.schedule_audit_event("other", "not-a-uuid", "POST", "/agents/execute", 500, 9)
+
+    asyncio.run(writer.flush())
+    assert len(executed) == 1
+    sql, params = executed[0]
+    assert "INSERT INTO audit_events" in sql and "unnest" in sql
+    assert params["tenant_ids"] == [uuid.UUID(acme), None]
+    assert params["user_ids"] == [uuid.UUID(user), None]
+    assert params["actions"] == ["GET /ping", "POST /agents/execute"]
+    assert params["status_codes"] == [200, 500]
+
+
+def test_thread_writer_batches_and_flush_waits():
+    batches = []
+    writer = ThreadBatchWriter(lambda batch: batches.append(list(batch)), batch_size=50, flush_interval=10)
+    for i in range(120):
+        assert writer.submit(i)
+    assert writer.flush(timeout=5)  # no espera los 10 s del intervalo
+    assert [x for b in batches for x in b] == list(range(120))
+    assert all(len(b) <= 50 for b in batches)
+    writer.stop()
+    assert not writer.stats()["running"]
+
+
+def test_thread_writer_drops_when_full_and_stop_drains():
+    release = threading.Event()
+    written = []
+
+    def slow(batch):
+        release.wait(5)
+        written.extend(batch)
+
+    writer = ThreadBatchWriter(slow, max_queue=3, batch_size=1, flush_interval=0, put_timeout=0.01)
+    writer.submit(0)
+    while len(writer):  # el writer tomo el primero y queda bloqueado
+        time.sleep(0.001)
+    assert all(writer.submit(i) for i in (1, 2, 3))
+    assert not writer.submit(4) and writer.dropped == 1
+    release.set()
+    writer.stop()
+    assert written == [0, 1, 2, 3] and len(writer) == 0
+
+
+def test_thread_writer_retries_transient_errors():
+    attempts = []
+
+    def flaky(batch):
+        attempts.append(list(batch))
+        if len(attempts) < 3:
+            raise TimeoutError("locked")
+
+    writer = ThreadBatchWriter(flaky, batch_size=10, flush_interval=0, retryable=lambda e: isinstance(e, TimeoutError))
+    writer.submit(1)
+    assert writer.flush(timeout=5)
+    assert attempts == [[1]] * 3
+    assert writer.stats()["retries"] == 2 and writer.written == 1 and writer.failed == 0
+
+    writer.retryable = None
+    writer.sink = lambda batch: 1 / 0
+    writer.submit(2)
+    assert writer.flush(timeout=5) and writer.failed == 1
+    writer.stop()
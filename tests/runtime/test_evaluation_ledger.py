@@ -0,0 +1,237 @@
+"""Tests for the append-only evaluation ledger behind core.billing_system.BillingManager."""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from core.evaluation_ledger import EvaluationLedger
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+@pytest.fixture
+def billing(tmp_path, monkeypatch):
+    # La instancia global del modulo crea billing.db en el cwd al importarse
+    monkeypatch.chdir(tmp_path)
+    from core import billing_system
+    return billing_system
+
+
+def _reference_track(db_path, manager, tenant_id):
+    """track_evaluation anterior (lock + SELECT/UPDATE/INSERT por evaluacion)"""
+    current_month = datetime.now().strftime('%Y-%m')
+    plan_type = manager._get_tenant_plan(tenant_id)
+    plan_config = manager.plans[plan_type]
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT evaluations_count, overage_count FROM tenant_usage WHERE tenant_id = ? AND year_month = ?",
+            (tenant_id, current_month),
+        ).fetchone()
+        new_count = row[0] + 1 if row else 1
+        new_overage = max(0, new_count - plan_config.monthly_evaluations)
+        if row:
+            conn.execute(
+                "UPDATE tenant_usage SET evaluations_count = ?, overage_count = ? WHERE tenant_id = ? AND year_month = ?",
+                (new_count, new_overage, tenant_id, current_month),
+            )
+        else:
+            conn.execute(
+                "INSERT INTO tenant_usage (tenant_id, year_month, evaluations_count, plan_type, monthly_limit, "
+                "overage_count) VALUES (?, ?, ?, ?, ?, ?)",
+                (tenant_id, current_month, new_count, plan_type.value, plan_config.monthly_evaluations, new_overage),
+            )
+        conn.execute(
+            "INSERT INTO billing_events (tenant_id, event_type, event_data) VALUES (?, ?, ?)",
+            (tenant_id, 'evaluation_tracked', json.dumps({
+                'evaluations_count': new_count,
+                'monthly_limit': plan_config.monthly_evaluations,
+                'overage_count': new_overage,
+                'plan_type': plan_type.value
+            })),
+        )
+
+
+def _events(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(conn.execute(
+            "SELECT tenant_id, event_data FROM billing_events WHERE event_type = 'evaluation_tracked'"
+        ).fetchall())
+
+
+def _bill(manager, tenant_id):
+    bill = manager.generate_monthly_bill(tenant_id)
+    bill.pop("generated_at")
+    return bill
+
+
+def test_bills_match_the_previous_implementation(billing, tmp_path):
+    manager = billing.BillingManager(str(tmp_path / "ledger.db"))
+    reference = billing.BillingManager(str(tmp_path / "reference.db"))
+    tenants = ["credicefi", "pro_bank", "enterprise_coop"]
+    for i in range(1205):
+        tenant = tenants[i % 3] if i < 300 else "credicefi"
+        result = manager.track_evaluation(tenant)
+        _reference_track(reference.db_path, reference, tenant)
+    assert result["current_usage"] == 1005 and result["overage_count"] == 5 and not result["allowed"]
+
+    for tenant in tenants:
+        assert _bill(manager, tenant) == _bill(reference, tenant)
+        summary = manager.get_tenant_usage_summary(tenant)
+        expected = reference.get_tenant_usage_summary(tenant)
+        summary.pop("last_updated"), expected.pop("last_updated")
+        assert summary == expected
+    assert _events(manager.db_path) == _events(reference.db_path)
+    assert manager.ledger.stats()["checkpoints"] < 1205
+
+
+def test_threads_get_unique_consecutive_counts(billing, tmp_path):
+    manager = billing.BillingManager(str(tmp_path / "billing.db"))
+    counts = []
+
+    def worker():
+        counts.extend(manager.track_evaluation("credicefi")["current_usage"] for _ in range(500))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(counts) == list(range(1, 4001))
+    assert manager.get_tenant_usage_summary("credicefi")["evaluations_used"] == 4000
+    assert len(_events(manager.db_path)) == 4000
+
+
+def test_restart_replays_the_log_tail(billing, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "billing.db")
+    manager = billing.BillingManager(db_path)
+    # El proceso "muere" antes de cualquier checkpoint: los eventos llegan al log pero no a SQLite
+    ledger = manager.ledger
+    monkeypatch.setattr(ledger, "_checkpoint", lambda: None)
+    for _ in range(25):
+        manager.track_evaluation("credicefi")
+    ledger._stopping = True
+    ledger._wake.set()
+    ledger._thread.join()
+    # Al morir el proceso el SO suelta el lock del ledger
+    ledger._release()
+    assert ledger.stats()["unapplied"] == 25 and ledger.stats()["checkpointed"] == 0
+    # Escritura cortada a la mitad al morir el proceso
+    with open(ledger._log_path(ledger._generation), "ab") as log:
+        log.write(b'{"t":"credicefi","m":')
+
+    restarted = billing.BillingManager(db_path)
+    assert restarted.track_evaluation("credicefi")["current_usage"] == 26
+    assert restarted.ledger.replayed == 25
+    assert restarted.get_tenant_usage_summary("credicefi")["evaluations_used"] == 26
+    assert len(_events(db_path)) == 26
+
+    # Cerrado el escritor, reabrir no reaplica nada
+    restarted.ledger.close()
+    again = billing.BillingManager(db_path)
+    assert again.track_evaluation("credicefi")["current_usage"] == 27
+    assert again.ledger.replayed == 0
+    assert again.get_tenant_usage_summary("credicefi")["evaluations_used"] == 27
+
+
+def test_instances_on_the_same_db_use_their_own_slots(billing, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "billing.db")
+    first = billing.BillingManager(db_path)
+    for _ in range(5):
+        first.track_evaluation("credicefi")
+    first.ledger.flush()
+    # Eventos escritos en el log del slot 0 y todavia sin checkpoint
+    monkeypatch.setattr(first.ledger, "checkpoint_interval", 3600)
+    for _ in range(3):
+        first.track_evaluation("credicefi")
+    log = first.ledger._log_path(first.ledger._generation)
+
+    # Otra instancia (otro worker) sobre el mismo billing.db: toma otro slot y no toca el log del primero
+    second = billing.BillingManager(db_path)
+    assert second.generate_monthly_bill("credicefi")["usage"]["evaluations_used"] == 5
+    assert [second.track_evaluation("credicefi")["current_usage"] for _ in range(3)] == [6, 7, 8]
+    assert second.ledger.slot == 1 and first.ledger.slot == 0
+    assert log.exists()
+
+    # El primero no ve lo que el segundo no aplico: se atrasa hasta un checkpoint
+    assert first.track_evaluation("credicefi")["current_usage"] == 9
+    second.ledger.flush()
+    first.ledger.flush()
+    assert second.get_tenant_usage_summary("credicefi")["evaluations_used"] == 12
+    assert len(_events(db_path)) == 12
+    # Tras su checkpoint el primero ve lo que conto el segundo
+    assert first.track_evaluation("credicefi")["current_usage"] == 13
+
+
+_WORKER = """
+import sys, time
+from pathlib import Path
+from core.billing_system import BillingManager
+
+db_path, n, ready = sys.argv[1], int(sys.argv[2]), Path(sys.argv[3])
+manager = BillingManager(db_path)
+manager.track_evaluation("credicefi")
+ready.write_text(str(manager.ledger.slot))
+while not (ready.parent / "go").exists():
+    time.sleep(0.01)
+for _ in range(n - 1):
+    manager.track_evaluation("credicefi")
+manager.ledger.close()
+"""
+
+
+def test_two_processes_count_every_evaluation(billing, tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    billing.BillingManager(db_path)
+    env = dict(os.environ, PYTHONPATH=str(_PROJECT_ROOT))
+    ready = [tmp_path / f"ready-{i}" for i in range(2)]
+    workers = [
+        subprocess.Popen([sys.executable, "-c", _WORKER, db_path, "400", str(path)], cwd=str(tmp_path), env=env)
+        for path in ready
+    ]
+    deadline = time.monotonic() + 60
+    while not all(path.exists() and path.read_text() for path in ready):
+        assert time.monotonic() < deadline and all(w.poll() is None for w in workers)
+        time.sleep(0.01)
+    # Los dos procesos cuentan a la vez, cada uno en su slot
+    assert sorted(path.read_text() for path in ready) == ["0", "1"]
+    (tmp_path / "go").touch()
+    assert [w.wait(60) for w in workers] == [0, 0]
+
+    manager = billing.BillingManager(db_path)
+    assert manager.get_tenant_usage_summary("credicefi")["evaluations_used"] == 800
+    assert len(_events(db_path)) == 800
+    assert manager.generate_monthly_bill("credicefi")["usage"]["overage_evaluations"] == 0
+
+
+def test_log_rotates_after_checkpoint(billing, tmp_path):
+    manager = billing.BillingManager(str(tmp_path / "billing.db"))
+    manager.ledger.close()
+    ledger = EvaluationLedger(manager.db_path, rotate_bytes=200)
+    ledger.append("credicefi", "2025-01", 1, "starter", 1000, 0)
+    first = ledger._generation
+    for n in range(2, 6):
+        ledger.append("credicefi", "2025-01", n, "starter", 1000, 0)
+    ledger.flush()
+    assert ledger._generation == first + 1
+    assert [p.name for p in ledger.log_dir.glob("*.log")] == [ledger._log_path(first + 1).name]
+    ledger.close()
+    assert manager.generate_monthly_bill("credicefi", "2025-01")["usage"]["evaluations_used"] == 5
+
+
+def test_reads_fail_when_the_checkpoint_times_out(billing, tmp_path, monkeypatch):
+    manager = billing.BillingManager(str(tmp_path / "billing.db"))
+    manager.track_evaluation("credicefi")
+    monkeypatch.setattr(manager.ledger, "flush", lambda timeout=None: False)
+    with pytest.raises(TimeoutError):
+        manager.get_tenant_usage_summary("credicefi")
+    with pytest.raises(TimeoutError):
+        manager.generate_monthly_bill("credicefi")
+    with sqlite3.connect(manager.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM billing_events WHERE event_type = 'bill_generated'").fetchone()[0] == 0
@@ -0,0 +1,271 @@
+"""Tests for the SQLite-backed async job queue (services.job_queue) and /agents/jobs."""
+import asyncio
+import time
+
+import pytest
+
+from services import agent_runner, job_queue
+from services.job_queue import JobQueue, JobStore
+
+AGENT_SOURCE = '''
+import time
+
+class ReportAgent:
+    def execute(self, payload):
+        if payload.get("sleep"):
+            time.sleep(payload["sleep"])
+        if payload.get("fail"):
+            raise ValueError("bad input")
+        return {"echo": payload.get("n"), "tenant": payload["tenant_id"]}
+'''
+
+ASYNC_SOURCE = '''
+import asyncio
+
+class SlowAsyncAgent:
+    async def execute(self, payload):
+        await asyncio.sleep(payload.get("sleep", 5))
+        return {"done": True}
+'''
+
+AGENT = {"id": "report__reportagent", "file_path": "marketing/report.py", "class_name": "ReportAgent"}
+SLOW = {"id": "slow__slowasyncagent", "file_path": "marketing/slow.py", "class_name": "SlowAsyncAgent"}
+
+
+@pytest.fixture
+def agent_sources():
+    return {"marketing/report.py": AGENT_SOURCE, "marketing/slow.py": ASYNC_SOURCE}
+
+
+@pytest.fixture(autouse=True)
+def no_job_audit(monkeypatch):
+    monkeypatch.setattr(job_queue, "_audit_job", lambda *a, **k: None)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = JobStore(tmp_path / "jobs.db")
+    yield s
+    s.close()
+
+
+async def _wait_final(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in job_queue.FINAL_STATES:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_submit_run_and_poll(agents_root, store):
+    async def scenario():
+        queue = JobQueue(store, workers=2, poll_interval=0.05)
+        queue.start()
+        job = queue.submit("acme", AGENT, {"n": 7})
+        assert job["status"] == "queued"
+        done = await _wait_final(queue, job["id"])
+        await queue.stop()
+        return done
+
+    done = asyncio.run(scenario())
+    assert done["status"] == "succeeded"
+    assert done["result"] == {"echo": 7, "tenant": "acme"}
+    assert done["attempts"] == 1
+    assert done["expires_at"] > done["finished_at"]
+
+
+def test_jobs_outlive_the_request_execution_timeout(agents_root, store, monkeypatch):
+    monkeypatch.setenv("AGENT_EXECUTION_TIMEOUT", "0.2")
+
+    async def scenario():
+        queue = JobQueue(store, workers=1, poll_interval=0.05, job_timeout=5)
+        queue.start()
+        sync_job = queue.submit("acme", AGENT, {"n": 1, "sleep": 0.5}, max_attempts=1)
+        async_job = queue.submit("acme", SLOW, {"sleep": 0.5}, max_attempts=1)
+        done = [await _wait_final(queue, sync_job["id"]), await _wait_final(queue, async_job["id"])]
+        await queue.stop()
+        return done
+
+    sync_done, async_done = asyncio.run(scenario())
+    assert sync_done["status"] == "succeeded", sync_done["error"]
+    assert async_done["status"] == "succeeded" and async_done["result"] == {"done": True}
+
+
+def test_failures_retry_then_fail(agents_root, store):
+    async def scenario():
+        queue = JobQueue(store, workers=1, poll_interval=0.05, retry_delay=0)
+        queue.start()
+        job = queue.submit("acme", AGENT, {"fail": True}, max_attempts=2)
+        done = await _wait_final(queue, job["id"])
+        await queue.stop()
+        return done, queue.retried
+
+    done, retried = asyncio.run(scenario())
+    assert done["status"] == "failed"
+    assert "bad input" in done["error"]
+    assert done["attempts"] == 2 and retried == 1
+
+
+def test_cancel_queued_and_running(agents_root, store):
+    async def scenario():
+        queue = JobQueue(store, workers=1, poll_interval=0.05)
+        queue.start()
+        running = queue.submit("acme", SLOW, {"sleep": 5})
+        queued = queue.submit("acme", AGENT, {})
+        while queue.get(running["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        assert queue.cancel(queued["id"]) == "cancelled"
+        assert queue.cancel(running["id"]) == "running"
+        done = await _wait_final(queue, running["id"])
+        await queue.stop()
+        return done, queue.get(queued["id"])
+
+    running, queued = asyncio.run(scenario())
+    assert running["status"] == "cancelled"
+    assert queued["status"] == "cancelled" and queued["started_at"] is None
+
+
+def test_priority_and_tenant_fairness(store):
+    queue = JobQueue(store, workers=1)
+    ids = {}
+    for i in range(3):
+        ids[f"a{i}"] = queue.submit("a", AGENT, {"i": i})["id"]
+    ids["b0"] = queue.submit("b", AGENT, {})["id"]
+    ids["urgent"] = queue.submit("c", AGENT, {}, priority=5)["id"]
+
+    order = []
+    for _ in range(5):
+        job = queue._claim_next()
+        order.append(job["id"])
+        # leave it "running" so the tenant's load counts against it
+    names = {v: k for k, v in ids.items()}
+    assert [names[i] for i in order] == ["urgent", "a0", "b0", "a1", "a2"]
+
+
+def test_recover_requeues_interrupted_jobs(store):
+    queue = JobQueue(store, workers=1)
+    once = queue.submit("a", AGENT, {}, max_attempts=1)
+    twice = queue.submit("a", AGENT, {}, max_attempts=2)
+    queue._claim_next()
+    queue._claim_next()
+
+    # Otro worker que arranca sobre el mismo store no toca jobs con lease vigente
+    other = JobStore(store.path, lease_seconds=store.lease_seconds)
+    assert other.recover() == 0
+    assert store.get(once["id"])["status"] == "running"
+    assert store.heartbeat(time.time()) == 2
+
+    # El dueno murio: el lease vence y cualquier proceso los recupera
+    assert other.recover(now=time.time() + store.lease_seconds + 1) == 1
+    assert store.get(once["id"])["status"] == "failed"
+    assert store.get(twice["id"])["status"] == "queued"
+    # El dueno original ya no puede cerrar ni re-encolar lo que perdio
+    assert not store.finish(twice["id"], "succeeded", ttl=60, result={"late": True})
+    assert store.get(twice["id"])["status"] == "queued"
+    other.close()
+
+
+def test_stop_releases_the_leases(agents_root, store):
+    async def scenario():
+        queue = JobQueue(store, workers=1, poll_interval=0.05)
+        queue.start()
+        job = queue.submit("acme", SLOW, {"sleep": 5}, max_attempts=2)
+        while queue.get(job["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    restarted = JobStore(store.path)
+    assert restarted.recover() == 1
+    assert store.get(job["id"])["status"] == "queued"
+    restarted.close()
+
+
+def test_a_busy_store_does_not_block_the_event_loop(agents_root, store, monkeypatch):
+    real_candidates = store.candidates
+
+    def busy_candidates(now, *args):
+        # Otro proceso tiene el lock de escritura: sqlite espera hasta busy_timeout
+        time.sleep(0.3)
+        return real_candidates(now, *args)
+
+    monkeypatch.setattr(store, "candidates", busy_candidates)
+
+    async def scenario():
+        queue = JobQueue(store, workers=2, poll_interval=0.05)
+        queue.start()
+        job = queue.submit("acme", AGENT, {"n": 1})
+        gaps, last = [], time.monotonic()
+        for _ in range(20):
+            await asyncio.sleep(0.02)
+            now = time.monotonic()
+            gaps.append(now - last)
+            last = now
+        done = await _wait_final(queue, job["id"])
+        await queue.stop()
+        return max(gaps), done
+
+    max_gap, done = asyncio.run(scenario())
+    assert max_gap < 0.2
+    assert done["status"] == "succeeded"
+
+
+def test_expired_results_are_purged(store):
+    queue = JobQueue(store, workers=1, result_ttl=1)
+    job = queue.submit("a", AGENT, {})
+    queue._claim_next()
+    store.finish(job["id"], "succeeded", ttl=1, result={"ok": True})
+    assert store.purge_expired(time.time()) == 0
+    assert store.purge_expired(time.time() + 2) == 1
+    assert store.get(job["id"]) is None
+
+
+def test_jobs_endpoints(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    queue = JobQueue(JobStore(tmp_path / "api_jobs.db"), workers=1, poll_interval=0.05)
+    monkeypatch.setattr(job_queue, "_queue", queue)
+    # El startup no debe aplicar la retencion sobre el usage.db del repo
+    monkeypatch.setenv("USAGE_RETENTION_INTERVAL_HOURS", "0")
+
+    resp = TestClient(app).get("/api/catalog", params={"module": "marketing", "limit": 253})
+    agent_id = next(
+        a["id"] for a in resp.json()["data"]["agents"]
+        if "_archived" not in a["file_path"] and a.get("status") != "template" and "execute" in a["action_methods"]
+    )
+
+    with TestClient(app) as client:
+        submitted = client.post("/agents/jobs", headers={"X-Tenant-ID": "jobs-t1"}, json={"agent_id": agent_id, "payload": {}})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["job_id"]
+        assert submitted.headers["location"] == f"/agents/jobs/{job_id}"
+
+        deadline = time.time() + 10
+        while True:
+            polled = client.get(f"/agents/jobs/{job_id}", headers={"X-Tenant-ID": "jobs-t1"}).json()
+            if polled["status"] in job_queue.FINAL_STATES or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        assert polled["status"] == "succeeded"
+        assert "result" in polled
+
+        assert client.get(f"/agents/jobs/{job_id}", headers={"X-Tenant-ID": "other"}).status_code == 404
+        assert client.get("/agents/jobs", headers={"X-Tenant-ID": "jobs-t1"}).json()["count"] == 1
+        assert client.get("/agents/jobs/stats").json()["jobs"]["succeeded"] >= 1
+        assert client.delete(f"/agents/jobs/{job_id}", headers={"X-Tenant-ID": "jobs-t1"}).status_code == 409
+        assert client.post("/agents/jobs", json={"agent_id": "agente_inexistente_xyz"}).status_code == 404
+
+        from backend.middleware import usage
+
+        async def over_limit(slug, count=1):
+            return "Plan 'starter' allows 100 executions/month. Current usage: 100. Upgrade your plan."
+
+        monkeypatch.setattr(usage, "_check_plan_limit", over_limit)
+        limited = client.post("/agents/jobs", headers={"X-Tenant-ID": "jobs-t1"}, json={"agent_id": agent_id})
+        assert limited.status_code == 429
+        assert client.get("/agents/jobs", headers={"X-Tenant-ID": "jobs-t1"}).json()["count"] == 1
+    queue.store.close()
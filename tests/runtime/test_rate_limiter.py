@@ -0,0 +1,198 @@
+"""Tests for the sliding-window limiter and its cluster-wide (shared store) variant."""
+import threading
+import time
+
+import pytest
+
+from services import security
+from services.rate_limit_store import RateLimitStore, SQLiteRateLimitStore
+from services.rate_limiter import ClusterLimiter, SlidingWindowLimiter, make_limiter
+
+
+def test_limit_remaining_and_headers():
+    limiter = SlidingWindowLimiter(3, 60)
+    decisions = [limiter.hit("t", now=1000.0 + i) for i in range(4)]
+
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+    assert "Retry-After" not in decisions[0].headers()
+    headers = decisions[3].headers()
+    assert headers["X-RateLimit-Limit"] == "3" and headers["X-RateLimit-Remaining"] == "0"
+    assert int(headers["Retry-After"]) >= 1
+    # Otros keys no se ven afectados
+    assert limiter.hit("other", now=1003.0).allowed
+
+
+def test_retry_after_is_exact():
+    limiter = SlidingWindowLimiter(10, 60)
+    for _ in range(10):
+        assert limiter.hit("t", now=0.0).allowed
+    denied = limiter.hit("t", now=30.0)
+    assert not denied.allowed
+
+    # En t+retry_after cabe exactamente un request mas; un instante antes no
+    at = 30.0 + denied.retry_after
+    assert not limiter.peek("t", now=at - 0.01).allowed
+    assert limiter.hit("t", now=at + 1e-6).allowed
+    assert not limiter.hit("t", now=at + 1e-6).allowed
+
+
+def test_previous_window_weight_decays():
+    limiter = SlidingWindowLimiter(10, 60)
+    for _ in range(10):
+        limiter.hit("t", now=0.0)
+    # A mitad de la ventana siguiente la previa pesa 50%: caben 5
+    allowed = sum(limiter.hit("t", now=90.0).allowed for _ in range(10))
+    assert allowed == 5
+    # Dos ventanas despues no queda nada
+    assert limiter.peek("t", now=240.0).remaining == 10
+
+
+def test_idle_keys_are_evicted():
+    limiter = SlidingWindowLimiter(5, 10)
+    for i in range(100):
+        limiter.hit(f"tenant-{i}", now=0.0)
+    assert len(limiter) == 100
+
+    # El desalojo es incremental: unas pocas llamadas mas tarde ya no quedan keys inactivas
+    for n in range(50):
+        limiter.hit("active", now=25.0 + n * 0.01)
+    assert len(limiter) == 1
+    assert limiter.stats()["evicted"] == 100
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        SlidingWindowLimiter(0, 60)
+
+
+def test_security_helpers_share_the_limiter(monkeypatch):
+    monkeypatch.setattr(security, "_limiters", {})
+    key = "acme:10.0.0.1"
+    assert [security.rate_limit_check(key, max_requests=2) for _ in range(3)] == [True, True, False]
+    assert security.rate_limit_remaining(key, max_requests=2) == 0
+    # Otra configuracion (limite/ventana) lleva su propio contador
+    assert security.rate_limit_check(key, max_requests=5)
+    decision = security.rate_limit_hit(key, max_requests=2)
+    assert not decision.allowed and decision.retry_after > 0
+
+
+# ---------------------------------------------------------------------------
+# ClusterLimiter: dos "workers" (limiter + conexion propia) sobre el mismo SQLite
+# ---------------------------------------------------------------------------
+
+def _workers(tmp_path, limit=10, tolerance=1, sync_interval=0.25, n=2):
+    db = tmp_path / "rate_limits.db"
+    return [
+        ClusterLimiter(
+            limit, 60, SQLiteRateLimitStore(db), "global",
+            tolerance=tolerance, sync_interval=sync_interval, background=False,
+        )
+        for _ in range(n)
+    ]
+
+
+def test_cluster_limit_holds_across_workers(tmp_path):
+    a, b = _workers(tmp_path, limit=10, tolerance=1)
+    admitted = 0
+    for i in range(30):
+        worker = a if i % 2 else b
+        admitted += worker.hit("acme", now=600.0 + i * 0.5).allowed
+    assert admitted == 10
+    # Cada worker por separado habria admitido 10
+    decision = a.hit("acme", now=620.0)
+    assert not decision.allowed and decision.remaining == 0 and decision.retry_after > 0
+
+
+def test_tolerance_bounds_the_overshoot(tmp_path):
+    workers = _workers(tmp_path, limit=20, tolerance=4, sync_interval=3600, n=3)
+    admitted = sum(
+        workers[i % 3].hit("acme", now=600.0 + i * 0.01).allowed for i in range(90)
+    )
+    assert 20 <= admitted <= 20 + 3 * 4
+    for worker in workers:
+        worker.flush(now=601.0)
+    assert workers[0].store.sync("global", [], ["acme"], 9)["acme"][10] == admitted
+
+
+def test_updates_are_batched(tmp_path):
+    a, = _workers(tmp_path, limit=1000, tolerance=50, sync_interval=3600, n=1)
+    for i in range(200):
+        a.hit(f"tenant-{i % 20}", now=600.0)
+    # Solo la sync del primer hit: nada de escrituras por request
+    assert a.syncs == 1
+    assert a.stats()["pending"] == 200
+    a.flush(now=600.0)
+    totals = a.store.sync("global", [], [f"tenant-{i}" for i in range(20)], 9)
+    assert sum(t[10] for t in totals.values()) == 200
+
+
+def test_pending_of_a_closed_window_is_not_lost(tmp_path):
+    a, b = _workers(tmp_path, limit=100, tolerance=100, sync_interval=3600)
+    for _ in range(5):
+        a.hit("acme", now=650.0)
+    a.hit("acme", now=665.0)  # la ventana 10 cierra con 5 pendientes
+    a.flush(now=665.0)
+    b.hit("acme", now=666.0)
+    # b ve la ventana previa (5) ponderada + la actual (1 de a, 1 suyo)
+    assert b.peek("acme", now=666.0).remaining == 100 - int(5 * (1 - 6 / 60) + 2 + 0.999)
+
+
+def test_store_must_implement_sync():
+    class Incomplete(RateLimitStore):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_store_failure_falls_back_to_local_counts(tmp_path):
+    class Broken(RateLimitStore):
+        def sync(self, scope, increments, keys, since):
+            raise RuntimeError("disk full")
+
+    limiter = ClusterLimiter(3, 60, Broken(), "global", tolerance=1, background=False)
+    assert [limiter.hit("acme", now=600.0 + i).allowed for i in range(4)] == [True, True, True, False]
+    assert limiter.sync_errors > 0
+
+
+def test_hit_never_waits_for_a_busy_store(tmp_path):
+    class Busy(RateLimitStore):
+        def __init__(self):
+            self.inner = SQLiteRateLimitStore(tmp_path / "rl.db")
+            self.gate = threading.Event()
+            self.entered = threading.Event()
+
+        def sync(self, scope, increments, keys, since):
+            self.entered.set()
+            self.gate.wait(5)  # otro worker con el lock de escritura
+            return self.inner.sync(scope, increments, keys, since)
+
+    store = Busy()
+    limiter = ClusterLimiter(100, 60, store, "global", tolerance=1, sync_interval=3600)
+    assert limiter.hit("acme").allowed
+    assert store.entered.wait(2)
+    started = time.monotonic()
+    assert all(limiter.hit("acme").allowed for _ in range(20))
+    assert time.monotonic() - started < 0.5
+
+    store.gate.set()
+    limiter.flush()
+    assert sum(store.inner.sync("global", [], ["acme"], 0)["acme"].values()) == 21
+    assert limiter.stats()["pending"] == 0
+    store.inner.close()
+
+
+def test_make_limiter_uses_the_configured_backend(tmp_path, monkeypatch):
+    from services import rate_limit_store
+
+    monkeypatch.setattr(rate_limit_store, "_store", None)
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "local")
+    assert type(make_limiter(5, 60, "global")) is SlidingWindowLimiter
+
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "sqlite")
+    monkeypatch.setenv("RATE_LIMIT_DB_PATH", str(tmp_path / "rl.db"))
+    monkeypatch.setenv("RATE_LIMIT_TOLERANCE", "2")
+    limiter = make_limiter(5, 60, "global")
+    assert isinstance(limiter, ClusterLimiter) and limiter.tolerance == 2
+    rate_limit_store._store.close()
@@ -0,0 +1,139 @@
+"""Tests for the dry-run result cache in services.agent_runner."""
+import asyncio
+import os
+
+import pytest
+
+from services import agent_runner
+from services.agent_runner import cache_stats, execute_agent_cached, payload_hash
+
+AGENT_SOURCE = '''
+import asyncio
+
+RESULT_CACHE_TTL = 60
+CALLS = []
+
+class PreviewAgent:
+    async def execute(self, payload):
+        CALLS.append(payload)
+        await asyncio.sleep(payload.get("sleep", 0))
+        if payload.get("fail"):
+            raise ValueError("bad input")
+        return {"n": len(CALLS), "version": %d}
+'''
+
+AGENT = {"id": "preview__previewagent", "result_cache_ttl": 60.0}
+
+
+@pytest.fixture
+def agent_sources():
+    return {"marketing/preview.py": AGENT_SOURCE % 1}
+
+
+def _run(payload, tenant="t1", dry_run=True, agent=AGENT):
+    return execute_agent_cached("marketing/preview.py", "PreviewAgent", payload, dry_run, tenant, agent=agent)
+
+
+def test_payload_hash_is_canonical():
+    assert payload_hash({"a": 1, "b": [1, 2]}) == payload_hash({"b": [1, 2], "a": 1})
+    assert payload_hash({"a": 1}) != payload_hash({"a": 2})
+
+
+def test_hit_after_miss_keyed_by_tenant_and_payload(agents_root):
+    async def scenario():
+        return [
+            await _run({"q": 1}),
+            await _run({"q": 1}),
+            await _run({"q": 1}, tenant="t2"),
+            await _run({"q": 2}),
+        ]
+
+    results = asyncio.run(scenario())
+    assert [status for _, status in results] == ["MISS", "HIT", "MISS", "MISS"]
+    assert results[0][0] == results[1][0]
+
+
+def test_bypass_for_live_calls_and_agents_without_ttl(agents_root, monkeypatch):
+    async def scenario():
+        return [
+            await _run({"q": 1}, dry_run=False),
+            await _run({"q": 1}, agent={"id": "preview__previewagent"}),
+        ]
+
+    assert [status for _, status in asyncio.run(scenario())] == ["BYPASS", "BYPASS"]
+
+    monkeypatch.setenv("AGENT_RESULT_CACHE_DEFAULT_TTL", "30")
+    assert asyncio.run(_run({"q": 1}, agent={"id": "preview__previewagent"}))[1] == "MISS"
+
+
+def test_single_flight(agents_root):
+    async def scenario():
+        return await asyncio.gather(*(_run({"sleep": 0.05}) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert sorted(status for _, status in results) == ["COALESCED"] * 4 + ["MISS"]
+    assert len({r["n"] for r, _ in results}) == 1
+    assert cache_stats()["results"]["coalesced"] == 4
+
+
+def test_errors_not_cached_and_shared_with_waiters(agents_root):
+    async def scenario():
+        return await asyncio.gather(*(_run({"fail": True, "sleep": 0.02}) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(scenario()))
+    assert cache_stats()["results"]["entries"] == 0
+
+
+def test_file_change_invalidates(agents_root):
+    path = agents_root / "marketing" / "preview.py"
+    asyncio.run(_run({"q": 1}))
+    path.write_text(AGENT_SOURCE % 2, encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    result, status = asyncio.run(_run({"q": 1}))
+    assert status == "MISS" and result["version"] == 2
+
+
+def test_lru_and_ttl(agents_root, monkeypatch):
+    async def scenario():
+        for q in range(5):
+            await _run({"q": q})
+        return await _run({"q": 0})
+
+    assert asyncio.run(scenario())[1] == "MISS"
+    assert cache_stats()["results"]["evictions"] >= 1
+
+    short = dict(AGENT, result_cache_ttl=0.01)
+    asyncio.run(_run({"ttl": 1}, agent=short))
+
+    async def later():
+        await asyncio.sleep(0.03)
+        return await _run({"ttl": 1}, agent=short)
+
+    assert asyncio.run(later())[1] == "MISS"
+
+
+def test_execute_endpoint_cache_header(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    agents = client.get("/api/catalog", params={"module": "marketing", "limit": 253}).json()["data"]["agents"]
+    agent_id = next(
+        a["id"] for a in agents
+        if "_archived" not in a["file_path"] and a.get("status") != "template" and "execute" in a["action_methods"]
+    )
+    monkeypatch.setenv("AGENT_RESULT_CACHE_DEFAULT_TTL", "60")
+    body = {"agent_id": agent_id, "payload": {"input_data": {"cache": "header"}}}
+    headers = {"X-Tenant-ID": "cache-header"}
+    try:
+        first = client.post("/agents/execute", json=body, headers=headers)
+        second = client.post("/agents/execute", json=body, headers=headers)
+        live = client.post("/agents/execute", json=dict(body, dry_run=False), headers={**headers, "X-Role": "admin"})
+    finally:
+        agent_runner.clear_agent_caches()
+    assert first.headers["x-agent-cache"] == "MISS"
+    assert second.headers["x-agent-cache"] == "HIT"
+    assert second.json()["result"] == first.json()["result"]
+    assert live.status_code != 200 or live.headers["x-agent-cache"] == "BYPASS"
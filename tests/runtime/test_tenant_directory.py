@@ -0,0 +1,161 @@
+"""Tests for the shared tenant slug -> (UUID, plan) directory."""
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from backend.middleware import usage
+from services import db, tenant_directory, usage_counters
+from services.db import get_session as real_get_session
+from services.tenant_directory import TenantDirectory
+
+TENANTS = [
+    (str(uuid.uuid4()), "acme", "starter"),
+    (str(uuid.uuid4()), "globex", "enterprise"),
+    (str(uuid.uuid4()), "initech", None),
+]
+
+
+class FakeResult:
+    def __init__(self, rows=None, scalar=None):
+        self._rows = rows or []
+        self._scalar = scalar
+
+    def fetchall(self):
+        return self._rows
+
+    def scalar(self):
+        return self._scalar
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    log = {"tenant_queries": 0, "usage_queries": 0, "set_local": [], "usage": 0}
+
+    class Session:
+        async def execute(self, stmt, params=None):
+            sql = str(stmt)
+            if "SET LOCAL" in sql:
+                log["set_local"].append(params["tid"])
+                return FakeResult()
+            if "FROM tenants" in sql:
+                log["tenant_queries"] += 1
+                await asyncio.sleep(0.01)
+                if params is None:
+                    return FakeResult(TENANTS)
+                return FakeResult([
+                    t for t in TENANTS if t[1] in params["slugs"] or t[0] in params["ids"]
+                ])
+            if "usage_tracking" in sql:
+                log["usage_queries"] += 1
+                return FakeResult(scalar=log["usage"])
+            raise AssertionError(sql)
+
+        async def commit(self):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    @asynccontextmanager
+    async def get_session(tenant_id=None):
+        yield Session()
+
+    monkeypatch.setattr(db, "db_available", lambda: True)
+    monkeypatch.setattr(db, "get_session", get_session)
+    monkeypatch.setattr(db, "_session_factory", Session)
+    monkeypatch.setattr(tenant_directory, "_directory", TenantDirectory())
+    monkeypatch.setattr(usage_counters, "_counters", None)
+    return log
+
+
+def test_resolve_caches_slug_and_uuid(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+
+    async def scenario():
+        first = await directory.resolve("acme")
+        again = await directory.resolve("acme")
+        by_id = await directory.resolve(TENANTS[0][0].upper())
+        return first, again, by_id
+
+    first, again, by_id = asyncio.run(scenario())
+    assert first == again == by_id == (TENANTS[0][0], "acme", "starter")
+    assert fake_db["tenant_queries"] == 1
+    assert directory.stats()["hits"] == 2
+
+
+def test_unknown_slugs_are_negatively_cached(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+
+    async def scenario():
+        return [await directory.resolve("nope") for _ in range(5)]
+
+    assert asyncio.run(scenario()) == [None] * 5
+    assert fake_db["tenant_queries"] == 1
+    assert directory.stats()["negative_hits"] == 4
+
+    directory.negative_ttl = 0
+    directory.invalidate("nope")
+    asyncio.run(directory.resolve("nope"))
+    asyncio.run(directory.resolve("nope"))  # ttl 0: vuelve a consultar
+    assert fake_db["tenant_queries"] == 3
+
+
+def test_concurrent_misses_share_one_query(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+
+    async def scenario():
+        return await asyncio.gather(*(directory.resolve("globex") for _ in range(20)))
+
+    results = asyncio.run(scenario())
+    assert {r.slug for r in results} == {"globex"}
+    assert fake_db["tenant_queries"] == 1
+
+
+def test_resolve_many_and_plan_default(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+    found = asyncio.run(directory.resolve_many(["acme", "initech", "ghost"]))
+    assert found["initech"].plan == "starter"  # plan NULL
+    assert found["ghost"] is None
+    assert fake_db["tenant_queries"] == 1
+
+
+def test_invalidate_drops_both_aliases(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+    asyncio.run(directory.resolve("acme"))
+    directory.invalidate("acme")
+    assert directory.lookup(TENANTS[0][0]) == (False, None)
+
+
+def test_preload_then_hot_path_makes_no_tenant_queries(fake_db):
+    directory = tenant_directory.get_tenant_directory()
+    assert asyncio.run(directory.preload()) == 3
+    fake_db["usage"] = 100
+
+    async def scenario():
+        return (
+            await usage._check_plan_limit("acme"),
+            await usage._check_plan_limit("globex"),
+            await usage._check_plan_limit("ghost-from-header"),
+        )
+
+    over, unlimited, unknown = asyncio.run(scenario())
+    assert "allows 100 executions/month" in over
+    assert unlimited is None and unknown is None
+    # Tenant lookups: solo el preload y el slug desconocido; enterprise ni cuenta uso
+    assert fake_db["tenant_queries"] == 2
+    assert fake_db["usage_queries"] == 1
+
+
+def test_get_session_maps_slug_to_uuid(fake_db):
+    async def scenario():
+        for tenant in ("acme", TENANTS[1][0]):
+            async with real_get_session(tenant_id=tenant):
+                pass
+
+    asyncio.run(scenario())
+    assert fake_db["set_local"] == [TENANTS[0][0], TENANTS[1][0]]
@@ -0,0 +1,158 @@
+"""Tests for write-behind usage counters and in-memory plan-limit checks."""
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from backend.middleware import usage
+from services import db, tenant_directory, usage_counters
+from services.tenant_directory import TenantDirectory, TenantRecord
+from services.usage_counters import UsageCounters
+
+ACME = str(uuid.uuid4())
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """usage_tracking compartida por varios 'workers' (UsageCounters)."""
+    state = {"rows": {}, "queries": 0, "upserts": 0, "fail": False}
+
+    class Result:
+        def __init__(self, rows=(), scalar=None):
+            self._rows, self._scalar = list(rows), scalar
+
+        def fetchall(self):
+            return self._rows
+
+        def scalar(self):
+            return self._scalar
+
+    class Session:
+        async def execute(self, stmt, params):
+            state["queries"] += 1
+            if state["fail"]:
+                raise ConnectionError("db down")
+            sql = str(stmt)
+            await asyncio.sleep(0)
+            if sql.startswith("INSERT INTO usage_tracking"):
+                state["upserts"] += 1
+                for tid, n in zip(params["tids"], params["counts"]):
+                    state["rows"][tid] = state["rows"].get(tid, 0) + n
+                return Result()
+            if "GROUP BY tenant_id" in sql:
+                return Result([(t, state["rows"][t]) for t in params["tids"] if t in state["rows"]])
+            if "FROM usage_tracking" in sql:
+                return Result(scalar=state["rows"].get(params["tid"], 0))
+            raise AssertionError(sql)
+
+        async def commit(self):
+            pass
+
+    @asynccontextmanager
+    async def get_session(tenant_id=None):
+        yield Session()
+
+    monkeypatch.setattr(db, "db_available", lambda: True)
+    monkeypatch.setattr(db, "get_session", get_session)
+    return state
+
+
+def test_check_is_in_memory_far_from_the_limit(fake_db):
+    counters = UsageCounters(flush_interval=3600, tolerance=100)
+
+    async def scenario():
+        results = []
+        for _ in range(50):
+            results.append(await counters.check(ACME, 1000))
+            counters.add(ACME)
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(allowed for allowed, _ in results)
+    assert [n for _, n in results][:3] == [0, 1, 2]
+    assert fake_db["queries"] == 1  # solo la siembra
+    assert counters.stats()["pending_executions"] == 50
+
+    asyncio.run(counters.flush())
+    assert fake_db["rows"][ACME] == 50 and fake_db["upserts"] == 1
+    assert counters.stats()["pending_executions"] == 0
+
+
+def test_seeded_from_the_db(fake_db):
+    fake_db["rows"][ACME] = 100
+    counters = UsageCounters(flush_interval=3600)
+    assert asyncio.run(counters.check(ACME, 100)) == (False, 100)
+
+
+def test_check_counts_every_requested_execution(fake_db):
+    fake_db["rows"][ACME] = 99
+    counters = UsageCounters(flush_interval=3600)
+    assert asyncio.run(counters.check(ACME, 100, count=1000)) == (False, 99)
+    assert asyncio.run(counters.check(ACME, 100, count=1)) == (True, 99)
+
+
+def test_limit_holds_across_workers_within_tolerance(fake_db):
+    workers = [UsageCounters(flush_interval=3600, tolerance=5) for _ in range(3)]
+
+    async def scenario():
+        admitted = 0
+        for i in range(200):
+            worker = workers[i % 3]
+            allowed, _ = await worker.check(ACME, 60)
+            if allowed:
+                worker.add(ACME)
+                admitted += 1
+            await asyncio.sleep(0)  # el I/O del request deja correr los flushes
+        for worker in workers:
+            await worker.flush()
+        return admitted
+
+    admitted = asyncio.run(scenario())
+    # Cada worker escribe cada 5 ejecuciones y cerca del limite sincroniza en cada check
+    assert admitted == fake_db["rows"][ACME]
+    assert 60 <= admitted <= 60 + 3 * 5
+    assert sum(w.near_limit_syncs for w in workers) > 0
+    assert fake_db["upserts"] < admitted
+
+
+def test_failed_flush_keeps_the_increments(fake_db):
+    counters = UsageCounters(flush_interval=3600)
+
+    async def scenario():
+        await counters.check(ACME, 1000)
+        for _ in range(7):
+            counters.add(ACME)
+        fake_db["fail"] = True
+        await counters.flush()
+        fake_db["fail"] = False
+        await counters.flush()
+
+    asyncio.run(scenario())
+    assert fake_db["rows"][ACME] == 7
+    assert counters.flush_errors == 1
+    assert asyncio.run(counters.check(ACME, 1000)) == (True, 7)
+
+
+def test_middleware_helpers_use_the_counters(fake_db, monkeypatch):
+    directory = TenantDirectory()
+    directory.put(TenantRecord(ACME, "acme", "starter"))
+    monkeypatch.setattr(tenant_directory, "_directory", directory)
+    counters = UsageCounters(flush_interval=3600, tolerance=0)
+    monkeypatch.setattr(usage_counters, "_counters", counters)
+    fake_db["rows"][ACME] = 98
+
+    async def scenario():
+        first = await usage._check_plan_limit("acme")
+        usage.schedule_usage_increment("acme")  # tenant en cache: sin task ni query
+        second = await usage._check_plan_limit("acme")
+        await usage._increment_usage("acme")
+        third = await usage._check_plan_limit("acme")
+        await asyncio.sleep(0)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first is None and second is None
+    assert "Current usage: 100" in third
+    # tolerance=0: cada ejecucion se escribe enseguida
+    assert fake_db["rows"][ACME] == 100 and counters.stats()["pending_executions"] == 0
@@ -0,0 +1,287 @@
+"""Tests for incremental monthly summaries and the batched write path in services.usage_tracker."""
+import asyncio
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from fastapi import HTTPException
+
+from backend.routers.usage_router import get_usage_timeseries
+from services import db, tenant_directory, usage_tracker
+from services.tenant_directory import TenantDirectory, TenantRecord
+from services.usage_tracker import UsageLog, UsageTracker, retention_interval, run_retention_forever
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"))
+    yield tracker
+    tracker.close()
+
+
+def _log_many(tracker, n, tenant="acme"):
+    for i in range(n):
+        tracker.log_request(
+            tenant, "/api/v1/evaluate",
+            response_status=500 if i % 10 == 0 else 200,
+            response_time_ms=float(i + 1),
+            tokens_used=10,
+        )
+
+
+def test_summary_is_maintained_incrementally(tracker):
+    _log_many(tracker, 200)
+    usage = tracker.get_monthly_usage("acme")
+    assert usage["total_requests"] == 200 and usage["total_tokens"] == 2000
+    assert usage["avg_response_time_ms"] == pytest.approx(100.5)
+    assert usage["success_rate"] == pytest.approx(90.0)
+    # Sketch con ~1% de error relativo
+    assert usage["p50_response_time_ms"] == pytest.approx(100.5, rel=0.02)
+    assert usage["p99_response_time_ms"] == pytest.approx(198, rel=0.02)
+
+
+def test_sync_mode_builds_the_same_summary(tmp_path, tracker):
+    sync = UsageTracker(str(tmp_path / "sync.db"), batched=False)
+    _log_many(sync, 50)
+    _log_many(tracker, 50)
+    expected, usage = sync.get_monthly_usage("acme"), tracker.get_monthly_usage("acme")
+    expected.pop("last_updated"), usage.pop("last_updated")
+    assert usage == expected
+
+
+def test_logging_does_not_touch_the_db_on_the_caller(tracker, monkeypatch):
+    _log_many(tracker, 50)
+    tracker.flush()
+    statements = []
+    connect = tracker._connect
+
+    def traced():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(tracker, "_connect", traced)
+    for _ in range(20):
+        tracker.log_request("acme", "/api/v1/evaluate", response_time_ms=5.0)
+    assert statements == []  # contadores ya sembrados: solo se encola
+
+    tracker._writer_conn.set_trace_callback(statements.append)
+    tracker.flush()
+    assert sum("INSERT INTO usage_logs" in sql for sql in statements) == 20
+    assert any(sql == "COMMIT" for sql in statements)
+    assert not any("FROM usage_logs" in sql for sql in statements)
+    assert tracker.writer_stats()["batches"] < 70
+
+
+def test_seeding_a_tenant_does_not_hold_the_counts_lock(tracker, monkeypatch):
+    tracker.log_request("globex", "/api/v1/evaluate")
+    reading, release = threading.Event(), threading.Event()
+    seed = tracker._seed_counts
+
+    def slow_seed(key):
+        if key[0] == "acme":
+            reading.set()
+            release.wait(5)
+        return seed(key)
+
+    monkeypatch.setattr(tracker, "_seed_counts", slow_seed)
+    first = threading.Thread(target=tracker.log_request, args=("acme", "/api/v1/evaluate"))
+    first.start()
+    assert reading.wait(5)
+    try:
+        done = threading.Thread(target=tracker.log_request, args=("globex", "/api/v1/evaluate"))
+        done.start()
+        done.join(1)
+        assert not done.is_alive()  # otro tenant no espera la lectura de acme
+    finally:
+        release.set()
+        first.join(5)
+    month = datetime.now().strftime("%Y-%m")
+    assert tracker._counts[("acme", month)] == 1 and tracker._counts[("globex", month)] == 2
+
+
+def test_batches_wait_out_a_locked_database(tracker):
+    # Sin busy_timeout: cada intento con la DB tomada falla enseguida con "database is locked"
+    tracker._writer_conn = sqlite3.connect(tracker.db_path, check_same_thread=False)
+    tracker._writer_conn.execute("PRAGMA busy_timeout=0")
+    holder = sqlite3.connect(tracker.db_path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")  # reconcile / cleanup / otro proceso
+    _log_many(tracker, 10)
+    assert not tracker.flush(timeout=0.3)
+    holder.execute("COMMIT")
+    holder.close()
+
+    assert tracker.flush(timeout=5)
+    assert tracker.get_monthly_usage("acme")["total_requests"] == 10
+    stats = tracker.writer_stats()
+    assert stats["failed"] == 0 and stats["retries"] > 0
+
+
+def test_alerts_use_the_running_totals(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, "_get_tenant_limit", lambda tenant_id: 4)
+    types = []
+    for _ in range(5):
+        types += [a["type"] for a in tracker.log_request("acme", "/x")["alerts"]]
+    assert types == ["warning", "alert", "critical", "limit_reached"]
+    assert tracker.get_monthly_usage("acme")["status"] == "limit_reached"
+    assert len(tracker.get_active_alerts("acme")) == 4
+
+    # Otro proceso arranca con los contadores y alertas de la DB
+    restarted = UsageTracker(tracker.db_path)
+    monkeypatch.setattr(restarted, "_get_tenant_limit", lambda tenant_id: 4)
+    assert restarted.log_request("acme", "/x")["alerts"] == []
+    assert restarted.get_monthly_usage("acme")["total_requests"] == 6
+    restarted.close()
+
+
+def test_reconcile_rebuilds_from_raw_logs(tracker):
+    _log_many(tracker, 120)
+    _log_many(tracker, 30, tenant="globex")
+    expected = {t: tracker.get_monthly_usage(t) for t in ("acme", "globex")}
+
+    conn = sqlite3.connect(tracker.db_path)
+    conn.execute("UPDATE usage_summary SET total_requests = 1, response_time_sum = 0")
+    conn.execute("DELETE FROM usage_latency_buckets WHERE tenant_id = 'globex'")
+    conn.commit()
+    conn.close()
+
+    assert tracker.reconcile_summaries() == 2
+    for tenant, usage in expected.items():
+        rebuilt = tracker.get_monthly_usage(tenant)
+        usage.pop("last_updated"), rebuilt.pop("last_updated")
+        assert rebuilt == usage
+
+
+def test_reconcile_skips_the_month_cut_by_cleanup(tracker):
+    _log_many(tracker, 10)
+    tracker.flush()
+    year_month = datetime.now().strftime("%Y-%m")
+    conn = sqlite3.connect(tracker.db_path)
+    conn.execute(
+        "INSERT INTO usage_meta (key, value) VALUES ('logs_complete_since', ?)",
+        (f"{year_month}-02T12:00:00",),
+    )
+    conn.execute("DELETE FROM usage_logs WHERE rowid IN (SELECT rowid FROM usage_logs LIMIT 5)")
+    conn.commit()
+    conn.close()
+
+    month_rollup = tracker.get_timeseries("acme", datetime.now() - timedelta(days=1), granularity="month")["points"]
+    assert tracker.reconcile_summaries() == 0
+    assert tracker.get_monthly_usage("acme")["total_requests"] == 10
+    # Pedido explicito: tampoco se rehace con lo que quedo (se perderia el resumen del mes)
+    assert tracker.reconcile_summaries("acme", year_month) == 0
+    assert tracker.get_monthly_usage("acme")["total_requests"] == 10
+    assert tracker.get_timeseries("acme", datetime.now() - timedelta(days=1), granularity="month")["points"] == month_rollup
+
+
+def _write_at(tracker, moments, tenant="acme", agent="credit_evaluator", status=200):
+    tracker._write_batch([
+        UsageLog(str(uuid.uuid4()), tenant, moment.isoformat(), "/x", "POST", status, 10.0, 5, agent)
+        for moment in moments
+    ])
+
+
+def test_timeseries_reads_the_coarsest_rollup_that_fits(tracker):
+    day = datetime(2025, 3, 10)
+    # 3 requests por hora durante 3 dias, uno de cada tres con error y sin agente
+    _write_at(tracker, [day + timedelta(hours=h, minutes=m) for h in range(72) for m in (5, 25)])
+    _write_at(tracker, [day + timedelta(hours=h, minutes=45) for h in range(72)], agent=None, status=500)
+
+    daily = tracker.get_timeseries("acme", day, day + timedelta(days=3), "day")
+    assert daily["source"] == "usage_rollup_day"
+    assert [p["period"] for p in daily["points"]] == ["2025-03-10", "2025-03-11", "2025-03-12"]
+    assert daily["points"][0]["requests"] == 72 and daily["points"][0]["errors"] == 24
+    assert daily["points"][0]["tokens"] == 360 and daily["points"][0]["avg_response_time_ms"] == 10.0
+
+    # Rango no alineado al dia: se agrega desde las horas
+    partial = tracker.get_timeseries("acme", day + timedelta(hours=12), day + timedelta(days=1), "day")
+    assert partial["source"] == "usage_rollup_hour"
+    assert partial["points"] == [dict(daily["points"][0], requests=36, errors=12, tokens=180)]
+
+    monthly = tracker.get_timeseries("acme", datetime(2025, 3, 1), datetime(2025, 4, 1), "month")
+    assert monthly["source"] == "usage_rollup_month" and monthly["points"][0]["requests"] == 216
+
+    agents = tracker.get_timeseries("acme", day, day + timedelta(days=1), "day", by_agent=True)
+    assert {(p["agent"], p["requests"]) for p in agents["points"]} == {("credit_evaluator", 48), (None, 24)}
+    only = tracker.get_timeseries("acme", day, day + timedelta(days=1), "hour", agent="credit_evaluator")
+    assert len(only["points"]) == 24 and all(p["requests"] == 2 for p in only["points"])
+
+
+def test_retention_downsamples_to_coarser_rollups(tracker):
+    old = datetime.now().replace(hour=1, minute=0, second=0, microsecond=0) - timedelta(days=60)
+    _write_at(tracker, [old + timedelta(minutes=10 * i) for i in range(12)])
+    deleted = tracker.apply_retention(raw_days=30, hourly_days=30, daily_days=365)
+    assert deleted["raw"] == 12 and deleted["hour"] == 2 and deleted["day"] == 0
+
+    series = tracker.get_timeseries("acme", old, old + timedelta(hours=2), "hour")
+    assert series["source"] == "usage_rollup_day" and series["granularity"] == "day"
+    assert series["points"][0]["requests"] == 12
+
+
+def test_retention_runs_on_a_schedule_off_the_event_loop(tracker, monkeypatch):
+    old = datetime.now().replace(hour=1, minute=0, second=0, microsecond=0) - timedelta(days=200)
+    _write_at(tracker, [old + timedelta(minutes=10 * i) for i in range(6)])
+    monkeypatch.setenv("USAGE_RAW_RETENTION_DAYS", "30")
+    calls = []
+    apply_retention = tracker.apply_retention
+
+    def recording():
+        calls.append(threading.get_ident())
+        return apply_retention()
+
+    monkeypatch.setattr(tracker, "apply_retention", recording)
+
+    async def scenario():
+        task = asyncio.get_running_loop().create_task(run_retention_forever(tracker, 0.05))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(calls) >= 2 and loop_thread not in calls
+    conn = sqlite3.connect(tracker.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM usage_logs").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM usage_rollup_hour").fetchone()[0] == 0
+    conn.close()
+
+
+def test_retention_interval_comes_from_the_env(monkeypatch):
+    monkeypatch.delenv("USAGE_RETENTION_INTERVAL_HOURS", raising=False)
+    assert retention_interval() == 24 * 3600
+    monkeypatch.setenv("USAGE_RETENTION_INTERVAL_HOURS", "0")
+    assert retention_interval() == 0
+
+
+def test_timeseries_route_accepts_slug_and_uuid(tracker, monkeypatch):
+    tid = str(uuid.uuid4())
+    directory = TenantDirectory()
+    directory.put(TenantRecord(tid, "acme", "pro"))
+    directory.put_missing("nobody")
+    monkeypatch.setattr(tenant_directory, "_directory", directory)
+    monkeypatch.setattr(db, "db_available", lambda: True)
+    monkeypatch.setattr(usage_tracker, "_tracker", tracker)
+    day = datetime(2025, 3, 10)
+    _write_at(tracker, [day + timedelta(hours=h) for h in range(5)], tenant=tid)
+
+    for key in ("acme", tid):
+        series = asyncio.run(get_usage_timeseries(key, day, day + timedelta(days=1)))
+        assert [p["requests"] for p in series["points"]] == [5]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_usage_timeseries("nobody", day, day + timedelta(days=1)))
+    assert exc.value.status_code == 404
+
+
+def test_reconcile_rebuilds_the_rollups(tracker):
+    _log_many(tracker, 40)
+    tracker.flush()
+    now = datetime.now()
+    before = tracker.get_timeseries("acme", now - timedelta(days=1), granularity="hour")
+    conn = sqlite3.connect(tracker.db_path)
+    conn.execute("DELETE FROM usage_rollup_hour")
+    conn.commit()
+    conn.close()
+    tracker.reconcile_summaries()
+    assert tracker.get_timeseries("acme", now - timedelta(days=1), granularity="hour")["points"] == before["points"]